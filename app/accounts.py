@@ -0,0 +1,120 @@
+import hashlib  # 检查点文件名中的名称摘要 / Name digest in checkpoint file names
+import json  # 账户文件解析 / Accounts file parsing
+import os  # 文件路径操作 / File path operations
+import re  # 正则表达式模块 / Regular expression module
+from typing import Any, Dict, List
+
+
+def default_account(server: str, username: str, password: str, topic: str, checkpoint: str) -> Dict[str, Any]:
+    """根据环境变量构建单账户配置
+    Build the single-account configuration from environment variables
+
+    Args:
+        server (str): IMAP服务器地址 / IMAP server address
+        username (str): 邮箱用户名 / Email username
+        password (str): 邮箱密码 / Email password
+        topic (str): MQTT主题 / MQTT topic
+        checkpoint (str): UID检查点文件 / UID checkpoint file
+
+    Returns:
+        dict: 监听配置 / Watcher configuration
+    """
+    return {
+        'name': 'default',
+        'server': server,
+        'port': 993,
+        'username': username,
+        'password': password,
+        'folder': 'INBOX',
+        'topic': topic,
+        'checkpoint': checkpoint
+    }
+
+
+def load_accounts(path: str, default_topic: str, checkpoint_file: str) -> List[Dict[str, Any]]:
+    """从JSON文件读取多账户、多文件夹配置
+    Load the multi-account, multi-folder configuration from a JSON file
+
+    每个账户的每个文件夹展开为一个独立的监听配置，文件格式:
+    Each folder of each account expands into its own watcher configuration. File format:
+
+        {"accounts": [{"name": "home", "server": "imap.qq.com", "username": "...",
+                       "password": "...", "topic": "email/home",
+                       "folders": ["INBOX", {"folder": "Alerts", "topic": "email/alerts"}]}]}
+
+    Args:
+        path (str): 账户文件路径 / Accounts file path
+        default_topic (str): 未配置主题时使用的MQTT主题 / MQTT topic used when none is configured
+        checkpoint_file (str): 默认检查点文件，其所在目录用于存放各文件夹的检查点
+                               Default checkpoint file, its directory holds per-folder checkpoints
+
+    Returns:
+        list: 监听配置列表 / List of watcher configurations
+
+    Raises:
+        ValueError: 配置缺少必填字段或名称重复 / Missing required fields or duplicate names
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    accounts = data['accounts'] if isinstance(data, dict) else data
+    checkpoint_dir = os.path.dirname(checkpoint_file)
+
+    watchers: List[Dict[str, Any]] = []
+    for index, account in enumerate(accounts):
+        for field in ('server', 'username', 'password'):
+            if not account.get(field):
+                raise ValueError(f"账户 {index} 缺少 {field} / Account {index} is missing {field}")
+        name = account.get('name') or account['username']
+        account_topic = account.get('topic') or default_topic
+
+        for folder in account.get('folders') or ['INBOX']:
+            if isinstance(folder, str):
+                folder = {'folder': folder}
+            folder_name = folder['folder']
+            watchers.append({
+                'name': f"{name}/{folder_name}",
+                'server': account['server'],
+                'port': int(account.get('port', 993)),
+                'username': account['username'],
+                'password': account['password'],
+                'folder': folder_name,
+                'topic': folder.get('topic') or account_topic,
+                'checkpoint': checkpoint_path(checkpoint_dir, name, folder_name)
+            })
+
+    names = [watcher['name'] for watcher in watchers]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"重复的账户/文件夹: {duplicates} / Duplicate account/folder: {duplicates}")
+    return watchers
+
+
+def checkpoint_path(checkpoint_dir: str, name: str, folder: str) -> str:
+    """一个账户文件夹的检查点文件路径 / Checkpoint file path of one account folder
+
+    替换特殊字符后不同的名称可能相同（如 a/b 和 a_b），因此文件名末尾加上原始名称的摘要
+    Different names can become the same once special characters are replaced (a/b and
+    a_b), so the file name ends with a digest of the raw names
+    """
+    digest = hashlib.blake2b(f"{name}\0{folder}".encode('utf-8'), digest_size=4).hexdigest()
+    return os.path.join(checkpoint_dir, f"checkpoint-{_safe_name(name)}-{_safe_name(folder)}-{digest}.json")
+
+
+def quote_mailbox(folder: str) -> str:
+    """为包含空格等字符的文件夹名称加引号
+    Quote folder names that contain spaces or other special characters
+
+    Args:
+        folder (str): 文件夹名称 / Folder name
+
+    Returns:
+        str: 可以直接用在IMAP命令中的名称 / Name usable directly in IMAP commands
+    """
+    if folder.startswith('"') or re.fullmatch(r'[A-Za-z0-9_./&+-]+', folder):
+        return folder
+    return '"' + folder.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def _safe_name(value: str) -> str:
+    """把名称转换为可用作文件名的形式 / Turn a name into something usable as a file name"""
+    return re.sub(r'[^A-Za-z0-9_.-]+', '_', value)
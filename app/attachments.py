@@ -0,0 +1,123 @@
+import binascii  # base64/quoted-printable解码 / base64 and quoted-printable decoding
+import hashlib  # 内容寻址的SHA-256 / SHA-256 for content addressing
+import os  # 文件操作 / File operations
+import tempfile  # 写入中的临时文件 / Temporary files while writing
+from typing import Any, Dict
+
+
+class AttachmentStore:
+    """按内容寻址的本地附件存储
+    Content-addressed local attachment store
+
+    附件按解码后内容的SHA-256保存为 root/ab/abcdef...，相同的附件只保存一份。
+    写入先进入 root/tmp，完成后原子地改名，中断的写入不会留下不完整的附件
+    Attachments are stored as root/ab/abcdef... by the SHA-256 of their decoded content,
+    so identical attachments are kept once. Writes go to root/tmp first and are renamed
+    atomically when complete, so an interrupted write never leaves a partial attachment
+
+    Args:
+        root (str): 存储目录 / Store directory
+    """
+
+    def __init__(self, root: str) -> None:
+        self.root = os.path.abspath(root)
+        self._tmp = os.path.join(self.root, 'tmp')
+        os.makedirs(self._tmp, exist_ok=True)
+        # 清理上次中断的写入 / Clean up writes interrupted last time
+        for name in os.listdir(self._tmp):
+            try:
+                os.remove(os.path.join(self._tmp, name))
+            except OSError:
+                pass
+
+    def open(self, encoding: str) -> 'AttachmentWriter':
+        """开始写入一个附件 / Start writing one attachment
+
+        Args:
+            encoding (str): Content-Transfer-Encoding，写入的数据按它逐块解码 / Transfer encoding the written chunks are decoded from
+        """
+        return AttachmentWriter(self, encoding)
+
+    def path_for(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+
+class AttachmentWriter:
+    """逐块解码并写入一个附件，内存中只保留当前块
+    Decode and write one attachment chunk by chunk, holding only the current chunk in memory
+
+    base64的块不必按4字节对齐，quoted-printable的块不必按行对齐，不完整的部分留到下一块
+    base64 chunks need not be aligned to 4 bytes and quoted-printable chunks need not end
+    on a line; the incomplete tail is carried over to the next chunk
+    """
+
+    def __init__(self, store: AttachmentStore, encoding: str) -> None:
+        self._store = store
+        self._encoding = encoding.lower()
+        self._digest = hashlib.sha256()
+        self._size = 0
+        self._pending = b''
+        fd, self._temp_path = tempfile.mkstemp(dir=store._tmp)
+        self._file = os.fdopen(fd, 'wb')
+
+    def write(self, data: bytes) -> None:
+        if self._encoding == 'base64':
+            data = self._pending + b''.join(data.split())
+            cut = len(data) - len(data) % 4
+            self._pending = data[cut:]
+            self._emit(_a2b_base64(data[:cut]))
+        elif self._encoding == 'quoted-printable':
+            data = self._pending + data
+            cut = data.rfind(b'\n') + 1
+            self._pending = data[cut:]
+            self._emit(binascii.a2b_qp(data[:cut]))
+        else:
+            self._emit(data)
+
+    def commit(self) -> Dict[str, Any]:
+        """完成写入并移入存储 / Finish writing and move the attachment into the store
+
+        Returns:
+            dict: {'sha256', 'size', 'path'}
+        """
+        if self._pending:
+            if self._encoding == 'base64':
+                self._emit(_a2b_base64(self._pending + b'=' * (-len(self._pending) % 4)))
+            else:
+                self._emit(binascii.a2b_qp(self._pending))
+            self._pending = b''
+        self._file.close()
+        digest = self._digest.hexdigest()
+        path = self._store.path_for(digest)
+        if os.path.exists(path):
+            # 已经保存过相同的内容 / The same content is already stored
+            os.remove(self._temp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self._temp_path, path)
+        return {'sha256': digest, 'size': self._size, 'path': path}
+
+    def abort(self) -> None:
+        """放弃写入 / Abandon the write"""
+        self._file.close()
+        try:
+            os.remove(self._temp_path)
+        except OSError:
+            pass
+
+    def _emit(self, data: bytes) -> None:
+        if data:
+            self._digest.update(data)
+            self._size += len(data)
+            self._file.write(data)
+
+
+def _a2b_base64(data: bytes) -> bytes:
+    try:
+        return binascii.a2b_base64(data)
+    except binascii.Error:
+        # 与email包一样容忍缺少的填充 / Tolerate missing padding like the email package
+        try:
+            return binascii.a2b_base64(data + b'===')
+        except binascii.Error:
+            return b''
@@ -0,0 +1,87 @@
+import time  # 时间相关操作 / Time-related operations
+from typing import Iterable, List, Optional
+
+ORDERS = ('oldest', 'newest')
+
+
+class Backlog:
+    """积压邮件的追赶队列：按固定大小分块取出UID，并限制追赶速率
+    Catch-up queue for a mail backlog: hands out UIDs in fixed-size chunks and caps the
+    catch-up rate
+
+    只保存UID，邮件在取出时才获取，因此内存占用与积压数量基本无关。按 order 从最旧或
+    最新的邮件开始；rate 为每秒最多取出的邮件数，留出的时间用于处理新到的邮件
+    Only UIDs are kept and messages are fetched as their chunk is taken, so memory hardly
+    depends on the size of the backlog. Chunks start from the oldest or the newest mail
+    according to order; rate is the most messages handed out per second, leaving time for
+    mail that arrives meanwhile
+
+    Args:
+        order (str): 'oldest' 或 'newest' / 'oldest' or 'newest'
+        rate (float): 每秒最多取出的邮件数，0为不限制 / Most messages handed out per second, 0 means no cap
+    """
+
+    def __init__(self, order: str = 'oldest', rate: float = 0.0) -> None:
+        if order not in ORDERS:
+            raise ValueError(f"未知顺序 {order!r}，可选 {ORDERS} / Unknown order {order!r}, expected one of {ORDERS}")
+        self.order = order
+        self.rate = rate
+        self._uids: List[int] = []  # 升序 / Ascending
+        self._resumable = True
+        self._next_at = 0.0
+
+    def __len__(self) -> int:
+        return len(self._uids)
+
+    def extend(self, uids: Iterable[int], resumable: bool = True) -> None:
+        """加入积压的UID / Add backlog UIDs
+
+        Args:
+            uids (Iterable[int]): 新的UID，都大于已有的UID / New UIDs, all above the ones already queued
+            resumable (bool): 能否从检查点继续；来自未读邮件同步的积压在追赶完成前不保存检查点
+                              Whether a checkpoint can resume it; a backlog from an unread-mail sync
+                              saves no checkpoint until it is caught up
+        """
+        self._uids.extend(uids)
+        self._uids.sort()
+        self._resumable = self._resumable and resumable
+
+    def take(self, size: int) -> List[int]:
+        """取出下一块UID（升序）并计入速率限制 / Take the next chunk of UIDs (ascending), counting it against the rate cap"""
+        size = max(1, size)
+        if self.order == 'newest':
+            chunk = self._uids[-size:]
+            del self._uids[-size:]
+        else:
+            chunk = self._uids[:size]
+            del self._uids[:size]
+        if self.rate > 0 and chunk:
+            now = time.monotonic()
+            self._next_at = max(now, self._next_at) + len(chunk) / self.rate
+        if not self._uids:
+            self._resumable = True
+        return chunk
+
+    def delay(self) -> float:
+        """距离可以取出下一块的秒数 / Seconds until the next chunk may be taken"""
+        return max(0.0, self._next_at - time.monotonic()) if self._uids else 0.0
+
+    def checkpoint(self, last_uid: Optional[int]) -> Optional[int]:
+        """可以保存的检查点：尚未取出的最小UID之前的位置
+        The checkpoint that can be saved: just before the lowest UID not yet taken
+
+        Args:
+            last_uid (int): 已取出或搜索过的最大UID / Highest UID taken or searched
+
+        Returns:
+            int: 检查点UID，None表示暂不保存 / Checkpoint UID, None means do not save yet
+        """
+        if not self._uids:
+            return last_uid
+        if not self._resumable:
+            return None
+        return self._uids[0] - 1
+
+    def clear(self) -> None:
+        self._uids.clear()
+        self._resumable = True
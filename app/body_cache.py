@@ -0,0 +1,137 @@
+import hashlib  # 按内容生成正文ID / Content-derived body IDs
+import json  # 缓存条目编码 / Cache entry encoding
+import logging  # 日志 / Logging
+import os  # 磁盘溢出文件 / Disk spillover files
+import threading  # 线程锁 / Thread lock
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+log = logging.getLogger('email2mqtt.body_cache')
+
+
+class BodyCache:
+    """按字节数限制大小的邮件正文LRU缓存，可溢出到磁盘
+    Size-bounded LRU cache of mail bodies with optional disk spillover
+
+    正文ID是正文内容的摘要，相同内容的ID不变，因此可以直接用作ETag。内存超过 max_bytes
+    时最久未用的条目移到 spill_dir（超过 spill_max_bytes 时删除最旧的文件），没有
+    spill_dir 时直接丢弃
+    The body ID is a digest of the content, so the same content always has the same ID
+    and it doubles as the ETag. Past max_bytes in memory the least recently used entries
+    move to spill_dir (deleting the oldest files past spill_max_bytes), or are dropped when
+    there is no spill_dir
+
+    Args:
+        max_bytes (int): 内存中缓存的最大字节数 / Most bytes cached in memory
+        spill_dir (str): 溢出目录，空字符串表示不溢出 / Spillover directory, empty disables spillover
+        spill_max_bytes (int): 溢出目录的最大字节数 / Most bytes kept in the spillover directory
+    """
+
+    def __init__(self, max_bytes: int, spill_dir: str = '', spill_max_bytes: int = 0) -> None:
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.spill_max_bytes = spill_max_bytes
+        self._lock = threading.Lock()
+        self._memory: 'OrderedDict[str, bytes]' = OrderedDict()
+        self._memory_bytes = 0
+        self._disk: 'OrderedDict[str, int]' = OrderedDict()
+        self._disk_bytes = 0
+        self._stats = {'hits': 0, 'disk_hits': 0, 'misses': 0}
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            # 上次溢出的条目按修改时间从旧到新恢复 / Entries spilled last time come back oldest first
+            entries = [entry for entry in os.scandir(spill_dir) if entry.name.endswith('.json')]
+            for entry in sorted(entries, key=lambda entry: entry.stat().st_mtime):
+                self._disk[entry.name[:-5]] = entry.stat().st_size
+                self._disk_bytes += entry.stat().st_size
+            self._trim_disk()
+
+    def put(self, text: str, html: str) -> str:
+        """缓存一封邮件的正文 / Cache the body of one email
+
+        Returns:
+            str: 正文ID / Body ID
+        """
+        data = json.dumps({'text': text, 'html': html}, ensure_ascii=False).encode('utf-8')
+        body_id = hashlib.blake2b(data, digest_size=16).hexdigest()
+        with self._lock:
+            if body_id in self._memory:
+                self._memory.move_to_end(body_id)
+                return body_id
+            self._memory[body_id] = data
+            self._memory_bytes += len(data)
+            evicted = []
+            while self._memory_bytes > self.max_bytes and self._memory:
+                key, value = self._memory.popitem(last=False)
+                self._memory_bytes -= len(value)
+                evicted.append((key, value))
+        if self.spill_dir:
+            for key, value in evicted:
+                self._spill(key, value)
+        return body_id
+
+    def get(self, body_id: str) -> Optional[Dict[str, Any]]:
+        """按ID读取正文 / Read a body by ID
+
+        Returns:
+            dict: {'text', 'html'}，已被淘汰时返回None / None once it has been evicted
+        """
+        if len(body_id) != 32 or any(c not in '0123456789abcdef' for c in body_id):
+            # 不是put()生成的ID，也防止拼出目录外的路径 / Not an ID from put(), which also keeps paths inside the directory
+            return None
+        with self._lock:
+            data = self._memory.get(body_id)
+            if data is not None:
+                self._memory.move_to_end(body_id)
+                self._stats['hits'] += 1
+                return json.loads(data)
+            on_disk = body_id in self._disk
+            if on_disk:
+                self._disk.move_to_end(body_id)
+        if on_disk:
+            try:
+                with open(self._path(body_id), 'rb') as f:
+                    data = f.read()
+                with self._lock:
+                    self._stats['disk_hits'] += 1
+                return json.loads(data)
+            except (OSError, ValueError):
+                pass
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, entries=len(self._memory), bytes=self._memory_bytes,
+                        disk_entries=len(self._disk), disk_bytes=self._disk_bytes)
+
+    def _path(self, body_id: str) -> str:
+        return os.path.join(self.spill_dir, f"{body_id}.json")
+
+    def _spill(self, body_id: str, data: bytes) -> None:
+        path = self._path(body_id)
+        try:
+            with open(f"{path}.tmp", 'wb') as f:
+                f.write(data)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            log.warning("正文缓存写入磁盘失败: %s", e)
+            return
+        with self._lock:
+            self._disk_bytes -= self._disk.pop(body_id, 0)
+            self._disk[body_id] = len(data)
+            self._disk_bytes += len(data)
+        self._trim_disk()
+
+    def _trim_disk(self) -> None:
+        while True:
+            with self._lock:
+                if self._disk_bytes <= self.spill_max_bytes or not self._disk:
+                    return
+                body_id, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+            try:
+                os.remove(self._path(body_id))
+            except OSError:
+                pass
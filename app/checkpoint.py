@@ -0,0 +1,55 @@
+import json  # 检查点序列化 / Checkpoint serialization
+import logging  # 日志 / Logging
+import os  # 文件操作 / File operations
+from typing import Dict, Optional
+
+log = logging.getLogger('email2mqtt.checkpoint')
+
+
+def load_checkpoint(path: str) -> Optional[Dict[str, int]]:
+    """读取UID同步检查点
+    Load the UID sync checkpoint
+
+    Args:
+        path (str): 检查点文件路径 / Checkpoint file path
+
+    Returns:
+        dict: {'uidvalidity': int, 'last_uid': int}，文件不存在或损坏时返回None
+        {'uidvalidity': int, 'last_uid': int}, None if the file is missing or corrupt
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return {
+            'uidvalidity': int(data['uidvalidity']),
+            'last_uid': int(data['last_uid'])
+        }
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log.warning("读取检查点出错，将重新同步: %s", e)
+        return None
+
+
+def save_checkpoint(path: str, uidvalidity: int, last_uid: int) -> None:
+    """原子地写入UID同步检查点
+    Atomically write the UID sync checkpoint
+
+    先写临时文件并刷到磁盘再替换，避免进程崩溃或断电时留下半个文件或空文件
+    Writes a temporary file, fsyncs it and renames it so a crash or power loss never
+    leaves a partial or empty file
+
+    Args:
+        path (str): 检查点文件路径 / Checkpoint file path
+        uidvalidity (int): 邮箱的UIDVALIDITY / Mailbox UIDVALIDITY
+        last_uid (int): 已处理的最大UID / Highest processed UID
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'uidvalidity': uidvalidity, 'last_uid': last_uid}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
@@ -1,29 +1,97 @@
 import os
-from typing import Optional
+import socket  # 默认节点名称 / Default node name
+from typing import List, Optional
+
+# 未设置的必填环境变量，由check_config()在启动时报告 / Required variables that are not set, reported by check_config() at startup
+MISSING: List[str] = []
 
 def get_env_var(name: str, default: Optional[str] = None) -> str:
     """
-    从环境变量获取配置 / Get configuration from environment variables
+    从环境变量获取配置，必填项未设置时记录下来并返回空字符串，导入本模块不会抛出异常
+    Get configuration from environment variables; a missing required variable is recorded
+    and returns an empty string, so importing this module never raises
     :param name: 环境变量名称 / Environment variable name
-    :param default: 默认值 / Default value
+    :param default: 默认值，None表示必填 / Default value, None means required
     :return: 环境变量值 / Environment variable value
-    :raises ValueError: 如果环境变量未设置 / If environment variable is not set
     """
     value = os.getenv(name, default)
     if value is None:
-        raise ValueError(f"环境变量 {name} 未设置 / Environment variable {name} not set")
+        MISSING.append(name)
+        return ''
     return value
 
+def check_config() -> None:
+    """
+    检查必填环境变量，启动监听前调用 / Check the required environment variables, called before the watchers start
+    :raises ValueError: 有环境变量未设置，列出全部缺少的变量；或 LOG_LEVEL、LOG_FORMAT 无效 / If any are not set, listing every missing variable; or if LOG_LEVEL or LOG_FORMAT is invalid
+    """
+    if MISSING:
+        raise ValueError(f"环境变量 {', '.join(MISSING)} 未设置 / Environment variables {', '.join(MISSING)} not set")
+    if LOG_LEVEL not in LOG_LEVELS:
+        raise ValueError(f"未知日志级别 LOG_LEVEL={LOG_LEVEL!r}，可选 {LOG_LEVELS} / Unknown LOG_LEVEL={LOG_LEVEL!r}, expected one of {LOG_LEVELS}")
+    if LOG_FORMAT not in LOG_FORMATS:
+        raise ValueError(f"未知日志格式 LOG_FORMAT={LOG_FORMAT!r}，可选 {LOG_FORMATS} / Unknown LOG_FORMAT={LOG_FORMAT!r}, expected one of {LOG_FORMATS}")
+
 # 邮箱配置 / Email settings
-IMAP_SERVER = get_env_var('IMAP_SERVER')  # IMAP服务器地址 / IMAP server address (e.g. imap.gmail.com)
-USERNAME = get_env_var('EMAIL_USERNAME')  # 邮箱用户名 / Email account username
-PASSWORD = get_env_var('EMAIL_PASSWORD')  # 邮箱密码或应用密码 / Email password or app password
+ACCOUNTS_FILE = get_env_var('ACCOUNTS_FILE', '')  # 多账户/多文件夹配置文件(JSON)，设置后忽略下面三项 / Multi-account/folder config file (JSON), overrides the three settings below
+_ACCOUNT_DEFAULT = '' if ACCOUNTS_FILE else None  # 使用账户文件时单账户配置不是必填项 / Single-account settings are optional with an accounts file
+IMAP_SERVER = get_env_var('IMAP_SERVER', _ACCOUNT_DEFAULT)  # IMAP服务器地址 / IMAP server address (e.g. imap.gmail.com)
+USERNAME = get_env_var('EMAIL_USERNAME', _ACCOUNT_DEFAULT)  # 邮箱用户名 / Email account username
+PASSWORD = get_env_var('EMAIL_PASSWORD', _ACCOUNT_DEFAULT)  # 邮箱密码或应用密码 / Email password or app password
 CHECK_INTERVAL = int(get_env_var('CHECK_INTERVAL', '5'))  # 邮件检查间隔时间(秒) / Email check interval (seconds)
+# 默认等于CHECK_INTERVAL，即不退避；设得更大时才在邮箱空闲时放慢轮询
+# Defaults to CHECK_INTERVAL, i.e. no backoff; polling only slows down on a quiet mailbox when set higher
+POLL_MAX_INTERVAL = float(get_env_var('POLL_MAX_INTERVAL', str(CHECK_INTERVAL)))  # 邮箱空闲时轮询间隔增长的上限(秒) / Longest polling interval (seconds) reached while the mailbox is quiet
+POLL_BACKOFF = float(get_env_var('POLL_BACKOFF', '1.5'))  # 每次没有新邮件时轮询间隔的增长倍数 / Polling interval growth factor after each check without new mail
+WATCH_MODE = get_env_var('WATCH_MODE', 'idle').lower()  # 监听模式: idle 或 poll / Watch mode: idle or poll
+IDLE_TIMEOUT = int(get_env_var('IDLE_TIMEOUT', '1740'))  # IDLE重新发起间隔(秒)，须小于29分钟 / IDLE re-issue interval (seconds), must stay below 29 minutes
+IMAP_KEEPALIVE = int(get_env_var('IMAP_KEEPALIVE', '300'))  # 连接空闲多久后发送NOOP或重新发起IDLE(秒) / Quiet time (seconds) after which a NOOP is sent or IDLE re-issued
+RECONNECT_MIN_DELAY = float(get_env_var('RECONNECT_MIN_DELAY', '1'))  # 重连退避的最短间隔(秒) / Shortest reconnect backoff (seconds)
+RECONNECT_MAX_DELAY = float(get_env_var('RECONNECT_MAX_DELAY', '120'))  # 重连退避的最长间隔(秒) / Longest reconnect backoff (seconds)
+CIRCUIT_FAILURE_THRESHOLD = int(get_env_var('CIRCUIT_FAILURE_THRESHOLD', '5'))  # 断路器打开前的连续失败次数 / Consecutive failures before the circuit opens
+RECONNECT_STABLE_AFTER = float(get_env_var('RECONNECT_STABLE_AFTER', '30'))  # 连接保持多少秒后清零失败次数 / Seconds a connection must stay up to clear its failure count
+CHECKPOINT_FILE = get_env_var('CHECKPOINT_FILE', 'data/checkpoint.json')  # UID同步检查点文件 / UID sync checkpoint file
+FETCH_CHUNK_SIZE = int(get_env_var('FETCH_CHUNK_SIZE', '50'))  # 每次UID FETCH获取的邮件数 / Messages fetched per UID FETCH
+CATCHUP_ORDER = get_env_var('CATCHUP_ORDER', 'oldest').lower()  # 积压追赶顺序: oldest 从最旧开始, newest 从最新开始 / Backlog catch-up order: oldest or newest first
+CATCHUP_RATE = float(get_env_var('CATCHUP_RATE', '0'))  # 积压追赶每秒最多获取的邮件数，0为不限制 / Most backlog messages fetched per second during catch-up, 0 means no cap
+PIPELINE_QUEUE_SIZE = int(get_env_var('PIPELINE_QUEUE_SIZE', '4'))  # 获取、解析和发布阶段之间缓冲的批次数 / Batches buffered between the fetch, parse and publish stages
+MAIL_RETRIES = int(get_env_var('MAIL_RETRIES', '3'))  # 解析或发布失败的邮件重新获取的次数，之后保持未读并跳过 / Times a message that failed to parse or publish is fetched again before it is left unread and skipped
+FETCH_MODE = get_env_var('FETCH_MODE', 'full').lower()  # 获取方式: full 完整邮件, text 只获取文本部分 / Fetch mode: full message or text parts only
+RULES_FILE = get_env_var('RULES_FILE', '')  # 按邮件头路由或丢弃邮件的规则文件(JSON) / Rules file (JSON) routing or dropping mail by its headers
+ATTACHMENT_DIR = get_env_var('ATTACHMENT_DIR', '')  # 附件存储目录，设置后附件逐块写入磁盘并发布元数据 / Attachment store directory; when set, attachments are streamed to disk and their metadata published
+ATTACHMENT_CHUNK_SIZE = int(get_env_var('ATTACHMENT_CHUNK_SIZE', str(1024 * 1024)))  # 每次部分获取的附件字节数 / Attachment bytes per partial fetch
+TEXT_PART_MAX_BYTES = int(get_env_var('TEXT_PART_MAX_BYTES', '0'))  # 每个文本部分的字节上限，0为不限制 / Byte cap per text part, 0 means unlimited
+PARSE_PROCESS_THRESHOLD = int(get_env_var('PARSE_PROCESS_THRESHOLD', str(8 * 1024 * 1024)))  # 超过此大小(字节)的邮件在子进程中解析 / Messages above this size (bytes) are parsed in a child process
+PARSE_PROCESS_WORKERS = int(get_env_var('PARSE_PROCESS_WORKERS', '2'))  # 解析大邮件的进程数，0为不使用进程池 / Processes parsing large messages, 0 disables the pool
+DEDUP_DB = get_env_var('DEDUP_DB', 'data/dedup.sqlite3')  # 去重索引数据库 / Dedup index database
+DEDUP_MAX_ENTRIES = int(get_env_var('DEDUP_MAX_ENTRIES', '10000'))  # 内存中最多保留的去重条目 / Maximum in-memory dedup entries
+DEDUP_TTL = int(get_env_var('DEDUP_TTL', '604800'))  # 去重条目有效期(秒) / Dedup entry lifetime (seconds)
+NEAR_DUP_WINDOW = float(get_env_var('NEAR_DUP_WINDOW', '0'))  # 近似重复合并窗口(秒)，0为关闭 / Near-duplicate collapsing window (seconds), 0 disables it
+NEAR_DUP_DISTANCE = int(get_env_var('NEAR_DUP_DISTANCE', '3'))  # 视为相似的SimHash最大汉明距离 / Maximum SimHash Hamming distance treated as similar
 
 # MQTT配置 / MQTT settings
 MQTT_BROKER = get_env_var('MQTT_BROKER')  # MQTT代理地址 / MQTT broker address
 MQTT_PORT = int(get_env_var('MQTT_PORT', '8883'))  # MQTT端口 / MQTT port
 MQTT_TOPIC = get_env_var('MQTT_TOPIC', 'email')  # MQTT主题 / MQTT topic
+MQTT_QOS = int(get_env_var('MQTT_QOS', '1'))  # 发布QoS，0为不确认 / Publish QoS, 0 means no acknowledgement
+MQTT_MAX_INFLIGHT = int(get_env_var('MQTT_MAX_INFLIGHT', '20'))  # 未确认消息窗口 / Window of unacknowledged messages
+PUBLISH_QUEUE_SIZE = int(get_env_var('PUBLISH_QUEUE_SIZE', '100'))  # 内存发布队列长度 / In-memory publish queue length
+PUBLISH_QUEUE_TIMEOUT = float(get_env_var('PUBLISH_QUEUE_TIMEOUT', '5'))  # 队列满时最长等待(秒)，之后写入磁盘缓冲 / Longest wait on a full queue (seconds) before spooling to disk
+SPOOL_FILE = get_env_var('SPOOL_FILE', 'data/spool.bin')  # 代理不可用时的磁盘缓冲 / Disk spool used while the broker is unavailable
+MQTT_PROTOCOL = get_env_var('MQTT_PROTOCOL', '3.1.1')  # MQTT协议版本: 3.1.1 或 5 / MQTT protocol version: 3.1.1 or 5
+MQTT_MESSAGE_EXPIRY = int(get_env_var('MQTT_MESSAGE_EXPIRY', '0'))  # MQTT v5 消息过期时间(秒)，0为不过期 / MQTT v5 message expiry (seconds), 0 never expires
+MQTT_TOPIC_ALIAS_MAX = int(get_env_var('MQTT_TOPIC_ALIAS_MAX', '16'))  # MQTT v5 QoS 0时最多使用的主题别名数 / Most MQTT v5 topic aliases used with QoS 0
+PAYLOAD_FORMAT = get_env_var('PAYLOAD_FORMAT', 'text').lower()  # 消息格式: text, json 或 msgpack / Payload format: text, json or msgpack
+PAYLOAD_COMPRESS_THRESHOLD = int(get_env_var('PAYLOAD_COMPRESS_THRESHOLD', '0'))  # json/msgpack超过该字节数时zlib压缩，0为不压缩 / zlib-compress json/msgpack payloads above this many bytes, 0 disables it
+MQTT_MAX_PAYLOAD = int(get_env_var('MQTT_MAX_PAYLOAD', '0'))  # 单条消息的字节上限，超过时分块发布，0为不分块 / Byte cap per message, larger ones are published in chunks, 0 disables chunking
+BODY_MODE = get_env_var('BODY_MODE', 'full').lower()  # 消息正文: full 为完整正文，summary 为摘要加正文ID / Message body: full for the whole body, summary for a snippet plus a body ID
+SNIPPET_LENGTH = int(get_env_var('SNIPPET_LENGTH', '200'))  # summary模式下摘要的最大字符数 / Most characters in a summary-mode snippet
+BODY_CACHE_BYTES = int(get_env_var('BODY_CACHE_BYTES', str(16 * 1024 * 1024)))  # 内存中正文缓存的字节上限 / Byte cap of the in-memory body cache
+BODY_CACHE_DIR = get_env_var('BODY_CACHE_DIR', '')  # 正文缓存的磁盘溢出目录，空为不溢出 / Disk spillover directory of the body cache, empty disables spillover
+BODY_CACHE_DIR_BYTES = int(get_env_var('BODY_CACHE_DIR_BYTES', str(256 * 1024 * 1024)))  # 磁盘溢出目录的字节上限 / Byte cap of the spillover directory
+HA_LEASE_TOPIC = get_env_var('HA_LEASE_TOPIC', '')  # 主备选举的租约主题，空为单实例运行 / Lease topic of the active/standby election, empty runs a single instance
+HA_NODE_ID = get_env_var('HA_NODE_ID', socket.gethostname())  # 本副本在选举中的唯一名称 / Unique name of this replica in the election
+HA_LEASE_SECONDS = float(get_env_var('HA_LEASE_SECONDS', '10'))  # 租约时长(秒)，主节点卡死后待命副本最迟在这之后接管 / Lease length (seconds), the latest a standby takes over after the leader hangs
 
 # MQTT SSL配置 / MQTT SSL settings
 MQTT_SSL = get_env_var('MQTT_SSL', 'True').lower() == 'true'  # 是否启用SSL / Enable SSL
@@ -33,4 +101,19 @@ MQTT_SSL_CA_CERTS = get_env_var('MQTT_SSL_CA_CERTS', 'ca.crt')  # CA证书路径
 MQTT_USERNAME = get_env_var('MQTT_USERNAME')  # MQTT用户名 / MQTT username
 MQTT_PASSWORD = get_env_var('MQTT_PASSWORD')  # MQTT密码 / MQTT password
 
-HTML_PROCESS_URL=get_env_var('HTML_PROCESS_URL','')  # HTML处理URL / HTML processing URL
\ No newline at end of file
+HTML_PROCESS_URL=get_env_var('HTML_PROCESS_URL','')  # HTML处理URL / HTML processing URL
+HTML_PROCESS_MODE = get_env_var('HTML_PROCESS_MODE', 'url' if HTML_PROCESS_URL else 'raw').lower()  # HTML处理方式: raw, url 或 text / HTML handling: raw, url or text
+HTML_PROCESS_CONNECT_TIMEOUT = float(get_env_var('HTML_PROCESS_CONNECT_TIMEOUT', '3.05'))  # HTML处理连接超时(秒) / HTML processor connect timeout (seconds)
+HTML_PROCESS_READ_TIMEOUT = float(get_env_var('HTML_PROCESS_READ_TIMEOUT', '30'))  # HTML处理读取超时(秒) / HTML processor read timeout (seconds)
+HTML_PROCESS_WORKERS = int(get_env_var('HTML_PROCESS_WORKERS', '4'))  # 并发处理HTML的线程数 / Concurrent HTML processing threads
+HTML_CACHE_SIZE = int(get_env_var('HTML_CACHE_SIZE', '256'))  # HTML处理结果缓存条数，0为不缓存 / Cached HTML results, 0 disables the cache
+
+# 日志配置 / Logging settings
+LOG_LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL')
+LOG_FORMATS = ('text', 'json')
+LOG_LEVEL = get_env_var('LOG_LEVEL', 'INFO').upper()  # 日志级别: DEBUG, INFO, WARNING, ERROR 或 CRITICAL / Log level: DEBUG, INFO, WARNING, ERROR or CRITICAL
+LOG_FORMAT = get_env_var('LOG_FORMAT', 'text').lower()  # 日志格式: text 或 json / Log format: text or json
+LOG_QUEUE_SIZE = int(get_env_var('LOG_QUEUE_SIZE', '10000'))  # 等待写出的日志条数上限，超过时丢弃 / Most log records waiting to be written, more are dropped
+LOG_REPEAT_LIMIT = int(get_env_var('LOG_REPEAT_LIMIT', '5'))  # 同一警告或错误在每个窗口内的最多条数，0为不限制 / Most repeats of one warning or error per window, 0 means no limit
+LOG_REPEAT_WINDOW = float(get_env_var('LOG_REPEAT_WINDOW', '60'))  # 重复日志限制的窗口(秒) / Window of the repeat limit (seconds)
+LOG_DEBUG_SAMPLE = float(get_env_var('LOG_DEBUG_SAMPLE', '1'))  # LOG_LEVEL=DEBUG时输出的调试日志比例，0到1 / Share of debug records written with LOG_LEVEL=DEBUG, 0 to 1
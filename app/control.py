@@ -0,0 +1,190 @@
+import select  # 等待唤醒 / Wait for a wake-up
+import socket  # 跨线程唤醒用的套接字对 / Socket pair for cross-thread wake-ups
+import threading  # 线程锁 / Thread lock
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class WatcherControl:
+    """运行时控制一个监听：立即检查、暂停/恢复，以及自适应的轮询间隔
+    Runtime control of one watcher: on-demand checks, pause/resume and the adaptive
+    polling interval
+
+    唤醒通过套接字对传递，因此IMAP线程中的IDLE和轮询等待都可以被HTTP接口立即打断。
+    轮询间隔在没有新邮件时按 backoff 倍数增长到 max_interval，发现新邮件后回到 interval
+    Wake-ups go through a socket pair, so both IDLE and the polling wait in the IMAP thread
+    can be interrupted at once from the HTTP endpoints. The polling interval grows by
+    backoff while no mail arrives, up to max_interval, and drops back to interval as soon
+    as mail is found
+
+    Args:
+        name (str): 监听名称 / Watcher name
+        interval (float): 最短轮询间隔（秒） / Shortest polling interval in seconds
+        max_interval (float): 最长轮询间隔（秒） / Longest polling interval in seconds
+        backoff (float): 每次没有新邮件时间隔的增长倍数 / Interval growth factor after each check without new mail
+    """
+
+    def __init__(self, name: str, interval: float, max_interval: Optional[float] = None, backoff: float = 1.5) -> None:
+        self.name = name
+        self.backoff = max(1.0, backoff)
+        self.paused = False
+        self._lock = threading.Lock()
+        self._reader, self._writer = socket.socketpair()
+        self._reader.setblocking(False)
+        self._writer.setblocking(False)
+        self._stats = {'polls': 0, 'checks': 0}
+        # 已安全发布、等待标记为已读的邮件 / Mail published safely and waiting to be marked as seen
+        self._seen: List[Tuple[int, int]] = []
+        # 解析或发布失败、等待重新获取的邮件 / Mail that failed to parse or publish, waiting to be fetched again
+        self._retry: List[Tuple[int, int]] = []
+        self.set_interval(interval, max_interval)
+
+    @property
+    def wake_socket(self) -> socket.socket:
+        """唤醒时变为可读的套接字，供IDLE等待 / Socket that becomes readable on a wake-up, watched during IDLE"""
+        return self._reader
+
+    @property
+    def interval(self) -> float:
+        with self._lock:
+            return self._interval
+
+    def set_interval(self, interval: float, max_interval: Optional[float] = None) -> None:
+        """设置轮询间隔范围并从最短间隔重新开始 / Set the polling interval range and restart from the shortest
+
+        Args:
+            interval (float): 最短轮询间隔（秒） / Shortest polling interval in seconds
+            max_interval (float): 最长轮询间隔（秒），默认等于最短间隔 / Longest polling interval in seconds, the shortest by default
+        """
+        with self._lock:
+            self.min_interval = max(0.1, interval)
+            self.max_interval = max(self.min_interval, max_interval or self.min_interval)
+            self._interval = self.min_interval
+
+    def adapt(self, found: bool) -> float:
+        """按一次检查的结果调整轮询间隔 / Adjust the polling interval after a check
+
+        Args:
+            found (bool): 这次检查是否发现新邮件 / Whether the check found new mail
+
+        Returns:
+            float: 新的轮询间隔（秒） / New polling interval in seconds
+        """
+        with self._lock:
+            self._stats['checks'] += 1
+            if found:
+                self._interval = self.min_interval
+            else:
+                self._interval = min(self.max_interval, self._interval * self.backoff)
+            return self._interval
+
+    def poll(self) -> None:
+        """请求立即检查新邮件 / Request an immediate check for new mail"""
+        with self._lock:
+            self._stats['polls'] += 1
+        self.wake()
+
+    def pause(self) -> None:
+        self.paused = True
+        self.wake()
+
+    def resume(self) -> None:
+        self.paused = False
+        self.wake()
+
+    def mark_seen(self, uidvalidity: int, uids: List[int]) -> None:
+        """登记可以标记为已读的邮件并唤醒监听，由它在IMAP线程中标记
+        Register mail that may be marked as seen and wake the watcher, which stores the flag
+        in the IMAP thread
+
+        Args:
+            uidvalidity (int): 邮件所属的UIDVALIDITY / UIDVALIDITY the UIDs belong to
+            uids (list): 邮件UID / Email UIDs
+        """
+        if not uids:
+            return
+        with self._lock:
+            self._seen.extend((uidvalidity, uid) for uid in uids)
+        self.wake()
+
+    def take_seen(self, uidvalidity: int) -> List[int]:
+        """取出等待标记为已读的UID，属于其他UIDVALIDITY的已经失效，直接丢弃
+        Take the UIDs waiting to be marked as seen, dropping those of another UIDVALIDITY,
+        which are no longer valid
+
+        Returns:
+            list: 邮件UID / Email UIDs
+        """
+        with self._lock:
+            seen, self._seen = self._seen, []
+        return [uid for validity, uid in seen if validity == uidvalidity]
+
+    def retry(self, uidvalidity: int, uids: List[int]) -> None:
+        """登记需要重新获取的邮件，监听在下一轮检查时获取，不立即唤醒，使重试之间有间隔
+        Register mail to be fetched again; the watcher fetches it on its next round and is
+        not woken for it, so retries are spaced out
+
+        Args:
+            uidvalidity (int): 邮件所属的UIDVALIDITY / UIDVALIDITY the UIDs belong to
+            uids (list): 邮件UID / Email UIDs
+        """
+        if not uids:
+            return
+        with self._lock:
+            self._retry.extend((uidvalidity, uid) for uid in uids)
+
+    def take_retry(self, uidvalidity: int) -> List[int]:
+        """取出需要重新获取的UID（升序），属于其他UIDVALIDITY的直接丢弃
+        Take the UIDs to fetch again (ascending), dropping those of another UIDVALIDITY
+
+        Returns:
+            list: 邮件UID / Email UIDs
+        """
+        with self._lock:
+            retry, self._retry = self._retry, []
+        return sorted({uid for validity, uid in retry if validity == uidvalidity})
+
+    def wake(self) -> None:
+        """打断当前的等待，可以从任意线程调用 / Interrupt the current wait, callable from any thread"""
+        try:
+            self._writer.send(b'\0')
+        except OSError:
+            # 缓冲区已满说明已有未处理的唤醒 / A full buffer means a wake-up is already pending
+            pass
+
+    def consume(self) -> bool:
+        """清除未处理的唤醒 / Clear pending wake-ups
+
+        Returns:
+            bool: 有未处理的唤醒时返回True / True if a wake-up was pending
+        """
+        woken = False
+        while True:
+            try:
+                if not self._reader.recv(4096):
+                    return woken
+                woken = True
+            except OSError:
+                return woken
+
+    def wait(self, timeout: float) -> bool:
+        """阻塞等待唤醒或超时，在IMAP线程中调用 / Block until woken or timed out, called in the IMAP thread
+
+        Returns:
+            bool: 被唤醒返回True，超时返回False / True if woken, False on timeout
+        """
+        select.select([self._reader], [], [], max(0.0, timeout))
+        return self.consume()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'paused': self.paused,
+                'interval': round(self._interval, 3),
+                'min_interval': self.min_interval,
+                'max_interval': self.max_interval,
+                **self._stats,
+            }
+
+    def close(self) -> None:
+        self._reader.close()
+        self._writer.close()
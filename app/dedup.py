@@ -0,0 +1,121 @@
+import os  # 文件操作 / File operations
+import sqlite3  # 磁盘索引 / On-disk index
+import threading  # 线程锁 / Thread lock
+import time  # 时间相关操作 / Time-related operations
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+class DedupStore:
+    """有界的持久化去重索引
+    Bounded, persistent deduplication index
+
+    内存中是带TTL的LRU缓存，磁盘上是WAL模式的SQLite表。内存条目数有上限，
+    磁盘条目超过TTL后被清理，重启后去重仍然有效
+    In memory it is an LRU cache with a TTL, on disk a SQLite table in WAL mode.
+    The number of in-memory entries is capped, disk entries are pruned once they
+    exceed the TTL, and deduplication survives restarts
+
+    Args:
+        path (str): SQLite文件路径 / SQLite file path
+        max_entries (int): 内存中最多保留的条目数 / Maximum number of in-memory entries
+        ttl (float): 条目有效期（秒） / Entry lifetime in seconds
+    """
+
+    # 每插入多少条清理一次过期条目 / Prune expired entries every this many inserts
+    PRUNE_EVERY = 500
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl: float = 7 * 24 * 3600) -> None:
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._cache: 'OrderedDict[str, Tuple[str, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._inserts = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS seen ('
+            'key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, ts REAL NOT NULL)'
+        )
+        self._db.execute('CREATE INDEX IF NOT EXISTS seen_ts ON seen (ts)')
+        self.prune()
+
+    def is_duplicate(self, key: str, fingerprint: str) -> bool:
+        """检查邮件是否已经处理过
+        Check whether a message has already been processed
+
+        Args:
+            key (str): Message-ID或UID键 / Message-ID or UID key
+            fingerprint (str): 发件人、主题和内容的特征 / Fingerprint of sender, subject and content
+
+        Returns:
+            bool: 键存在且特征相同时返回True / True if the key exists with the same fingerprint
+        """
+        return self._lookup(key) == fingerprint
+
+    def add(self, key: str, fingerprint: str) -> None:
+        """记录已处理的邮件
+        Record a processed message
+
+        Args:
+            key (str): Message-ID或UID键 / Message-ID or UID key
+            fingerprint (str): 发件人、主题和内容的特征 / Fingerprint of sender, subject and content
+        """
+        now = time.time()
+        with self._lock:
+            self._remember(key, fingerprint, now)
+            self._db.execute(
+                'INSERT OR REPLACE INTO seen (key, fingerprint, ts) VALUES (?, ?, ?)',
+                (key, fingerprint, now)
+            )
+            self._inserts += 1
+            if self._inserts % self.PRUNE_EVERY == 0:
+                self._prune_locked(now)
+
+    def prune(self) -> None:
+        """删除磁盘上过期的条目 / Delete expired entries from disk"""
+        with self._lock:
+            self._prune_locked(time.time())
+
+    def close(self) -> None:
+        """关闭数据库 / Close the database"""
+        with self._lock:
+            self._db.close()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def _lookup(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                fingerprint, ts = entry
+                if now - ts <= self.ttl:
+                    self._cache.move_to_end(key)
+                    return fingerprint
+                del self._cache[key]
+                return None
+
+            # 内存未命中时查询磁盘 / Fall back to disk on a memory miss
+            row = self._db.execute(
+                'SELECT fingerprint, ts FROM seen WHERE key = ? AND ts >= ?', (key, now - self.ttl)
+            ).fetchone()
+            if row is None:
+                return None
+            self._remember(key, row[0], row[1])
+            return row[0]
+
+    def _remember(self, key: str, fingerprint: str, ts: float) -> None:
+        self._cache[key] = (fingerprint, ts)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def _prune_locked(self, now: float) -> None:
+        self._db.execute('DELETE FROM seen WHERE ts < ?', (now - self.ttl,))
@@ -0,0 +1,256 @@
+import asyncio  # 领导权变化通知 / Leadership change notification
+import json  # 租约和检查点消息 / Lease and checkpoint messages
+import logging  # 日志 / Logging
+import threading  # 线程锁 / Thread lock
+import time  # 租约计时 / Lease timing
+from typing import Any, Dict, Optional, Tuple
+
+import paho.mqtt.client as mqtt  # MQTT客户端 / MQTT client
+
+log = logging.getLogger('email2mqtt.election')
+
+STANDBY, CLAIMING, LEADER = 'standby', 'claiming', 'leader'
+
+
+class LeaderElection:
+    """通过MQTT代理选出唯一的主节点，其余副本待命
+    Elect a single leader through the MQTT broker, leaving the other replicas on standby
+
+    租约是 topic 上的保留消息 {"node", "until"}，主节点每 lease/3 秒续约一次。代理按顺序
+    转发同一主题的消息，所以各节点都以最后收到的租约消息为准：认领从代理回来并且之后
+    settle 秒内没有其他节点的租约消息才成为主节点，主节点收到其他节点的租约消息就退位。遗嘱消息
+    {"node", "released": true} 在主节点掉线时由代理立即发布，正常停止时主节点自己发布，
+    待命节点随即认领；主节点卡死时租约在 lease 秒后过期。主节点每保存一次UID检查点就把它
+    作为保留消息发布到 topic/checkpoint/<监听名称>，接任的节点从这里继续
+    The lease is a retained message {"node", "until"} on topic, renewed by the leader every
+    lease/3 seconds. The broker forwards messages on one topic in order, so every node goes
+    by the last lease message it received: a claim becomes leadership only once it has come
+    back from the broker and no other node's lease message follows within settle seconds, and a leader that receives another
+    node's lease message steps down. The will {"node", "released": true} is published by the
+    broker as soon as the leader drops off, or by the leader itself on a clean shutdown, and a
+    standby claims at once; a leader that hangs lets the lease expire after lease seconds.
+    Every UID checkpoint the leader saves is published retained on
+    topic/checkpoint/<watcher name>, and the node taking over resumes from there
+
+    Args:
+        client (mqtt.Client): 尚未连接的MQTT客户端，遗嘱在这里设置 / MQTT client not yet connected, the will is set here
+        topic (str): 租约主题 / Lease topic
+        node (str): 本节点的唯一名称 / Unique name of this node
+        lease (float): 租约时长（秒），也是主节点卡死后的最长接管时间 / Lease length in seconds, also the longest takeover time after the leader hangs
+    """
+
+    def __init__(self, client: mqtt.Client, topic: str, node: str, lease: float = 10.0) -> None:
+        self.client = client
+        self.topic = topic
+        self.node = node
+        self.lease = max(1.0, lease)
+        self.settle = min(1.0, self.lease / 5)
+        self.state = STANDBY
+        self._lock = threading.Lock()
+        self._owner: Optional[str] = None  # 最后一条租约消息的节点 / Node of the last lease message
+        self._owner_seen = 0.0  # 收到它的时间 / When it was received
+        self._released = True
+        self._fresh = False  # 最后的租约消息是实时的而不是保留的 / The last lease message was live rather than retained
+        self._subscribed_at: Optional[float] = None
+        self._claimed_at = 0.0
+        self._renewed_at = 0.0
+        self._checkpoints: Dict[str, Tuple[int, int]] = {}
+        self._stats = {'elections': 0, 'step_downs': 0}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        # 领导权每次变化时设置，由使用方清除，在事件循环中创建本对象 / Set on every leadership change and cleared by the consumer; create this object inside the event loop
+        self.changed = asyncio.Event()
+        client.will_set(topic, self._release_payload(), qos=1, retain=True)
+        client.message_callback_add(topic, self._on_lease)
+        client.message_callback_add(f"{topic}/checkpoint/#", self._on_checkpoint)
+
+    @property
+    def is_leader(self) -> bool:
+        return self.state == LEADER
+
+    def subscribe(self) -> None:
+        """连接建立后订阅租约和检查点，在on_connect中调用 / Subscribe to the lease and checkpoints, called from on_connect"""
+        with self._lock:
+            self._subscribed_at = time.monotonic()
+        self.client.subscribe([(self.topic, 1), (f"{self.topic}/checkpoint/#", 1)])
+        self._notify()
+
+    def disconnected(self) -> None:
+        """MQTT连接断开，在on_disconnect中调用 / The MQTT connection dropped, called from on_disconnect
+
+        代理会发布遗嘱，其他节点随即接管，所以主节点立刻退位，不等租约过期
+        The broker publishes the will and another node takes over, so the leader steps down
+        at once instead of waiting for the lease to expire
+        """
+        with self._lock:
+            self._subscribed_at = None
+            if self.state != STANDBY:
+                self._step_down('MQTT连接断开 / MQTT connection lost')
+        self._notify()
+
+    def publish_checkpoint(self, name: str, uidvalidity: int, last_uid: int) -> None:
+        """发布主节点保存的UID检查点 / Publish a UID checkpoint saved by the leader"""
+        if self.is_leader and '+' not in name and '#' not in name:
+            # 名称含通配符时无法作为主题发布 / A name containing wildcards cannot be published as a topic
+            payload = json.dumps({'uidvalidity': uidvalidity, 'last_uid': last_uid, 'node': self.node})
+            self.client.publish(f"{self.topic}/checkpoint/{name}", payload, qos=1, retain=True)
+
+    def checkpoint(self, name: str) -> Optional[Dict[str, int]]:
+        """上一任主节点发布的检查点 / Checkpoint published by the previous leader"""
+        with self._lock:
+            found = self._checkpoints.get(name)
+        return {'uidvalidity': found[0], 'last_uid': found[1]} if found else None
+
+    def release(self) -> None:
+        """正常停止时交出领导权，待命节点无需等待租约过期 / Hand over leadership on a clean shutdown so a standby need not wait for the lease to expire"""
+        with self._lock:
+            leading = self.state != STANDBY
+            self.state = STANDBY
+        if leading:
+            info = self.client.publish(self.topic, self._release_payload(), qos=1, retain=True)
+            try:
+                info.wait_for_publish(2)
+            except Exception:
+                pass
+
+    async def run(self) -> None:
+        """按租约时钟认领、续约和退位，每次领导权变化时设置 changed
+        Claim, renew and step down on the lease clock, setting changed on every leadership change
+        """
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        leading = False
+        try:
+            while True:
+                delay = self._tick()
+                # 状态也会在paho线程中改变，因此与上次通知的状态比较 / The state also changes in paho's thread, so compare with the last notified state
+                if self.is_leader != leading:
+                    leading = self.is_leader
+                    self.changed.set()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wake.clear()
+        finally:
+            await asyncio.to_thread(self.release)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            now = time.monotonic()
+            return {
+                'node': self.node,
+                'state': self.state,
+                'leader': None if self._released else self._owner,
+                'lease_age': round(now - self._owner_seen, 3) if self._owner_seen else None,
+                'lease_seconds': self.lease,
+                'checkpoints': {name: {'uidvalidity': v, 'last_uid': u} for name, (v, u) in self._checkpoints.items()},
+                **self._stats,
+            }
+
+    def _tick(self) -> float:
+        # 推进状态机，返回距离下一次检查的秒数 / Advance the state machine, returning the seconds until the next check
+        renew = self.lease / 3
+        now = time.monotonic()
+        with self._lock:
+            if self._subscribed_at is None:
+                return renew
+            if self.state == LEADER:
+                if self._owner != self.node or self._released:
+                    self._step_down(f"节点 {self._owner} 持有租约 / node {self._owner} holds the lease")
+                elif now - self._owner_seen > self.lease - self.settle:
+                    # 自己的续约一直没有回来，比待命节点认领早 settle 秒退位
+                    # Our own renewals have stopped coming back; step down settle seconds before a standby claims
+                    self._step_down('续约超时 / lease renewal timed out')
+                elif now - self._renewed_at >= renew:
+                    self._renewed_at = now
+                    self._publish_lease()
+                deadline = self.lease - self.settle - (now - self._owner_seen)
+                return max(0.05, min(renew - (now - self._renewed_at), deadline))
+            if self.state == CLAIMING:
+                if self._owner != self.node and self._owner_seen > self._claimed_at:
+                    # 认领之后收到了其他节点的租约 / Another node's lease arrived after our claim
+                    self.state = STANDBY
+                elif self._owner == self.node and self._owner_seen >= self._claimed_at and now - self._claimed_at >= self.settle:
+                    # 自己的认领已经从代理回来，之后 settle 秒内没有其他节点的租约
+                    # Our own claim came back from the broker and no other node's lease followed within settle
+                    self.state = LEADER
+                    self._renewed_at = self._claimed_at
+                    self._stats['elections'] += 1
+                    log.info("成为主节点 / Became the leader", extra={'node': self.node})
+                    return renew
+                elif now - self._claimed_at > self.lease:
+                    # 认领没有回来，重新开始 / The claim never came back, start over
+                    self.state = STANDBY
+                else:
+                    return self.settle / 2
+            # 待命：租约空缺或过期，并且订阅后至少观察了一个续约周期才认领
+            # Standby: claim when the lease is vacant or expired, after watching for at least one renewal period since subscribing
+            vacant = self._released or self._owner == self.node or now - self._owner_seen > self.lease
+            # 保留消息可能是旧的，只有实时收到的释放才立即认领，否则先等一个续约周期让在任的主节点出现
+            # A retained message may be stale, so only a live release is claimed at once; otherwise
+            # wait one renewal period for a sitting leader to show up
+            if vacant and (now - self._subscribed_at >= renew or (self._fresh and self._owner_seen > self._subscribed_at)):
+                self.state = CLAIMING
+                self._claimed_at = now
+                self._publish_lease()
+                return self.settle / 2
+            if vacant:
+                return max(0.05, renew - (now - self._subscribed_at))
+            return max(0.05, self.lease - (now - self._owner_seen))
+
+    def _step_down(self, reason: str) -> None:
+        # 调用时持有锁 / Called with the lock held
+        if self.state == LEADER:
+            self._stats['step_downs'] += 1
+            log.warning("退出主节点: %s", reason, extra={'node': self.node})
+        self.state = STANDBY
+
+    def _publish_lease(self) -> None:
+        payload = json.dumps({'node': self.node, 'until': time.time() + self.lease})
+        self.client.publish(self.topic, payload, qos=1, retain=True)
+
+    def _release_payload(self) -> str:
+        return json.dumps({'node': self.node, 'released': True})
+
+    def _on_lease(self, client: mqtt.Client, userdata: Any, message: mqtt.MQTTMessage) -> None:
+        # 在paho的网络线程中调用 / Called in paho's network thread
+        try:
+            lease = json.loads(message.payload) if message.payload else {}
+        except ValueError:
+            lease = {}
+        node = lease.get('node')
+        with self._lock:
+            self._fresh = not message.retain
+            if lease.get('released') or not node:
+                # 只有当前持有者的释放才使租约空缺，旧主节点迟到的遗嘱不算
+                # Only a release by the current holder vacates the lease, not a late will from an old leader
+                if node is None or node == self._owner or self._owner is None:
+                    self._released = True
+                    self._owner = node
+                    self._owner_seen = time.monotonic()
+            elif message.retain and lease.get('until', 0) < time.time():
+                # 订阅时收到的过期租约 / An expired lease received on subscribing
+                self._owner, self._released, self._owner_seen = node, True, time.monotonic()
+            else:
+                self._owner, self._released, self._owner_seen = node, False, time.monotonic()
+        self._notify()
+
+    def _on_checkpoint(self, client: mqtt.Client, userdata: Any, message: mqtt.MQTTMessage) -> None:
+        name = message.topic[len(self.topic) + len('/checkpoint/'):]
+        try:
+            data = json.loads(message.payload)
+            checkpoint = (int(data['uidvalidity']), int(data['last_uid']))
+        except (ValueError, KeyError, TypeError):
+            return
+        with self._lock:
+            self._checkpoints[name] = checkpoint
+
+    def _notify(self) -> None:
+        loop, wake = self._loop, self._wake
+        if loop is not None and wake is not None:
+            try:
+                loop.call_soon_threadsafe(wake.set)
+            except RuntimeError:
+                # 事件循环已关闭 / The event loop is closed
+                pass
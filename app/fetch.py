@@ -0,0 +1,326 @@
+import binascii  # base64解码 / base64 decoding
+import quopri  # quoted-printable解码 / quoted-printable decoding
+import re  # 正则表达式模块 / Regular expression module
+from email.header import decode_header, make_header
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import unquote_to_bytes
+
+# FETCH响应中每封邮件的开头，例如 b'12 (UID 34 ...' / Start of each message in a FETCH response
+MESSAGE_START = re.compile(rb'^\d+ \(')
+# 行尾的字面量长度标记 / Literal length marker at the end of a line
+LITERAL_MARKER = re.compile(rb'\{(\d+)\}$')
+
+
+def compress_uids(uids: Iterable[int]) -> str:
+    """把UID列表压缩成IMAP序列集合
+    Compress a list of UIDs into an IMAP sequence set
+
+    例如 [1, 2, 3, 5, 7, 8] -> '1:3,5,7:8'
+    e.g. [1, 2, 3, 5, 7, 8] -> '1:3,5,7:8'
+
+    Args:
+        uids (Iterable[int]): UID列表 / List of UIDs
+
+    Returns:
+        str: IMAP序列集合 / IMAP sequence set
+    """
+    ranges: List[Tuple[int, int]] = []
+    for uid in sorted(set(uids)):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1] = (ranges[-1][0], uid)
+        else:
+            ranges.append((uid, uid))
+    return ','.join(str(start) if start == end else f'{start}:{end}' for start, end in ranges)
+
+
+def chunked(items: List[Any], size: int) -> Iterator[List[Any]]:
+    """按固定大小切分列表
+    Split a list into fixed-size chunks
+
+    Args:
+        items (list): 待切分的列表 / List to split
+        size (int): 每块大小 / Chunk size
+
+    Returns:
+        Iterator[list]: 依次返回每一块 / Yields each chunk in turn
+    """
+    size = max(1, size)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def iter_fetch_response(data: List[Any]) -> Iterator[Dict[str, Any]]:
+    """逐封解析多邮件FETCH响应
+    Parse a multi-message FETCH response one message at a time
+
+    imaplib把字面量拆成 (前缀, 内容) 元组，其余部分是字节串。每封邮件解析完立即返回，
+    调用方可以边解析边处理，不必先构建整个结果列表
+    imaplib splits literals into (prefix, content) tuples and leaves the rest as bytes.
+    Each message is yielded as soon as it is parsed, so callers can process as they go
+    instead of building the whole result list first
+
+    Args:
+        data (list): imaplib FETCH返回的数据 / Data returned by an imaplib FETCH
+
+    Returns:
+        Iterator[dict]: 每封邮件的数据项，例如 {'UID': b'5', 'RFC822': b'...'}
+        Data items of each message, e.g. {'UID': b'5', 'RFC822': b'...'}
+    """
+    segments: List[Tuple[bytes, Optional[bytes]]] = []
+    for item in data:
+        if item is None:
+            continue
+        if isinstance(item, tuple):
+            text, literal = item
+        else:
+            text, literal = item, None
+        if MESSAGE_START.match(text) and segments:
+            yield _parse_message(segments)
+            segments = []
+        segments.append((text, literal))
+    if segments:
+        yield _parse_message(segments)
+
+
+def _parse_message(segments: List[Tuple[bytes, Optional[bytes]]]) -> Dict[str, Any]:
+    """解析单封邮件的FETCH数据项
+    Parse the FETCH data items of a single message
+    """
+    tokens: List[Any] = []
+    for text, literal in segments:
+        if literal is not None:
+            text = LITERAL_MARKER.sub(b'', text.rstrip())
+        tokens.extend(_tokenize(text))
+        if literal is not None:
+            tokens.append(literal)
+
+    # 跳过序号，读取括号内的名称/值对 / Skip the sequence number and read name/value pairs
+    values, _ = _read_list(tokens, 2)
+    items: Dict[str, Any] = {}
+    for index in range(0, len(values) - 1, 2):
+        name = values[index]
+        if isinstance(name, bytes):
+            # 去掉部分获取的起始偏移，例如 BODY[1]<0> / Drop partial fetch origins such as BODY[1]<0>
+            key = re.sub(r'<\d+>$', '', name.decode('ascii', 'replace').upper())
+            items[key] = values[index + 1]
+    return items
+
+
+def _tokenize(text: bytes) -> List[Any]:
+    """把IMAP响应文本拆分为记号，括号为str，其余为bytes或None(NIL)
+    Split IMAP response text into tokens; parentheses are str, the rest bytes or None (NIL)
+    """
+    tokens: List[Any] = []
+    i, length = 0, len(text)
+    while i < length:
+        char = text[i:i + 1]
+        if char in b' \r\n':
+            i += 1
+        elif char in b'()':
+            tokens.append(char.decode())
+            i += 1
+        elif char == b'"':
+            j, value = i + 1, bytearray()
+            while j < length and text[j:j + 1] != b'"':
+                if text[j:j + 1] == b'\\':
+                    j += 1
+                value += text[j:j + 1]
+                j += 1
+            tokens.append(bytes(value))
+            i = j + 1
+        else:
+            # 原子，方括号内可以包含空格，例如 BODY[HEADER.FIELDS (FROM)]
+            # Atom; brackets may contain spaces, e.g. BODY[HEADER.FIELDS (FROM)]
+            j, depth = i, 0
+            while j < length:
+                c = text[j:j + 1]
+                if c == b'[':
+                    depth += 1
+                elif c == b']':
+                    depth -= 1
+                elif depth == 0 and (c in b' ()"' or c in b'\r\n'):
+                    break
+                j += 1
+            atom = text[i:j]
+            tokens.append(None if atom.upper() == b'NIL' else atom)
+            i = j
+    return tokens
+
+
+def _read_list(tokens: List[Any], start: int) -> Tuple[List[Any], int]:
+    """从 start 位置读取一个括号列表的内容
+    Read the contents of a parenthesized list starting at start
+    """
+    values: List[Any] = []
+    i = start
+    while i < len(tokens):
+        token = tokens[i]
+        if token == '(':
+            nested, i = _read_list(tokens, i + 1)
+            values.append(nested)
+        elif token == ')':
+            return values, i + 1
+        else:
+            values.append(token)
+            i += 1
+    return values, i
+
+
+def find_text_parts(structure: List[Any], prefix: str = '') -> List[Dict[str, str]]:
+    """从BODYSTRUCTURE中找出非附件的text/plain和text/html部分
+    Find the non-attachment text/plain and text/html parts in a BODYSTRUCTURE
+
+    Args:
+        structure (list): 解析后的BODYSTRUCTURE / Parsed BODYSTRUCTURE
+        prefix (str): 父部分的段号，顶层为空 / Section number of the parent part, empty at top level
+
+    Returns:
+        list: 每个部分的 {'section', 'type', 'charset', 'encoding'}
+        {'section', 'type', 'charset', 'encoding'} for each part
+    """
+    if structure and isinstance(structure[0], list):
+        # 多部分：先列出所有子部分，再是子类型 / Multipart: child parts first, then the subtype
+        parts: List[Dict[str, str]] = []
+        for index, child in enumerate(structure, 1):
+            if not isinstance(child, list):
+                break
+            parts.extend(find_text_parts(child, f'{prefix}{index}.'))
+        return parts
+
+    section = prefix.rstrip('.') or '1'
+    content_type = f"{_text(structure[0])}/{_text(structure[1])}".lower()
+    if content_type not in ('text/plain', 'text/html'):
+        return []
+    # text类型的第10个字段是Content-Disposition / Field 10 of a text part is Content-Disposition
+    disposition = structure[9] if len(structure) > 9 else None
+    if isinstance(disposition, list) and disposition and _text(disposition[0]).lower() == 'attachment':
+        return []
+    params = structure[2] if isinstance(structure[2], list) else []
+    charset = ''
+    for index in range(0, len(params) - 1, 2):
+        if _text(params[index]).lower() == 'charset':
+            charset = _text(params[index + 1])
+    return [{
+        'section': section,
+        'type': content_type,
+        'charset': charset or 'utf-8',
+        'encoding': _text(structure[5]).lower() or '7bit'
+    }]
+
+
+def find_attachment_parts(structure: List[Any], prefix: str = '') -> List[Dict[str, Any]]:
+    """从BODYSTRUCTURE中找出附件，即find_text_parts之外的所有叶子部分
+    Find the attachments in a BODYSTRUCTURE, that is every leaf part that find_text_parts does not return
+
+    内嵌邮件(message/rfc822)作为一个整体的附件 / An embedded message (message/rfc822) is one attachment as a whole
+
+    Args:
+        structure (list): 解析后的BODYSTRUCTURE / Parsed BODYSTRUCTURE
+        prefix (str): 父部分的段号，顶层为空 / Section number of the parent part, empty at top level
+
+    Returns:
+        list: 每个附件的 {'section', 'type', 'encoding', 'size', 'filename'}
+        {'section', 'type', 'encoding', 'size', 'filename'} for each attachment
+    """
+    if structure and isinstance(structure[0], list):
+        parts: List[Dict[str, Any]] = []
+        for index, child in enumerate(structure, 1):
+            if not isinstance(child, list):
+                break
+            parts.extend(find_attachment_parts(child, f'{prefix}{index}.'))
+        return parts
+    if len(structure) < 7 or find_text_parts(structure, prefix):
+        return []
+
+    content_type = f"{_text(structure[0])}/{_text(structure[1])}".lower()
+    # 扩展字段的位置：text多一个行数，message/rfc822多信封、结构和行数
+    # Where the extension fields start: text adds a line count, message/rfc822 an envelope, a structure and a line count
+    if content_type.startswith('text/'):
+        disposition_index = 9
+    elif content_type == 'message/rfc822':
+        disposition_index = 11
+    else:
+        disposition_index = 8
+    disposition = structure[disposition_index] if len(structure) > disposition_index else None
+    disposition_params = disposition[1] if isinstance(disposition, list) and len(disposition) > 1 else None
+    filename = _parameter(disposition_params, 'filename') or _parameter(structure[2], 'name')
+    try:
+        size = int(structure[6])
+    except (TypeError, ValueError):
+        size = 0
+    return [{
+        'section': prefix.rstrip('.') or '1',
+        'type': content_type,
+        'encoding': _text(structure[5]).lower() or '7bit',
+        'size': size,
+        'filename': filename,
+    }]
+
+
+def decode_transfer_encoding(data: bytes, encoding: str) -> bytes:
+    """解码Content-Transfer-Encoding，兼容被截断的部分获取
+    Decode Content-Transfer-Encoding, tolerating truncated partial fetches
+
+    Args:
+        data (bytes): 原始段内容 / Raw section content
+        encoding (str): 传输编码 / Transfer encoding
+
+    Returns:
+        bytes: 解码后的内容 / Decoded content
+    """
+    if encoding == 'base64':
+        compact = b''.join(data.split())
+        # 截断后可能不是4的倍数 / Truncation may leave a length that is not a multiple of 4
+        compact = compact[:len(compact) - len(compact) % 4]
+        return binascii.a2b_base64(compact)
+    if encoding == 'quoted-printable':
+        return quopri.decodestring(data)
+    return data
+
+
+def _parameter(params: Any, name: str) -> str:
+    """读取BODYSTRUCTURE参数列表中的参数，解码RFC 2231续行和RFC 2047编码字
+    Read a parameter from a BODYSTRUCTURE parameter list, decoding RFC 2231 continuations
+    and RFC 2047 encoded words
+    """
+    if not isinstance(params, list):
+        return ''
+    # 支持UTF8=ACCEPT的服务器可能直接发送UTF-8 / Servers with UTF8=ACCEPT may send raw UTF-8
+    values = {
+        _text(params[index]).lower(): params[index + 1].decode('utf-8', 'replace')
+        if isinstance(params[index + 1], bytes) else _text(params[index + 1])
+        for index in range(0, len(params) - 1, 2)
+    }
+    if name in values:
+        value = values[name]
+        try:
+            return str(make_header(decode_header(value))) if '=?' in value else value
+        except (UnicodeDecodeError, LookupError, ValueError):
+            return value
+    # RFC 2231: name*=utf-8''..., 或 name*0*=..., name*1*=... / or name*0*=..., name*1*=...
+    pieces = sorted(
+        (int(key[len(name) + 1:].rstrip('*') or 0), key.endswith('*'), value) for key, value in values.items()
+        if key.startswith(name + '*') and key[len(name) + 1:].rstrip('*').isdigit() or key == name + '*'
+    )
+    if not pieces:
+        return ''
+    if not any(encoded for _, encoded, _ in pieces):
+        return ''.join(value for _, _, value in pieces)
+    # 只有第一段带 charset'language' 前缀，编码的段是百分号编码 / Only the first piece carries charset'language', encoded pieces are percent-encoded
+    charset = 'utf-8'
+    data = b''
+    for position, (_, encoded, value) in enumerate(pieces):
+        if position == 0 and encoded and value.count("'") >= 2:
+            charset, _, value = value.split("'", 2)
+        data += unquote_to_bytes(value) if encoded else value.encode('utf-8')
+    try:
+        return data.decode(charset or 'utf-8', 'replace')
+    except LookupError:
+        return data.decode('utf-8', 'replace')
+
+
+def _text(value: Any) -> str:
+    """把BODYSTRUCTURE字段转换为字符串 / Convert a BODYSTRUCTURE field to str"""
+    if isinstance(value, bytes):
+        return value.decode('ascii', 'replace')
+    return '' if value is None else str(value)
@@ -0,0 +1,164 @@
+import hashlib  # blake2b哈希 / blake2b hashing
+import re  # 正则表达式模块 / Regular expression module
+import threading  # 线程锁 / Thread lock
+import time  # 时间相关操作 / Time-related operations
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+WORD = re.compile(r'\w+')
+DIGIT = re.compile(r'\d')
+# 参与SimHash计算的最大字符数 / Maximum characters fed into the SimHash
+SIMHASH_MAX_CHARS = 8192
+
+
+class ContentHasher:
+    """对所有解码后的文本部分做流式blake2b摘要
+    Streaming blake2b digest over every decoded text part
+
+    每个部分前写入内容类型和长度，因此 "ab"+"c" 和 "a"+"bc" 的结果不同
+    Each part is prefixed with its content type and length, so "ab"+"c" and "a"+"bc"
+    hash differently
+    """
+
+    def __init__(self) -> None:
+        self._hash = hashlib.blake2b(digest_size=16)
+        self._parts = 0
+
+    def update(self, content_type: str, payload: bytes) -> None:
+        self._hash.update(f'{content_type}:{len(payload)}:'.encode('ascii'))
+        self._hash.update(payload)
+        self._parts += 1
+
+    def hexdigest(self) -> str:
+        """没有任何文本部分时返回空字符串 / Empty string when there were no text parts"""
+        return self._hash.hexdigest() if self._parts else ''
+
+
+def message_fingerprint(sender: str, subject: str, content_hash: str) -> str:
+    """由发件人、主题和内容摘要组成的去重特征 / Dedup fingerprint made of sender, subject and content digest"""
+    digest = hashlib.blake2b(digest_size=16)
+    for field in (sender, subject, content_hash):
+        digest.update(field.encode('utf-8', 'surrogatepass'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def simhash(text: str) -> int:
+    """计算文本的64位SimHash，数字统一替换为0，使只有编号或时间不同的告警相似
+    Compute a 64-bit SimHash of the text, with every digit replaced by 0 so alerts that
+    differ only in counters or timestamps come out similar
+
+    Args:
+        text (str): 主题和正文 / Subject and body
+
+    Returns:
+        int: 64位指纹 / 64-bit fingerprint
+    """
+    words = WORD.findall(DIGIT.sub('0', text[:SIMHASH_MAX_CHARS].lower()))
+    features = set(zip(words, words[1:])) if len(words) > 1 else {(word,) for word in words}
+    if not features:
+        return 0
+    bits = [format(int.from_bytes(hashlib.blake2b(' '.join(feature).encode('utf-8'), digest_size=8).digest(), 'big'), '064b')
+            for feature in features]
+    half = len(bits) / 2
+    # 按位统计1的个数，超过一半则该位为1 / Count the ones per bit position, set the bit when they are the majority
+    return int(''.join('1' if column.count('1') > half else '0' for column in zip(*bits)), 2)
+
+
+class NearDuplicateIndex:
+    """时间窗口内的近似重复检测，把告警风暴合并为一次发布加一个计数
+    Time-windowed near-duplicate detection that collapses an alert storm into one
+    publish plus a count
+
+    每组的第一封邮件正常发布，窗口内与其SimHash汉明距离不超过 max_distance 的后续邮件被抑制并计数；
+    窗口结束后由 expired() 返回有抑制计数的组，用于发布汇总。
+    64位指纹被分成 max_distance+1 段建立索引，距离不超过阈值的两个指纹至少有一段完全相同
+    The first message of a group is published normally, later messages within the window
+    whose SimHash is within max_distance bits of it are suppressed and counted; once the
+    window ends expired() returns the groups with suppressed messages so a summary can
+    be published. The 64-bit fingerprints are indexed in max_distance+1 bands, and two
+    fingerprints within the threshold always share at least one band exactly
+
+    Args:
+        window (float): 窗口长度（秒） / Window length in seconds
+        max_distance (int): 视为相似的最大汉明距离 / Maximum Hamming distance considered similar
+    """
+
+    def __init__(self, window: float, max_distance: int = 3) -> None:
+        self.window = window
+        self.max_distance = max(0, min(max_distance, 15))
+        bands = self.max_distance + 1
+        self._bands = [(64 * i // bands, 64 * (i + 1) // bands) for i in range(bands)]
+        self._groups: Dict[int, Dict[str, Any]] = {}
+        self._index: Dict[Tuple[str, int, int], List[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def check(self, scope: str, fingerprint: int, info: Dict[str, Any], now: Optional[float] = None) -> bool:
+        """检查并记录一封邮件
+        Check and record a message
+
+        Args:
+            scope (str): 只在同一范围内比较，例如主题和发件人 / Only compare within a scope, e.g. topic and sender
+            fingerprint (int): simhash() 的结果 / Result of simhash()
+            info (dict): 新建组时保存的信息，用于之后的汇总 / Stored when a group starts, for the later summary
+
+        Returns:
+            bool: 是近似重复、应被抑制时返回True / True when it is a near duplicate and should be suppressed
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            for group_id in self._candidates(scope, fingerprint):
+                group = self._groups.get(group_id)
+                if group and now - group['start'] < self.window and \
+                        bin(group['fingerprint'] ^ fingerprint).count('1') <= self.max_distance:
+                    group['count'] += 1
+                    group['last'] = now
+                    return True
+            group_id = self._next_id
+            self._next_id += 1
+            self._groups[group_id] = {
+                'scope': scope, 'fingerprint': fingerprint, 'start': now, 'last': now, 'count': 0, 'info': info
+            }
+            for key in self._band_keys(scope, fingerprint):
+                self._index.setdefault(key, []).append(group_id)
+            return False
+
+    def expired(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """移除窗口已结束的组，返回其中有抑制计数的组
+        Remove groups whose window has ended and return those with suppressed messages
+
+        Returns:
+            list: [{'info': ..., 'count': 抑制数 / suppressed, 'start': ..., 'last': ...}]
+        """
+        now = time.time() if now is None else now
+        finished = []
+        with self._lock:
+            for group_id, group in list(self._groups.items()):
+                if now - group['start'] < self.window:
+                    continue
+                del self._groups[group_id]
+                for key in self._band_keys(group['scope'], group['fingerprint']):
+                    members = self._index.get(key)
+                    if members:
+                        members.remove(group_id)
+                        if not members:
+                            del self._index[key]
+                if group['count']:
+                    finished.append(group)
+        return finished
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._groups)
+
+    def _band_keys(self, scope: str, fingerprint: int) -> Iterable[Tuple[str, int, int]]:
+        for index, (low, high) in enumerate(self._bands):
+            yield scope, index, (fingerprint >> low) & ((1 << (high - low)) - 1)
+
+    def _candidates(self, scope: str, fingerprint: int) -> List[int]:
+        candidates: List[int] = []
+        for key in self._band_keys(scope, fingerprint):
+            for group_id in self._index.get(key, ()):
+                if group_id not in candidates:
+                    candidates.append(group_id)
+        return candidates
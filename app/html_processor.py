@@ -0,0 +1,144 @@
+import hashlib  # 计算HTML内容哈希 / Hash HTML content
+import threading  # 线程锁 / Thread lock
+import time  # 时间相关操作 / Time-related operations
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, TypeVar
+
+if TYPE_CHECKING:
+    import requests  # 只在url模式下使用，首次请求时才导入 / Only used in url mode, imported on the first request
+
+T = TypeVar('T')
+R = TypeVar('R')
+
+
+class HtmlProcessor:
+    """带连接复用、超时、并发和缓存的HTML_PROCESS_URL客户端
+    HTML_PROCESS_URL client with keep-alive, timeouts, concurrency and caching
+
+    相同的HTML（按内容哈希）只会提交一次，之后直接从LRU缓存返回
+    Identical HTML (by content hash) is posted only once and then served from an LRU cache
+
+    Args:
+        url (str): HTML处理服务地址 / HTML processing service URL
+        connect_timeout (float): 连接超时（秒） / Connect timeout in seconds
+        read_timeout (float): 读取超时（秒） / Read timeout in seconds
+        workers (int): 并发工作线程数 / Number of concurrent worker threads
+        cache_size (int): 缓存的结果数量，0表示不缓存 / Number of cached results, 0 disables caching
+    """
+
+    def __init__(self, url: str, connect_timeout: float = 3.05, read_timeout: float = 30,
+                 workers: int = 4, cache_size: int = 256) -> None:
+        self.url = url
+        self.timeout = (connect_timeout, read_timeout)
+        self.workers = max(1, workers)
+        self.cache_size = cache_size
+        self._cache: 'OrderedDict[str, str]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._session: Optional['requests.Session'] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stats: Dict[str, float] = {
+            'requests': 0, 'errors': 0, 'cache_hits': 0, 'cache_misses': 0,
+            'latency_total': 0.0, 'latency_max': 0.0
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.url != ''
+
+    def process(self, html: str) -> str:
+        """提交HTML并返回处理结果，失败时抛出异常
+        Post HTML and return the processed result, raising on failure
+
+        Args:
+            html (str): 解码后的HTML / Decoded HTML
+
+        Returns:
+            str: 处理后的内容 / Processed content
+        """
+        key = hashlib.sha256(html.encode('utf-8', 'surrogatepass')).hexdigest()
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                self._stats['cache_hits'] += 1
+                return cached
+            self._stats['cache_misses'] += 1
+
+        start = time.perf_counter()
+        try:
+            response = self._get_session().post(self.url, data={'html': html}, timeout=self.timeout)
+            response.raise_for_status()
+            result = response.text
+        except Exception:
+            with self._lock:
+                self._stats['errors'] += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self._stats['requests'] += 1
+                self._stats['latency_total'] += elapsed
+                self._stats['latency_max'] = max(self._stats['latency_max'], elapsed)
+
+        if self.cache_size > 0:
+            with self._lock:
+                self._cache[key] = result
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return result
+
+    def map(self, func: Callable[[T], R], items: Iterable[T]) -> List[R]:
+        """在有界工作线程池中并行执行func，结果保持输入顺序
+        Run func over items in the bounded worker pool, keeping input order
+
+        未启用HTML处理时直接顺序执行，避免无谓的线程切换
+        Runs sequentially when HTML processing is disabled to avoid needless thread hops
+
+        Args:
+            func (Callable): 处理函数 / Function to apply
+            items (Iterable): 输入项 / Input items
+
+        Returns:
+            list: 结果列表 / List of results
+        """
+        items = list(items)
+        if not self.enabled or self.workers == 1 or len(items) < 2:
+            return [func(item) for item in items]
+        return list(self._get_executor().map(func, items))
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存命中和处理延迟统计
+        Return cache hit and processing latency statistics
+
+        Returns:
+            dict: 统计数据 / Statistics
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cache_entries'] = len(self._cache)
+        lookups = stats['cache_hits'] + stats['cache_misses']
+        stats['cache_hit_ratio'] = stats['cache_hits'] / lookups if lookups else 0.0
+        stats['latency_avg'] = stats['latency_total'] / stats['requests'] if stats['requests'] else 0.0
+        return stats
+
+    def _get_session(self) -> 'requests.Session':
+        with self._lock:
+            if self._session is None:
+                # 延迟导入requests，不使用HTML处理服务时不增加启动时间
+                # Import requests lazily so startup does not pay for it without an HTML processing service
+                import requests
+                from requests.adapters import HTTPAdapter
+                # 连接池大小与工作线程数一致 / Pool size matches the number of workers
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._session = session
+            return self._session
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='html')
+            return self._executor
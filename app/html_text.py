@@ -0,0 +1,144 @@
+import re  # 正则表达式模块 / Regular expression module
+from html.parser import HTMLParser  # 标准库HTML解析器 / Standard library HTML parser
+from typing import List, Optional, Tuple
+
+# 内容被完全丢弃的标签 / Tags whose content is dropped entirely
+SKIP_TAGS = {'script', 'style', 'head', 'title', 'noscript', 'template', 'svg'}
+# 前后需要换行的块级标签 / Block-level tags that start and end a line
+BLOCK_TAGS = {
+    'p', 'div', 'section', 'article', 'header', 'footer', 'main', 'nav', 'aside',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'ul', 'ol', 'table', 'tr', 'blockquote',
+    'pre', 'form', 'hr', 'address', 'dl', 'dt', 'dd', 'center'
+}
+# 每次喂给解析器的字符数 / Characters fed to the parser at a time
+FEED_CHUNK = 65536
+
+WHITESPACE = re.compile(r'\s+')
+# 标记<pre>区域的私用区字符，get_text只整理区域之外的空白
+# Private-use characters marking <pre> regions; get_text only tidies whitespace outside them
+PRE_START, PRE_END = '\ue000', '\ue001'
+PRE_REGION = re.compile(f'{PRE_START}(.*?){PRE_END}', re.S)
+
+
+class HtmlToText(HTMLParser):
+    """把HTML增量转换为可读的纯文本
+    Incrementally convert HTML into readable plain text
+
+    丢弃script/style，在<pre>之外折叠空白（<pre>内容原样保留），链接渲染为 "文字 (地址)"，
+    表格单元格用 " | " 分隔
+    Drops script/style, collapses whitespace outside <pre> (whose content is kept
+    verbatim), renders links as "text (url)" and separates table cells with " | "
+    """
+
+    def __init__(self) -> None:
+        super().__init__(convert_charrefs=True)
+        self._parts: List[str] = []
+        self._skip_depth = 0
+        self._pre_depth = 0
+        self._links: List[Tuple[Optional[str], int]] = []
+        self._cells_in_row = 0
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+            return
+        if self._skip_depth:
+            return
+        if tag == 'br':
+            self._parts.append('\n')
+        elif tag in BLOCK_TAGS:
+            self._newline()
+            if tag == 'pre':
+                if not self._pre_depth:
+                    self._parts.append(PRE_START)
+                self._pre_depth += 1
+            elif tag == 'tr':
+                self._cells_in_row = 0
+            elif tag == 'hr':
+                self._parts.append('-' * 20 + '\n')
+        elif tag == 'li':
+            self._newline()
+            self._parts.append('- ')
+        elif tag in ('td', 'th'):
+            if self._cells_in_row:
+                self._parts.append(' | ')
+            self._cells_in_row += 1
+        elif tag == 'a':
+            self._links.append((dict(attrs).get('href'), len(self._parts)))
+        elif tag == 'img':
+            alt = dict(attrs).get('alt')
+            if alt:
+                self._parts.append(f' [{alt}] ')
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in SKIP_TAGS:
+            self._skip_depth = max(0, self._skip_depth - 1)
+            return
+        if self._skip_depth:
+            return
+        if tag in BLOCK_TAGS or tag == 'li':
+            if tag == 'pre' and self._pre_depth:
+                self._pre_depth -= 1
+                if not self._pre_depth:
+                    self._parts.append(PRE_END)
+            self._newline()
+        elif tag == 'a' and self._links:
+            href, start = self._links.pop()
+            text = ''.join(self._parts[start:]).strip()
+            if href and href.startswith(('http://', 'https://', 'mailto:')) and href not in text:
+                self._parts.append(f' ({href})' if text else href)
+
+    def handle_data(self, data: str) -> None:
+        if self._skip_depth:
+            return
+        data = data.replace(PRE_START, '').replace(PRE_END, '')
+        if self._pre_depth:
+            self._parts.append(data.replace('\r\n', '\n'))
+        else:
+            self._parts.append(WHITESPACE.sub(' ', data))
+
+    def get_text(self) -> str:
+        """返回转换结果，整理<pre>之外的行首尾空白和空行，<pre>内容保持原样
+        Return the converted text with leading/trailing whitespace and blank lines tidied
+        outside <pre>; <pre> content is left as it is
+
+        Returns:
+            str: 纯文本 / Plain text
+        """
+        text = ''.join(self._parts)
+        if self._pre_depth:
+            # 未闭合的<pre>延续到文末 / An unclosed <pre> runs to the end of the text
+            text += PRE_END
+        # split的奇数下标是<pre>内容 / Odd indexes of split are <pre> content
+        pieces = PRE_REGION.split(text)
+        for i, piece in enumerate(pieces):
+            if i % 2:
+                # 与浏览器一样忽略<pre>后紧跟的换行 / Ignore a newline right after <pre>, as browsers do
+                pieces[i] = piece[1:] if piece.startswith('\n') else piece
+                pieces[i] = pieces[i].rstrip('\n')
+            else:
+                lines = [line.strip() for line in piece.split('\n')]
+                pieces[i] = re.sub(r'\n{3,}', '\n\n', '\n'.join(lines))
+        return ''.join(pieces).strip('\n')
+
+    def _newline(self) -> None:
+        if self._parts and not self._parts[-1].endswith('\n'):
+            self._parts.append('\n')
+
+
+def html_to_text(html: str) -> str:
+    """把HTML转换为纯文本，分块喂给解析器以避免一次性处理超大文档
+    Convert HTML to plain text, feeding the parser in chunks so very large
+    documents are not handled in one piece
+
+    Args:
+        html (str): HTML内容 / HTML content
+
+    Returns:
+        str: 纯文本 / Plain text
+    """
+    parser = HtmlToText()
+    for start in range(0, len(html), FEED_CHUNK):
+        parser.feed(html[start:start + FEED_CHUNK])
+    parser.close()
+    return parser.get_text()
@@ -0,0 +1,207 @@
+import imaplib  # 用于IMAP邮件操作 / For IMAP mail operations
+import logging  # 日志 / Logging
+import re  # 正则表达式模块 / Regular expression module
+import select  # 等待套接字可读 / Wait for socket readability
+import socket  # 唤醒套接字 / Wake-up socket
+import ssl  # 非阻塞读取TLS套接字 / Non-blocking reads from TLS sockets
+import time  # 时间相关操作 / Time-related operations
+from typing import Optional
+
+log = logging.getLogger('email2mqtt.idle')
+
+# 表示邮箱有新邮件的未标记响应 / Untagged responses signalling new mail
+NEW_MAIL_RESPONSE = re.compile(rb'^\* \d+ (EXISTS|RECENT)\b', re.IGNORECASE)
+# 服务器在30分钟后断开空闲连接，IDLE最长持续29分钟 / Servers drop idle connections after 30 minutes, so IDLE lasts at most 29
+MAX_IDLE_SECONDS = 29 * 60
+
+
+def supports_idle(mail: imaplib.IMAP4) -> bool:
+    """检查服务器是否支持IDLE扩展 (RFC 2177)
+    Check whether the server supports the IDLE extension (RFC 2177)
+
+    登录后的能力列表可能与登录前不同，因此重新查询一次
+    Capabilities may change after login, so they are queried again
+
+    Args:
+        mail (imaplib.IMAP4): 已登录的邮箱连接对象 / Logged-in mailbox connection object
+
+    Returns:
+        bool: 支持IDLE返回True / True if IDLE is supported
+    """
+    try:
+        status, data = mail.capability()
+        if status == 'OK' and data and data[0]:
+            return b'IDLE' in data[0].upper().split()
+    except Exception as e:
+        log.warning("查询IMAP能力出错: %s", e)
+    return 'IDLE' in mail.capabilities
+
+
+def idle_wait(mail: imaplib.IMAP4, timeout: float, wake: Optional[socket.socket] = None,
+              max_idle: float = MAX_IDLE_SECONDS) -> bool:
+    """进入IDLE状态，直到有新邮件或超时
+    Enter the IDLE state until new mail arrives or the timeout expires
+
+    服务器会在30分钟后断开空闲连接，所以等待时间不超过 max_idle，调用方在返回后重新进入IDLE
+    Servers drop idle connections after 30 minutes, so the wait never exceeds max_idle and
+    the caller re-issues IDLE after this returns
+
+    Args:
+        mail (imaplib.IMAP4): 已选择邮箱的连接对象 / Connection object with a selected mailbox
+        timeout (float): 最长等待时间（秒） / Maximum wait time in seconds
+        wake (socket.socket): 变为可读时提前结束IDLE，数据留给调用方读取
+                              Ends IDLE early when it becomes readable; its data is left for the caller
+        max_idle (float): timeout的上限，默认29分钟 / Cap on timeout, 29 minutes by default
+
+    Returns:
+        bool: 收到EXISTS/RECENT返回True，超时或被唤醒返回False
+        True if EXISTS/RECENT was received, False on timeout or a wake-up
+
+    Raises:
+        imaplib.IMAP4.abort: 连接断开 / Connection lost
+        imaplib.IMAP4.error: 服务器拒绝IDLE命令 / Server rejected the IDLE command
+    """
+    timeout = min(timeout, max_idle)
+    tag = mail._new_tag()
+    reader = _LineReader(mail)
+    try:
+        mail.send(tag + b' IDLE\r\n')
+        return _idle(mail, reader, tag, timeout, wake)
+    finally:
+        # 完成响应由这里读取，imaplib不会自己清理这个标签；完成响应之后的字节交还给imaplib
+        # The completion is read here, so imaplib never clears the tag itself; bytes after the completion go back to imaplib
+        mail.tagged_commands.pop(tag, None)
+        reader.release()
+
+
+def _idle(mail: imaplib.IMAP4, reader: '_LineReader', tag: bytes, timeout: float,
+          wake: Optional[socket.socket]) -> bool:
+    # 等待服务器的继续响应 / Wait for the continuation response
+    has_new = False
+    while True:
+        line = reader.readline(timeout)
+        if line is None:
+            raise imaplib.IMAP4.abort('IDLE继续响应超时 / IDLE continuation timed out')
+        if line.startswith(b'+'):
+            break
+        if line.startswith(tag):
+            raise imaplib.IMAP4.error(f"IDLE被拒绝: {line!r}")
+        if NEW_MAIL_RESPONSE.match(line):
+            has_new = True
+
+    deadline = time.monotonic() + timeout
+    while not has_new:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        line = reader.readline(remaining, wake)
+        if line is None:
+            break
+        if NEW_MAIL_RESPONSE.match(line):
+            has_new = True
+
+    # 结束IDLE并读取完成响应 / Terminate IDLE and read the completion response
+    mail.send(b'DONE\r\n')
+    while True:
+        line = reader.readline(mail.sock.gettimeout() or 30)
+        if line is None:
+            raise imaplib.IMAP4.abort('IDLE完成响应超时 / IDLE completion timed out')
+        if line.startswith(tag):
+            if not line[len(tag):].strip().upper().startswith(b'OK'):
+                raise imaplib.IMAP4.error(f"IDLE结束失败: {line!r}")
+            break
+        if NEW_MAIL_RESPONSE.match(line):
+            has_new = True
+    return has_new
+
+
+class _LineReader:
+    """在IDLE期间直接从套接字按行读取，带超时
+    Reads lines straight from the socket with a timeout while idling
+
+    imaplib的缓冲文件对象在超时后不可再用，因此IDLE期间绕过它：开始时取走它已缓冲的字节，
+    release() 把读过头的字节交还给它
+    imaplib's buffered file object is unusable after a timeout, so it is bypassed during IDLE:
+    the bytes it has already buffered are taken over at the start, and release() hands back
+    whatever was read past the end
+    """
+
+    def __init__(self, mail: imaplib.IMAP4) -> None:
+        self.mail = mail
+        self.sock = mail.sock
+        self.buffer = _take_buffered(mail)
+
+    def readline(self, timeout: float, wake: Optional[socket.socket] = None) -> Optional[bytes]:
+        deadline = time.monotonic() + timeout
+        while b'\r\n' not in self.buffer:
+            pending = getattr(self.sock, 'pending', None)
+            if not (pending and pending()):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                readable, _, _ = select.select([self.sock] if wake is None else [self.sock, wake], [], [], remaining)
+                if self.sock not in readable:
+                    # 超时或被唤醒 / Timed out or woken
+                    return None
+            chunk = self.sock.recv(8192)
+            if not chunk:
+                raise imaplib.IMAP4.abort('IDLE期间连接被关闭 / Connection closed during IDLE')
+            self.buffer += chunk
+        line, self.buffer = self.buffer.split(b'\r\n', 1)
+        return line
+
+    def release(self) -> None:
+        if self.buffer:
+            self.mail.file = _PrefixedFile(self.buffer, self.mail.file)
+            self.buffer = b''
+
+
+class _PrefixedFile:
+    """先返回 prefix 再读取原文件对象，imaplib只用到 readline/read/close
+    Serves prefix before reading from the wrapped file object; imaplib only uses readline/read/close
+    """
+
+    def __init__(self, prefix: bytes, file) -> None:
+        self.prefix = prefix
+        self.file = file
+
+    def readline(self, size: int = -1) -> bytes:
+        if not self.prefix:
+            return self.file.readline(size)
+        end = self.prefix.find(b'\n') + 1 or len(self.prefix)
+        if size >= 0:
+            end = min(end, size)
+        line, self.prefix = self.prefix[:end], self.prefix[end:]
+        if not line.endswith(b'\n') and (size < 0 or len(line) < size):
+            line += self.file.readline(size - len(line) if size >= 0 else -1)
+        return line
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0:
+            data, self.prefix = self.prefix, b''
+            return data + self.file.read()
+        data, self.prefix = self.prefix[:size], self.prefix[size:]
+        return data + self.file.read(size - len(data)) if len(data) < size else data
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def _take_buffered(mail: imaplib.IMAP4) -> bytes:
+    """取走imaplib文件对象中已缓冲、尚未读取的字节，不阻塞
+    Take the bytes imaplib's file object has buffered but not yet read, without blocking
+    """
+    file = mail.file
+    if isinstance(file, _PrefixedFile):
+        # 上一次IDLE交还的字节 / Bytes handed back by the previous IDLE
+        mail.file = file.file
+        return file.prefix + _take_buffered(mail)
+    timeout = mail.sock.gettimeout()
+    mail.sock.settimeout(0)
+    try:
+        # 缓冲区非空时read1只返回缓冲的字节，为空时非阻塞读取一次 / read1 returns only buffered bytes when there are any, otherwise reads once without blocking
+        return file.read1(65536) or b''
+    except (BlockingIOError, ssl.SSLWantReadError):
+        return b''
+    finally:
+        mail.sock.settimeout(timeout)
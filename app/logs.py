@@ -0,0 +1,224 @@
+import atexit  # 退出时写出剩余日志 / Write out pending records at exit
+import json  # JSON日志格式 / JSON log format
+import logging  # 标准日志 / Standard logging
+import logging.handlers  # QueueHandler/QueueListener
+import queue  # 日志队列 / Log queue
+import random  # 调试日志抽样 / Debug log sampling
+import sys
+import threading  # 线程锁 / Thread lock
+import time  # 重复日志的时间窗口 / Time window of repeated records
+from typing import Any, Dict, Optional, Tuple
+
+FORMATS = ('text', 'json')
+# 日志记录的标准属性，其余属性都是通过 extra 传入的结构化字段
+# Standard attributes of a log record; everything else is a structured field passed through extra
+_STANDARD_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class RepeatFilter(logging.Filter):
+    """按消息模板限制重复的警告和错误，并按比例抽样调试日志
+    Rate-limit repeated warnings and errors per message template, and sample debug records
+
+    同一模板（格式化参数之前的消息）在每个 window 秒内最多输出 limit 条，其余被丢弃；
+    窗口结束后的下一条记录带上 suppressed 字段说明丢弃了多少条。调试日志按 sample 的比例输出。
+    在调用方线程中运行，被丢弃的记录不会进入队列
+    Each template (the message before its arguments are formatted) is let through at most
+    limit times per window seconds and the rest are dropped; the next record after the
+    window carries a suppressed field saying how many were dropped. Debug records are let
+    through at the sample rate. Runs in the calling thread, so dropped records never reach
+    the queue
+
+    Args:
+        limit (int): 每个窗口内同一模板的最多条数，0为不限制 / Most records per template per window, 0 means no limit
+        window (float): 窗口长度（秒） / Window length in seconds
+        sample (float): 调试日志的输出比例，0到1 / Share of debug records let through, 0 to 1
+    """
+
+    def __init__(self, limit: int = 5, window: float = 60.0, sample: float = 1.0) -> None:
+        super().__init__()
+        self.limit = limit
+        self.window = window
+        self.sample = sample
+        self.suppressed = 0
+        self.sampled_out = 0
+        self._lock = threading.Lock()
+        # 模板 -> [窗口开始时间, 窗口内条数, 被丢弃的条数] / Template -> [window start, records in window, dropped]
+        self._templates: Dict[Tuple[str, Any], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno <= logging.DEBUG and self.sample < 1.0:
+            if random.random() >= self.sample:
+                with self._lock:
+                    self.sampled_out += 1
+                return False
+            return True
+        if record.levelno < logging.WARNING or not self.limit:
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            state = self._templates.get(key)
+            if state is None or now - state[0] >= self.window:
+                if len(self._templates) >= 1024 and state is None:
+                    # 模板通常是固定的几十个，防止误用时无限增长 / Templates are normally a few dozen fixed strings; bound them against misuse
+                    self._templates.clear()
+                dropped = state[2] if state else 0
+                self._templates[key] = [now, 1, 0]
+                if dropped:
+                    record.suppressed = dropped
+                return True
+            state[1] += 1
+            if state[1] <= self.limit:
+                return True
+            state[2] += 1
+            self.suppressed += 1
+            return False
+
+
+class StructuredFormatter(logging.Formatter):
+    """把 extra 传入的字段输出为 key=value 或JSON
+    Render the fields passed through extra as key=value pairs or JSON
+
+    文本格式中 watcher 字段作为 [名称] 前缀，与之前的输出一致
+    In the text format the watcher field becomes the [name] prefix, as in the earlier output
+    """
+
+    def __init__(self, fmt: str = 'text') -> None:
+        super().__init__()
+        if fmt not in FORMATS:
+            raise ValueError(f"未知日志格式 {fmt!r}，可选 {FORMATS} / Unknown log format {fmt!r}, expected one of {FORMATS}")
+        self.fmt = fmt
+        self._second = 0
+        self._time = ''
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = {key: value for key, value in vars(record).items() if key not in _STANDARD_ATTRS}
+        message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.created - self._second >= 1 or record.created < self._second:
+            # 同一秒内的记录共用时间前缀 / Records within one second share the time prefix
+            self._second = int(record.created)
+            self._time = time.strftime('%Y-%m-%d %H:%M:%S', self.converter(self._second))
+        timestamp = f'{self._time},{int(record.msecs):03d}'
+        if self.fmt == 'json':
+            entry = {'time': timestamp, 'level': record.levelname, 'logger': record.name,
+                     'message': message, **fields}
+            if record.exc_text:
+                entry['exception'] = record.exc_text
+            return json.dumps(entry, ensure_ascii=False, default=str)
+        watcher = fields.pop('watcher', None)
+        line = f"{timestamp} {record.levelname} {f'[{watcher}] ' if watcher else ''}{message}"
+        if fields:
+            line += ' ' + ' '.join(f'{key}={value}' for key, value in fields.items())
+        if record.exc_text:
+            line += '\n' + record.exc_text
+        return line
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    # 队列满时丢弃记录而不是阻塞或报错 / Drop records on a full queue instead of blocking or raising
+    def __init__(self, log_queue: 'queue.Queue[logging.LogRecord]') -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 在调用方线程中只合并参数，格式化留给后台线程；记录只进入这一个处理器，不必复制
+        # Only merge the arguments in the calling thread and leave formatting to the background
+        # thread; the record goes to this one handler, so it need not be copied
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # 异常对象不跨线程保留 / Do not keep exception objects across threads
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _BatchingListener(logging.handlers.QueueListener):
+    # 队列空时先等待 latency 秒再取，让记录攒成一批写出，而不是每条记录都唤醒后台线程
+    # Wait latency seconds before taking from an empty queue so records are written in
+    # batches, instead of waking the background thread for every record
+    def __init__(self, log_queue: 'queue.Queue[logging.LogRecord]', handler: logging.Handler, latency: float) -> None:
+        super().__init__(log_queue, handler)
+        self.latency = latency
+
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        if block and self.queue.empty():
+            time.sleep(self.latency)
+        return self.queue.get(block)
+
+    def enqueue_sentinel(self) -> None:
+        # 队列满时也要等到哨兵放入 / Wait for room for the sentinel even on a full queue
+        self.queue.put(self._sentinel)
+
+
+class LogPipeline:
+    """异步日志管道：调用方只把记录放入队列，由后台线程格式化并写到标准输出
+    Asynchronous logging pipeline: callers only put records on a queue, a background
+    thread formats them and writes them to standard output
+
+    队列有上限，写出跟不上时丢弃新的记录，处理邮件的线程永远不会等待日志I/O
+    The queue is bounded and new records are dropped when writing falls behind, so threads
+    processing mail never wait on log I/O
+
+    Args:
+        name (str): 挂载处理器的日志器名称 / Name of the logger the handler is attached to
+        level (str): 日志级别 / Log level
+        fmt (str): 'text' 或 'json' / 'text' or 'json'
+        queue_size (int): 队列中最多等待写出的记录数 / Most records waiting to be written
+        repeat_filter (RepeatFilter): 重复日志限制和调试抽样 / Repeat limiting and debug sampling
+        latency (float): 后台线程攒批的最长等待（秒） / Longest wait (seconds) of the background thread while a batch collects
+    """
+
+    def __init__(self, name: str, level: str = 'INFO', fmt: str = 'text', queue_size: int = 10000,
+                 repeat_filter: Optional[RepeatFilter] = None, latency: float = 0.05) -> None:
+        self.logger = logging.getLogger(name)
+        # 无效的级别和格式由 check_config() 报告，这里回退到默认值，导入时不抛出异常
+        # Invalid levels and formats are reported by check_config(); fall back to the
+        # defaults here so nothing raises at import time
+        levelno = logging.getLevelName(level.upper())
+        self.logger.setLevel(levelno if isinstance(levelno, int) else logging.INFO)
+        # 不再传给根日志器，避免被其他处理器重复输出 / Do not propagate to the root logger, which would print them twice
+        self.logger.propagate = False
+        self.repeat_filter = repeat_filter or RepeatFilter()
+        self._queue: 'queue.Queue[logging.LogRecord]' = queue.Queue(max(1, queue_size))
+        self.handler = _DroppingQueueHandler(self._queue)
+        self.handler.addFilter(self.repeat_filter)
+        output = logging.StreamHandler(sys.stdout)
+        output.setFormatter(StructuredFormatter(fmt if fmt in FORMATS else 'text'))
+        self._listener = _BatchingListener(self._queue, output, latency)
+        self._started = False
+        self._lock = threading.Lock()
+        for handler in [h for h in self.logger.handlers if isinstance(h, logging.handlers.QueueHandler)]:
+            # 重新配置时替换之前的管道 / Replace an earlier pipeline when reconfigured
+            self.logger.removeHandler(handler)
+        self.logger.addHandler(self.handler)
+        atexit.register(self.stop)
+
+    def start(self) -> None:
+        with self._lock:
+            if not self._started:
+                self._listener.start()
+                self._started = True
+
+    def stop(self) -> None:
+        """写出队列中剩余的记录并停止后台线程 / Write out the remaining records and stop the background thread"""
+        with self._lock:
+            if self._started:
+                self._started = False
+                self._listener.stop()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'queued': self._queue.qsize(),
+            'dropped': self.handler.dropped,
+            'suppressed': self.repeat_filter.suppressed,
+            'sampled_out': self.repeat_filter.sampled_out,
+        }
@@ -1,93 +1,364 @@
+import asyncio  # 监听任务 / Watcher tasks
+import json  # 附件元数据 / Attachment metadata
 import imaplib  # 用于IMAP邮件操作 / For IMAP mail operations
 import email  # 用于解析邮件 / For parsing emails
-from re import M  # 正则表达式模块 / Regular expression module
-import sys
-import time  # 时间相关操作 / Time-related operations
+import re  # 正则表达式模块 / Regular expression module
 import socket  # 网络套接字操作 / Network socket operations
+import threading  # 消息送达事件 / Message delivery events
+import time  # 时间相关操作 / Time-related operations
 from email.header import decode_header  # 解码邮件头 / Decode email headers
 import paho.mqtt.client as mqtt  # MQTT客户端 / MQTT client
-import requests  # 用于HTTP请求 / For HTTP requests
-import uvicorn
 import logging
-from fastapi import FastAPI
-import hashlib
-from typing import Any, Dict, List, Optional, Tuple
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
 try:
     from app.config import (  # 从配置文件导入配置 / Import configuration from config file
-        IMAP_SERVER, USERNAME, PASSWORD, CHECK_INTERVAL,
-        MQTT_BROKER, MQTT_PORT, MQTT_TOPIC,
-        MQTT_SSL, MQTT_SSL_CA_CERTS, HTML_PROCESS_URL,
+        check_config, ACCOUNTS_FILE, IMAP_SERVER, USERNAME, PASSWORD, CHECK_INTERVAL, POLL_MAX_INTERVAL, POLL_BACKOFF, WATCH_MODE, IDLE_TIMEOUT, IMAP_KEEPALIVE,
+        RECONNECT_MIN_DELAY, RECONNECT_MAX_DELAY, CIRCUIT_FAILURE_THRESHOLD, RECONNECT_STABLE_AFTER,
+        CHECKPOINT_FILE, FETCH_CHUNK_SIZE, CATCHUP_ORDER, CATCHUP_RATE, PIPELINE_QUEUE_SIZE, MAIL_RETRIES, FETCH_MODE, RULES_FILE, ATTACHMENT_DIR, ATTACHMENT_CHUNK_SIZE,
+        TEXT_PART_MAX_BYTES,
+        PARSE_PROCESS_THRESHOLD, PARSE_PROCESS_WORKERS,
+        DEDUP_DB, DEDUP_MAX_ENTRIES, DEDUP_TTL, NEAR_DUP_WINDOW, NEAR_DUP_DISTANCE, MQTT_BROKER, MQTT_PORT, MQTT_TOPIC,
+        MQTT_QOS, MQTT_MAX_INFLIGHT, PUBLISH_QUEUE_SIZE, PUBLISH_QUEUE_TIMEOUT, SPOOL_FILE,
+        MQTT_PROTOCOL, MQTT_MESSAGE_EXPIRY, MQTT_TOPIC_ALIAS_MAX, PAYLOAD_FORMAT, PAYLOAD_COMPRESS_THRESHOLD, MQTT_MAX_PAYLOAD,
+        BODY_MODE, SNIPPET_LENGTH, BODY_CACHE_BYTES, BODY_CACHE_DIR, BODY_CACHE_DIR_BYTES,
+        HA_LEASE_TOPIC, HA_NODE_ID, HA_LEASE_SECONDS,
+        LOG_LEVEL, LOG_FORMAT, LOG_QUEUE_SIZE, LOG_REPEAT_LIMIT, LOG_REPEAT_WINDOW, LOG_DEBUG_SAMPLE,
+        MQTT_SSL, MQTT_SSL_CA_CERTS, HTML_PROCESS_URL, HTML_PROCESS_MODE, HTML_PROCESS_CONNECT_TIMEOUT,
+        HTML_PROCESS_READ_TIMEOUT, HTML_PROCESS_WORKERS, HTML_CACHE_SIZE,
         MQTT_USERNAME, MQTT_PASSWORD  # MQTT认证信息 / MQTT authentication info
     )
+    from app.idle import supports_idle, idle_wait  # IMAP IDLE推送 / IMAP IDLE push
+    from app.checkpoint import load_checkpoint, save_checkpoint  # UID同步检查点 / UID sync checkpoint
+    from app.dedup import DedupStore  # 持久化去重索引 / Persistent dedup index
+    from app.accounts import default_account, load_accounts, quote_mailbox  # 多账户配置 / Multi-account configuration
+    from app.html_processor import HtmlProcessor  # HTML处理服务客户端 / HTML processing service client
+    from app.spool import Spool  # MQTT磁盘缓冲 / MQTT disk spool
+    from app.publisher import Publisher  # 带背压的MQTT发布队列 / Backpressured MQTT publish pipeline
+    from app.payload import PayloadEncoder  # 消息格式、压缩和分块 / Payload format, compression and chunking
+    from app.metrics import Registry  # Prometheus格式指标 / Prometheus-format metrics
+    from app.mime import PartScanner, parse_headers  # 只解码文本部分的MIME扫描 / MIME scanning that decodes only text parts
+    from app.fingerprint import (  # 内容摘要和近似重复检测 / Content digests and near-duplicate detection
+        ContentHasher, NearDuplicateIndex, message_fingerprint, simhash
+    )
+    from app.rules import RuleSet, load_rules  # 按邮件头路由 / Header-based routing
+    from app.supervisor import ConnectionSupervisor, STATE_VALUES  # 重连退避和断路器 / Reconnect backoff and circuit breaker
+    from app.control import WatcherControl  # 运行时控制监听 / Runtime watcher control
+    from app.html_text import html_to_text  # 内置HTML转文本 / Built-in HTML-to-text converter
+    from app.fetch import (  # 批量FETCH / Batched FETCH
+        chunked, compress_uids, iter_fetch_response, find_text_parts, find_attachment_parts, decode_transfer_encoding
+    )
+    from app.attachments import AttachmentStore  # 按内容寻址的附件存储 / Content-addressed attachment store
+    from app.backlog import Backlog  # 积压邮件的分块追赶 / Chunked backlog catch-up
+    from app.body_cache import BodyCache  # 按需读取完整正文的LRU缓存 / LRU cache for on-demand full bodies
+    from app.logs import LogPipeline, RepeatFilter  # 队列化的结构化日志 / Queued structured logging
+    from app.election import LeaderElection  # 主备选举 / Active/standby election
 except ImportError:
     # 如果app.config导入失败,尝试直接导入config
     from config import (
-        IMAP_SERVER, USERNAME, PASSWORD, CHECK_INTERVAL,
-        MQTT_BROKER, MQTT_PORT, MQTT_TOPIC,
-        MQTT_SSL, MQTT_SSL_CA_CERTS, HTML_PROCESS_URL,
+        check_config, ACCOUNTS_FILE, IMAP_SERVER, USERNAME, PASSWORD, CHECK_INTERVAL, POLL_MAX_INTERVAL, POLL_BACKOFF, WATCH_MODE, IDLE_TIMEOUT, IMAP_KEEPALIVE,
+        RECONNECT_MIN_DELAY, RECONNECT_MAX_DELAY, CIRCUIT_FAILURE_THRESHOLD, RECONNECT_STABLE_AFTER,
+        CHECKPOINT_FILE, FETCH_CHUNK_SIZE, CATCHUP_ORDER, CATCHUP_RATE, PIPELINE_QUEUE_SIZE, MAIL_RETRIES, FETCH_MODE, RULES_FILE, ATTACHMENT_DIR, ATTACHMENT_CHUNK_SIZE,
+        TEXT_PART_MAX_BYTES,
+        PARSE_PROCESS_THRESHOLD, PARSE_PROCESS_WORKERS,
+        DEDUP_DB, DEDUP_MAX_ENTRIES, DEDUP_TTL, NEAR_DUP_WINDOW, NEAR_DUP_DISTANCE, MQTT_BROKER, MQTT_PORT, MQTT_TOPIC,
+        MQTT_QOS, MQTT_MAX_INFLIGHT, PUBLISH_QUEUE_SIZE, PUBLISH_QUEUE_TIMEOUT, SPOOL_FILE,
+        MQTT_PROTOCOL, MQTT_MESSAGE_EXPIRY, MQTT_TOPIC_ALIAS_MAX, PAYLOAD_FORMAT, PAYLOAD_COMPRESS_THRESHOLD, MQTT_MAX_PAYLOAD,
+        BODY_MODE, SNIPPET_LENGTH, BODY_CACHE_BYTES, BODY_CACHE_DIR, BODY_CACHE_DIR_BYTES,
+        HA_LEASE_TOPIC, HA_NODE_ID, HA_LEASE_SECONDS,
+        LOG_LEVEL, LOG_FORMAT, LOG_QUEUE_SIZE, LOG_REPEAT_LIMIT, LOG_REPEAT_WINDOW, LOG_DEBUG_SAMPLE,
+        MQTT_SSL, MQTT_SSL_CA_CERTS, HTML_PROCESS_URL, HTML_PROCESS_MODE, HTML_PROCESS_CONNECT_TIMEOUT,
+        HTML_PROCESS_READ_TIMEOUT, HTML_PROCESS_WORKERS, HTML_CACHE_SIZE,
         MQTT_USERNAME, MQTT_PASSWORD
     )
+    from idle import supports_idle, idle_wait
+    from checkpoint import load_checkpoint, save_checkpoint
+    from dedup import DedupStore
+    from accounts import default_account, load_accounts, quote_mailbox
+    from html_processor import HtmlProcessor
+    from spool import Spool
+    from publisher import Publisher
+    from payload import PayloadEncoder
+    from metrics import Registry
+    from mime import PartScanner, parse_headers
+    from fingerprint import ContentHasher, NearDuplicateIndex, message_fingerprint, simhash
+    from rules import RuleSet, load_rules
+    from supervisor import ConnectionSupervisor, STATE_VALUES
+    from control import WatcherControl
+    from html_text import html_to_text
+    from fetch import (
+        chunked, compress_uids, iter_fetch_response, find_text_parts, find_attachment_parts, decode_transfer_encoding
+    )
+    from attachments import AttachmentStore
+    from backlog import Backlog
+    from body_cache import BodyCache
+    from logs import LogPipeline, RepeatFilter
+    from election import LeaderElection
 
-app = FastAPI()
-
-class DuplicateMessageFilter(logging.Filter):
-    def __init__(self) -> None:
-        super().__init__()
-        self.last_message: Optional[str] = None
-        self.count: int = 0
-
-    def filter(self, record):
-        current_message = record.getMessage()
-        if current_message == self.last_message:
-            self.count += 1
-            if self.count>=60:
-                self.count = 0
-                return True
-            return False
-        else:
-            self.last_message = current_message
-            self.count = 0
-            return True
-
-logger = logging.getLogger('uvicorn')
-logger.setLevel(logging.DEBUG)
-duplicate_filter = DuplicateMessageFilter()
-logger.addFilter(duplicate_filter)
-
-# 已读邮件特征字典 / Dictionary of read email features
-read: Dict[str, Dict[str, str]] = {}  # 格式: {email_id: {'sender': sender_hash, 'subject': subject_hash, 'content': content_hash}}
-def connect_to_imap(timeout: int = 30) -> Optional[imaplib.IMAP4_SSL]:
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """随FastAPI启动邮箱监听，关闭时取消任务并等待其清理完毕
+    Start the mailbox watchers with FastAPI, cancelling them on shutdown and waiting for
+    them to clean up
+    """
+    global core
+    # 缺少必填配置时启动失败，而不是在导入时失败 / Missing required settings fail the startup instead of the import
+    check_config()
+    core = asyncio.create_task(main(), name='email2mqtt')
+    core.add_done_callback(report_exit)
+    try:
+        yield
+    finally:
+        core.cancel()
+        await asyncio.gather(core, return_exceptions=True)
+
+def report_exit(task: 'asyncio.Task[None]') -> None:
+    # 记录监听任务的异常退出 / Log an abnormal exit of the watcher task
+    if not task.cancelled() and task.exception() is not None:
+        log.error("程序异常退出: %s", task.exception(), exc_info=task.exception())  # 异常退出日志 / Exception exit log
+
+app = FastAPI(lifespan=lifespan)
+
+# 邮箱监听任务，由lifespan创建 / Mailbox watcher task, created by the lifespan
+core: Optional['asyncio.Task[None]'] = None
+
+# HTML处理服务客户端 / HTML processing service client
+# 只有url模式才向HTML_PROCESS_URL提交 / Only the url mode posts to HTML_PROCESS_URL
+html_processor = HtmlProcessor(
+    HTML_PROCESS_URL if HTML_PROCESS_MODE == 'url' else '', HTML_PROCESS_CONNECT_TIMEOUT, HTML_PROCESS_READ_TIMEOUT,
+    HTML_PROCESS_WORKERS, HTML_CACHE_SIZE
+)
+
+# 大邮件交给进程池解析 / Large messages are parsed in a process pool
+part_scanner = PartScanner(PARSE_PROCESS_THRESHOLD, PARSE_PROCESS_WORKERS)
+
+# MQTT发布队列，在main()中创建 / MQTT publish pipeline, created in main()
+publisher: Optional[Publisher] = None
+
+# 主备选举，设置HA_LEASE_TOPIC时在main()中创建 / Active/standby election, created in main() when HA_LEASE_TOPIC is set
+election: Optional[LeaderElection] = None
+
+# 消息编码，在main()中按配置创建 / Payload encoding, created from the configuration in main()
+payload_encoder = PayloadEncoder()
+
+def publish_record(publisher: Publisher, topic: str, record: Dict[str, Any]) -> Tuple[int, List[threading.Event]]:
+    """编码并发布一封邮件，可能分为多条消息，在工作线程中调用
+    Encode and publish one email, possibly as several messages; called in a worker thread
+
+    Returns:
+        tuple: (发布的字节数, 每条消息的送达事件) / (bytes published, delivery event of each message)
+    """
+    size, deliveries = 0, []
+    for data, content_type in payload_encoder.encode(record):
+        deliveries.append(publisher.publish(topic, data, content_type))
+        size += len(data)
+    return size, deliveries
+
+# summary模式下的完整正文缓存，在main()中创建 / Full-body cache of summary mode, created in main()
+body_cache: Optional[BodyCache] = None
+
+def summarize(body: str, body_type: str) -> Tuple[str, bool]:
+    """截取正文开头作为摘要，HTML先转为文本 / Take the start of the body as a snippet, converting HTML to text first
+
+    Returns:
+        tuple: (摘要, 是否被截断) / (snippet, whether it was truncated)
+    """
+    text = ' '.join((html_to_text(body) if body_type == 'html' else body).split())
+    if len(text) <= SNIPPET_LENGTH:
+        return text, False
+    return text[:SNIPPET_LENGTH].rstrip() + '…', True
+
+# IMAP和MQTT连接的监督器，按连接名称 / IMAP and MQTT connection supervisors by connection name
+supervisors: Dict[str, ConnectionSupervisor] = {}
+
+def supervise(name: str) -> ConnectionSupervisor:
+    # 创建并登记一个连接监督器 / Create and register a connection supervisor
+    supervisor = ConnectionSupervisor(name, RECONNECT_MIN_DELAY, RECONNECT_MAX_DELAY, CIRCUIT_FAILURE_THRESHOLD,
+                                     RECONNECT_STABLE_AFTER)
+    supervisors[name] = supervisor
+    return supervisor
+
+# 各监听的运行时控制，按监听名称 / Runtime control of each watcher by watcher name
+watchers: Dict[str, WatcherControl] = {}
+
+def watcher_control(name: str) -> WatcherControl:
+    # 创建并登记一个监听控制 / Create and register a watcher control
+    control = WatcherControl(name, CHECK_INTERVAL, POLL_MAX_INTERVAL, POLL_BACKOFF)
+    watchers[name] = control
+    return control
+
+# 附件存储，设置ATTACHMENT_DIR时在main()中创建 / Attachment store, created in main() when ATTACHMENT_DIR is set
+attachment_store: Optional[AttachmentStore] = None
+
+# 路由规则，在main()中加载，None表示全部发布到账户主题 / Routing rules loaded in main(), None publishes everything to the account topic
+rules: Optional[RuleSet] = None
+
+def publisher_gauges(key: str) -> List[Tuple[Dict[str, str], float]]:
+    # 抓取时读取发布队列状态 / Read the publish pipeline state at scrape time
+    return [({}, float(publisher.stats()[key]))] if publisher else []
+
+# 各阶段的计数和延迟，在 /metrics 输出 / Per-stage counts and latencies, served at /metrics
+metrics = Registry()
+STAGE_SECONDS = metrics.histogram('email2mqtt_stage_seconds', 'Time spent in each processing stage')
+STAGE_ERRORS = metrics.counter('email2mqtt_stage_errors_total', 'Failures per processing stage')
+FETCHED_MESSAGES = metrics.counter('email2mqtt_fetched_messages_total', 'Messages fetched from IMAP')
+FETCHED_BYTES = metrics.counter('email2mqtt_fetched_bytes_total', 'Bytes of message data fetched from IMAP')
+PUBLISHED_MESSAGES = metrics.counter('email2mqtt_published_messages_total', 'Messages handed to the MQTT publisher')
+PUBLISHED_BYTES = metrics.counter('email2mqtt_published_bytes_total', 'Payload bytes handed to the MQTT publisher')
+DUPLICATES = metrics.counter('email2mqtt_duplicates_total', 'Messages skipped as duplicates')
+ATTACHMENT_BYTES = metrics.counter('email2mqtt_attachment_bytes_total', 'Decoded attachment bytes written to the attachment store')
+ROUTED = metrics.counter('email2mqtt_routed_messages_total', 'Messages per routing rule action')
+NEAR_DUPLICATES = metrics.counter('email2mqtt_near_duplicates_total', 'Messages collapsed into an earlier similar message')
+BACKLOG = metrics.gauge('email2mqtt_backlog_messages', 'Fetched messages not yet handed to the publisher')
+CATCHUP = metrics.gauge('email2mqtt_catchup_messages', 'Backlog messages found but not yet fetched')
+metrics.gauge('email2mqtt_publish_queue_depth', 'Messages waiting in the in-memory publish queue',
+              lambda: publisher_gauges('queue_depth'))
+metrics.gauge('email2mqtt_spool_bytes', 'Unsent bytes in the disk spool', lambda: publisher_gauges('spool_bytes'))
+metrics.gauge('email2mqtt_mqtt_connected', 'Whether the MQTT client is connected', lambda: publisher_gauges('connected'))
+metrics.gauge('email2mqtt_leader', 'Whether this replica is the active leader watching the mailboxes',
+              lambda: [({'node': election.node}, float(election.is_leader))] if election else [])
+metrics.counter('email2mqtt_log_records_discarded_total', 'Log records not written, by reason: dropped on a full queue, suppressed repeats, sampled-out debug records',
+                lambda: [({'reason': reason}, float(value)) for reason, value in log_pipeline.stats().items() if reason != 'queued'])
+metrics.gauge('email2mqtt_circuit_state', 'Connection circuit breaker state: 0 closed, 1 half open, 2 open',
+              lambda: [({'connection': name}, float(STATE_VALUES[s.state])) for name, s in list(supervisors.items())])
+
+# 所有输出经由队列异步写出，处理邮件的线程不等待日志I/O
+# All output is written asynchronously through a queue, threads processing mail never wait on log I/O
+log_pipeline = LogPipeline('email2mqtt', LOG_LEVEL, LOG_FORMAT, LOG_QUEUE_SIZE,
+                           RepeatFilter(LOG_REPEAT_LIMIT, LOG_REPEAT_WINDOW, LOG_DEBUG_SAMPLE))
+log_pipeline.start()
+log = log_pipeline.logger
+# uvicorn自己的重复错误同样按模板限制 / uvicorn's own repeated errors are limited per template too
+logging.getLogger('uvicorn.error').addFilter(RepeatFilter(LOG_REPEAT_LIMIT, LOG_REPEAT_WINDOW))
+
+def connect_to_imap(timeout: int = 30, account: Optional[Dict[str, Any]] = None,
+                    supervisor: Optional[ConnectionSupervisor] = None) -> Optional[imaplib.IMAP4_SSL]:
     """连接到IMAP服务器
     Connect to the IMAP server
     
     Args:
         timeout (int, optional): 连接超时时间（秒）。默认为30秒。
                                 Connection timeout in seconds. Default is 30 seconds.
+        account (dict, optional): 监听配置，默认使用环境变量中的账户
+                                  Watcher configuration, defaults to the account from environment variables
+        supervisor (ConnectionSupervisor, optional): 记录成功或失败，失败后的等待时间由它决定
+                                                     Records success or failure and decides the delay after a failure
     
     Returns:
         imaplib.IMAP4_SSL: 连接成功返回邮箱对象，失败返回None
         Returns mailbox object if connection is successful, None if failed
     """
+    account = account or default_account(IMAP_SERVER, USERNAME, PASSWORD, MQTT_TOPIC, CHECKPOINT_FILE)
+    if supervisor and not supervisor.allow():
+        # 断路器打开，冷却期内不尝试；半开时已有试探在进行 / The circuit is open and cooling off, or a half-open probe is already running
+        return None
+    with STAGE_SECONDS.time(stage='imap_connect'):
+        try:
+            mail = _open_imap(account, timeout)
+        except (imaplib.IMAP4.error, socket.timeout, ConnectionRefusedError, OSError) as e:
+            log.warning("连接失败: %s", e, extra={'watcher': account['name']})
+            mail, error = None, e
+        except Exception as e:
+            log.error("未知错误: %s", e, extra={'watcher': account['name']})
+            mail, error = None, e
+    if mail is None:
+        STAGE_ERRORS.inc(stage='imap_connect')
+        if supervisor:
+            supervisor.failed(error)
+    elif supervisor:
+        supervisor.succeeded()
+    return mail
+
+def _open_imap(account: Dict[str, Any], timeout: int) -> imaplib.IMAP4_SSL:
+    # 创建IMAP连接并设置超时
+    mail = imaplib.IMAP4_SSL(account['server'], account['port'], timeout=timeout)
     try:
-        # 创建IMAP连接并设置超时
-        mail = imaplib.IMAP4_SSL(IMAP_SERVER, timeout=timeout)
-        
         # 设置登录和命令操作的超时
         mail.socket().settimeout(timeout)
         
         # 登录邮箱
-        mail.login(USERNAME, PASSWORD)
-        
-        # 选择收件箱
-        mail.select('inbox')
+        mail.login(account['username'], account['password'])
         
+        # 选择要监听的文件夹
+        status, data = mail.select(quote_mailbox(account['folder']))
+        if status != 'OK':
+            raise imaplib.IMAP4.error(f"SELECT {account['folder']}: {data}")
         return mail
-    except (imaplib.IMAP4.error, socket.timeout, ConnectionRefusedError, OSError) as e:
-        print(f"连接失败: {e}")
-        return None
-    except Exception as e:
-        print(f"未知错误: {e}")
+    except Exception:
+        close_imap(mail)
+        raise
+
+def get_mailbox_state(mail: imaplib.IMAP4_SSL, folder: str = 'INBOX') -> Tuple[int, int]:
+    """获取文件夹的UIDVALIDITY和UIDNEXT
+    Get the UIDVALIDITY and UIDNEXT of a folder
+
+    Args:
+        mail (imaplib.IMAP4_SSL): 邮箱连接对象 / Mailbox connection object
+        folder (str): 文件夹名称 / Folder name
+
+    Returns:
+        tuple: (uidvalidity, uidnext)
+    """
+    status, data = mail.status(quote_mailbox(folder), '(UIDVALIDITY UIDNEXT)')
+    if status != 'OK':
+        raise imaplib.IMAP4.error(f"STATUS失败: {data}")
+    text = data[0].decode() if isinstance(data[0], bytes) else str(data[0])
+    uidvalidity = re.search(r'UIDVALIDITY (\d+)', text)
+    uidnext = re.search(r'UIDNEXT (\d+)', text)
+    if not uidvalidity or not uidnext:
+        raise imaplib.IMAP4.error(f"无法解析STATUS响应: {text}")
+    return int(uidvalidity.group(1)), int(uidnext.group(1))
+
+def selected_mailbox_state(mail: imaplib.IMAP4_SSL) -> Optional[Tuple[int, int]]:
+    """取出SELECT响应中的UIDVALIDITY和UIDNEXT，服务器没有发送时返回None
+    Take the UIDVALIDITY and UIDNEXT out of the SELECT response, None if the server did not send them
+
+    Args:
+        mail (imaplib.IMAP4_SSL): 刚选择文件夹的邮箱连接对象 / Mailbox connection object that just selected the folder
+
+    Returns:
+        tuple: (uidvalidity, uidnext) 或 None / or None
+    """
+    responses = mail.untagged_responses
+    try:
+        state = int(responses['UIDVALIDITY'][-1]), int(responses['UIDNEXT'][-1])
+    except (KeyError, IndexError, TypeError, ValueError):
         return None
+    # 取出后删除，重连前不会被再次使用 / Removed once taken so they are never reused before a reconnect
+    responses.pop('UIDVALIDITY', None)
+    responses.pop('UIDNEXT', None)
+    return state
+
+def resume_from_checkpoint(mail: imaplib.IMAP4_SSL, account: Dict[str, Any]) -> Tuple[int, Optional[int], int]:
+    """根据检查点确定从哪个UID继续同步
+    Determine which UID to resume syncing from using the checkpoint
+
+    UIDVALIDITY变化时旧UID全部失效，丢弃检查点并重新同步未读邮件
+    When UIDVALIDITY changes all old UIDs are invalid, so the checkpoint is dropped
+    and unread mail is resynced
+
+    Args:
+        mail (imaplib.IMAP4_SSL): 邮箱连接对象 / Mailbox connection object
+        account (dict): 监听配置 / Watcher configuration
+
+    Returns:
+        tuple: (uidvalidity, last_uid, uidnext)，last_uid为None表示需要重新同步
+        (uidvalidity, last_uid, uidnext), last_uid is None when a resync is needed
+    """
+    # SELECT的响应中已经有这两个值，省去一次STATUS往返 / The SELECT response already carries both, saving a STATUS round trip
+    uidvalidity, uidnext = selected_mailbox_state(mail) or get_mailbox_state(mail, account['folder'])
+    checkpoint = load_checkpoint(account['checkpoint'])
+    if checkpoint is None:
+        log.info("没有检查点，同步未读邮件", extra={'watcher': account['name']})
+        return uidvalidity, None, uidnext
+    if checkpoint['uidvalidity'] != uidvalidity:
+        log.warning("UIDVALIDITY已变化 (%s -> %s)，重新同步未读邮件", checkpoint['uidvalidity'], uidvalidity,
+                    extra={'watcher': account['name']})
+        return uidvalidity, None, uidnext
+    return uidvalidity, checkpoint['last_uid'], uidnext
 
 def process_text_content(payload: bytes, charset: str) -> str:
     """处理纯文本内容
@@ -103,7 +374,7 @@ def process_text_content(payload: bytes, charset: str) -> str:
     try:
         return payload.decode(charset, 'replace')
     except Exception as e:
-        print(f"解码纯文本内容出错: {e}")
+        log.warning("解码纯文本内容出错: %s", e)
         return payload.decode('utf-8', 'replace')
 
 def process_html_content(payload: bytes, charset: str) -> str:
@@ -115,55 +386,52 @@ def process_html_content(payload: bytes, charset: str) -> str:
         charset (str): 字符编码 / Character encoding
         
     Returns:
-        str: 解码后的HTML内容，如果配置了HTML处理URL，则返回处理后的内容
-        Decoded HTML content, if HTML_PROCESS_URL is configured, returns processed content
+        str: 按HTML_PROCESS_MODE处理后的内容: raw 原始HTML，url 由HTML_PROCESS_URL处理，text 内置转换为纯文本
+        Content processed according to HTML_PROCESS_MODE: raw HTML, url processed by
+        HTML_PROCESS_URL, or text converted to plain text by the built-in converter
     """
     try:
         html = payload.decode(charset, 'replace')
-        if HTML_PROCESS_URL != '':           
+        if HTML_PROCESS_MODE == 'text':
+            with STAGE_SECONDS.time(stage='html'):
+                return html_to_text(html)
+        if HTML_PROCESS_MODE == 'url' and html_processor.enabled:
             try:
-                response = requests.post(HTML_PROCESS_URL, data={'html': html})
-                return response.text
+                with STAGE_SECONDS.time(stage='html'):
+                    return html_processor.process(html)
             except Exception as e:
-                print(e)
+                STAGE_ERRORS.inc(stage='html')
+                log.warning("HTML处理服务出错: %s", e)
         # with open('temp.html', 'wb') as file:
         #     file.write(payload)
         return html
     except Exception as e:
-        print(f"解码HTML内容出错: {e}")
+        log.warning("解码HTML内容出错: %s", e)
         return payload.decode('utf-8', 'replace')
 
-def process_email_part(part: email.message.Message, content_disposition: str) -> Dict[str, str]:
-    """处理邮件的单个部分
-    Process a single part of an email
+def process_email_part(part: email.message.Message, content_disposition: str) -> Optional[Tuple[str, str, bytes]]:
+    """取出邮件单个部分的文本内容
+    Take the text content out of a single part of an email
     
     Args:
         part (email.message.Message): 邮件部分对象 / Email part object
         content_disposition (str): 内容处置类型 / Content disposition type
         
     Returns:
-        dict: 包含文本和HTML内容的字典 / Dictionary containing text and HTML content
+        tuple: 非附件的文本部分返回 (content_type, charset, payload)，否则返回None
+        (content_type, charset, payload) for a non-attachment text part, None otherwise
     """
-    content = {'text': '', 'html': ''}
-    
     # 跳过附件
     if 'attachment' in content_disposition:
-        return content
+        return None
         
     content_type = part.get_content_type()
+    if content_type not in ('text/plain', 'text/html'):
+        return None
     payload = part.get_payload(decode=True)
-    
     if not payload:
-        return content
-        
-    charset = part.get_content_charset() or 'utf-8'
-    
-    if content_type == 'text/plain' and 'attachment' not in content_disposition:
-        content['text'] = process_text_content(payload, charset)
-    elif content_type == 'text/html' and 'attachment' not in content_disposition:
-        content['html'] = process_html_content(payload, charset)
-        
-    return content
+        return None
+    return content_type, part.get_content_charset() or 'utf-8', payload
 
 def extract_email_content(email_message: email.message.Message) -> Tuple[Dict[str, str], str]:
     """提取邮件内容（纯文本和HTML）
@@ -173,93 +441,457 @@ def extract_email_content(email_message: email.message.Message) -> Tuple[Dict[st
         email_message (email.message.Message): 邮件消息对象 / Email message object
         
     Returns:
-        dict: 包含文本和HTML内容的字典 / Dictionary containing text and HTML content
+        tuple: (content, content_hash)，content包含文本和HTML内容 / content holds the text and HTML
     """
-    content = {
-        'text': '',
-        'html': ''
-    }
-    
+    parts = []
     if email_message.is_multipart():
         for part in email_message.walk():
-            content_disposition = str(part.get('Content-Disposition'))
-            part_content = process_email_part(part, content_disposition)
-            
-            if part_content['text']:
-                content['text'] += part_content['text']
-            if part_content['html']:
-                content['html'] += part_content['html']
+            text_part = process_email_part(part, str(part.get('Content-Disposition')))
+            if text_part:
+                parts.append(text_part)
     else:
-        # 非多部分邮件
-        content_type = email_message.get_content_type()
-        # 获取邮件内容并计算哈希值
-        payload = email_message.get_payload(decode=True)
-        if payload:
-            content_hash = hashlib.md5(payload).hexdigest()
+        # 非多部分邮件不检查Content-Disposition / Single-part mail does not check Content-Disposition
+        text_part = process_email_part(email_message, '')
+        if text_part:
+            parts.append(text_part)
+    return build_content(parts)
+
+def build_content(parts: List[Tuple[str, str, bytes]]) -> Tuple[Dict[str, str], str]:
+    """解码文本部分并一次性拼接，同时对所有部分计算blake2b内容摘要
+    Decode the text parts and join them once, computing a blake2b content digest over
+    every part along the way
+
+    Args:
+        parts (list): [(content_type, charset, payload)]
+
+    Returns:
+        tuple: (content, content_hash)，没有文本部分时摘要为空 / The digest is empty without text parts
+    """
+    hasher = ContentHasher()
+    text_chunks, html_chunks = [], []
+    for content_type, charset, payload in parts:
+        hasher.update(content_type, payload)
+        if content_type == 'text/plain':
+            text_chunks.append(process_text_content(payload, charset))
         else:
-            content_hash = ''
+            html_chunks.append(process_html_content(payload, charset))
+    return {'text': ''.join(text_chunks), 'html': ''.join(html_chunks)}, hasher.hexdigest()
+
+def extract_raw_email_content(raw_email: bytes) -> Tuple[email.message.Message, Dict[str, str], str]:
+    """直接从原始邮件读取邮件头并提取文本，跳过附件，不构建完整的邮件对象树
+    Read the headers and extract the text straight from the raw message, skipping
+    attachments without building the full message object tree
+
+    结构无法识别时退回到email包完整解析和 extract_email_content
+    Falls back to a full email-package parse and extract_email_content when the
+    structure cannot be followed
+
+    Args:
+        raw_email (bytes): 原始邮件数据 / Raw email data
+
+    Returns:
+        tuple: (headers, content, content_hash)
+    """
+    try:
+        headers, parts = part_scanner.scan(raw_email)
+    except Exception as e:
+        log.warning("MIME扫描失败，改用完整解析: %s", e)
+        email_message = email.message_from_bytes(raw_email)
+        return (email_message,) + extract_email_content(email_message)
+    return (headers,) + build_content(parts)
+
+def decode_subject(email_message: email.message.Message) -> str:
+    """解码邮件主题
+    Decode the email subject
+
+    Args:
+        email_message (email.message.Message): 邮件消息对象 / Email message object
+
+    Returns:
+        str: 解码后的主题 / Decoded subject
+    """
+    subject, encoding = decode_header(email_message['Subject'] or '')[0]
+    if isinstance(subject, bytes):
+        # 无效的字节和未知的字符集不应使整封邮件无法处理 / Invalid bytes or an unknown charset must not make the whole message unprocessable
+        try:
+            subject = subject.decode(encoding or 'utf-8', errors='replace')
+        except LookupError:
+            subject = subject.decode('utf-8', errors='replace')
+    return subject
+
+def parse_raw_email(e_id: bytes, raw_email: bytes) -> Dict[str, Any]:
+    """解析原始邮件
+    Parse a raw email
+
+    Args:
+        e_id (bytes): 邮件UID / Email UID
+        raw_email (bytes): 原始邮件数据 / Raw email data
+
+    Returns:
+        dict: 包含UID、主题、发件人和内容的字典 / Dictionary containing UID, subject, sender and content
+    """
+    with STAGE_SECONDS.time(stage='parse'):
+        # 邮件头和正文都来自一次MIME扫描 / Headers and body both come from one MIME scan
+        email_message, content, content_hash = extract_raw_email_content(raw_email)
         
-        if payload:
-            charset = email_message.get_content_charset() or 'utf-8'
-            
-            if content_type == 'text/plain':
-                content['text'] = process_text_content(payload, charset)
-            elif content_type == 'text/html':
-                content['html'] = process_html_content(payload, charset)
-    
-    return content,content_hash
+    return {
+        'id': e_id,
+        'message_id': (email_message['Message-ID'] or '').strip(),
+        'subject': decode_subject(email_message),
+        'from': email_message['From'],
+        'content': content,
+        'content_hash': content_hash
+    }
+
+def parse_text_sections(e_id: bytes, header: bytes, structure: List[Any], sections: Dict[str, Any]) -> Dict[str, Any]:
+    """根据邮件头和单独获取的文本段构建邮件信息
+    Build email information from the headers and separately fetched text sections
+
+    Args:
+        e_id (bytes): 邮件UID / Email UID
+        header (bytes): 邮件头 / Email headers
+        structure (list): 解析后的BODYSTRUCTURE / Parsed BODYSTRUCTURE
+        sections (dict): FETCH返回的数据项，例如 {'BODY[1]': b'...'} / FETCH data items, e.g. {'BODY[1]': b'...'}
+
+    Returns:
+        dict: 与parse_raw_email格式相同的字典 / Dictionary in the same format as parse_raw_email
+    """
+    with STAGE_SECONDS.time(stage='parse'):
+        email_message = parse_headers(header)
+        parts = []
+        for part in find_text_parts(structure):
+            data = sections.get(f"BODY[{part['section']}]")
+            if not data:
+                continue
+            parts.append((part['type'], part['charset'], decode_transfer_encoding(data, part['encoding'])))
+        content, content_hash = build_content(parts)
+
+    return {
+        'id': e_id,
+        'message_id': (email_message['Message-ID'] or '').strip(),
+        'subject': decode_subject(email_message),
+        'from': email_message['From'],
+        'content': content,
+        'content_hash': content_hash
+    }
+
+def route_email(headers: email.message.Message) -> Dict[str, Any]:
+    """按路由规则决定邮件的去向
+    Decide where a message goes according to the routing rules
+
+    Args:
+        headers (email.message.Message): 邮件头 / Message headers
+
+    Returns:
+        dict: {'action': 'publish' | 'headers' | 'drop', 'topic': 主题或None / topic or None, 'rule': ...}
+    """
+    if rules is None:
+        return {'action': 'publish', 'topic': None, 'rule': None}
+    route = rules.match(headers['From'] or '', decode_subject(headers), headers['List-Id'] or '')
+    ROUTED.inc(action=route['action'])
+    return route
+
+def headers_only_email(e_id: bytes, headers: email.message.Message) -> Dict[str, Any]:
+    """不下载正文，只根据邮件头构建邮件信息
+    Build email information from the headers alone, without downloading the body
+
+    Args:
+        e_id (bytes): 邮件UID / Email UID
+        headers (email.message.Message): 邮件头 / Message headers
+
+    Returns:
+        dict: 与parse_raw_email格式相同、内容为空的字典 / Dictionary in the parse_raw_email format with empty content
+    """
+    return {
+        'id': e_id,
+        'message_id': (headers['Message-ID'] or '').strip(),
+        'subject': decode_subject(headers),
+        'from': headers['From'],
+        'content': {'text': '', 'html': ''},
+        'content_hash': ''
+    }
+
+def fetch_routed_headers(mail: imaplib.IMAP4_SSL, uid_set: str) -> Tuple[Dict[int, Dict[str, Any]], List[Dict[str, Any]]]:
+    """先只获取邮件头并按规则分流，被丢弃或只发布邮件头的邮件不再下载正文
+    Fetch only the headers first and route them, so dropped and headers-only messages
+    never have their body downloaded
 
-def check_new_emails(mail: imaplib.IMAP4_SSL, last_uid: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
-    """检查新邮件
-    Check for new emails
-    
     Args:
         mail (imaplib.IMAP4_SSL): 邮箱连接对象 / Mailbox connection object
-        last_uid (str, optional): 上次检查的最后一封邮件的UID / UID of the last email checked
-        
+        uid_set (str): IMAP UID集合 / IMAP UID set
+
     Returns:
-        list: 新邮件列表，每个邮件包含ID、主题、发件人和内容 / List of new emails, each containing ID, subject, sender and content
-        如果出错则返回None / Returns None if an error occurs
+        tuple: ({uid: 路由结果 / route} 需要正文的邮件 / messages that need their body,
+                [{'uid': ..., 'email': 邮件信息 / email information}] 不需要正文的邮件 / messages that need no body)
     """
-    try:
-        # 搜索所有未读邮件
-        status, messages = mail.search(None, 'UNSEEN')
+    with STAGE_SECONDS.time(stage='imap_fetch'):
+        status, msg_data = mail.uid('FETCH', uid_set, '(UID BODY.PEEK[HEADER])')
+    if status != 'OK':
+        STAGE_ERRORS.inc(stage='imap_fetch')
+        return {}, []
+
+    body_routes: Dict[int, Dict[str, Any]] = {}
+    finished: List[Dict[str, Any]] = []
+    for item in iter_fetch_response(msg_data):
+        if item.get('UID') is None or item.get('BODY[HEADER]') is None:
+            continue
+        FETCHED_BYTES.inc(len(item['BODY[HEADER]']))
+        headers = parse_headers(item['BODY[HEADER]'])
+        route = route_email(headers)
+        if route['action'] == 'publish':
+            body_routes[int(item['UID'])] = route
+        else:
+            finished.append({'uid': item['UID'], 'email': dict(headers_only_email(item['UID'], headers), **route)})
+    FETCHED_MESSAGES.inc(len(finished))
+    return body_routes, finished
+
+def fetch_full_emails(mail: imaplib.IMAP4_SSL, uid_set: str) -> List[Dict[str, Any]]:
+    """用一次UID FETCH获取完整的RFC822邮件，BODY.PEEK不设置已读标志
+    Fetch complete RFC822 messages with a single UID FETCH; BODY.PEEK leaves the seen flag alone
+
+    配置了路由规则时先获取邮件头，只下载需要发布正文的邮件
+    With routing rules configured the headers are fetched first, and only messages whose
+    body gets published are downloaded
+
+    Args:
+        mail (imaplib.IMAP4_SSL): 邮箱连接对象 / Mailbox connection object
+        uid_set (str): IMAP UID集合 / IMAP UID set
+
+    Returns:
+        list: 待解析的邮件，交给parse_fetched / Fetched messages awaiting parse_fetched
+    """
+    body_routes: Dict[int, Dict[str, Any]] = {}
+    finished: List[Dict[str, Any]] = []
+    if rules is not None:
+        body_routes, finished = fetch_routed_headers(mail, uid_set)
+        if not body_routes:
+            return finished
+        uid_set = compress_uids(body_routes)
+
+    with STAGE_SECONDS.time(stage='imap_fetch'):
+        status, msg_data = mail.uid('FETCH', uid_set, '(UID BODY.PEEK[])')
+    if status != 'OK':
+        STAGE_ERRORS.inc(stage='imap_fetch')
+        return finished
+
+    # 跳过服务器附带的FLAGS等非正文响应 / Skip FLAGS-only responses sent alongside
+    items = [
+        item for item in iter_fetch_response(msg_data)
+        if item.get('UID') is not None and item.get('BODY[]') is not None
+    ]
+    FETCHED_MESSAGES.inc(len(items))
+    FETCHED_BYTES.inc(sum(len(item['BODY[]']) for item in items))
+    fetched = [
+        {'uid': item['UID'], 'raw': item['BODY[]'], 'route': body_routes.get(int(item['UID']))} for item in items
+    ]
+    if not finished:
+        return fetched
+    return sorted(fetched + finished, key=lambda f: int(f['uid']))
+
+def fetch_text_emails(mail: imaplib.IMAP4_SSL, uid_set: str) -> List[Dict[str, Any]]:
+    """先获取BODYSTRUCTURE和邮件头，再只获取文本段，跳过附件
+    Fetch BODYSTRUCTURE and headers first, then only the text sections, skipping attachments
+
+    段结构相同的邮件合并为一次FETCH；BODY.PEEK不会设置已读标志
+    Messages with the same section layout share one FETCH; BODY.PEEK does not set the
+    seen flag
+
+    Args:
+        mail (imaplib.IMAP4_SSL): 邮箱连接对象 / Mailbox connection object
+        uid_set (str): IMAP UID集合 / IMAP UID set
+
+    Returns:
+        list: 待解析的邮件，交给parse_fetched / Fetched messages awaiting parse_fetched
+    """
+    with STAGE_SECONDS.time(stage='imap_fetch'):
+        status, msg_data = mail.uid('FETCH', uid_set, '(UID BODYSTRUCTURE BODY.PEEK[HEADER])')
+    if status != 'OK':
+        STAGE_ERRORS.inc(stage='imap_fetch')
+        return []
+
+    headers: Dict[int, Tuple[bytes, List[Any]]] = {}
+    routes: Dict[int, Dict[str, Any]] = {}
+    groups: Dict[Tuple[str, ...], List[int]] = {}
+    for item in iter_fetch_response(msg_data):
+        if item.get('UID') is None or item.get('BODY[HEADER]') is None:
+            continue
+        uid = int(item['UID'])
+        structure = item.get('BODYSTRUCTURE') or []
+        headers[uid] = (item['BODY[HEADER]'], structure)
+        if rules is not None:
+            # 被丢弃或只发布邮件头的邮件不获取正文 / No body fetch for dropped and headers-only messages
+            routes[uid] = route_email(parse_headers(item['BODY[HEADER]']))
+            if routes[uid]['action'] != 'publish':
+                continue
+        sections = tuple(part['section'] for part in find_text_parts(structure))
+        groups.setdefault(sections, []).append(uid)
+
+    # 可选的字节上限，例如 BODY.PEEK[1]<0.65536> / Optional byte cap, e.g. BODY.PEEK[1]<0.65536>
+    partial = f'<0.{TEXT_PART_MAX_BYTES}>' if TEXT_PART_MAX_BYTES > 0 else ''
+    bodies: Dict[int, Dict[str, Any]] = {}
+    for sections, uids in groups.items():
+        if not sections:
+            continue
+        query = ' '.join(f'BODY.PEEK[{section}]{partial}' for section in sections)
+        with STAGE_SECONDS.time(stage='imap_fetch'):
+            status, body_data = mail.uid('FETCH', compress_uids(uids), f'(UID {query})')
         if status != 'OK':
-            return None
+            STAGE_ERRORS.inc(stage='imap_fetch')
+            continue
+        for item in iter_fetch_response(body_data):
+            if item.get('UID') is not None:
+                bodies[int(item['UID'])] = item
+                FETCHED_BYTES.inc(sum(len(value) for key, value in item.items()
+                                      if key.startswith('BODY[') and isinstance(value, bytes)))
 
-        email_ids = messages[0].split()
-        new_emails = []
-        
-        for e_id in email_ids:
-            # 获取邮件内容
-            status, msg_data = mail.fetch(e_id, '(RFC822)')
-            if status != 'OK':
+    # 附件逐块写入附件存储，只保留元数据 / Attachments are streamed into the attachment store and only their metadata is kept
+    attachments: Dict[int, List[Dict[str, Any]]] = {}
+    if attachment_store is not None:
+        for uid, (_, structure) in sorted(headers.items()):
+            if uid in routes and routes[uid]['action'] != 'publish':
                 continue
-                
-            raw_email = msg_data[0][1]
-            email_message = email.message_from_bytes(raw_email)
-            
-            # 解码邮件主题
-            subject, encoding = decode_header(email_message['Subject'])[0]
-            if isinstance(subject, bytes):
-                subject = subject.decode(encoding or 'utf-8')
-            
-            # 提取邮件正文
-            content,content_hash = extract_email_content(email_message)
-                
-            new_emails.append({
-                'id': e_id,
-                'subject': subject,
-                'from': email_message['From'],
-                'content': content,
-                'content_hash': content_hash
-            })
-            
-        return new_emails
-    except Exception as e:
-        print(f"检查邮件出错: {e}")
+            attachments[uid] = store_attachments(mail, uid, structure)
+
+    FETCHED_MESSAGES.inc(len(headers))
+    FETCHED_BYTES.inc(sum(len(header) for header, _ in headers.values()))
+
+    return [
+        {'uid': str(uid).encode(), 'header': header, 'structure': structure,
+         'sections': bodies.get(uid, {}), 'route': routes.get(uid), 'attachments': attachments.get(uid)}
+        for uid, (header, structure) in sorted(headers.items())
+    ]
+
+def store_seen(mail: imaplib.IMAP4_SSL, uids: List[int]) -> None:
+    """把已安全发布的邮件标记为已读
+    Mark mail that was published safely as seen
+
+    Args:
+        mail (imaplib.IMAP4_SSL): 邮箱连接对象 / Mailbox connection object
+        uids (list): 邮件UID / Email UIDs
+    """
+    status, data = mail.uid('STORE', compress_uids(uids), '+FLAGS.SILENT', '(\\Seen)')
+    if status != 'OK':
+        # 例如只读文件夹，邮件照常发布 / E.g. a read-only folder; the mail is published all the same
+        log.warning("标记已读失败: %s", data)
+
+def store_attachments(mail: imaplib.IMAP4_SSL, uid: int, structure: List[Any]) -> List[Dict[str, Any]]:
+    """用部分获取逐块下载邮件的附件，边解码边写入附件存储
+    Download the attachments of a message chunk by chunk with partial fetches, decoding
+    them into the attachment store as they arrive
+
+    每次只获取 ATTACHMENT_CHUNK_SIZE 字节，附件再大内存占用也不变
+    Only ATTACHMENT_CHUNK_SIZE bytes are fetched at a time, so memory use stays the same
+    however large the attachment is
+
+    Args:
+        mail (imaplib.IMAP4_SSL): 邮箱连接对象 / Mailbox connection object
+        uid (int): 邮件UID / Email UID
+        structure (list): 解析后的BODYSTRUCTURE / Parsed BODYSTRUCTURE
+
+    Returns:
+        list: 每个附件的 {'filename', 'content_type', 'size', 'sha256', 'path'}
+        {'filename', 'content_type', 'size', 'sha256', 'path'} for each attachment
+    """
+    stored = []
+    for part in find_attachment_parts(structure):
+        key = f"BODY[{part['section']}]"
+        writer = attachment_store.open(part['encoding'])
+        offset = 0
+        try:
+            with STAGE_SECONDS.time(stage='attachment'):
+                while True:
+                    query = f"(UID BODY.PEEK[{part['section']}]<{offset}.{ATTACHMENT_CHUNK_SIZE}>)"
+                    status, data = mail.uid('FETCH', str(uid), query)
+                    if status != 'OK':
+                        raise imaplib.IMAP4.error(f"FETCH {query}: {data}")
+                    chunk = next((item[key] for item in iter_fetch_response(data) if item.get(key) is not None), b'')
+                    writer.write(chunk)
+                    offset += len(chunk)
+                    FETCHED_BYTES.inc(len(chunk))
+                    if len(chunk) < ATTACHMENT_CHUNK_SIZE:
+                        break
+            info = writer.commit()
+        except imaplib.IMAP4.abort:
+            writer.abort()
+            raise
+        except imaplib.IMAP4.error as e:
+            # 跳过这个附件，邮件照常发布 / Skip this attachment, the message is published as usual
+            writer.abort()
+            STAGE_ERRORS.inc(stage='attachment')
+            log.warning("获取附件失败: %s", e, extra={'uid': uid, 'section': part['section']})
+            continue
+        except Exception:
+            writer.abort()
+            raise
+        ATTACHMENT_BYTES.inc(info['size'])
+        stored.append({'filename': part['filename'], 'content_type': part['type'], **info})
+    return stored
+
+def parse_fetched(item: Dict[str, Any]) -> Dict[str, Any]:
+    """解析fetch阶段获取的一封邮件
+    Parse one message produced by the fetch stage
+
+    Args:
+        item (dict): fetch_full_emails或fetch_text_emails返回的一项 / One item returned by fetch_full_emails or fetch_text_emails
+
+    Returns:
+        dict: 包含UID、主题、发件人、内容和路由结果的字典 / Dictionary containing UID, subject, sender, content and route
+    """
+    if 'email' in item:
+        return item['email']
+    if 'raw' in item:
+        email_info = parse_raw_email(item['uid'], item['raw'])
+    else:
+        email_info = parse_text_sections(item['uid'], item['header'], item['structure'], item['sections'])
+        if item.get('attachments'):
+            email_info['attachments'] = item['attachments']
+    return dict(email_info, **item['route']) if item.get('route') else email_info
+
+def search_new_emails(mail: imaplib.IMAP4_SSL, last_uid: Optional[int] = None) -> Optional[List[int]]:
+    """搜索新邮件的UID
+    Search for the UIDs of new emails
+    
+    Args:
+        mail (imaplib.IMAP4_SSL): 邮箱连接对象 / Mailbox connection object
+        last_uid (int, optional): 已处理的最大UID，为None时只同步未读邮件
+                                  Highest processed UID, only unread mail is synced when None
+        
+    Returns:
+        list: 按升序排列的新邮件UID / UIDs of new emails in ascending order
+        如果出错则返回None / Returns None if an error occurs
+    """
+    with STAGE_SECONDS.time(stage='imap_search'):
+        if last_uid is None:
+            # 没有检查点时搜索所有未读邮件
+            status, messages = mail.uid('SEARCH', None, 'UNSEEN')
+        else:
+            # 只搜索比检查点更新的邮件
+            status, messages = mail.uid('SEARCH', None, f'UID {last_uid + 1}:*')
+    if status != 'OK':
+        STAGE_ERRORS.inc(stage='imap_search')
         return None
 
+    # "n:*" 在没有新邮件时仍会返回最后一封邮件，需要过滤
+    return sorted(int(uid) for uid in messages[0].split() if last_uid is None or int(uid) > last_uid)
+
+def fetch_emails(mail: imaplib.IMAP4_SSL, uids: List[int]) -> List[Dict[str, Any]]:
+    """用一次往返获取一块邮件，按FETCH_MODE选择完整邮件或只获取文本段
+    Fetch one chunk of emails in a single round trip, complete messages or text sections
+    only depending on FETCH_MODE
+
+    Args:
+        mail (imaplib.IMAP4_SSL): 邮箱连接对象 / Mailbox connection object
+        uids (list): 邮件UID / Email UIDs
+
+    Returns:
+        list: 待解析的邮件，交给parse_fetched / Fetched messages awaiting parse_fetched
+    """
+    uid_set = compress_uids(uids)
+    # 附件存储需要BODYSTRUCTURE，因此总是按段获取 / The attachment store needs BODYSTRUCTURE, so it always fetches by section
+    if FETCH_MODE == 'text' or attachment_store is not None:
+        return fetch_text_emails(mail, uid_set)
+    return fetch_full_emails(mail, uid_set)
+
 def parse_sender(sender: str) -> Dict[str, str]:
     """解析发件人信息
     Parse sender information
@@ -271,6 +903,9 @@ def parse_sender(sender: str) -> Dict[str, str]:
     Returns:
         dict: 包含发件人名称和邮箱的字典 / Dictionary containing sender's name and email
     """
+    if not sender:
+        # 没有From邮件头 / No From header
+        return {'name': '', 'email': ''}
     try:
         # 处理没有尖括号的情况
         if '<' not in sender and '>' not in sender:
@@ -307,13 +942,13 @@ def parse_sender(sender: str) -> Dict[str, str]:
             'email': email_part
         }
     except Exception as e:
-        print(f"解析发件人信息出错: {e}")
+        log.warning("解析发件人信息出错: %s", e)
         return {
             'name': sender,
             'email': sender
         }
 
-def on_connect(client: mqtt.Client, userdata: Any, flags: Dict[str, Any], rc: int) -> None:
+def on_connect(client: mqtt.Client, userdata: Any, flags: Dict[str, Any], rc: int, properties: Any = None) -> None:
     """MQTT连接回调函数
     MQTT connection callback function
     
@@ -322,13 +957,27 @@ def on_connect(client: mqtt.Client, userdata: Any, flags: Dict[str, Any], rc: in
         userdata: 用户数据 / User data
         flags: 连接标志 / Connection flags
         rc (int): 结果代码，0表示连接成功 / Result code, 0 means successful connection
+        properties: MQTT v5 的CONNACK属性 / MQTT v5 CONNACK properties
     """
+    supervisor = supervisors.get('mqtt')
     if rc == 0:
-        print("MQTT连接成功")
+        log.info("MQTT连接成功")
+        if supervisor:
+            supervisor.succeeded()
+        if election:
+            # 每次连接后重新订阅租约，之前的订阅不一定保留 / Resubscribe to the lease on every connect, earlier subscriptions may be gone
+            election.subscribe()
     else:
-        print(f"MQTT连接失败，错误码: {rc}")
+        log.warning("MQTT连接失败，错误码: %s", rc)
+        if supervisor:
+            # 代理拒绝连接，按退避间隔重试 / The broker refused the connection, retry after the backoff
+            delay = supervisor.failed(f"CONNACK {rc}")
+            client.reconnect_delay_set(delay, delay)
+    if isinstance(userdata, Publisher):
+        # MQTT v5 代理在CONNACK中告知允许的主题别名数 / An MQTT v5 broker announces its topic alias limit in CONNACK
+        userdata.set_connected(rc == 0, getattr(properties, 'TopicAliasMaximum', 0))
 
-def on_disconnect(client: mqtt.Client, userdata: Any, rc: int) -> None:
+def on_disconnect(client: mqtt.Client, userdata: Any, rc: int, properties: Any = None) -> None:
     """MQTT断开连接回调函数
     MQTT disconnection callback function
     
@@ -336,29 +985,151 @@ def on_disconnect(client: mqtt.Client, userdata: Any, rc: int) -> None:
         client (mqtt.Client): MQTT客户端对象 / MQTT client object
         userdata: 用户数据 / User data
         rc (int): 结果代码，0表示正常断开，非0表示意外断开 / Result code, 0 means normal disconnection, non-zero means unexpected disconnection
+        properties: MQTT v5 的DISCONNECT属性 / MQTT v5 DISCONNECT properties
     """
-    print(f"MQTT连接断开，错误码: {rc}")
-    # 自动重连逻辑
-    if rc != 0:
-        print("尝试重新连接...")
-        client.reconnect()
+    log.log(logging.INFO if rc == 0 else logging.WARNING, "MQTT连接断开，错误码: %s", rc)
+    # 网络循环会自动重连，这里只暂停发布，未发送的消息留在队列和磁盘缓冲中
+    # The network loop reconnects on its own; publishing just pauses here and
+    # unsent messages stay in the queue and the disk spool
+    if isinstance(userdata, Publisher):
+        userdata.set_connected(False)
+    if election:
+        # 代理随即发布遗嘱，主节点不再监听邮箱 / The broker publishes the will right away, so the leader stops watching
+        election.disconnected()
+    supervisor = supervisors.get('mqtt')
+    # 连接被拒绝时on_connect已经设置了退避间隔 / After a refused connection on_connect already set the backoff
+    if supervisor and supervisor.connected:
+        delay = supervisor.disconnected(f"disconnect {rc}")
+        client.reconnect_delay_set(delay, delay)
+
+def on_connect_fail(client: mqtt.Client, userdata: Any) -> None:
+    """MQTT连接失败回调函数（网络错误，未收到CONNACK），设置下一次重连前的等待时间
+    MQTT connection failure callback (network error, no CONNACK); sets the wait before the next reconnect
 
-def main() -> None:
-    """主函数，程序入口点
-    Main function, program entry point
+    Args:
+        client (mqtt.Client): MQTT客户端对象 / MQTT client object
+        userdata: 用户数据 / User data
+    """
+    supervisor = supervisors.get('mqtt')
+    if supervisor:
+        delay = supervisor.failed('connect failed')
+        log.warning("MQTT连接失败，%.1f秒后重试", delay)
+        client.reconnect_delay_set(delay, delay)
+
+async def wait_for_new_mail(mail: imaplib.IMAP4_SSL, use_idle: bool, imap: Callable[..., Awaitable[Any]],
+                            control: WatcherControl, timeout: Optional[float] = None) -> bool:
+    """等待下一次检查邮件的时机
+    Wait until the next mailbox check is due
+
+    支持IDLE时等待服务器推送新邮件或IDLE超时（不超过IMAP_KEEPALIVE），否则按监听控制的
+    自适应间隔轮询。两种等待都可以被监听控制（POST /poll 等）立即打断
+    Waits until the server pushes new mail or IDLE times out (after at most IMAP_KEEPALIVE)
+    when IDLE is supported, otherwise polls at the watcher control's adaptive interval.
+    Either wait can be cut short by the watcher control (POST /poll and friends)
+
+    Args:
+        mail (imaplib.IMAP4_SSL): 邮箱连接对象 / Mailbox connection object
+        use_idle (bool): 是否使用IDLE / Whether to use IDLE
+        imap (Callable): 在该连接的IMAP线程中执行函数 / Runs a function in the connection's IMAP thread
+        control (WatcherControl): 监听控制 / Watcher control
+        timeout (float): 最多等待的秒数，默认按上述间隔 / Most seconds to wait, the intervals above by default
+
+    Returns:
+        bool: 期间与服务器有过成功的往返时返回True / True when a round trip with the server succeeded meanwhile
+
+    Raises:
+        imaplib.IMAP4.abort: IDLE期间连接断开 / The connection dropped during IDLE
+    """
+    if not use_idle:
+        await imap(control.wait, control.interval if timeout is None else min(timeout, control.interval))
+        return False
+    if timeout is not None and timeout < 1:
+        # 很短的等待不值得一次IDLE往返 / A very short wait is not worth an IDLE round trip
+        await imap(control.wait, timeout)
+        return False
+    try:
+        await imap(idle_wait, mail, min(IDLE_TIMEOUT, IMAP_KEEPALIVE, timeout or IMAP_KEEPALIVE), control.wake_socket)
+        return True
+    except imaplib.IMAP4.abort:
+        raise
+    except imaplib.IMAP4.error as e:
+        # 服务器拒绝IDLE时退回一次轮询间隔 / Fall back to one polling interval when the server rejects IDLE
+        log.warning("IDLE等待出错: %s", e)
+        await asyncio.sleep(CHECK_INTERVAL)
+        return False
+
+def close_imap(mail: Optional[imaplib.IMAP4_SSL]) -> None:
+    """关闭IMAP套接字，正在IDLE中等待的线程随即返回
+    Shut down the IMAP socket so a thread waiting in IDLE returns right away
+
+    Args:
+        mail (imaplib.IMAP4_SSL): 邮箱连接对象 / Mailbox connection object
+    """
+    if mail is None:
+        return
+    try:
+        mail.sock.shutdown(socket.SHUT_RDWR)
+    except Exception:
+        pass
+
+async def main() -> None:
+    """主函数，程序入口点，在FastAPI生命周期内作为asyncio任务运行
+    Main function, program entry point, run as an asyncio task within the FastAPI lifespan
     
-    持续监听邮箱，检查新邮件并通过MQTT发送邮件内容
-    Continuously monitors mailbox, checks for new emails and sends email content via MQTT
+    持续监听邮箱，检查新邮件并通过MQTT发送邮件内容；任务被取消时停止所有监听并关闭连接
+    Continuously monitors mailbox, checks for new emails and sends email content via MQTT;
+    cancelling the task stops every watcher and closes the connections
     """
-    print("开始监听邮箱...")  # 开始监听提示 / Start monitoring prompt
-    last_uid = None
+    global publisher, rules, attachment_store, payload_encoder, body_cache, election
+    check_config()
+    log.info("开始监听邮箱...")  # 开始监听提示 / Start monitoring prompt
+    
+    # 先读取配置文件，配置有误时在建立任何连接之前退出
+    # Read the config files first so a mistake fails before any connection is opened
+    if RULES_FILE:
+        # 按邮件头路由的规则 / Header-based routing rules
+        rules = load_rules(RULES_FILE)
+        log.info("已加载 %d 条路由规则", len(rules))
+    payload_encoder = PayloadEncoder(PAYLOAD_FORMAT, PAYLOAD_COMPRESS_THRESHOLD, MQTT_MAX_PAYLOAD)
+    if BODY_MODE == 'summary':
+        # MQTT只发布摘要，完整正文通过 GET /mail/{id} 读取 / MQTT carries only a snippet, the full body is read through GET /mail/{id}
+        body_cache = BodyCache(BODY_CACHE_BYTES, BODY_CACHE_DIR, BODY_CACHE_DIR_BYTES)
+        log.info("正文缓存: %d 字节", BODY_CACHE_BYTES, extra={'spill_dir': BODY_CACHE_DIR} if BODY_CACHE_DIR else None)
+    elif BODY_MODE != 'full':
+        raise ValueError(f"未知正文模式 {BODY_MODE!r}，可选 full 或 summary / Unknown body mode {BODY_MODE!r}, expected full or summary")
+    if ATTACHMENT_DIR:
+        # 附件写入本地存储，MQTT消息只带元数据 / Attachments go to the local store, MQTT carries only their metadata
+        attachment_store = AttachmentStore(ATTACHMENT_DIR)
+        log.info("附件存储: %s", attachment_store.root)
+    if ACCOUNTS_FILE:
+        # 读取要监听的账户和文件夹 / Load the accounts and folders to watch
+        accounts = load_accounts(ACCOUNTS_FILE, MQTT_TOPIC, CHECKPOINT_FILE)
+    else:
+        accounts = [default_account(IMAP_SERVER, USERNAME, PASSWORD, MQTT_TOPIC, CHECKPOINT_FILE)]
+    
+    # 每个连接的监督器，全部连接成功后/ready才返回就绪
+    # One supervisor per connection; /ready reports ready once all of them are connected
+    supervisors.clear()
+    supervise('mqtt')
+    for control in watchers.values():
+        control.close()
+    watchers.clear()
+    for account in accounts:
+        supervise(f"imap:{account['name']}")
+        watcher_control(account['name'])
     
     # 初始化MQTT客户端 / Initialize MQTT client
-    mqtt_client = mqtt.Client(client_id='email2mqtt')  # 使用指定的客户端ID / Use specified client ID
+    # 主备运行时每个副本需要自己的客户端ID，否则代理会互相踢掉连接
+    # With active/standby each replica needs its own client ID, otherwise the broker kicks one off for the other
+    mqtt_client = mqtt.Client(  # 使用指定的客户端ID / Use specified client ID
+        client_id=f'email2mqtt-{HA_NODE_ID}' if HA_LEASE_TOPIC else 'email2mqtt',
+        protocol=mqtt.MQTTv5 if MQTT_PROTOCOL == '5' else mqtt.MQTTv311
+    )
     
     # 设置回调函数 / Set callback functions
     mqtt_client.on_connect = on_connect  # 连接回调 / Connection callback
     mqtt_client.on_disconnect = on_disconnect  # 断开连接回调 / Disconnection callback
+    mqtt_client.on_connect_fail = on_connect_fail  # 连接失败回调 / Connection failure callback
     
     # 设置MQTT用户名和密码 / Set MQTT username and password
     mqtt_client.username_pw_set(MQTT_USERNAME, MQTT_PASSWORD)
@@ -371,106 +1142,592 @@ def main() -> None:
             #keyfile=MQTT_SSL_KEYFILE  # 客户端密钥 / Client key
         )
     
-    # 连接到MQTT代理 / Connect to MQTT broker
-    mqtt_client.connect(MQTT_BROKER, MQTT_PORT)
+    # 发布队列在代理不可用时阻塞并写入磁盘缓冲 / The publish queue blocks and spools to disk while the broker is unavailable
+    publisher = Publisher(
+        mqtt_client, Spool(SPOOL_FILE), MQTT_QOS, MQTT_MAX_INFLIGHT, PUBLISH_QUEUE_SIZE, PUBLISH_QUEUE_TIMEOUT,
+        protocol_v5=MQTT_PROTOCOL == '5', message_expiry=MQTT_MESSAGE_EXPIRY, topic_alias_max=MQTT_TOPIC_ALIAS_MAX
+    )
+    mqtt_client.user_data_set(publisher)
+    election = None
+    if HA_LEASE_TOPIC:
+        # 遗嘱在连接前设置，只有赢得租约的副本监听邮箱 / The will is set before connecting; only the replica holding the lease watches the mailboxes
+        election = LeaderElection(mqtt_client, HA_LEASE_TOPIC, HA_NODE_ID, HA_LEASE_SECONDS)
+        log.info("主备模式，节点 %s", HA_NODE_ID, extra={'lease_topic': HA_LEASE_TOPIC})
+    # 每次重连前的等待时间由连接监督器在回调中设置 / The callbacks set each reconnect delay from the connection supervisor
+    mqtt_client.reconnect_delay_set(min_delay=RECONNECT_MIN_DELAY, max_delay=RECONNECT_MIN_DELAY)
+    
+    # 连接到MQTT代理，启动时代理不可用也会在后台重试；网络I/O在paho的线程中进行，不阻塞事件循环
+    # Connect to MQTT broker, retrying in the background if it is down at startup; network
+    # I/O happens in paho's own thread and never blocks the event loop
+    # 主备模式下心跳间隔随租约缩短，代理更快发现掉线的主节点并发布其遗嘱
+    # In active/standby mode the keepalive shrinks with the lease so the broker notices a dead leader and publishes its will sooner
+    mqtt_client.connect_async(MQTT_BROKER, MQTT_PORT, keepalive=max(5, round(HA_LEASE_SECONDS / 2)) if election else 60)
     mqtt_client.loop_start()  # 启动网络循环 / Start network loop
     
-    # 连接到邮箱服务器 / Connect to mail server
-    mail = connect_to_imap()
-    if not mail:
-        print("初始邮箱连接失败，程序退出")  # 初始连接失败提示 / Initial connection failure prompt
-        return
+    tasks = []
+    dedup = None
+    try:
+        # 已处理邮件的去重索引，在线程中打开，与MQTT握手同时进行
+        # Dedup index of processed emails, opened in a thread while the MQTT handshake runs
+        dedup = await asyncio.to_thread(DedupStore, DEDUP_DB, DEDUP_MAX_ENTRIES, DEDUP_TTL)
         
-    print("邮箱连接成功，开始监听新邮件")  # 连接成功提示 / Connection success prompt
-    
+        # 近似重复合并，窗口结束后发布汇总 / Near-duplicate collapsing, with a summary once each window ends
+        near_duplicates = None
+        if NEAR_DUP_WINDOW > 0:
+            near_duplicates = NearDuplicateIndex(NEAR_DUP_WINDOW, NEAR_DUP_DISTANCE)
+            tasks.append(asyncio.create_task(flush_near_duplicates(near_duplicates, publisher), name='near-dup-flush'))
+        
+        # 每个文件夹一个任务，共享同一个发布队列和去重索引，各自的IMAP连接同时建立
+        # One task per folder, all sharing one publish pipeline and dedup index; their IMAP
+        # connections are set up concurrently
+        if election:
+            # 只有主节点监听邮箱 / Only the leader watches the mailboxes
+            tasks.append(asyncio.create_task(election.run(), name='election'))
+            tasks.append(asyncio.create_task(lead(accounts, publisher, dedup, near_duplicates), name='leader'))
+        else:
+            for account in accounts:
+                tasks.append(asyncio.create_task(
+                    watch_mailbox(account, publisher, dedup, near_duplicates), name=f"watch-{account['name']}"
+                ))
+            log.info("正在监听 %d 个文件夹", len(accounts))
+        
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # 未发送的消息写入磁盘缓冲，下次启动时发送 / Unsent messages go to the disk spool and are sent on the next start
+        await asyncio.to_thread(publisher.close)
+        mqtt_client.disconnect()
+        mqtt_client.loop_stop()
+        part_scanner.close()
+        if dedup:
+            dedup.close()
+        log.info("邮箱监听已停止")
+
+
+async def lead(accounts: List[Dict[str, Any]], publisher: Publisher, dedup: DedupStore,
+               near_duplicates: Optional[NearDuplicateIndex] = None) -> None:
+    """当选主节点时开始监听所有文件夹，失去领导权时停止
+    Watch every folder while this replica is the leader and stop when leadership is lost
+
+    接任时先采用上一任主节点发布的UID检查点，从它停下的地方继续；它最后一批已发布
+    但未写入检查点的邮件会再发布一次
+    On taking over, the UID checkpoints published by the previous leader are adopted first
+    so watching resumes where it stopped; its last batch that was published but not yet
+    checkpointed is published once more
+
+    Args:
+        accounts (list): 监听配置 / Watcher configurations
+        publisher (Publisher): 共享的MQTT发布队列 / Shared MQTT publish pipeline
+        dedup (DedupStore): 共享的去重索引 / Shared dedup index
+        near_duplicates (NearDuplicateIndex): 共享的近似重复索引，None为关闭 / Shared near-duplicate index, None disables it
+    """
     while True:
+        election.changed.clear()
+        if not election.is_leader:
+            await election.changed.wait()
+            continue
+        for account in accounts:
+            adopt_checkpoint(account)
+        watching = [
+            asyncio.create_task(watch_mailbox(account, publisher, dedup, near_duplicates), name=f"watch-{account['name']}")
+            for account in accounts
+        ]
+        log.info("正在监听 %d 个文件夹", len(accounts))
+        changed = asyncio.create_task(election.changed.wait())
         try:
-            # 检查邮箱连接是否有效 / Check if mailbox connection is valid
+            done, _ = await asyncio.wait([changed, *watching], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task is not changed:
+                    # 与单实例相同，监听异常退出时程序退出 / As with a single instance, a watcher failing ends the program
+                    task.result()
+        finally:
+            for task in [changed, *watching]:
+                task.cancel()
+            await asyncio.gather(changed, *watching, return_exceptions=True)
+        log.info("不再是主节点，停止监听")
+
+def adopt_checkpoint(account: Dict[str, Any]) -> None:
+    # 上一任主节点的检查点比本地的新时写入本地检查点文件 / Write the previous leader's checkpoint locally when it is newer than ours
+    remote = election.checkpoint(account['name'])
+    if remote is None:
+        return
+    local = load_checkpoint(account['checkpoint'])
+    if local is None or local['uidvalidity'] != remote['uidvalidity'] or local['last_uid'] < remote['last_uid']:
+        save_checkpoint(account['checkpoint'], remote['uidvalidity'], remote['last_uid'])
+        log.info("从上一任主节点的检查点继续: UID %d", remote['last_uid'], extra={'watcher': account['name']})
+
+
+async def flush_near_duplicates(near_duplicates: NearDuplicateIndex, publisher: Publisher) -> None:
+    """定期发布窗口已结束的近似重复组的汇总
+    Periodically publish a summary of every near-duplicate group whose window has ended
+
+    Args:
+        near_duplicates (NearDuplicateIndex): 近似重复索引 / Near-duplicate index
+        publisher (Publisher): MQTT发布队列 / MQTT publish pipeline
+    """
+    window = near_duplicates.window
+    while True:
+        await asyncio.sleep(min(1.0, window / 4))
+        for group in near_duplicates.expired():
+            info, count = group['info'], group['count']
+            record = {
+                'id': '', 'message_id': '', 'from': {'name': info['sender'], 'email': info['email']},
+                'subject': info['subject'],
+                'body': f"{window:g}秒内另有 {count} 封相似邮件 / {count} more similar messages within {window:g}s",
+                'body_type': 'text', 'similar': count
+            }
+            size, _ = await asyncio.to_thread(publish_record, publisher, info['topic'], record)
+            PUBLISHED_MESSAGES.inc(watcher='near-dup')
+            PUBLISHED_BYTES.inc(size, watcher='near-dup')
+
+
+async def watch_mailbox(account: Dict[str, Any], publisher: Publisher, dedup: DedupStore,
+                        near_duplicates: Optional[NearDuplicateIndex] = None) -> None:
+    """监听单个账户的单个文件夹，检查新邮件并通过MQTT发送邮件内容
+    Watch one folder of one account, check for new emails and send their content via MQTT
+
+    获取、解析和发布是三个asyncio任务，由有界队列连接：HTML处理服务或MQTT代理较慢时
+    只会填满队列，不会阻塞邮箱检查；队列满时获取自然放慢。阻塞的imaplib调用在该文件夹
+    专用的线程中执行，事件循环不被阻塞
+    Fetching, parsing and publishing are three asyncio tasks joined by bounded queues: a
+    slow HTML processor or MQTT broker only fills the queues instead of stalling the
+    mailbox checks, and fetching naturally slows down once they are full. Blocking
+    imaplib calls run in a thread dedicated to this folder, so the event loop never blocks
+
+    第四个提交阶段等每个批次的消息被代理确认或写入磁盘缓冲后，才更新检查点并把邮件标记为已读
+    A fourth commit stage waits until the messages of each batch were acknowledged by the
+    broker or written to the disk spool before it updates the checkpoint and marks the
+    mail as seen
+
+    Args:
+        account (dict): 监听配置 / Watcher configuration
+        publisher (Publisher): 共享的MQTT发布队列 / Shared MQTT publish pipeline
+        dedup (DedupStore): 共享的去重索引 / Shared dedup index
+        near_duplicates (NearDuplicateIndex): 共享的近似重复索引，None为关闭 / Shared near-duplicate index, None disables it
+    """
+    parse_queue: 'asyncio.Queue[Dict[str, Any]]' = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    publish_queue: 'asyncio.Queue[Dict[str, Any]]' = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    commit_queue: 'asyncio.Queue[Dict[str, Any]]' = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    # 已发布但尚未提交的去重键，提交后才写入去重索引 / Dedup keys published but not committed yet; they reach the dedup index on commit
+    uncommitted: Dict[str, str] = {}
+    stages = [
+        asyncio.create_task(fetch_stage(account, parse_queue)),
+        asyncio.create_task(parse_stage(account, parse_queue, publish_queue)),
+        asyncio.create_task(publish_stage(account, publish_queue, commit_queue, publisher, dedup, uncommitted,
+                                          near_duplicates)),
+        asyncio.create_task(commit_stage(account, commit_queue, dedup, uncommitted)),
+    ]
+    try:
+        # 各阶段都不会自行结束，任何一个异常退出时监听随之失败，而不是留下不再前进的管道
+        # No stage ends on its own; when any of them fails the watcher fails with it instead
+        # of leaving a pipeline that no longer moves
+        done, _ = await asyncio.wait(stages, return_when=asyncio.FIRST_EXCEPTION)
+        for stage in done:
+            stage.result()
+    finally:
+        # 未提交的批次不会写入检查点，下次启动时重新获取 / Uncommitted batches never reach the checkpoint and are fetched again next time
+        for stage in stages:
+            stage.cancel()
+        await asyncio.gather(*stages, return_exceptions=True)
+
+
+async def fetch_stage(account: Dict[str, Any], parse_queue: 'asyncio.Queue[Dict[str, Any]]') -> None:
+    """获取阶段：保持IMAP连接，按块获取新邮件放入解析队列，然后等待新邮件
+    Fetch stage: keep the IMAP connection, fetch new mail chunk by chunk into the parse
+    queue, then wait for more mail
+
+    一次搜索到超过 FETCH_CHUNK_SIZE 封邮件时交给追赶队列，每轮先处理新到的邮件再追赶一块
+    A search finding more than FETCH_CHUNK_SIZE messages goes to the catch-up queue, and
+    each round handles newly arrived mail before catching up one chunk
+
+    连接失败或断开后按监督器的退避间隔重连，初始连接失败也不会停止监听。只有连接空闲超过
+    IMAP_KEEPALIVE 秒时才先发送NOOP，IDLE也按该间隔重新发起，及早发现被中间设备断开的连接
+    After a failed or dropped connection it reconnects at the supervisor's backoff delay,
+    and a failed initial connection no longer stops the watcher. A NOOP is sent only after
+    the connection has been quiet for IMAP_KEEPALIVE seconds, and IDLE is re-issued at the
+    same interval so connections silently dropped by middleboxes are noticed early
+
+    Args:
+        account (dict): 监听配置 / Watcher configuration
+        parse_queue (asyncio.Queue): 解析队列 / Parse queue
+    """
+    name = account['name']
+    supervisor = supervisors.get(f"imap:{name}") or supervise(f"imap:{name}")
+    control = watchers.get(name) or watcher_control(name)
+    loop = asyncio.get_running_loop()
+    # 同一连接的所有IMAP命令都在这一个线程中执行 / Every IMAP command of this connection runs in this one thread
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"imap-{name}")
+
+    def imap(func: Callable[..., Any], *args: Any) -> Awaitable[Any]:
+        return loop.run_in_executor(executor, func, *args)
+
+    async def fetch_chunk(chunk: List[int]) -> None:
+        fetched = await imap(fetch_emails, mail, chunk)
+        BACKLOG.inc(len(fetched), watcher=name)
+        log.debug("已获取 %d 封邮件", len(fetched), extra={'watcher': name, 'first_uid': chunk[0], 'last_uid': chunk[-1],
+                                                      'backlog': len(backlog)})
+        # 队列满时在这里等待，从而拖慢邮件获取 / Waits here while the queue is full, slowing down fetching
+        await parse_queue.put({'uidvalidity': uidvalidity, 'last_uid': backlog.checkpoint(last_uid), 'uids': chunk,
+                               'fetched': fetched})
+
+    mail = None
+    uidvalidity, last_uid, uidnext = None, None, 0
+    # 尚未获取的积压UID，重连后继续 / Backlog UIDs not fetched yet, carried across reconnects
+    backlog = Backlog(CATCHUP_ORDER, CATCHUP_RATE)
+    use_idle = False
+    last_activity = 0.0
+    try:
+        while True:
             try:
-                # 尝试执行一个简单的IMAP命令来检查连接 / Try to execute a simple IMAP command to check connection
-                mail.noop()
-            except Exception as e:
-                print(f"邮箱连接已断开，尝试重新连接: {e}")  # 连接断开提示 / Connection lost prompt
-                mail = connect_to_imap()
-                if not mail:
-                    print("重新连接失败，等待下一次尝试")  # 重连失败提示 / Reconnection failure prompt
-                    time.sleep(CHECK_INTERVAL)
+                if control.paused:
+                    # 暂停期间不检查邮件，恢复时被唤醒 / No checks while paused, woken on resume
+                    await imap(control.wait, IMAP_KEEPALIVE)
                     continue
-                print("邮箱重新连接成功")  # 重连成功提示 / Reconnection success prompt
-            
-            # 检查新邮件 / Check for new emails
-            new_emails = check_new_emails(mail, last_uid)
-            # 如果有新邮件，处理并发送到MQTT / If there are new emails, process and send to MQTT
-            if new_emails:
-                # 处理每封新邮件 / Process each new email
-                for email_info in new_emails:
-                    # 获取邮件ID，确保是字符串格式 / Get email ID, ensure it's in string format
-                    email_id = email_info['id'].decode('utf-8') if isinstance(email_info['id'], bytes) else email_info['id']
-                    
-                    # 检查邮件是否已处理过 / Check if email has been processed before
-                    sender_info = parse_sender(email_info['from'])
-                    
-                    # 计算邮件特征哈希值
-                    import hashlib
-                    sender_hash = hashlib.md5((sender_info['email'] + sender_info['name']).encode()).hexdigest()
-                    subject_hash = hashlib.md5(email_info['subject'].encode()).hexdigest()
-                    content_hash = email_info['content_hash']
-                    
-                    # 检查是否重复邮件
-                    is_duplicate = False
-                    if email_id in read:
-                        existing = read[email_id]
-                        if (existing['sender'] == sender_hash and 
-                            existing['subject'] == subject_hash and 
-                            existing['content'] == content_hash):
-                            is_duplicate = True
-                    
-                    if not is_duplicate:
-                        # 打印邮件信息 / Print email information
-                        print(f"邮件ID: {email_id}")
-                        print(f"发件人名称: {sender_info['name']}")
-                        print(f"发件人邮箱: {sender_info['email']}")
-                        print(f"主题: {email_info['subject']}")
-                        print("-" * 50)
-                        
-                        # 构建MQTT消息 / Build MQTT message
-                        # 包含发件人名称和邮件主题 / Include sender name and email subject
-                        message = f"{sender_info['name']}\n{email_info['subject']}\n"
-                        
-                        # 添加邮件内容 / Add email content
-                        # 优先使用纯文本内容 / Prefer plain text content
-                        if email_info['content']['text']:
-                            message += email_info['content']['text']
-                        # 如果没有纯文本但有HTML内容，使用HTML内容 / If no plain text but has HTML content, use HTML
-                        elif email_info['content']['html']:
-                            # message += "[邮件包含HTML内容]" / [Email contains HTML content]
-                            message += email_info['content']['html']
-                            
-                        # 发布消息到MQTT主题 / Publish message to MQTT topic
-                        mqtt_client.publish(MQTT_TOPIC, message)
-                        
-                        # 将邮件特征添加到已读字典 / Add email features to read dictionary
-                        read[email_id] = {
-                            'sender': sender_hash,
-                            'subject': subject_hash,
-                            'content': content_hash
-                        }
-                    # 邮件已处理过，跳过 / Email already processed, skip
-                    # else:
-                    #     print(f"邮件ID {email_id} 已存在，跳过处理")
+                if mail is None:
+                    # 连接到邮箱服务器 / Connect to mail server
+                    mail = await imap(connect_to_imap, 30, account, supervisor)
+                    if not mail:
+                        delay = supervisor.retry_in()
+                        log.warning("邮箱连接失败，%.1f秒后重试 (%s)", delay, supervisor.state, extra={'watcher': name})  # 连接失败提示 / Connection failure prompt
+                        await asyncio.sleep(delay)
+                        continue
+                    log.info("邮箱连接成功，开始监听新邮件", extra={'watcher': name})  # 连接成功提示 / Connection success prompt
+                    use_idle = WATCH_MODE == 'idle' and await imap(supports_idle, mail)
+                    previous = (uidvalidity, last_uid)
+                    uidvalidity, last_uid, uidnext = await imap(resume_from_checkpoint, mail, account)
+                    # 队列中还有已获取但尚未发布的邮件时，从已获取的位置继续
+                    # Resume from what was already fetched while it is still queued for publishing
+                    if previous[0] == uidvalidity and previous[1] is not None and (last_uid is None or last_uid < previous[1]):
+                        last_uid = previous[1]
+                    elif previous[0] != uidvalidity:
+                        backlog.clear()
+                    log.info("监听模式: %s", 'IDLE' if use_idle else '轮询 / polling', extra={'watcher': name})
+                    last_activity = time.monotonic()
+                elif time.monotonic() - last_activity >= IMAP_KEEPALIVE:
+                    # 空闲过久时先确认连接仍然有效 / Make sure a long-quiet connection is still alive
+                    await imap(mail.noop)
                 
-                # 更新最后处理的邮件ID / Update last processed email ID
-                last_uid = new_emails[-1]['id']
-            
-            # 等待指定的检查间隔时间 / Wait for the specified check interval
-            time.sleep(CHECK_INTERVAL)
+                seen = control.take_seen(uidvalidity)
+                if seen:
+                    # 提交阶段确认送达的邮件在这个线程中标记为已读，失败时重连后再标记
+                    # Mail the commit stage confirmed delivered is marked as seen here, again after reconnecting on failure
+                    try:
+                        await imap(store_seen, mail, seen)
+                    except (imaplib.IMAP4.abort, OSError):
+                        control.mark_seen(uidvalidity, seen)
+                        raise
+                retry = control.take_retry(uidvalidity)
+                if retry:
+                    # 提交阶段报告处理失败的邮件重新获取，失败次数由提交阶段计算
+                    # Mail the commit stage reported as failed is fetched again; the commit stage counts the failures
+                    try:
+                        for chunk in chunked(retry, FETCH_CHUNK_SIZE):
+                            await fetch_chunk(chunk)
+                            retry = retry[len(chunk):]
+                    except (imaplib.IMAP4.abort, OSError):
+                        control.retry(uidvalidity, retry)
+                        raise
+
+                # 检查新邮件：少量新邮件立即获取，大量积压交给追赶队列分块获取
+                # Check for new emails: a few are fetched at once, a large backlog is handed to the catch-up queue
+                # 这次检查同时响应此前的立即检查请求 / This check also answers earlier on-demand check requests
+                control.consume()
+                uids = await imap(search_new_emails, mail, last_uid)
+                if uids is not None:
+                    # 没有新邮件时放慢轮询，有新邮件时恢复 / Slow down polling while quiet, speed up again on new mail
+                    control.adapt(bool(uids))
+                    unseen_sync = last_uid is None
+                    if uids:
+                        last_uid = max(uids[-1], last_uid or 0)  # 升序 / Ascending
+                    if unseen_sync:
+                        # 首次同步后从当前位置开始 / After the first sync start from the current position
+                        last_uid = max(last_uid or 0, uidnext - 1)
+                    if len(uids) > FETCH_CHUNK_SIZE:
+                        log.info("发现 %d 封积压邮件，按 %s 顺序分块追赶", len(uids), CATCHUP_ORDER, extra={'watcher': name})
+                        backlog.extend(uids, resumable=not unseen_sync)
+                        uids = []
+                    for chunk in chunked(uids, FETCH_CHUNK_SIZE):
+                        await fetch_chunk(chunk)
+                    if unseen_sync and not uids:
+                        await parse_queue.put({'uidvalidity': uidvalidity, 'last_uid': backlog.checkpoint(last_uid), 'uids': [],
+                                               'fetched': []})
+                if backlog and backlog.delay() == 0:
+                    # 每轮只追赶一块，新到的邮件在下一轮搜索中优先获取
+                    # Catch up one chunk per round so mail arriving meanwhile is fetched first on the next search
+                    await fetch_chunk(backlog.take(FETCH_CHUNK_SIZE))
+                CATCHUP.set(len(backlog), watcher=name)
+                last_activity = time.monotonic()
+                
+                # 等待新邮件推送或检查间隔，追赶期间最多等到下一块 / Wait for a new-mail push or the check interval, during catch-up only until the next chunk
+                if not backlog:
+                    if await wait_for_new_mail(mail, use_idle, imap, control):
+                        last_activity = time.monotonic()
+                elif backlog.delay() > 0:
+                    if await wait_for_new_mail(mail, use_idle, imap, control, backlog.delay()):
+                        last_activity = time.monotonic()
+            except (imaplib.IMAP4.abort, OSError) as e:
+                # 连接已断开，短暂随机等待后重连，再次失败则按退避间隔
+                # The connection dropped: reconnect after a short random wait, backing off if that fails
+                log.warning("邮箱连接已断开，尝试重新连接: %s", e, extra={'watcher': name})  # 连接断开提示 / Connection lost prompt
+                delay = supervisor.disconnected(e)
+                close_imap(mail)
+                mail = None
+                await asyncio.sleep(delay)
+            # 捕获并记录异常 / Catch and log exceptions
+            except Exception as e:
+                STAGE_ERRORS.inc(stage='check')
+                log.error("程序异常: %s", e, exc_info=True, extra={'watcher': name})  # 异常日志 / Exception log
+                await asyncio.sleep(CHECK_INTERVAL)
+    finally:
+        # 关闭套接字使IMAP线程立即退出IDLE，唤醒使轮询或暂停中的等待立即返回
+        # Shutting the socket makes the IMAP thread leave IDLE at once, and the wake-up ends a polling or paused wait
+        close_imap(mail)
+        control.wake()
+        executor.shutdown(wait=False)
 
-            # 刷新标准输出缓冲区 / Flush standard output buffer
-            sys.stdout.flush()
-        # 捕获并记录异常 / Catch and log exceptions
+
+async def parse_stage(account: Dict[str, Any], parse_queue: 'asyncio.Queue[Dict[str, Any]]',
+                      publish_queue: 'asyncio.Queue[Dict[str, Any]]') -> None:
+    """解析阶段：在工作线程中解析每个批次，HTML处理服务较慢时并行处理
+    Parse stage: parse each batch in worker threads, in parallel while the HTML processor is slow
+
+    Args:
+        account (dict): 监听配置 / Watcher configuration
+        parse_queue (asyncio.Queue): 解析队列 / Parse queue
+        publish_queue (asyncio.Queue): 发布队列 / Publish queue
+    """
+    name = account['name']
+
+    def parse_one(item: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        # 每封邮件单独处理失败，不影响同一批次的其他邮件 / Failures are isolated per message and do not affect the rest of the batch
+        try:
+            return parse_fetched(item)
         except Exception as e:
-            print(f"程序异常: {e}")  # 异常日志 / Exception log
-    # mqtt_client.disconnect()
+            STAGE_ERRORS.inc(stage='parse')
+            log.error("解析邮件出错: %s", e, exc_info=True, extra={'watcher': name, 'id': item['uid']})
+            BACKLOG.inc(-1, watcher=name)
+            return None
+
+    while True:
+        batch = await parse_queue.get()
+        fetched = batch.pop('fetched')
+        # 解析失败的邮件不在emails中，提交阶段不会把它们标记为已读 / Messages that failed to parse are left out of emails, so the commit stage does not mark them as seen
+        batch['emails'] = [e for e in await asyncio.to_thread(html_processor.map, parse_one, fetched) if e is not None]
+        await publish_queue.put(batch)
+
+
+async def publish_stage(account: Dict[str, Any], publish_queue: 'asyncio.Queue[Dict[str, Any]]',
+                        commit_queue: 'asyncio.Queue[Dict[str, Any]]', publisher: Publisher, dedup: DedupStore,
+                        uncommitted: Dict[str, str], near_duplicates: Optional[NearDuplicateIndex] = None) -> None:
+    """发布阶段：去重后发布每封邮件，把批次连同各消息的送达事件交给提交阶段
+    Publish stage: deduplicate and publish each email, handing the batch with the delivery
+    events of its messages to the commit stage
+
+    Args:
+        account (dict): 监听配置 / Watcher configuration
+        publish_queue (asyncio.Queue): 发布队列 / Publish queue
+        commit_queue (asyncio.Queue): 提交队列 / Commit queue
+        publisher (Publisher): 共享的MQTT发布队列 / Shared MQTT publish pipeline
+        dedup (DedupStore): 共享的去重索引 / Shared dedup index
+        uncommitted (dict): 已发布但尚未提交的去重键和特征 / Dedup keys and fingerprints published but not committed yet
+        near_duplicates (NearDuplicateIndex): 共享的近似重复索引，None为关闭 / Shared near-duplicate index, None disables it
+    """
+    name = account['name']
+    while True:
+        batch = await publish_queue.get()
+        # done: 已发布、写入缓冲、被规则丢弃或判为重复的邮件UID / done: UIDs published, spooled, dropped by a rule or found to be duplicates
+        batch['deliveries'], batch['dedup'], batch['done'] = [], [], []
+        # 处理每封新邮件，一封出错不影响其他邮件 / Process each new email; one failing does not affect the others
+        for email_info in batch['emails']:
+            BACKLOG.inc(-1, watcher=name)
+            try:
+                await publish_email(account, email_info, batch, publisher, dedup, uncommitted, near_duplicates)
+            except Exception as e:
+                # 提交阶段不会把它标记为已读，并安排重新获取 / The commit stage leaves it unseen and has it fetched again
+                STAGE_ERRORS.inc(stage='publish')
+                log.error("发布邮件出错: %s", e, exc_info=True, extra={'watcher': name, 'id': email_info['id']})
+                continue
+            batch['done'].append(int(email_info['id']))
+
+        await commit_queue.put(batch)
+
+
+async def publish_email(account: Dict[str, Any], email_info: Dict[str, Any], batch: Dict[str, Any],
+                        publisher: Publisher, dedup: DedupStore, uncommitted: Dict[str, str],
+                        near_duplicates: Optional[NearDuplicateIndex] = None) -> None:
+    """去重后发布一封邮件，送达事件和去重键记入批次
+    Deduplicate and publish one email, recording its delivery events and dedup key in the batch
+
+    Args:
+        account (dict): 监听配置 / Watcher configuration
+        email_info (dict): 解析后的邮件 / Parsed email
+        batch (dict): 邮件所属的批次 / Batch the email belongs to
+        publisher (Publisher): 共享的MQTT发布队列 / Shared MQTT publish pipeline
+        dedup (DedupStore): 共享的去重索引 / Shared dedup index
+        uncommitted (dict): 已发布但尚未提交的去重键和特征 / Dedup keys and fingerprints published but not committed yet
+        near_duplicates (NearDuplicateIndex): 共享的近似重复索引，None为关闭 / Shared near-duplicate index, None disables it
+    """
+    name = account['name']
+    uidvalidity = batch['uidvalidity']
+    # 获取邮件ID，确保是字符串格式 / Get email ID, ensure it's in string format
+    email_id = email_info['id'].decode('utf-8') if isinstance(email_info['id'], bytes) else email_info['id']
+    # 被规则丢弃的邮件只用于推进检查点 / Mail dropped by a rule only advances the checkpoint
+    if email_info.get('action') == 'drop':
+        return
+    topic = email_info.get('topic') or account['topic']
+
+    # 检查邮件是否已处理过 / Check if email has been processed before
+    sender_info = parse_sender(email_info['from'])
+
+    # 检查是否重复邮件，优先按Message-ID，否则按UIDVALIDITY+UID；特征包含所有文本部分的摘要
+    # Check for duplicates by Message-ID, falling back to UIDVALIDITY+UID; the
+    # fingerprint covers a digest of every text part
+    dedup_key = f"{name}:" + (email_info.get('message_id') or f"uid:{uidvalidity}:{email_id}")
+    fingerprint = message_fingerprint(
+        sender_info['email'] + sender_info['name'], email_info['subject'], email_info['content_hash']
+    )
+    is_duplicate = uncommitted.get(dedup_key) == fingerprint or await asyncio.to_thread(dedup.is_duplicate, dedup_key, fingerprint)
+
+    if not is_duplicate:
+        # 每封邮件一条记录，字段结构化，写出在后台线程中完成
+        # One record per email with structured fields, written out in the background thread
+        log.info("新邮件: %s", email_info['subject'], extra={
+            'watcher': name, 'id': email_id, 'sender': sender_info['name'], 'email': sender_info['email']
+        })
+
+        # 构建MQTT消息 / Build MQTT message
+        # 优先使用纯文本内容，没有纯文本时使用HTML内容 / Prefer plain text content, falling back to HTML
+        body, body_type = '', ''
+        if email_info['content']['text']:
+            body, body_type = email_info['content']['text'], 'text'
+        elif email_info['content']['html']:
+            body, body_type = email_info['content']['html'], 'html'
+        record = {
+            'id': email_id, 'message_id': email_info.get('message_id', ''), 'from': sender_info,
+            'subject': email_info['subject'], 'body': body, 'body_type': body_type
+        }
+        # 近似重复检测使用文本格式的消息 / Near-duplicate detection works on the text-format message
+        message = f"{sender_info['name']}\n{email_info['subject']}\n{body}"
+
+        # 同一发件人在窗口内的相似邮件只发布第一封，其余在窗口结束后汇总
+        # Only the first similar message from a sender within the window is published,
+        # the rest are summarised when the window ends
+        if near_duplicates and near_duplicates.check(
+            f"{topic}\n{sender_info['email']}", simhash(message),
+            {'topic': topic, 'sender': sender_info['name'], 'email': sender_info['email'], 'subject': email_info['subject']}
+        ):
+            log.info("近似重复邮件，已合并 / Near-duplicate message collapsed", extra={'watcher': name, 'id': email_id})
+            NEAR_DUPLICATES.inc(watcher=name)
+        else:
+            if body_cache:
+                # 完整正文进入缓存，消息中只保留摘要和正文ID / The full body goes to the cache, the message keeps a snippet and the body ID
+                record['body_id'] = await asyncio.to_thread(
+                    body_cache.put, email_info['content']['text'], email_info['content']['html'])
+                record['body'], record['truncated'] = summarize(body, body_type)
+            # 发布消息到MQTT主题 / Publish message to MQTT topic
+            # 发布队列满时在工作线程中阻塞，队列随之填满并拖慢获取
+            # Blocks in a worker thread on a full publish queue, which fills these queues and slows fetching
+            with STAGE_SECONDS.time(stage='publish'):
+                size, deliveries = await asyncio.to_thread(publish_record, publisher, topic, record)
+            batch['deliveries'].extend(deliveries)
+            PUBLISHED_MESSAGES.inc(watcher=name)
+            PUBLISHED_BYTES.inc(size, watcher=name)
+
+            # 附件只发布元数据，内容在附件存储中 / Only attachment metadata is published, the content is in the attachment store
+            if email_info.get('attachments'):
+                notice = json.dumps({
+                    'id': email_id,
+                    'message_id': email_info.get('message_id', ''),
+                    'subject': email_info['subject'],
+                    'from': sender_info['email'],
+                    'attachments': email_info['attachments']
+                }, ensure_ascii=False)
+                with STAGE_SECONDS.time(stage='publish'):
+                    batch['deliveries'].append(await asyncio.to_thread(
+                        publisher.publish, f"{topic}/attachments", notice, 'application/json'))
+
+        # 提交时将邮件特征添加到去重索引 / The email features are added to the dedup index on commit
+        uncommitted[dedup_key] = fingerprint
+        batch['dedup'].append((dedup_key, fingerprint))
+    else:
+        # 邮件已处理过，跳过 / Email already processed, skip
+        DUPLICATES.inc(watcher=name)
+        log.debug("邮件已存在，跳过处理", extra={'watcher': name, 'id': email_id})
+
+
+async def commit_stage(account: Dict[str, Any], commit_queue: 'asyncio.Queue[Dict[str, Any]]',
+                       dedup: DedupStore, uncommitted: Dict[str, str]) -> None:
+    """提交阶段：批次的每条消息都被代理确认或写入磁盘缓冲后，记入去重索引、更新检查点并把邮件标记为已读
+    Commit stage: once every message of a batch was acknowledged by the broker or written
+    to the disk spool, record it in the dedup index, update the checkpoint and mark the
+    mail as seen
+
+    在此之前进程退出时，这些邮件在重启后重新获取并再次发布：宁可重复，不会丢失
+    Should the process stop before that, the mail is fetched and published again after
+    a restart: a duplicate at worst, never a loss
+
+    未能获取、解析或发布的邮件不标记为已读，检查点停在它之前，并由获取阶段重新获取；
+    重试 MAIL_RETRIES 次仍失败的邮件保持未读并被跳过，检查点继续前进
+    Mail that could not be fetched, parsed or published is not marked as seen, the
+    checkpoint stops just before it and the fetch stage fetches it again; after
+    MAIL_RETRIES failed retries it is left unread and skipped, and the checkpoint moves on
+
+    Args:
+        account (dict): 监听配置 / Watcher configuration
+        commit_queue (asyncio.Queue): 提交队列 / Commit queue
+        dedup (DedupStore): 共享的去重索引 / Shared dedup index
+        uncommitted (dict): 已发布但尚未提交的去重键和特征 / Dedup keys and fingerprints published but not committed yet
+    """
+    name = account['name']
+    control = watchers.get(name) or watcher_control(name)
+    saved = None
+    # 失败的UID -> 失败次数，属于 held_validity / Failed UID -> failures, belonging to held_validity
+    held: Dict[int, int] = {}
+    held_validity = None
+    while True:
+        batch = await commit_queue.get()
+        for delivered in batch['deliveries']:
+            # 分段等待，任务随时可以取消 / Wait in slices so the task can be cancelled at any time
+            while not delivered.is_set():
+                await asyncio.to_thread(delivered.wait, 1.0)
+        for dedup_key, fingerprint in batch['dedup']:
+            await asyncio.to_thread(dedup.add, dedup_key, fingerprint)
+            if uncommitted.get(dedup_key) == fingerprint:
+                del uncommitted[dedup_key]
+
+        uidvalidity = batch['uidvalidity']
+        if uidvalidity != held_validity:
+            held, held_validity = {}, uidvalidity
+        done = set(batch['done'])
+        retry = []
+        for uid in batch['uids']:
+            if uid in done:
+                held.pop(uid, None)
+                continue
+            held[uid] = held.get(uid, 0) + 1
+            if held[uid] > MAIL_RETRIES:
+                del held[uid]
+                STAGE_ERRORS.inc(stage='commit')
+                log.error("邮件重试 %d 次仍然失败，保持未读并跳过", MAIL_RETRIES, extra={'watcher': name, 'id': uid})
+            else:
+                retry.append(uid)
+        if retry:
+            log.warning("%d 封邮件处理失败，稍后重新获取", len(retry), extra={'watcher': name, 'uids': compress_uids(retry)})
+            control.retry(uidvalidity, retry)
+
+        # 更新并保存UID检查点，不越过仍在重试的邮件 / Update and persist the UID checkpoint, never past mail still being retried
+        last_uid = batch['last_uid']
+        if last_uid is not None and held:
+            last_uid = min(last_uid, min(held) - 1)
+        if last_uid is not None and (uidvalidity, last_uid) != saved:
+            saved = (uidvalidity, last_uid)
+            await asyncio.to_thread(save_checkpoint, account['checkpoint'], uidvalidity, last_uid)
+            if election:
+                # 备用副本接任时从这里继续 / A standby taking over resumes from here
+                election.publish_checkpoint(name, uidvalidity, last_uid)
+        control.mark_seen(uidvalidity, [uid for uid in batch['uids'] if uid in done])
 
 
 @app.get('/')
@@ -478,32 +1735,142 @@ async def index():
     from . import __version__
     return 'version:' +__version__
 
+@app.get('/stats')
+async def stats():
+    # HTML处理服务的缓存命中和延迟统计，以及MQTT发布队列深度
+    return {
+        "html_processor": html_processor.stats(),
+        "publisher": publisher.stats() if publisher else None,
+        "body_cache": body_cache.stats() if body_cache else None,
+        "logging": log_pipeline.stats()
+    }
+
+@app.get('/mail/{body_id}')
+async def mail_body(body_id: str, request: Request, part: Optional[str] = None):
+    # summary模式下读取完整正文；正文ID由内容生成，直接用作ETag
+    # Read a full body in summary mode; the body ID is derived from the content and doubles as the ETag
+    if part not in (None, 'text', 'html'):
+        return JSONResponse({"error": "part must be text or html"}, status_code=400)
+    etag = f'"{body_id}"'
+    headers = {'ETag': etag, 'Cache-Control': 'private, max-age=31536000, immutable'}
+    if body_cache and etag in [tag.strip() for tag in request.headers.get('if-none-match', '').split(',')]:
+        # 相同ID的内容不会改变，客户端的副本仍然有效 / Content under an ID never changes, so the client's copy is still valid
+        return Response(status_code=304, headers=headers)
+    content = await asyncio.to_thread(body_cache.get, body_id) if body_cache else None
+    if content is None:
+        return JSONResponse({"error": f"unknown or evicted body {body_id!r}"}, status_code=404)
+    if part == 'text':
+        return PlainTextResponse(content['text'], headers=headers)
+    if part == 'html':
+        return HTMLResponse(content['html'], headers=headers)
+    return JSONResponse({'id': body_id, **content}, headers=headers)
+
+@app.get('/leader')
+async def leader():
+    # 主备选举状态，单实例运行时为null / Active/standby election state, null when running a single instance
+    return election.snapshot() if election else None
+
+@app.get('/connections')
+async def connections():
+    # 各IMAP和MQTT连接的断路器状态和重连退避 / Circuit state and reconnect backoff of every IMAP and MQTT connection
+    return {name: supervisor.snapshot() for name, supervisor in list(supervisors.items())}
+
+@app.get('/watchers')
+async def watcher_states():
+    # 各监听的暂停状态、当前轮询间隔和立即检查次数 / Pause state, current polling interval and on-demand checks of every watcher
+    return {name: control.snapshot() for name, control in list(watchers.items())}
+
+def select_watchers(watcher: Optional[str]) -> Optional[List[WatcherControl]]:
+    # 未指定时选择全部监听，名称未知时返回None / All watchers when none is named, None for an unknown name
+    if watcher is None:
+        return list(watchers.values())
+    control = watchers.get(watcher)
+    return [control] if control else None
+
+def unknown_watcher(watcher: Optional[str]) -> JSONResponse:
+    return JSONResponse({"error": f"unknown watcher {watcher!r}", "watchers": list(watchers)}, status_code=404)
+
+@app.post('/poll')
+async def poll(watcher: Optional[str] = None):
+    # 立即检查新邮件，例如由发信端的webhook触发 / Check for new mail now, e.g. from a webhook on the sending side
+    controls = select_watchers(watcher)
+    if controls is None:
+        return unknown_watcher(watcher)
+    for control in controls:
+        control.poll()
+    return {"polled": [control.name for control in controls]}
+
+@app.post('/pause')
+async def pause(watcher: Optional[str] = None):
+    # 暂停检查邮件，连接保持打开 / Stop checking for mail, keeping the connections open
+    controls = select_watchers(watcher)
+    if controls is None:
+        return unknown_watcher(watcher)
+    for control in controls:
+        control.pause()
+    return {"paused": [control.name for control in controls]}
+
+@app.post('/resume')
+async def resume(watcher: Optional[str] = None):
+    controls = select_watchers(watcher)
+    if controls is None:
+        return unknown_watcher(watcher)
+    for control in controls:
+        control.resume()
+    return {"resumed": [control.name for control in controls]}
+
+@app.post('/interval')
+async def set_interval(seconds: float, max_seconds: Optional[float] = None, watcher: Optional[str] = None):
+    # 不重启地调整轮询间隔，max_seconds 省略时不自适应 / Change the polling interval without a restart; without max_seconds it stays fixed
+    if seconds <= 0 or (max_seconds is not None and max_seconds < seconds):
+        return JSONResponse({"error": "need 0 < seconds <= max_seconds"}, status_code=400)
+    controls = select_watchers(watcher)
+    if controls is None:
+        return unknown_watcher(watcher)
+    for control in controls:
+        control.set_interval(seconds, max_seconds)
+        # 正在等待的监听按新间隔重新开始 / A waiting watcher starts over with the new interval
+        control.wake()
+    return {control.name: control.snapshot() for control in controls}
+
+@app.get('/metrics', response_class=PlainTextResponse)
+async def metrics_endpoint():
+    # Prometheus文本格式 / Prometheus text exposition format
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.get('/health')
 async def health_check():
-    # 检查子线程是否存活
-    if 't' in globals() and t.is_alive():
-        return {"status": "healthy", "thread_status": "alive"}
+    # 存活检查：邮箱监听任务是否仍在运行，连接断开时仍然存活
+    # Liveness: is the mailbox watcher task still running; it stays alive while connections are down
+    if core is not None and not core.done():
+        return {"status": "healthy", "task_status": "running"}
     else:
-        return {"status": "unhealthy", "thread_status": "dead"}, 400
+        return JSONResponse({"status": "unhealthy", "task_status": "stopped"}, status_code=400)
 
-try:
-    import threading
-    # 创建并启动子线程运行main函数
-    t = threading.Thread(target=main, daemon=True)
-    t.start()
-except KeyboardInterrupt:
-    # 处理键盘中断（Ctrl+C） / Handle keyboard interrupt (Ctrl+C)
-    print("程序退出")  # 程序退出提示 / Program exit prompt
-except Exception as e:
-    # 处理其他异常 / Handle other exceptions
-    print(f"程序异常退出: {e}")  # 异常退出日志 / Exception exit log
+@app.get('/ready')
+async def readiness_check():
+    # 就绪检查：MQTT和每个IMAP连接都已建立 / Readiness: MQTT and every IMAP connection are established
+    # 已连接显示为connected，否则显示断路器状态 / Shows connected when up, the circuit state otherwise
+    connections = {name: 'connected' if supervisor.connected else supervisor.state
+                   for name, supervisor in list(supervisors.items())}
+    if election and not election.is_leader:
+        # 待命副本不连接IMAP，连上MQTT就可以接任 / A standby has no IMAP connections and can take over once MQTT is up
+        connections = {name: state for name, state in connections.items() if name == 'mqtt'}
+    ready = core is not None and not core.done() and bool(connections) and all(
+        state == 'connected' for state in connections.values()
+    )
+    return JSONResponse(
+        {"status": "ready" if ready else "not_ready", "connections": connections}, status_code=200 if ready else 503
+    )
 
 if __name__ == '__main__':
-    # 启动FastAPI服务
+    import uvicorn  # 只在直接运行时需要 / Only needed when run directly
+    # 启动FastAPI服务，邮箱监听随生命周期启动和停止
+    # Start the FastAPI service, the mailbox watchers start and stop with its lifespan
     uvicorn.run(
         app, 
         host="0.0.0.0", 
         port=8000,
     )
     # 最终退出提示 / Final exit prompt
-    print("程序退出")
\ No newline at end of file
+    log.info("程序退出")
@@ -0,0 +1,193 @@
+import bisect  # 查找直方图桶 / Locate histogram buckets
+import logging  # 日志 / Logging
+import threading  # 线程锁 / Thread lock
+import time  # 计时 / Timing
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+log = logging.getLogger('email2mqtt.metrics')
+
+# 默认延迟桶(秒)，覆盖毫秒级解析到分钟级IMAP连接 / Default latency buckets (seconds), from millisecond parsing to minute-long IMAP connects
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str) -> None:
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """只增不减的计数器，也可以在抓取时读取别处维护的累计值
+    Monotonically increasing counter, or a running total kept elsewhere and read at scrape time
+
+    Args:
+        callback: 可选，抓取时调用，返回 [(标签, 累计值)] / Optional, called at scrape time and returns [(labels, total)]
+    """
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str,
+                 callback: Optional[Callable[[], Sequence[Tuple[Dict[str, str], float]]]] = None) -> None:
+        super().__init__(name, documentation)
+        self._values: Dict[LabelKey, float] = {}
+        self._callback = callback
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        if self._callback:
+            try:
+                values += [(_label_key(labels), value) for labels, value in self._callback()]
+            except Exception as e:
+                log.warning("指标 %s 计算出错: %s", self.name, e)
+        return self.header() + [f'{self.name}{_format_labels(key)} {_format_value(value)}' for key, value in values]
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值，也可以在抓取时由回调计算
+    Point-in-time value that can go up and down, or be computed by a callback at scrape time
+
+    Args:
+        callback: 可选，抓取时调用，返回 [(标签, 值)] / Optional, called at scrape time and returns [(labels, value)]
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str,
+                 callback: Optional[Callable[[], Sequence[Tuple[Dict[str, str], float]]]] = None) -> None:
+        super().__init__(name, documentation)
+        self._values: Dict[LabelKey, float] = {}
+        self._callback = callback
+
+    def set(self, value: float, **labels: str) -> None:
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        if self._callback:
+            try:
+                values += [(_label_key(labels), value) for labels, value in self._callback()]
+            except Exception as e:
+                log.warning("指标 %s 计算出错: %s", self.name, e)
+        return self.header() + [f'{self.name}{_format_labels(key)} {_format_value(value)}' for key, value in values]
+
+
+class Histogram(_Metric):
+    """固定桶的延迟直方图，每次记录只做一次二分查找和加法
+    Fixed-bucket latency histogram, each observation is one binary search and a few additions
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签: [各桶计数..., 总和, 次数] / Per label set: [bucket counts..., sum, count]
+        self._values: Dict[LabelKey, List[float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """记录代码块耗时，异常时同样记录 / Time a block of code, also recorded when it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(series)) for key, series in self._values.items()]
+        lines = self.header()
+        for key, series in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{_format_labels(key, ("le", _format_value(bound)))} {_format_value(cumulative)}')
+            lines.append(f'{self.name}_bucket{_format_labels(key, ("le", "+Inf"))} {_format_value(series[-1])}')
+            lines.append(f'{self.name}_sum{_format_labels(key)} {_format_value(series[-2])}')
+            lines.append(f'{self.name}_count{_format_labels(key)} {_format_value(series[-1])}')
+        return lines
+
+
+class Registry:
+    """指标集合，按Prometheus文本格式输出
+    Collection of metrics rendered in the Prometheus text exposition format
+    """
+
+    def __init__(self) -> None:
+        self._metrics: List[_Metric] = []
+
+    def counter(self, name: str, documentation: str,
+                callback: Optional[Callable[[], Sequence[Tuple[Dict[str, str], float]]]] = None) -> Counter:
+        return self._register(Counter(name, documentation, callback))
+
+    def gauge(self, name: str, documentation: str,
+              callback: Optional[Callable[[], Sequence[Tuple[Dict[str, str], float]]]] = None) -> Gauge:
+        return self._register(Gauge(name, documentation, callback))
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, buckets))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
@@ -0,0 +1,217 @@
+import binascii  # base64/quoted-printable解码 / base64 and quoted-printable decoding
+import multiprocessing  # 大邮件的进程池 / Process pool for large messages
+import re  # 正则表达式模块 / Regular expression module
+import threading  # 线程锁 / Thread lock
+from concurrent.futures import ProcessPoolExecutor
+from email.message import Message
+from typing import List, Optional, Tuple
+
+# (内容类型, 字符集, 解码后的内容) / (content type, charset, decoded payload)
+TextPart = Tuple[str, str, bytes]
+
+TEXT_TYPES = ('text/plain', 'text/html')
+HEADER_END = re.compile(rb'\r?\n\r?\n')
+# 分隔符后允许出现的字符 / Characters allowed right after a delimiter
+DELIMITER_TAIL = (b'-', b'\r', b'\n', b' ', b'\t', b'')
+# 嵌套层数上限，防止恶意邮件 / Nesting limit guarding against hostile mail
+MAX_DEPTH = 32
+
+def parse_headers(raw: bytes) -> Message:
+    """只读取邮件头，不解析正文
+    Read only the header block without parsing the body
+
+    不经过FeedParser，直接按行拆分并展开折叠行；没有冒号的行（例如mbox的 "From " 行）被忽略
+    Bypasses FeedParser and splits the lines directly, unfolding continuation lines;
+    lines without a colon (such as an mbox "From " line) are ignored
+
+    Args:
+        raw (bytes): 原始邮件或邮件头 / Raw message or header block
+
+    Returns:
+        email.message.Message: 只含邮件头的消息对象 / Message object holding only the headers
+    """
+    return _split_headers(raw, 0, len(raw))[0]
+
+
+def scan_message(raw: bytes) -> Tuple[Message, List[TextPart]]:
+    """读取邮件头，再按MIME边界扫描原始邮件，只解码非附件的文本部分
+    Read the headers, then scan the raw message along its MIME boundaries and decode only
+    the non-attachment text parts
+
+    附件和其他非文本部分只被跳过，不会被复制或解码
+    Attachments and other non-text parts are skipped without being copied or decoded
+
+    Args:
+        raw (bytes): 原始邮件 / Raw message
+
+    Returns:
+        tuple: (headers, [(content_type, charset, payload)])
+
+    Raises:
+        ValueError: 邮件结构无法识别时，调用方应退回到email包解析
+                    When the structure cannot be followed, callers should fall back to the email package
+    """
+    headers, body_start = _split_headers(raw, 0, len(raw))
+    content_type = headers.get_content_type()
+    parts: List[TextPart] = []
+    if headers.get_content_maintype() == 'multipart' or content_type == 'message/rfc822':
+        _walk_body(raw, headers, body_start, len(raw), parts, 0)
+        return headers, parts
+
+    # 单部分邮件与原有逻辑一致：不检查Content-Disposition
+    # Single-part messages behave as before: Content-Disposition is not checked
+    if content_type in TEXT_TYPES:
+        payload = _decode(raw[body_start:], headers.get('Content-Transfer-Encoding'))
+        if payload:
+            parts.append((content_type, headers.get_content_charset() or 'utf-8', payload))
+    return headers, parts
+
+
+class PartScanner:
+    """调用scan_message，超过阈值的大邮件交给进程池，避免阻塞其他线程
+    Run scan_message, handing messages above a threshold to a process pool so they
+    do not hold up other threads
+
+    Args:
+        threshold (int): 使用进程池的邮件大小（字节） / Message size (bytes) that goes to the process pool
+        workers (int): 进程数，0表示始终在当前线程解析 / Number of processes, 0 always scans in the calling thread
+    """
+
+    def __init__(self, threshold: int = 8 * 1024 * 1024, workers: int = 2) -> None:
+        self.threshold = threshold
+        self.workers = workers
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def scan(self, raw: bytes) -> Tuple[Message, List[TextPart]]:
+        if self.workers <= 0 or len(raw) < self.threshold:
+            return scan_message(raw)
+        return self._pool().submit(scan_message, raw).result()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._executor:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn避免在多线程进程中fork / spawn avoids forking a multi-threaded process
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+
+def _split_headers(raw: bytes, start: int, end: int) -> Tuple[Message, int]:
+    """读取一个部分的头，返回头和正文起始位置 / Read the headers of a part, returning them and where the body starts"""
+    headers = Message()
+    # 以空行开头的部分没有头 / A part starting with a blank line has no headers
+    if raw.startswith(b'\r\n', start, end):
+        return headers, start + 2
+    if raw.startswith(b'\n', start, end):
+        return headers, start + 1
+    match = HEADER_END.search(raw, start, end)
+    header_end, body_start = (match.start(), match.end()) if match else (end, end)
+    name, value = None, ''
+    for line in raw[start:header_end].decode('ascii', 'surrogateescape').split('\n'):
+        line = line.rstrip('\r')
+        if line[:1] in (' ', '\t'):
+            if name:
+                value += ' ' + line.strip()  # 折叠行 / Folded line
+            continue
+        if name:
+            headers[name] = value
+        name, colon, value = line.partition(':')
+        name = name.strip() if colon and ' ' not in name.strip() else None
+        value = value.strip()
+    if name:
+        headers[name] = value
+    return headers, body_start
+
+
+def _walk(raw: bytes, start: int, end: int, parts: List[TextPart], depth: int) -> None:
+    headers, body_start = _split_headers(raw, start, end)
+    _walk_body(raw, headers, body_start, end, parts, depth)
+
+
+def _walk_body(raw: bytes, headers: Message, body_start: int, end: int, parts: List[TextPart], depth: int) -> None:
+    if depth > MAX_DEPTH:
+        raise ValueError('MIME nesting too deep')
+    content_type = headers.get_content_type()
+    if headers.get_content_maintype() == 'multipart':
+        boundary = headers.get_boundary()
+        if not boundary:
+            raise ValueError('multipart without boundary')
+        for part_start, part_end in _iter_parts(raw, body_start, end, boundary.encode('latin-1')):
+            _walk(raw, part_start, part_end, parts, depth + 1)
+    elif content_type == 'message/rfc822':
+        # 与email包的walk()一致，进入内嵌邮件 / Descend into the embedded message like email's walk() does
+        _walk(raw, body_start, end, parts, depth + 1)
+    elif content_type in TEXT_TYPES and 'attachment' not in str(headers.get('Content-Disposition')):
+        payload = _decode(raw[body_start:end], headers.get('Content-Transfer-Encoding'))
+        if payload:
+            parts.append((content_type, headers.get_content_charset() or 'utf-8', payload))
+
+
+def _find_delimiter(raw: bytes, delimiter: bytes, start: int, end: int) -> int:
+    """查找位于行首的分隔符 / Find a delimiter at the start of a line"""
+    position = start
+    while True:
+        position = raw.find(delimiter, position, end)
+        if position == -1:
+            return -1
+        at_line_start = position == start or raw[position - 1:position] == b'\n'
+        tail = raw[position + len(delimiter):position + len(delimiter) + 1]
+        if at_line_start and tail in DELIMITER_TAIL:
+            return position
+        position += 1
+
+
+def _iter_parts(raw: bytes, start: int, end: int, boundary: bytes):
+    """依次返回每个子部分的 (起始, 结束) 位置 / Yield (start, end) of every body part in turn"""
+    delimiter = b'--' + boundary
+    position = _find_delimiter(raw, delimiter, start, end)
+    if position == -1:
+        raise ValueError('boundary not found')
+    while True:
+        if raw.startswith(b'--', position + len(delimiter), end):
+            return  # 结束分隔符 / Close delimiter
+        line_end = raw.find(b'\n', position, end)
+        if line_end == -1:
+            return
+        part_start = line_end + 1
+        next_position = _find_delimiter(raw, delimiter, part_start, end)
+        if next_position == -1:
+            # 缺少结束分隔符时把剩余内容作为最后一部分，与email包一样去掉末尾的一个换行
+            # Without a close delimiter the rest is the last part, less one trailing line break as in the email package
+            yield part_start, _strip_line_break(raw, part_start, end)
+            return
+        # 分隔符前的换行属于分隔符 / The line break before a delimiter belongs to the delimiter
+        yield part_start, _strip_line_break(raw, part_start, next_position)
+        position = next_position
+
+
+def _strip_line_break(raw: bytes, start: int, end: int) -> int:
+    """去掉 raw[start:end] 末尾的一个换行，返回新的结束位置 / Drop one trailing line break from raw[start:end], returning the new end"""
+    if raw[end - 2:end] == b'\r\n':
+        end -= 2
+    elif raw[end - 1:end] == b'\n':
+        end -= 1
+    return max(start, end)
+
+
+def _decode(data: bytes, encoding: Optional[str]) -> bytes:
+    """解码Content-Transfer-Encoding / Decode the Content-Transfer-Encoding"""
+    encoding = (encoding or '').strip().lower()
+    if encoding == 'base64':
+        try:
+            return binascii.a2b_base64(data)
+        except binascii.Error:
+            # 与email包一样容忍缺少的填充 / Tolerate missing padding like the email package
+            try:
+                return binascii.a2b_base64(data + b'===')
+            except binascii.Error:
+                return data
+    if encoding == 'quoted-printable':
+        return binascii.a2b_qp(data)
+    return data
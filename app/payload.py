@@ -0,0 +1,146 @@
+import json  # JSON格式 / JSON format
+import struct  # MessagePack和分块头编码 / MessagePack and chunk header encoding
+import time  # 分块消息ID的起点 / Starting point of chunked message IDs
+import zlib  # 压缩 / Compression
+from itertools import count
+from typing import Any, Dict, List, Optional, Tuple
+
+# 消息格式 / Payload formats
+FORMATS = ('text', 'json', 'msgpack')
+CONTENT_TYPES = {'text': 'text/plain; charset=utf-8', 'json': 'application/json', 'msgpack': 'application/msgpack'}
+# 压缩后的内容类型后缀 / Content type suffix of a compressed payload
+COMPRESSED_SUFFIX = '; compression=zlib'
+CHUNK_CONTENT_TYPE = 'application/octet-stream'
+# 分块头: 标记、消息ID、块序号、块数 / Chunk header: marker, message ID, chunk index, chunk count
+CHUNK_MAGIC = b'\x00E2M'
+CHUNK_HEADER = struct.Struct('>4sQHH')
+
+
+class PayloadEncoder:
+    """把一封邮件编码为一条或多条MQTT消息
+    Encode one email into one or more MQTT messages
+
+    text 与之前相同：发件人名称、主题和正文各占一行；json 和 msgpack 是包含发件人各字段的
+    结构化记录。结构化记录超过 compress_threshold 字节时用zlib压缩（首字节0x78，不会与
+    JSON或MessagePack的映射混淆）。超过 max_payload 字节的消息拆成多块，每块以
+    CHUNK_HEADER 开头，按序号拼接块内容即得到原来的消息
+    text is unchanged: sender name, subject and body on their own lines; json and msgpack
+    are structured records with the individual sender fields. A structured record larger
+    than compress_threshold bytes is compressed with zlib (first byte 0x78, which cannot be
+    mistaken for a JSON object or a MessagePack map). A message larger than max_payload
+    bytes is split into chunks that each start with CHUNK_HEADER; joining the chunk bodies
+    in index order gives back the original message
+
+    Args:
+        fmt (str): 'text'、'json' 或 'msgpack' / 'text', 'json' or 'msgpack'
+        compress_threshold (int): 压缩的字节阈值，0为不压缩 / Size in bytes above which records are compressed, 0 disables it
+        max_payload (int): 单条消息的字节上限，0为不分块 / Byte cap per message, 0 disables chunking
+    """
+
+    def __init__(self, fmt: str = 'text', compress_threshold: int = 0, max_payload: int = 0) -> None:
+        if fmt not in FORMATS:
+            raise ValueError(f"未知消息格式 {fmt!r}，可选 {FORMATS} / Unknown payload format {fmt!r}, expected one of {FORMATS}")
+        if max_payload and max_payload <= CHUNK_HEADER.size:
+            raise ValueError(f"max_payload 必须大于 {CHUNK_HEADER.size} / max_payload must exceed {CHUNK_HEADER.size}")
+        self.fmt = fmt
+        self.compress_threshold = compress_threshold
+        self.max_payload = max_payload
+        self._ids = count(time.time_ns())
+
+    def encode(self, record: Dict[str, Any]) -> List[Tuple[bytes, str]]:
+        """编码一封邮件 / Encode one email
+
+        Args:
+            record (dict): {'id', 'message_id', 'from': {'name', 'email'}, 'subject', 'body', 'body_type'}，
+                           summary模式下还有 'body_id' 和 'truncated' / plus 'body_id' and 'truncated' in summary mode
+
+        Returns:
+            list: (消息内容, 内容类型) 列表，按顺序发布 / (payload, content type) pairs to publish in order
+        """
+        content_type = CONTENT_TYPES[self.fmt]
+        if self.fmt == 'text':
+            text = f"{record['from']['name']}\n{record['subject']}\n{record['body']}"
+            if record.get('body_id'):
+                # summary模式下最后一行是读取完整正文的路径 / In summary mode the last line is the path of the full body
+                text += f"\n/mail/{record['body_id']}"
+            data = text.encode('utf-8')
+        else:
+            if self.fmt == 'json':
+                data = json.dumps(record, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            else:
+                data = packb(record)
+            if self.compress_threshold and len(data) > self.compress_threshold:
+                data = zlib.compress(data)
+                content_type += COMPRESSED_SUFFIX
+        if not self.max_payload or len(data) <= self.max_payload:
+            return [(data, content_type)]
+        size = self.max_payload - CHUNK_HEADER.size
+        total = -(-len(data) // size)
+        if total > 0xFFFF:
+            raise ValueError(f"消息需要 {total} 块，超过上限 / Message needs {total} chunks, over the limit")
+        message_id = next(self._ids) & 0xFFFFFFFFFFFFFFFF
+        return [
+            (CHUNK_HEADER.pack(CHUNK_MAGIC, message_id, index, total) + data[index * size:(index + 1) * size],
+             CHUNK_CONTENT_TYPE)
+            for index in range(total)
+        ]
+
+
+def packb(value: Any) -> bytes:
+    """按MessagePack格式编码，支持None、bool、int、float、str、bytes、list和dict
+    Encode as MessagePack, supporting None, bool, int, float, str, bytes, list and dict
+    """
+    out = bytearray()
+    _pack(value, out)
+    return bytes(out)
+
+
+def _pack(value: Any, out: bytearray) -> None:
+    if value is None:
+        out += b'\xc0'
+    elif value is True:
+        out += b'\xc3'
+    elif value is False:
+        out += b'\xc2'
+    elif isinstance(value, int):
+        if 0 <= value < 0x80:
+            out.append(value)
+        elif -0x20 <= value < 0:
+            out.append(value & 0xFF)
+        elif 0 <= value <= 0xFFFFFFFFFFFFFFFF:
+            out += b'\xcf' + struct.pack('>Q', value)
+        else:
+            out += b'\xd3' + struct.pack('>q', value)
+    elif isinstance(value, float):
+        out += b'\xcb' + struct.pack('>d', value)
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+        _header(out, len(data), 0xA0, 32, b'\xd9', b'\xda', b'\xdb')
+        out += data
+    elif isinstance(value, (bytes, bytearray)):
+        _header(out, len(value), None, 0, b'\xc4', b'\xc5', b'\xc6')
+        out += value
+    elif isinstance(value, (list, tuple)):
+        _header(out, len(value), 0x90, 16, None, b'\xdc', b'\xdd')
+        for item in value:
+            _pack(item, out)
+    elif isinstance(value, dict):
+        _header(out, len(value), 0x80, 16, None, b'\xde', b'\xdf')
+        for key, item in value.items():
+            _pack(key, out)
+            _pack(item, out)
+    else:
+        raise TypeError(f"无法编码 {type(value).__name__} / Cannot encode {type(value).__name__}")
+
+
+def _header(out: bytearray, length: int, fix: Optional[int], fix_limit: int, code8: Optional[bytes],
+            code16: bytes, code32: bytes) -> None:
+    # 按长度选择最短的类型头 / Pick the shortest type header for the length
+    if fix is not None and length < fix_limit:
+        out.append(fix | length)
+    elif code8 is not None and length < 0x100:
+        out += code8 + struct.pack('>B', length)
+    elif length < 0x10000:
+        out += code16 + struct.pack('>H', length)
+    else:
+        out += code32 + struct.pack('>I', length)
@@ -0,0 +1,327 @@
+import logging  # 日志 / Logging
+import queue  # 有界内存队列 / Bounded in-memory queue
+import threading  # 发布线程 / Publisher thread
+import time  # 停止时等待确认的期限 / Deadline for acknowledgements at shutdown
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple, Union
+
+import paho.mqtt.client as mqtt  # MQTT客户端 / MQTT client
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties  # MQTT v5 属性 / MQTT v5 properties
+
+try:
+    from app.spool import Spool
+except ImportError:
+    from spool import Spool
+
+log = logging.getLogger('email2mqtt.publisher')
+
+# 等待发布的消息: 主题、内容、内容类型、送达事件 / A message awaiting publishing: topic, payload, content type, delivery event
+Pending = Tuple[str, bytes, Optional[str], threading.Event]
+
+
+class Publisher:
+    """带背压和磁盘缓冲的MQTT发布队列
+    MQTT publish pipeline with backpressure and an on-disk spool
+
+    消息先进入有界内存队列，由单独的线程按顺序发布。代理断开时队列会被填满，
+    publish() 阻塞最多 queue_timeout 秒以拖慢IMAP获取，超时后消息写入磁盘缓冲。
+    代理恢复后先发送内存队列，再按写入顺序清空磁盘缓冲
+    Messages enter a bounded in-memory queue and are published in order by a
+    dedicated thread. While the broker is down the queue fills up and publish()
+    blocks for up to queue_timeout seconds to slow down IMAP fetching, after which
+    messages go to the disk spool. Once the broker is back the memory queue is
+    sent first and the spool is then drained in write order
+
+    publish() 返回一个事件，消息被代理确认（QoS 0 为已发送）或写入磁盘缓冲并刷盘后置位；
+    调用方只有在事件置位后才能认为消息不会丢失，例如推进检查点
+    publish() returns an event that is set once the broker acknowledged the message (sent,
+    for QoS 0) or it was appended to the spool and flushed to disk; only then may the caller
+    treat the message as safe, e.g. advance a checkpoint
+
+    使用MQTT v5时每条消息带上内容类型和过期时间，QoS 0时同一主题的后续消息只发送主题别名。
+    QoS 1/2不使用别名：paho会在新连接上重发未确认的消息，而别名只在原来的连接内有效
+    With MQTT v5 each message carries its content type and expiry, and with QoS 0 later
+    messages to the same topic send only a topic alias. QoS 1/2 uses no aliases: paho
+    resends unacknowledged messages on a new connection, where the alias no longer exists
+
+    Args:
+        client (mqtt.Client): 已启动网络循环的MQTT客户端 / MQTT client with a running network loop
+        spool (Spool): 磁盘缓冲 / Disk spool
+        qos (int): 发布QoS / Publish QoS
+        max_inflight (int): 未确认消息窗口 / Window of unacknowledged messages
+        queue_size (int): 内存队列长度 / Memory queue length
+        queue_timeout (float): 队列满时publish()最长阻塞时间（秒） / Longest publish() block on a full queue (seconds)
+        ack_timeout (float): 清空缓冲时等待PUBACK的时间（秒） / PUBACK wait while draining the spool (seconds)
+        protocol_v5 (bool): 客户端是否使用MQTT v5 / Whether the client speaks MQTT v5
+        message_expiry (int): 消息过期时间（秒），0为不过期 / Message expiry in seconds, 0 never expires
+        topic_alias_max (int): 最多使用的主题别名数，不超过代理允许的数量 / Most topic aliases to use, capped by what the broker allows
+    """
+
+    def __init__(self, client: mqtt.Client, spool: Spool, qos: int = 1, max_inflight: int = 20,
+                 queue_size: int = 100, queue_timeout: float = 5.0, ack_timeout: float = 10.0,
+                 protocol_v5: bool = False, message_expiry: int = 0, topic_alias_max: int = 0) -> None:
+        self.client = client
+        self.spool = spool
+        self.qos = qos
+        self.max_inflight = max(1, max_inflight)
+        self.queue_timeout = queue_timeout
+        self.ack_timeout = ack_timeout
+        self.protocol_v5 = protocol_v5
+        self.message_expiry = message_expiry
+        self.topic_alias_max = topic_alias_max if protocol_v5 and qos == 0 else 0
+        self.client.max_inflight_messages_set(self.max_inflight)
+        self._queue: 'queue.Queue[Pending]' = queue.Queue(maxsize=max(1, queue_size))
+        # 已交给paho但尚未确认的消息，按发送顺序 / Messages handed to paho but not acknowledged yet, in send order
+        self._unacked: Deque[Tuple[mqtt.MQTTMessageInfo, Pending]] = deque()
+        # 从磁盘缓冲发出、尚未确认的消息及其之后的读取位置，断线后继续等待paho重发的确认
+        # Spooled messages sent but not acknowledged yet with the read position after each;
+        # kept across disconnects to wait for the acknowledgements of paho's resends
+        self._window: Deque[Tuple[mqtt.MQTTMessageInfo, int]] = deque()
+        self._aliases: Dict[str, int] = {}
+        self._alias_limit = 0
+        self._connected = threading.Event()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, int] = {'published': 0, 'spooled': 0, 'spool_drained': 0}
+        self._thread = threading.Thread(target=self._run, name='mqtt-publisher', daemon=True)
+        self._thread.start()
+
+    def set_connected(self, connected: bool, topic_alias_maximum: int = 0) -> None:
+        """由MQTT连接/断开回调调用 / Called from the MQTT connect/disconnect callbacks
+
+        Args:
+            connected (bool): 是否已连接 / Whether the client is connected
+            topic_alias_maximum (int): 代理在CONNACK中允许的主题别名数 / Topic aliases the broker allows in its CONNACK
+        """
+        if connected:
+            # 主题别名只在一个连接内有效 / Topic aliases only live within one connection
+            with self._lock:
+                self._aliases = {}
+                self._alias_limit = min(self.topic_alias_max, topic_alias_maximum)
+            self._connected.set()
+        else:
+            self._connected.clear()
+
+    def publish(self, topic: str, payload: Union[str, bytes], content_type: Optional[str] = None) -> threading.Event:
+        """提交一条消息，队列满时阻塞，超时后写入磁盘缓冲
+        Submit a message, blocking while the queue is full and spooling to disk on timeout
+
+        磁盘缓冲中还有消息时新消息也写入缓冲，保证顺序
+        While the spool still holds messages new ones are spooled too, preserving order
+
+        Args:
+            topic (str): MQTT主题 / MQTT topic
+            payload (str | bytes): 消息内容 / Message payload
+            content_type (str): MQTT v5 内容类型 / MQTT v5 content type
+
+        Returns:
+            threading.Event: 代理确认或写入磁盘缓冲后置位 / Set once acknowledged by the broker or spooled to disk
+        """
+        data = payload.encode('utf-8') if isinstance(payload, str) else payload
+        delivered = threading.Event()
+        if len(self.spool) == 0 and not self._stopped.is_set():
+            try:
+                self._queue.put((topic, data, content_type, delivered), timeout=self.queue_timeout)
+                return delivered
+            except queue.Full:
+                log.warning("MQTT发布队列已满，写入磁盘缓冲")
+        self._spool([(topic, data, content_type, delivered)])
+        return delivered
+
+    def stats(self) -> Dict[str, Any]:
+        """返回发布统计和队列深度 / Return publish statistics and queue depth"""
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['unacked'] = len(self._unacked) + len(self._window)
+        stats['spool_bytes'] = len(self.spool)
+        stats['connected'] = self._connected.is_set()
+        return stats
+
+    def close(self) -> None:
+        """停止发布线程，未确认和未发送的消息按原来的顺序写入磁盘缓冲，下次启动时发送
+        Stop the publisher thread, moving unacknowledged and unsent messages to the disk
+        spool in their original order, to be sent on the next start
+
+        磁盘缓冲只由发布线程写入，因此等它退出后再返回
+        Only the publisher thread writes the spool meanwhile, so this waits for it to exit
+        """
+        self._stopped.set()
+        self._thread.join()
+        # 发布线程退出后才提交的消息排在最后 / Messages submitted after the thread exited go last
+        self._spool(self._take_queue())
+
+    def _queued(self, info: mqtt.MQTTMessageInfo) -> bool:
+        """paho是否接收了这条消息 / Whether paho took the message
+
+        QoS>0 时断线期间的消息由paho保留并在重连后重发，但rc停留在NO_CONN，is_published()
+        会因此报错；这里清除它，让之后的确认可以被看到。消息在确认之前不算送达
+        With QoS>0 paho keeps a message published while disconnected and resends it after
+        reconnecting, but leaves rc at NO_CONN so is_published() would raise; clearing it lets
+        the later acknowledgement show. The message does not count as delivered until then
+        """
+        if info.rc == mqtt.MQTT_ERR_SUCCESS:
+            return True
+        if self.qos > 0 and info.rc == mqtt.MQTT_ERR_NO_CONN:
+            info.rc = mqtt.MQTT_ERR_SUCCESS
+            return True
+        return False
+
+    def _send(self, topic: str, data: bytes, content_type: Optional[str]) -> mqtt.MQTTMessageInfo:
+        properties = None
+        if self.protocol_v5:
+            properties = Properties(PacketTypes.PUBLISH)
+            if content_type:
+                properties.ContentType = content_type
+            if self.message_expiry:
+                properties.MessageExpiryInterval = self.message_expiry
+            with self._lock:
+                alias = self._aliases.get(topic)
+                if alias is None and len(self._aliases) < self._alias_limit:
+                    # 第一条消息同时发送主题和新别名 / The first message sends both the topic and the new alias
+                    self._aliases[topic] = len(self._aliases) + 1
+                    properties.TopicAlias = self._aliases[topic]
+                elif alias is not None:
+                    properties.TopicAlias = alias
+                    topic = ''
+        return self.client.publish(topic, data, self.qos, properties=properties)
+
+    def _run(self) -> None:
+        held: Optional[Pending] = None
+        while not self._stopped.is_set():
+            self._reap()
+            if not self._connected.wait(timeout=1):
+                continue
+            if held is None:
+                if len(self._unacked) >= self.max_inflight:
+                    # 未确认的消息已满一个窗口，等最早的一条 / A full window is unacknowledged, wait for the oldest
+                    self._unacked[0][0].wait_for_publish(0.1)
+                    continue
+                try:
+                    held = self._queue.get(timeout=0.05 if self._unacked else 0.5)
+                except queue.Empty:
+                    # 缓冲中的消息比已发送的新，等它们确认后再发送 / Spooled messages are newer than the ones in flight, so wait for those first
+                    if len(self.spool) and not self._unacked:
+                        self._drain_spool()
+                    continue
+            try:
+                info = self._send(*held[:3])
+            except Exception as e:
+                log.error("MQTT发布出错: %s", e)
+                self._stopped.wait(1)
+                continue
+            if not self._queued(info):
+                # 保留这条消息，等待重连后重试 / Keep the message and retry after reconnecting
+                self._stopped.wait(0.5)
+            elif self.qos > 0:
+                self._unacked.append((info, held))
+                held = None
+            else:
+                held[3].set()
+                held = None
+                with self._lock:
+                    self._stats['published'] += 1
+        self._settle(time.monotonic() + self.ack_timeout)
+        # 未确认的、正在重试的和队列中的消息都比缓冲中尚未发送的消息早，按顺序放在缓冲最前面
+        # Unacknowledged, retried and queued messages are all older than what the spool still
+        # holds, so they go to its front in order
+        pending = [message for _, message in self._unacked]
+        self._unacked.clear()
+        if held is not None:
+            pending.append(held)
+        self._spool(pending + self._take_queue(), front=True)
+
+    def _reap(self) -> None:
+        """为已确认的消息置位事件 / Set the events of acknowledged messages"""
+        while self._unacked and self._unacked[0][0].is_published():
+            _, (_, _, _, delivered) = self._unacked.popleft()
+            delivered.set()
+            with self._lock:
+                self._stats['published'] += 1
+
+    def _settle(self, deadline: float) -> None:
+        """停止时仍连接着就等待已发送消息的确认，尽量少把已送达的消息再写入缓冲
+        At shutdown, while still connected, wait for the messages in flight to be
+        acknowledged so as few delivered messages as possible are spooled again
+        """
+        while (self._unacked or self._window) and self._connected.is_set() and time.monotonic() < deadline:
+            self._reap()
+            while self._window and self._window[0][0].is_published():
+                self.spool.commit(self._window.popleft()[1])
+                with self._lock:
+                    self._stats['spool_drained'] += 1
+            time.sleep(0.01)
+        self._reap()
+
+    def _drain_spool(self) -> None:
+        """按顺序清空磁盘缓冲，收到确认后才提交读取位置
+        Drain the spool in order, committing the read position only after acknowledgement
+
+        已发出的消息留在窗口中，断线重连后paho重发它们，这里从窗口之后继续读取而不重复发送
+        Messages already sent stay in the window; after a reconnect paho resends them, and
+        reading continues after the window instead of sending them twice
+        """
+        while self._connected.is_set() and not self._stopped.is_set():
+            offset = self._window[-1][1] if self._window else self.spool.offset
+            while len(self._window) < self.max_inflight:
+                record = self.spool.read(offset)
+                if record is None:
+                    break
+                spool_topic, data, offset = record
+                topic, content_type = _split_spool_topic(spool_topic)
+                info = self._send(topic, data, content_type)
+                if not self._queued(info):
+                    return
+                self._window.append((info, offset))
+            if not self._window:
+                return
+            info, next_offset = self._window[0]
+            deadline = time.monotonic() + self.ack_timeout
+            while not info.is_published():
+                if not self._connected.is_set() or self._stopped.is_set() or time.monotonic() > deadline:
+                    return
+                info.wait_for_publish(0.1)
+            self._window.popleft()
+            self.spool.commit(next_offset)
+            with self._lock:
+                self._stats['spool_drained'] += 1
+
+    def _take_queue(self) -> List[Pending]:
+        messages = []
+        while True:
+            try:
+                messages.append(self._queue.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def _spool(self, messages: List[Pending], front: bool = False) -> None:
+        """把消息写入磁盘缓冲并置位事件 / Write messages to the disk spool and set their events
+
+        Args:
+            messages (list): 按顺序的消息 / Messages in order
+            front (bool): 放在缓冲中尚未发送的消息之前 / Put them ahead of what the spool has not sent yet
+        """
+        if not messages:
+            return
+        records = [(_spool_topic(topic, content_type), data) for topic, data, content_type, _ in messages]
+        if front:
+            self.spool.prepend(records)
+        else:
+            for spool_topic, data in records:
+                self.spool.append(spool_topic, data)
+        for _, _, _, delivered in messages:
+            delivered.set()
+        with self._lock:
+            self._stats['spooled'] += len(messages)
+
+
+def _spool_topic(topic: str, content_type: Optional[str]) -> str:
+    # MQTT主题不能包含U+0000，用它在磁盘缓冲中把内容类型附在主题后面
+    # MQTT topics cannot contain U+0000, so it separates the content type from the topic in the spool
+    return f"{topic}\0{content_type}" if content_type else topic
+
+
+def _split_spool_topic(spool_topic: str) -> Tuple[str, Optional[str]]:
+    topic, _, content_type = spool_topic.partition('\0')
+    return topic, content_type or None
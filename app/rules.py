@@ -0,0 +1,176 @@
+import json  # 规则文件解析 / Rules file parsing
+import re  # 正则表达式模块 / Regular expression module
+from email.utils import parseaddr
+from typing import Any, Dict, List, Optional, Set
+
+# 规则动作: publish 正常发布, headers 只发布邮件头不下载正文, drop 丢弃
+# Rule actions: publish as usual, headers publishes without downloading the body, drop discards
+ACTIONS = ('publish', 'headers', 'drop')
+# 可以建立索引的精确条件，按选择性排序 / Exact conditions that can be indexed, most selective first
+EXACT_CONDITIONS = ('from', 'list_id', 'subject', 'from_domain')
+CONDITIONS = EXACT_CONDITIONS + ('subject_regex',)
+LIST_ID = re.compile(r'<([^<>]+)>')
+
+
+class RuleSet:
+    """按邮件头路由邮件的规则集
+    Rule set that routes mail by its headers
+
+    规则按顺序排列，第一条匹配的规则生效。每条规则的一个精确条件进入哈希索引
+    （发件人地址、List-Id、主题，或按域名后缀逐级查找的发件域名），其余条件在候选规则上校验；
+    只有正则条件的规则按顺序检查，且只检查排在已命中规则之前的部分。
+    因此精确规则的匹配开销与规则数量无关
+    Rules are ordered and the first matching rule wins. One exact condition of each rule
+    goes into a hash index (sender address, List-Id, subject, or the sender domain looked
+    up one suffix at a time), the remaining conditions are verified on the candidates.
+    Rules with only regex conditions are checked in order, and only those ranked before
+    an indexed hit, so matching exact rules costs the same however many rules there are
+
+    Args:
+        rules (list): 规则列表 / List of rules
+        default (dict): 没有规则匹配时的结果 / Result when no rule matches
+    """
+
+    def __init__(self, rules: List[Dict[str, Any]], default: Optional[Dict[str, Any]] = None) -> None:
+        self._conditions: List[Dict[str, Any]] = []
+        self._decisions: List[Dict[str, Any]] = []
+        self._index: Dict[str, Dict[str, List[int]]] = {key: {} for key in EXACT_CONDITIONS}
+        self._unindexed: List[int] = []
+        self.default = _decision(default or {}, None)
+        for rule in rules:
+            self._add(rule)
+
+    def __len__(self) -> int:
+        return len(self._decisions)
+
+    def match(self, sender: str, subject: str, list_id: str) -> Dict[str, Any]:
+        """返回第一条匹配规则的结果
+        Return the result of the first matching rule
+
+        Args:
+            sender (str): From邮件头 / From header
+            subject (str): 解码后的主题 / Decoded subject
+            list_id (str): List-Id邮件头 / List-Id header
+
+        Returns:
+            dict: {'action': ..., 'topic': 主题或None / topic or None, 'rule': 规则序号或None / rule index or None}
+        """
+        fields = {
+            'from': parseaddr(sender)[1].lower(),
+            'list_id': _list_id(list_id),
+            'subject': subject.strip(),
+        }
+        fields['from_domain'] = _suffixes(fields['from'].rpartition('@')[2])
+
+        candidates: Set[int] = set()
+        for key in ('from', 'list_id', 'subject'):
+            candidates.update(self._index[key].get(fields[key], ()))
+        for suffix in fields['from_domain']:
+            candidates.update(self._index['from_domain'].get(suffix, ()))
+
+        best = next((index for index in sorted(candidates) if self._matches(index, fields)), None)
+        for index in self._unindexed:
+            if best is not None and index > best:
+                break
+            if self._matches(index, fields):
+                best = index
+                break
+        return self.default if best is None else self._decisions[best]
+
+    def _add(self, rule: Dict[str, Any]) -> None:
+        index = len(self._decisions)
+        conditions: Dict[str, Any] = {}
+        for key in EXACT_CONDITIONS:
+            if key in rule:
+                values = rule[key] if isinstance(rule[key], list) else [rule[key]]
+                conditions[key] = {_normalize(key, value) for value in values}
+        if 'subject_regex' in rule:
+            try:
+                conditions['subject_regex'] = re.compile(rule['subject_regex'])
+            except re.error as e:
+                raise ValueError(f"规则 {index} 的正则无效: {e} / Rule {index} has an invalid regex: {e}")
+        if not conditions:
+            raise ValueError(f"规则 {index} 没有条件 / Rule {index} has no conditions")
+        unknown = set(rule) - set(CONDITIONS) - {'action', 'topic', 'name'}
+        if unknown:
+            raise ValueError(f"规则 {index} 包含未知字段 {sorted(unknown)} / Rule {index} has unknown fields {sorted(unknown)}")
+
+        self._conditions.append(conditions)
+        self._decisions.append(_decision(rule, index))
+        key = next((key for key in EXACT_CONDITIONS if key in conditions), None)
+        if key is None:
+            self._unindexed.append(index)
+            return
+        for value in conditions[key]:
+            self._index[key].setdefault(value, []).append(index)
+
+    def _matches(self, index: int, fields: Dict[str, Any]) -> bool:
+        for key, expected in self._conditions[index].items():
+            if key == 'subject_regex':
+                if not expected.search(fields['subject']):
+                    return False
+            elif key == 'from_domain':
+                if expected.isdisjoint(fields['from_domain']):
+                    return False
+            elif fields[key] not in expected:
+                return False
+        return True
+
+
+def load_rules(path: str) -> RuleSet:
+    """从JSON文件读取路由规则
+    Load routing rules from a JSON file
+
+    文件格式 / File format:
+
+        {"rules": [
+            {"from": "noreply@github.com", "topic": "email/github"},
+            {"from_domain": "alerts.example.com", "subject_regex": "^\\\\[RESOLVED\\\\]", "action": "drop"},
+            {"list_id": "announce.lists.example.org", "action": "headers"}
+         ],
+         "default": {"action": "publish"}}
+
+    Args:
+        path (str): 规则文件路径 / Rules file path
+
+    Returns:
+        RuleSet: 编译后的规则集 / Compiled rule set
+
+    Raises:
+        ValueError: 规则无效 / Invalid rules
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        return RuleSet(data)
+    return RuleSet(data.get('rules') or [], data.get('default'))
+
+
+def _decision(rule: Dict[str, Any], index: Optional[int]) -> Dict[str, Any]:
+    action = rule.get('action', 'publish')
+    if action not in ACTIONS:
+        raise ValueError(f"未知动作 {action!r}，可选 {ACTIONS} / Unknown action {action!r}, expected one of {ACTIONS}")
+    return {'action': action, 'topic': rule.get('topic') or None, 'rule': rule.get('name', index)}
+
+
+def _normalize(key: str, value: str) -> str:
+    value = str(value).strip()
+    if key == 'subject':
+        return value
+    if key == 'list_id':
+        return _list_id(value)
+    if key == 'from_domain':
+        return value.lower().lstrip('@.')
+    return value.lower()
+
+
+def _list_id(value: str) -> str:
+    """取出List-Id尖括号中的标识 / Take the identifier out of the List-Id angle brackets"""
+    match = LIST_ID.search(value or '')
+    return (match.group(1) if match else value or '').strip().lower()
+
+
+def _suffixes(domain: str) -> List[str]:
+    """a.example.com -> ['a.example.com', 'example.com', 'com']"""
+    labels = domain.split('.') if domain else []
+    return ['.'.join(labels[i:]) for i in range(len(labels))]
@@ -0,0 +1,170 @@
+import logging  # 日志 / Logging
+import os  # 文件操作 / File operations
+import struct  # 记录头编码 / Record header encoding
+import threading  # 线程锁 / Thread lock
+from typing import List, Optional, Tuple
+
+log = logging.getLogger('email2mqtt.spool')
+
+# 记录头: 主题长度、消息长度 / Record header: topic length, payload length
+RECORD_HEADER = struct.Struct('>II')
+# 偏移文件: 已发送的字节位置 / Offset file: byte position already sent
+OFFSET = struct.Struct('>Q')
+
+
+class Spool:
+    """仅追加的磁盘消息队列，按写入顺序读出
+    Append-only on-disk message queue, read back in write order
+
+    数据文件只追加，另一个小文件记录已确认的读取位置；全部读完后截断两个文件
+    The data file is only appended to, a small side file records the committed read
+    position, and both are truncated once everything has been read
+
+    Args:
+        path (str): 数据文件路径，偏移文件为 path + '.offset' / Data file path, the offset file is path + '.offset'
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.offset_path = f"{path}.offset"
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._data = open(path, 'a+b')
+        self._offset = self._load_offset()
+        self._size = self._data.seek(0, os.SEEK_END)
+        if self._offset > self._size:
+            self._offset = self._size
+        self._drop_partial_record()
+
+    def __len__(self) -> int:
+        """未读取的字节数 / Number of unread bytes"""
+        with self._lock:
+            return self._size - self._offset
+
+    def append(self, topic: str, payload: bytes) -> None:
+        """追加一条消息并刷到磁盘 / Append a message and flush it to disk"""
+        topic_bytes = topic.encode('utf-8')
+        record = RECORD_HEADER.pack(len(topic_bytes), len(payload)) + topic_bytes + payload
+        with self._lock:
+            self._data.seek(0, os.SEEK_END)
+            self._data.write(record)
+            self._data.flush()
+            os.fsync(self._data.fileno())
+            self._size += len(record)
+
+    def prepend(self, records: List[Tuple[str, bytes]]) -> None:
+        """把消息放在尚未读取的消息之前，重写数据文件并刷到磁盘
+        Put messages ahead of the unread ones, rewriting the data file and flushing it to disk
+
+        只在停止时用于保存比缓冲内容更早的消息，因此重写整个文件的代价可以接受
+        Only used at shutdown to keep messages older than the spooled ones, so rewriting the
+        whole file is acceptable
+
+        Args:
+            records (list): 按顺序的 (topic, payload) / (topic, payload) in order
+        """
+        tmp_path = f"{self.path}.tmp"
+        with self._lock:
+            self._data.seek(self._offset)
+            unread = self._data.read(self._size - self._offset)
+            with open(tmp_path, 'wb') as f:
+                for topic, payload in records:
+                    topic_bytes = topic.encode('utf-8')
+                    f.write(RECORD_HEADER.pack(len(topic_bytes), len(payload)) + topic_bytes + payload)
+                f.write(unread)
+                f.flush()
+                os.fsync(f.fileno())
+                size = f.tell()
+            # 先把读取位置归零：替换后崩溃最多重发，不会跳过 / Reset the read position first: a crash after the swap resends at worst, never skips
+            self._offset = 0
+            self._save_offset()
+            self._data.close()
+            os.replace(tmp_path, self.path)
+            self._data = open(self.path, 'a+b')
+            self._size = size
+
+    @property
+    def offset(self) -> int:
+        """已确认的读取位置 / Committed read position"""
+        with self._lock:
+            return self._offset
+
+    def read(self, offset: int) -> Optional[Tuple[str, bytes, int]]:
+        """从指定位置读取一条消息，不移动已确认的读取位置
+        Read one message at the given position without moving the committed read position
+
+        Args:
+            offset (int): 读取位置，通常是offset或上一次read返回的位置
+                          Position to read from, usually offset or the position returned by the previous read
+
+        Returns:
+            tuple: (topic, payload, next_offset)，没有更多消息时返回None
+            (topic, payload, next_offset), None when there are no more messages
+        """
+        with self._lock:
+            if offset >= self._size:
+                return None
+            self._data.seek(offset)
+            header = self._data.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                return None
+            topic_length, payload_length = RECORD_HEADER.unpack(header)
+            topic = self._data.read(topic_length).decode('utf-8')
+            payload = self._data.read(payload_length)
+            return topic, payload, offset + RECORD_HEADER.size + topic_length + payload_length
+
+    def commit(self, next_offset: int) -> None:
+        """确认read返回的消息已发送，全部读完时压缩文件
+        Confirm the messages returned by read were sent, compacting once fully drained
+
+        Args:
+            next_offset (int): read返回的下一条位置 / Next position returned by read
+        """
+        with self._lock:
+            self._offset = next_offset
+            if self._offset >= self._size:
+                self._data.truncate(0)
+                self._offset = self._size = 0
+            self._save_offset()
+
+    def close(self) -> None:
+        with self._lock:
+            self._data.close()
+
+    def _drop_partial_record(self) -> None:
+        """截掉进程崩溃时写了一半的最后一条记录
+        Cut off a last record that was only half written when the process crashed
+        """
+        position = self._offset
+        while position < self._size:
+            self._data.seek(position)
+            header = self._data.read(RECORD_HEADER.size)
+            if len(header) < RECORD_HEADER.size:
+                break
+            topic_length, payload_length = RECORD_HEADER.unpack(header)
+            end = position + RECORD_HEADER.size + topic_length + payload_length
+            if end > self._size:
+                break
+            position = end
+        if position < self._size:
+            log.warning("磁盘缓冲末尾有不完整的记录，已截断 %d 字节", self._size - position)
+            self._data.truncate(position)
+            self._size = position
+
+    def _load_offset(self) -> int:
+        try:
+            with open(self.offset_path, 'rb') as f:
+                return OFFSET.unpack(f.read(OFFSET.size))[0]
+        except (FileNotFoundError, struct.error):
+            return 0
+
+    def _save_offset(self) -> None:
+        # 先写临时文件并刷盘再替换，崩溃时偏移文件不会只写了一半 / Write and fsync a temporary file, then rename it, so a crash never leaves a half-written offset
+        tmp_path = f"{self.offset_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(OFFSET.pack(self._offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.offset_path)
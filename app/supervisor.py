@@ -0,0 +1,179 @@
+import random  # 退避抖动 / Backoff jitter
+import threading  # 线程锁 / Thread lock
+import time  # 时间相关操作 / Time-related operations
+from typing import Any, Dict, Optional
+
+# 断路器状态 / Circuit breaker states
+CLOSED = 'closed'  # 允许连接尝试，连续失败未达阈值 / Attempts allowed, consecutive failures below the threshold
+HALF_OPEN = 'half_open'  # 冷却期已过，只允许一次试探 / Cool-off over, a single probe attempt allowed
+OPEN = 'open'  # 连续失败达到阈值，冷却期内拒绝连接尝试 / Threshold reached, attempts rejected until the cool-off ends
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class ConnectionSupervisor:
+    """连接监督：带抖动的指数退避和断路器，IMAP和MQTT共用
+    Connection supervision with jittered exponential backoff and a circuit breaker,
+    shared by IMAP and MQTT
+
+    第n次连续失败后等待 d/2 + random(0, d/2)，其中 d = min(max_delay, min_delay * 2^n)：
+    短暂中断后很快重连，长时间中断时间隔增长到上限，抖动使多个连接不会同时重试。
+    连续失败达到 failure_threshold 次时断路器打开，在这次等待（冷却期）结束前 allow()
+    拒绝连接尝试；冷却期过后变为半开，只允许一次试探，成功则关闭，失败则以更长的冷却期
+    重新打开
+    After the n-th consecutive failure it waits d/2 + random(0, d/2), where
+    d = min(max_delay, min_delay * 2^n): a short outage reconnects quickly, a long one
+    backs off to the cap, and the jitter keeps many connections from retrying in step.
+    After failure_threshold consecutive failures the circuit opens and allow() rejects
+    attempts until that wait (the cool-off) is over; it then goes half open and lets a
+    single probe through, closing on success and opening again with a longer cool-off on
+    failure
+
+    连接成功不会立即清零失败次数，连接保持 stable_after 秒后才清零：连上后很快又断开
+    与连接失败同样计数和退避，接受连接后立即断开的服务器不会被反复快速重试
+    A successful connection does not clear the failure count at once, only once it has
+    stayed up for stable_after seconds: a connection dropping soon after it was made counts
+    and backs off like a failed attempt, so a server that accepts and then drops right away
+    is not retried quickly forever
+
+    Args:
+        name (str): 连接名称 / Connection name
+        min_delay (float): 最短重试间隔（秒） / Shortest retry delay in seconds
+        max_delay (float): 最长重试间隔（秒） / Longest retry delay in seconds
+        failure_threshold (int): 打开断路器的连续失败次数 / Consecutive failures that open the circuit
+        stable_after (float): 连接保持多少秒后清零失败次数 / Seconds a connection must stay up to clear the failure count
+    """
+
+    def __init__(self, name: str, min_delay: float = 1.0, max_delay: float = 120.0,
+                 failure_threshold: int = 5, stable_after: float = 30.0) -> None:
+        self.name = name
+        self.min_delay = max(0.01, min_delay)
+        self.max_delay = max(self.min_delay, max_delay)
+        self.failure_threshold = max(1, failure_threshold)
+        self.stable_after = max(0.0, stable_after)
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._probing = False
+        self._failures = 0
+        self._retry_at = 0.0
+        self._last_error = ''
+        self._connected_since: Optional[float] = None
+        self._stats = {'connects': 0, 'failures': 0, 'disconnects': 0, 'rejected': 0}
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state(time.time())
+
+    @property
+    def connected(self) -> bool:
+        with self._lock:
+            return self._connected_since is not None
+
+    def allow(self) -> bool:
+        """是否允许现在尝试连接：打开时拒绝，半开时只放行一次试探
+        Whether a connection attempt may be made now: rejected while open, a single probe
+        while half open
+
+        Returns:
+            bool: 允许时返回True / True if allowed
+        """
+        with self._lock:
+            state = self._current_state(time.time())
+            if state == OPEN or (state == HALF_OPEN and self._probing):
+                self._stats['rejected'] += 1
+                return False
+            if state == HALF_OPEN:
+                self._probing = True
+            return True
+
+    def succeeded(self) -> None:
+        """连接成功，关闭断路器 / The connection succeeded: close the circuit"""
+        with self._lock:
+            self._state = CLOSED
+            self._probing = False
+            self._retry_at = 0.0
+            self._connected_since = time.time()
+            self._stats['connects'] += 1
+
+    def disconnected(self, error: Any = '') -> float:
+        """已建立的连接断开，返回重连前的等待时间
+        An established connection dropped; return the wait before reconnecting
+
+        稳定运行过的连接等待不超过min_delay的随机时间；连上后不久就断开的连接按失败退避
+        A connection that had been stable waits a random time up to min_delay; one that
+        dropped soon after connecting backs off like a failure
+
+        Args:
+            error: 断开原因 / Reason for the drop
+
+        Returns:
+            float: 等待时间（秒） / Delay in seconds
+        """
+        with self._lock:
+            now = time.time()
+            stable = False
+            if self._connected_since is not None:
+                self._stats['disconnects'] += 1
+                stable = now - self._connected_since >= self.stable_after
+            self._connected_since = None
+            if not stable:
+                # 连上后不久就断开，与连接失败同样计数和退避 / Dropped soon after connecting: counts and backs off like a failure
+                return self._fail(now, error or 'dropped right after connecting')
+            self._failures = 0
+            if error:
+                self._last_error = str(error)
+            delay = random.uniform(0, self.min_delay)
+            self._retry_at = now + delay
+            return delay
+
+    def failed(self, error: Any = '') -> float:
+        """连接尝试失败，返回下一次尝试前应等待的秒数
+        A connection attempt failed; return how many seconds to wait before the next one
+
+        Args:
+            error: 失败原因 / Failure reason
+
+        Returns:
+            float: 等待时间（秒） / Delay in seconds
+        """
+        with self._lock:
+            self._connected_since = None
+            return self._fail(time.time(), error)
+
+    def retry_in(self) -> float:
+        """距离下一次尝试的秒数 / Seconds until the next attempt is due"""
+        with self._lock:
+            return max(0.0, self._retry_at - time.time()) if self._connected_since is None else 0.0
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回连接状态，用于HTTP和指标 / Return the connection state for HTTP and metrics"""
+        with self._lock:
+            now = time.time()
+            if self._connected_since is not None and now - self._connected_since >= self.stable_after:
+                self._failures = 0
+            return {
+                'state': self._current_state(now),
+                'connected': self._connected_since is not None,
+                'consecutive_failures': self._failures,
+                'retry_in': round(max(0.0, self._retry_at - now), 3) if self._connected_since is None else 0.0,
+                'connected_for': round(now - self._connected_since, 3) if self._connected_since else None,
+                'last_error': self._last_error,
+                **self._stats,
+            }
+
+    def _current_state(self, now: float) -> str:
+        # 冷却期结束时从打开变为半开 / Open turns half open once the cool-off is over
+        if self._state == OPEN and now >= self._retry_at:
+            self._state = HALF_OPEN
+        return self._state
+
+    def _fail(self, now: float, error: Any) -> float:
+        self._failures += 1
+        self._stats['failures'] += 1
+        self._last_error = str(error)
+        self._probing = False
+        self._state = OPEN if self._failures >= self.failure_threshold else CLOSED
+        ceiling = min(self.max_delay, self.min_delay * 2 ** min(self._failures - 1, 32))
+        delay = ceiling / 2 + random.uniform(0, ceiling / 2)
+        self._retry_at = now + delay
+        return delay
@@ -0,0 +1,96 @@
+"""测量每增加一个监听文件夹的内存开销
+Measure the memory cost of each additional watched folder
+
+启动N个 watch_mailbox 任务监听本地IMAP替身，比较1个和N个监听时的RSS
+Starts N watch_mailbox tasks against the local IMAP stand-in and compares RSS
+between one watcher and N watchers
+
+用法 / Usage:
+    python -m benchmarks.bench_accounts --accounts 50
+"""
+import argparse
+import asyncio
+import imaplib
+import os
+import sys
+import tempfile
+import threading
+import time
+
+WORK_DIR = tempfile.mkdtemp(prefix='email2mqtt-bench-')
+# 导入app.main前提供必填配置 / Provide required settings before importing app.main
+for key, value in {
+    'IMAP_SERVER': '127.0.0.1', 'EMAIL_USERNAME': 'bench', 'EMAIL_PASSWORD': 'bench',
+    'MQTT_BROKER': '127.0.0.1', 'MQTT_PORT': '1', 'MQTT_SSL': 'False',
+    'MQTT_USERNAME': 'bench', 'MQTT_PASSWORD': 'bench', 'WATCH_MODE': 'idle',
+    'CHECKPOINT_FILE': os.path.join(WORK_DIR, 'checkpoint.json'),
+    'DEDUP_DB': os.path.join(WORK_DIR, 'dedup.sqlite3'),
+}.items():
+    os.environ.setdefault(key, value)
+
+from app import main as email2mqtt  # noqa: E402
+from app.dedup import DedupStore  # noqa: E402
+from benchmarks.fake_imap import FakeIMAPServer  # noqa: E402
+
+# 替身服务器使用明文连接 / The stand-in speaks plain IMAP
+imaplib.IMAP4_SSL = imaplib.IMAP4
+
+
+class NullPublisher:
+    """丢弃所有消息的MQTT客户端替身 / MQTT client stand-in that drops every message"""
+
+    def publish(self, topic: str, payload: str, *args, **kwargs) -> threading.Event:
+        # 丢弃的消息立即算作送达 / A dropped message counts as delivered at once
+        delivered = threading.Event()
+        delivered.set()
+        return delivered
+
+
+def rss_kib() -> int:
+    with open('/proc/self/status', encoding='ascii') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1])
+    return 0
+
+
+def start_watchers(loop: asyncio.AbstractEventLoop, server: FakeIMAPServer, start: int, count: int,
+                   dedup: DedupStore) -> None:
+    for index in range(start, start + count):
+        account = {
+            'name': f'bench{index}/INBOX', 'server': '127.0.0.1', 'port': server.port,
+            'username': f'bench{index}', 'password': 'bench', 'folder': 'INBOX',
+            'topic': f'email/bench{index}', 'checkpoint': os.path.join(WORK_DIR, f'checkpoint-{index}.json')
+        }
+        asyncio.run_coroutine_threadsafe(email2mqtt.watch_mailbox(account, NullPublisher(), dedup), loop)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--accounts', type=int, default=50)
+    parser.add_argument('--settle', type=float, default=2.0, help='等待监听进入IDLE的时间 / Time for the watchers to reach IDLE')
+    args = parser.parse_args()
+
+    server = FakeIMAPServer()
+    dedup = DedupStore(os.path.join(WORK_DIR, 'bench-dedup.sqlite3'))
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    start_watchers(loop, server, 0, 1, dedup)
+    time.sleep(args.settle)
+    baseline = rss_kib()
+
+    start_watchers(loop, server, 1, args.accounts - 1, dedup)
+    time.sleep(args.settle)
+    total = rss_kib()
+
+    per_account = (total - baseline) / max(1, args.accounts - 1)
+    print(f"watchers={args.accounts} rss_1={baseline} KiB rss_{args.accounts}={total} KiB")
+    print(f"memory per additional watcher: {per_account:.0f} KiB")
+
+
+if __name__ == '__main__':
+    main()
+    sys.stdout.flush()
+    # IMAP线程仍在IDLE中等待 / The IMAP threads are still waiting in IDLE
+    os._exit(0)
@@ -0,0 +1,210 @@
+"""端到端吞吐量基准：IMAP替身 → 获取 → 解析 → 发布 → MQTT替身
+End-to-end throughput benchmark: IMAP stand-in → fetch → parse → publish → MQTT stand-in
+
+在同一进程中启动本地IMAP替身和MQTT替身，用生成的MIME邮件运行完整的 main()，
+输出JSON格式的吞吐量、端到端延迟和峰值内存。延迟从邮件放入邮箱算起，到MQTT替身收到为止。
+使用 --baseline 与之前的结果比较，性能下降超过 --tolerance 时以非零状态退出
+Runs the real main() in-process against the local IMAP and MQTT stand-ins with a
+generated MIME corpus, and prints throughput, end-to-end latency and peak RSS as JSON.
+Latency runs from the moment a message lands in the mailbox until the MQTT stand-in
+receives it. With --baseline the result is compared to an earlier run and the exit
+status is non-zero when it regressed by more than --tolerance
+
+用法 / Usage:
+    python -m benchmarks.bench_e2e --messages 1000 --output result.json
+    python -m benchmarks.bench_e2e --messages 1000 --rate 200 --baseline result.json
+    python -m benchmarks.bench_e2e --mix plain=1,legacy_charset=1 --fetch-mode text
+"""
+import argparse
+import asyncio
+import imaplib
+import json
+import os
+import platform
+import re
+import resource
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+from benchmarks.corpus import DEFAULT_MIX, generate, parse_mix
+from benchmarks.fake_imap import FakeIMAPServer, Mailbox
+from benchmarks.fake_mqtt import FakeMQTTBroker
+
+TOKEN = re.compile(rb'bench-(\d+)')
+
+
+def peak_rss_kib() -> int:
+    """进程的峰值RSS / Peak RSS of the process"""
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def configure(work_dir: str, imap_port: int, mqtt_port: int, args: argparse.Namespace) -> None:
+    """导入app.main前写入账户文件和环境变量 / Write the accounts file and environment before importing app.main"""
+    accounts_file = os.path.join(work_dir, 'accounts.json')
+    with open(accounts_file, 'w', encoding='utf-8') as f:
+        json.dump({'accounts': [{
+            'name': 'bench', 'server': '127.0.0.1', 'port': imap_port,
+            'username': 'bench', 'password': 'bench', 'topic': 'email/bench'
+        }]}, f)
+    os.environ.update({
+        'ACCOUNTS_FILE': accounts_file,
+        'MQTT_BROKER': '127.0.0.1', 'MQTT_PORT': str(mqtt_port), 'MQTT_SSL': 'False',
+        'MQTT_USERNAME': 'bench', 'MQTT_PASSWORD': 'bench',
+        'CHECKPOINT_FILE': os.path.join(work_dir, 'checkpoint.json'),
+        'DEDUP_DB': os.path.join(work_dir, 'dedup.sqlite3'),
+        'SPOOL_FILE': os.path.join(work_dir, 'spool.bin'),
+        'WATCH_MODE': args.watch_mode, 'CHECK_INTERVAL': '1',
+        'FETCH_MODE': args.fetch_mode, 'HTML_PROCESS_MODE': args.html_mode,
+        'FETCH_CHUNK_SIZE': str(args.chunk_size),
+    })
+
+
+def feed(mailbox: Mailbox, corpus: List, sent_at: Dict[int, float], rate: float) -> None:
+    """按速率把邮件放入邮箱，rate为0时一次放入 / Drop messages into the mailbox at a rate, all at once when rate is 0"""
+    interval = 1.0 / rate if rate > 0 else 0.0
+    start = time.perf_counter()
+    for position, (_, raw) in enumerate(corpus):
+        if interval:
+            delay = start + position * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        sent_at[int(TOKEN.search(raw).group(1))] = time.time()
+        mailbox.add(raw, seen=False)
+
+
+def compare(result: Dict, baseline_path: str, tolerance: float) -> List[str]:
+    """与基线比较，返回退化项 / Compare with a baseline and return the regressions"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = []
+    if result['mails_per_sec'] < baseline['mails_per_sec'] * (1 - tolerance):
+        regressions.append(f"mails_per_sec {result['mails_per_sec']} < {baseline['mails_per_sec']}")
+    for key in ('p50', 'p99'):
+        if result['latency_ms'][key] > baseline['latency_ms'][key] * (1 + tolerance):
+            regressions.append(f"latency {key} {result['latency_ms'][key]} > {baseline['latency_ms'][key]}")
+    if result['peak_rss_kib'] > baseline['peak_rss_kib'] * (1 + tolerance):
+        regressions.append(f"peak_rss_kib {result['peak_rss_kib']} > {baseline['peak_rss_kib']}")
+    return regressions
+
+
+def main() -> Optional[int]:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=500, help='邮件数量 / Number of messages')
+    parser.add_argument('--rate', type=float, default=0, help='每秒放入的邮件数，0为预先全部放入 / Messages per second, 0 preloads them all')
+    parser.add_argument('--mix', default=None, help='邮件类型比例，例如 plain=3,attachment=1 / Message mix, e.g. plain=3,attachment=1')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--fetch-mode', default='full', choices=('full', 'text'))
+    parser.add_argument('--html-mode', default='raw', choices=('raw', 'text'))
+    parser.add_argument('--watch-mode', default='idle', choices=('idle', 'poll'))
+    parser.add_argument('--chunk-size', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.0, help='IMAP替身每条命令的延迟(秒) / Per-command IMAP stand-in latency (seconds)')
+    parser.add_argument('--timeout', type=float, default=300)
+    parser.add_argument('--output', help='同时把结果写入文件 / Also write the result to a file')
+    parser.add_argument('--baseline', help='用于比较的旧结果 / Earlier result to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='允许的退化比例 / Allowed regression ratio')
+    parser.add_argument('--quiet', action='store_true', help='丢弃程序日志 / Discard the application log')
+    args = parser.parse_args()
+
+    # 标准输出只留给JSON结果，程序日志转到标准错误 / Keep stdout for the JSON result, send the application log to stderr
+    result_stream = sys.stdout
+    sys.stdout = open(os.devnull, 'w') if args.quiet else sys.stderr
+
+    mix = parse_mix(args.mix) if args.mix else DEFAULT_MIX
+    corpus = generate(args.messages, args.seed, mix)
+    corpus_bytes = sum(len(raw) for _, raw in corpus)
+
+    work_dir = tempfile.mkdtemp(prefix='email2mqtt-e2e-')
+    mailbox = Mailbox()
+    sent_at: Dict[int, float] = {}
+    if args.rate <= 0:
+        feed(mailbox, corpus, sent_at, 0)
+    imap_server = FakeIMAPServer(mailbox, latency=args.latency)
+    broker = FakeMQTTBroker()
+    configure(work_dir, imap_server.port, broker.port, args)
+
+    # 替身服务器使用明文连接 / The stand-in speaks plain IMAP
+    imaplib.IMAP4_SSL = imaplib.IMAP4
+    rss_before = peak_rss_kib()
+    start = time.time()
+    from app import main as email2mqtt
+    # 在后台线程的事件循环中运行 main() / Run main() on an event loop in a background thread
+    threading.Thread(target=asyncio.run, args=(email2mqtt.main(),), daemon=True).start()
+    if args.rate > 0:
+        threading.Thread(target=feed, args=(mailbox, corpus, sent_at, args.rate), daemon=True).start()
+
+    received: Dict[int, float] = {}
+    seen_messages = 0
+    deadline = start + args.timeout
+    while len(received) < args.messages and time.time() < deadline:
+        time.sleep(0.05)
+        messages = broker.messages[seen_messages:]
+        seen_messages += len(messages)
+        for received_at, topic, payload in messages:
+            match = TOKEN.search(payload)
+            if match:
+                received.setdefault(int(match.group(1)), received_at)
+    elapsed = (max(received.values()) if received else time.time()) - start
+
+    latencies = [(received[index] - sent_at[index]) * 1000 for index in received if index in sent_at]
+    result = {
+        'benchmark': 'e2e',
+        'messages': args.messages,
+        'delivered': len(received),
+        'corpus_bytes': corpus_bytes,
+        'duration_s': round(elapsed, 3),
+        'mails_per_sec': round(len(received) / elapsed, 1) if elapsed > 0 else 0.0,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 0.50), 2),
+            'p99': round(percentile(latencies, 0.99), 2),
+            'max': round(max(latencies), 2) if latencies else 0.0,
+        },
+        'peak_rss_kib': peak_rss_kib(),
+        'rss_before_start_kib': rss_before,
+        'config': {
+            'rate': args.rate, 'mix': mix, 'seed': args.seed, 'fetch_mode': args.fetch_mode,
+            'html_mode': args.html_mode, 'watch_mode': args.watch_mode,
+            'chunk_size': args.chunk_size, 'imap_latency': args.latency,
+        },
+        'python': platform.python_version(),
+        'timestamp': int(time.time()),
+    }
+    output = json.dumps(result, indent=2)
+    print(output, file=result_stream, flush=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+
+    if result['delivered'] < args.messages:
+        print(f"only {result['delivered']}/{args.messages} messages delivered", file=sys.stderr)
+        return 1
+    if args.baseline:
+        regressions = compare(result, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"regression: {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    exit_code = main() or 0
+    sys.stderr.flush()
+    # 监听线程不会自行退出 / The watcher threads never exit on their own
+    os._exit(exit_code)
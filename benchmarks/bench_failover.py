@@ -0,0 +1,199 @@
+"""主备故障切换演练：主节点崩溃或卡死后待命副本多快接管，邮件是否丢失
+Active/standby failover drill: how fast a standby takes over after the leader crashes or
+hangs, and whether any mail is lost
+
+两个副本用uvicorn子进程启动（与 bench_startup 相同），连接同一个IMAP替身和MQTT替身，
+各自有独立的工作目录（检查点、去重索引和磁盘缓冲互不共享，如同两台主机）。演练期间
+每隔 --interval 秒向邮箱投递一封邮件。每一轮模拟主节点故障：kill 发送SIGKILL（连接断开，
+代理发布遗嘱），hang 发送SIGSTOP（进程卡死，只能等租约过期），stop 发送SIGTERM（正常停止，
+主节点自己交出租约，如滚动升级）。输出JSON格式的结果：
+各轮的接管时间（故障到另一个副本 /leader 报告为主节点）、故障后第一封新邮件的发布延迟，
+以及演练结束时丢失和重复发布的邮件数
+Two replicas run as uvicorn child processes (as in bench_startup) against the same IMAP
+and MQTT stand-ins, each in its own work directory (checkpoints, dedup index and spool are
+not shared, as on two hosts). A message is delivered to the mailbox every --interval
+seconds during the drill. Each round simulates a leader failure: kill sends SIGKILL (the
+connection drops and the broker publishes the will), hang sends SIGSTOP (the process
+freezes and only the lease expiring helps), stop sends SIGTERM (a clean shutdown where the
+leader hands over the lease itself, as in a rolling upgrade). Prints the result as JSON: the takeover time
+of each round (failure until the other replica's /leader reports leader), the publish
+delay of the first new message after the failure, and the messages lost or published
+twice by the end of the drill
+
+用法 / Usage:
+    python -m benchmarks.bench_failover --rounds 3
+    python -m benchmarks.bench_failover --rounds 3 --mode hang --lease 3 --output failover.json
+"""
+import argparse
+import json
+import platform
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from benchmarks.bench_startup import LAUNCHER, child_env, free_port
+from benchmarks.fake_imap import FakeIMAPServer, Mailbox
+from benchmarks.fake_mqtt import FakeMQTTBroker
+
+LEASE_TOPIC = 'email2mqtt/leader'
+MAIL_TOPIC = 'email/bench'
+
+
+class Replica:
+    """一个副本子进程，故障后可以在同一工作目录中重新启动
+    One replica child process, restartable in the same work directory after a failure
+    """
+
+    def __init__(self, node: str, imap_port: int, mqtt_port: int, lease: float, quiet: bool) -> None:
+        self.node = node
+        self.port = free_port()
+        self.quiet = quiet
+        self.env = child_env(tempfile.mkdtemp(prefix=f'email2mqtt-failover-{node}-'), imap_port, mqtt_port)
+        self.env.update({'HA_LEASE_TOPIC': LEASE_TOPIC, 'HA_NODE_ID': node, 'HA_LEASE_SECONDS': str(lease)})
+        self.child: Optional[subprocess.Popen] = None
+
+    def start(self) -> None:
+        output = subprocess.DEVNULL if self.quiet else sys.stderr
+        self.child = subprocess.Popen([sys.executable, '-c', LAUNCHER, str(self.port)], env=self.env,
+                                      stdout=output, stderr=output)
+
+    def state(self) -> Optional[str]:
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{self.port}/leader', timeout=0.5) as response:
+                return json.load(response)['state']
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def fail(self, mode: str) -> None:
+        self.child.send_signal({'kill': signal.SIGKILL, 'hang': signal.SIGSTOP, 'stop': signal.SIGTERM}[mode])
+
+    def recover(self, mode: str) -> None:
+        if mode in ('kill', 'stop'):
+            self.child.wait()
+            self.start()
+        else:
+            # 卡死的旧主节点恢复后必须发现租约已易主并退位 / The hung leader must find the lease taken and step down once it resumes
+            self.child.send_signal(signal.SIGCONT)
+
+    def stop(self) -> None:
+        if self.child and self.child.poll() is None:
+            self.child.send_signal(signal.SIGCONT)
+            self.child.terminate()
+            self.child.wait()
+
+
+def published_subjects(broker: FakeMQTTBroker) -> List[str]:
+    # text格式的第二行是主题 / The second line of the text format is the subject
+    with broker.lock:
+        payloads = [payload for _, topic, payload in broker.messages if topic == MAIL_TOPIC]
+    return [payload.decode('utf-8', 'replace').split('\n')[1] for payload in payloads]
+
+
+def wait_for(predicate, timeout: float) -> Optional[float]:
+    """等待条件成立，返回耗时，超时返回None / Wait for a condition, returning the time taken or None on timeout"""
+    start = time.perf_counter()
+    while time.perf_counter() - start < timeout:
+        if predicate():
+            return time.perf_counter() - start
+        time.sleep(0.01)
+    return None
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    mailbox = Mailbox()
+    imap_server = FakeIMAPServer(mailbox)
+    broker = FakeMQTTBroker()
+    replicas = [Replica(node, imap_server.port, broker.port, args.lease, not args.verbose) for node in ('a', 'b')]
+    sent: List[str] = []
+    stop = threading.Event()
+
+    def deliver() -> None:
+        # 以固定间隔投递邮件，主题带序号 / Deliver messages at a fixed interval with numbered subjects
+        while not stop.wait(args.interval):
+            subject = f'drill {len(sent)}'
+            mailbox.add(f'From: drill@example.com\r\nSubject: {subject}\r\n\r\nfailover drill\r\n'.encode(), seen=False)
+            sent.append(subject)
+
+    rounds: List[Dict[str, Optional[float]]] = []
+    for replica in replicas:
+        replica.start()
+    try:
+        if wait_for(lambda: any(replica.state() == 'leader' for replica in replicas), args.timeout) is None:
+            raise RuntimeError('no replica became the leader')
+        threading.Thread(target=deliver, daemon=True).start()
+        for _ in range(args.rounds):
+            time.sleep(args.settle)
+            leader = next(replica for replica in replicas if replica.state() == 'leader')
+            standby = next(replica for replica in replicas if replica is not leader)
+            failed_at, failed = len(sent), time.perf_counter()
+            leader.fail(args.mode)
+            takeover = wait_for(lambda: standby.state() == 'leader', args.timeout)
+            # 故障之后投递的第一封邮件，同样从故障时刻计时 / The first message delivered after the failure, also timed from the failure
+            first_new = wait_for(lambda: len(sent) > failed_at and f'drill {failed_at}' in published_subjects(broker),
+                                 args.timeout)
+            rounds.append({'takeover_s': takeover,
+                           'first_new_mail_s': None if first_new is None else time.perf_counter() - failed})
+            leader.recover(args.mode)
+        time.sleep(args.settle)
+        stop.set()
+        # 最后几封邮件也发布后再统计 / Count once the last messages are published too
+        wait_for(lambda: set(sent) <= set(published_subjects(broker)), args.timeout)
+        leaders = [replica.node for replica in replicas if replica.state() == 'leader']
+    finally:
+        stop.set()
+        for replica in replicas:
+            replica.stop()
+        imap_server.shutdown()
+        broker.stop()
+
+    counts = Counter(published_subjects(broker))
+    takeovers = [r['takeover_s'] for r in rounds if r['takeover_s'] is not None]
+    return {
+        'benchmark': 'failover',
+        'mode': args.mode,
+        'rounds': [{key: None if value is None else round(value, 3) for key, value in r.items()} for r in rounds],
+        'median_takeover_s': round(statistics.median(takeovers), 3) if takeovers else None,
+        'max_takeover_s': round(max(takeovers), 3) if takeovers else None,
+        'sent': len(sent),
+        'lost': sum(1 for subject in sent if not counts[subject]),
+        'duplicated': sum(1 for subject in sent if counts[subject] > 1),
+        'leaders_at_end': leaders,
+        'config': {'lease': args.lease, 'interval': args.interval},
+        'python': platform.python_version(),
+        'timestamp': int(time.time()),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--mode', choices=('kill', 'hang', 'stop'), default='kill',
+                        help='kill: 主节点崩溃 / the leader crashes; hang: 主节点卡死 / the leader hangs; '
+                             'stop: 主节点正常停止 / the leader shuts down cleanly')
+    parser.add_argument('--lease', type=float, default=3, help='HA_LEASE_SECONDS')
+    parser.add_argument('--interval', type=float, default=0.2, help='投递邮件的间隔(秒) / Seconds between delivered messages')
+    parser.add_argument('--settle', type=float, default=3, help='每轮故障前的稳定时间(秒) / Seconds to settle before each failure')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--output', help='同时把结果写入文件 / Also write the result to a file')
+    parser.add_argument('--verbose', action='store_true', help='显示子进程日志 / Show the child process logs')
+    args = parser.parse_args()
+
+    result = run(args)
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    ok = len(result['rounds']) == args.rounds and all(r['takeover_s'] is not None for r in result['rounds'])
+    return 0 if ok and not result['lost'] and len(result['leaders_at_end']) == 1 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
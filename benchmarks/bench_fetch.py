@@ -0,0 +1,74 @@
+"""逐封FETCH与批量UID FETCH的对比
+Per-message FETCH versus batched UID FETCH
+
+用法 / Usage:
+    python -m benchmarks.bench_fetch --messages 500 --latency 0.02 --chunk-size 50
+"""
+import argparse
+import imaplib
+import time
+
+from app.fetch import chunked, compress_uids, iter_fetch_response
+from benchmarks.fake_imap import FakeIMAPServer
+
+
+def build_message(index: int) -> bytes:
+    return (f'From: Sender {index} <sender{index}@example.com>\r\n'
+            f'Subject: Message {index}\r\n'
+            f'Content-Type: text/plain; charset=utf-8\r\n\r\n'
+            f'{"body line " * 40}\r\n').encode()
+
+
+def fetch_one_by_one(mail: imaplib.IMAP4, uids: list) -> int:
+    count = 0
+    for uid in uids:
+        status, data = mail.uid('FETCH', str(uid), '(RFC822)')
+        if status == 'OK' and data[0]:
+            count += 1
+    return count
+
+
+def fetch_batched(mail: imaplib.IMAP4, uids: list, chunk_size: int) -> int:
+    count = 0
+    for chunk in chunked(uids, chunk_size):
+        status, data = mail.uid('FETCH', compress_uids(chunk), '(UID RFC822)')
+        if status != 'OK':
+            continue
+        count += sum(1 for item in iter_fetch_response(data) if item.get('RFC822') is not None)
+    return count
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--latency', type=float, default=0.02, help='每个响应的延迟（秒） / Delay per response (s)')
+    parser.add_argument('--chunk-size', type=int, default=50)
+    args = parser.parse_args()
+
+    server = FakeIMAPServer(latency=args.latency)
+    for index in range(args.messages):
+        server.mailbox.add(build_message(index))
+    uids = [m['uid'] for m in server.mailbox.messages]
+
+    mail = imaplib.IMAP4('127.0.0.1', server.port)
+    mail.login('user', 'password')
+    mail.select('inbox')
+
+    start = time.perf_counter()
+    sequential = fetch_one_by_one(mail, uids)
+    sequential_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched = fetch_batched(mail, uids, args.chunk_size)
+    batched_time = time.perf_counter() - start
+
+    print(f"messages={args.messages} latency={args.latency}s chunk_size={args.chunk_size}")
+    print(f"per-message FETCH: {sequential} mails in {sequential_time:.2f}s")
+    print(f"batched UID FETCH: {batched} mails in {batched_time:.2f}s")
+    print(f"speedup: {sequential_time / batched_time:.1f}x")
+    mail.logout()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
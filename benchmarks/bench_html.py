@@ -0,0 +1,108 @@
+"""内置HTML转文本与HTML_PROCESS_URL往返的吞吐量对比
+Throughput of the built-in HTML-to-text converter versus an HTML_PROCESS_URL round trip
+
+HTTP对照组是本地服务，它用同一个转换器处理请求，因此差值就是往返本身的开销。
+可以用 --corpus 指定包含 .html 或 .eml 文件的目录来使用真实邮件
+The HTTP baseline is a local service running the same converter, so the difference
+is the cost of the round trip itself. Point --corpus at a directory of .html or .eml
+files to use real mail
+
+用法 / Usage:
+    python -m benchmarks.bench_html --messages 200
+    python -m benchmarks.bench_html --corpus ~/mail-samples
+"""
+import argparse
+import email
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+from urllib.parse import parse_qs
+
+from app.html_processor import HtmlProcessor
+from app.html_text import html_to_text
+
+
+def synthetic_newsletter(index: int) -> str:
+    """生成类似营销邮件的HTML，包含样式、脚本、表格布局和追踪链接
+    Build newsletter-like HTML with styles, scripts, table layout and tracking links
+    """
+    rows = ''.join(
+        f'<tr><td style="padding:8px"><img src="https://cdn.example.com/{index}/{row}.png" alt="item {row}"></td>'
+        f'<td><h3 style="font-family:Arial">Product {row}</h3><p>Only today: {row * 10}% off the regular price. '
+        f'<a href="https://click.example.com/t/{index}/{row}?utm_source=mail">Shop now</a></p></td></tr>'
+        for row in range(12)
+    )
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8"><title>Weekly deals</title>'
+        '<style>body{margin:0}td{vertical-align:top}.btn{color:#fff}</style>'
+        '<script>window.dataLayer=[];</script></head><body>'
+        f'<table width="100%" cellpadding="0"><tr><td><h1>Deals of week {index}</h1></td></tr>{rows}</table>'
+        '<p style="font-size:10px">You are receiving this email because you subscribed. '
+        '<a href="https://example.com/unsubscribe">Unsubscribe</a></p></body></html>'
+    )
+
+
+def load_corpus(path: str) -> List[str]:
+    """读取 .html 文件和 .eml 文件中的HTML部分 / Load .html files and the HTML parts of .eml files"""
+    documents = []
+    for name in sorted(os.listdir(path)):
+        full_path = os.path.join(path, name)
+        if name.endswith(('.html', '.htm')):
+            with open(full_path, 'r', encoding='utf-8', errors='replace') as f:
+                documents.append(f.read())
+        elif name.endswith('.eml'):
+            with open(full_path, 'rb') as f:
+                message = email.message_from_binary_file(f)
+            for part in message.walk():
+                if part.get_content_type() == 'text/html':
+                    payload = part.get_payload(decode=True) or b''
+                    documents.append(payload.decode(part.get_content_charset() or 'utf-8', 'replace'))
+    return documents
+
+
+class ConvertHandler(BaseHTTPRequestHandler):
+    def do_POST(self) -> None:
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        html = parse_qs(body.decode('utf-8'))['html'][0]
+        text = html_to_text(html).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(text)))
+        self.end_headers()
+        self.wfile.write(text)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--messages', type=int, default=200, help='合成邮件数量 / Number of synthetic mails')
+    parser.add_argument('--corpus', help='包含 .html/.eml 文件的目录 / Directory of .html/.eml files')
+    args = parser.parse_args()
+
+    documents = load_corpus(args.corpus) if args.corpus else [synthetic_newsletter(i) for i in range(args.messages)]
+    total_bytes = sum(len(document.encode('utf-8')) for document in documents)
+
+    start = time.perf_counter()
+    text_bytes = sum(len(html_to_text(document).encode('utf-8')) for document in documents)
+    local_time = time.perf_counter() - start
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ConvertHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    processor = HtmlProcessor(f'http://127.0.0.1:{server.server_address[1]}/', cache_size=0)
+    start = time.perf_counter()
+    for document in documents:
+        processor.process(document)
+    http_time = time.perf_counter() - start
+    server.shutdown()
+
+    print(f"documents={len(documents)} html={total_bytes / 1024:.0f} KiB text={text_bytes / 1024:.0f} KiB")
+    print(f"built-in converter: {len(documents) / local_time:.0f} docs/s ({total_bytes / local_time / 1e6:.1f} MB/s)")
+    print(f"HTTP round trip:    {len(documents) / http_time:.0f} docs/s ({total_bytes / http_time / 1e6:.1f} MB/s)")
+    print(f"payload reduction:  {total_bytes / max(1, text_bytes):.1f}x smaller than raw HTML")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""email包完整解析与MIME扫描的解析速度对比
+Parsing speed of the full email-package parse versus the MIME scan
+
+两种方式都只取出非附件的文本部分并解码，按邮件类型分别统计。
+--large-mb 额外测量一封带大附件的邮件：解析耗时，以及解析期间另一个线程被阻塞的最长时间
+（在当前线程解析和交给进程池解析）
+Both approaches extract and decode only the non-attachment text parts, reported per
+message kind. --large-mb also measures one message with a large attachment: the
+parse time, and the longest time another thread was held up while it was parsed
+(in the calling thread versus in the process pool)
+
+用法 / Usage:
+    python -m benchmarks.bench_parse --messages 500
+    python -m benchmarks.bench_parse --messages 200 --large-mb 30
+"""
+import argparse
+import base64
+import email
+import threading
+import time
+from collections import defaultdict
+from typing import Callable, List
+
+from app.mime import PartScanner, scan_message
+from benchmarks.corpus import generate
+
+
+def legacy_parse(raw: bytes) -> List[bytes]:
+    """原有方式：构建完整的邮件对象树并遍历所有部分 / Previous approach: build the full message tree and walk every part"""
+    message = email.message_from_bytes(raw)
+    message['Subject']
+    if not message.is_multipart():
+        return [message.get_payload(decode=True)]
+    payloads = []
+    for part in message.walk():
+        if 'attachment' in str(part.get('Content-Disposition')):
+            continue
+        payload = part.get_payload(decode=True)
+        if payload and part.get_content_type() in ('text/plain', 'text/html'):
+            payloads.append(payload)
+    return payloads
+
+
+def scan_parse(raw: bytes) -> List[bytes]:
+    headers, parts = scan_message(raw)
+    headers['Subject']
+    return [payload for _, _, payload in parts]
+
+
+def large_message(megabytes: int) -> bytes:
+    data = base64.encodebytes(bytes(range(256)) * (megabytes * 4096)).replace(b'\n', b'\r\n')
+    return (b'From: big@example.com\r\nSubject: large bench-0\r\nMIME-Version: 1.0\r\n'
+            b'Content-Type: multipart/mixed; boundary="b"\r\n\r\n'
+            b'--b\r\nContent-Type: text/plain\r\n\r\nbench-0 see attachment\r\n'
+            b'--b\r\nContent-Type: application/octet-stream\r\nContent-Disposition: attachment; filename="big.bin"\r\n'
+            b'Content-Transfer-Encoding: base64\r\n\r\n' + data + b'--b--\r\n')
+
+
+def longest_stall(work: Callable[[], None]) -> float:
+    """在后台线程每毫秒计时一次，返回work运行期间的最长间隔（毫秒）
+    Tick every millisecond in a background thread and return the longest gap (ms) while work runs
+    """
+    gaps = [0.0]
+    done = threading.Event()
+
+    def ticker() -> None:
+        last = time.perf_counter()
+        while not done.is_set():
+            time.sleep(0.001)
+            now = time.perf_counter()
+            gaps[0] = max(gaps[0], now - last)
+            last = now
+
+    thread = threading.Thread(target=ticker)
+    thread.start()
+    work()
+    done.set()
+    thread.join()
+    return gaps[0] * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--large-mb', type=int, default=0, help='大附件邮件的大小(MB)，0为跳过 / Size of the large message (MB), 0 skips it')
+    args = parser.parse_args()
+
+    corpus = generate(args.messages)
+    by_kind = defaultdict(list)
+    for kind, raw in corpus:
+        by_kind[kind].append(raw)
+
+    print(f"{'kind':<16}{'msgs':>6}{'legacy msg/s':>14}{'scan msg/s':>12}{'speedup':>9}")
+    for kind, messages in sorted(by_kind.items()) + [('all', [raw for _, raw in corpus])]:
+        timings = {}
+        for name, parse in (('legacy', legacy_parse), ('scan', scan_parse)):
+            best = float('inf')
+            for _ in range(args.rounds):
+                start = time.perf_counter()
+                for raw in messages:
+                    parse(raw)
+                best = min(best, time.perf_counter() - start)
+            timings[name] = len(messages) / best
+        print(f"{kind:<16}{len(messages):>6}{timings['legacy']:>14.0f}{timings['scan']:>12.0f}"
+              f"{timings['scan'] / timings['legacy']:>8.1f}x")
+
+    if args.large_mb:
+        raw = large_message(args.large_mb)
+        scanner = PartScanner(threshold=0, workers=1)
+        scanner.scan(b'From: warmup\r\n\r\nx')  # 启动子进程 / Start the child process
+        print(f"\n{len(raw) / 1e6:.1f} MB message with one attachment:")
+        for name, work in (('legacy, in thread', lambda: legacy_parse(raw)),
+                           ('scan, in thread', lambda: scan_message(raw)),
+                           ('scan, process pool', lambda: scanner.scan(raw))):
+            start = time.perf_counter()
+            stall = longest_stall(work)
+            print(f"  {name:<20} {time.perf_counter() - start:7.3f} s   longest stall of another thread {stall:8.1f} ms")
+        scanner.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""路由规则的匹配开销随规则数量的变化
+Routing rule match cost as the number of rules grows
+
+生成指定数量的规则（发件人地址、发件域名、List-Id、主题各占一部分，另有少量正则规则），
+对一组邮件头反复匹配，输出每封邮件的平均匹配时间。精确规则通过索引查找，时间应与规则数量无关
+Generates the given numbers of rules (a share each of sender addresses, sender domains,
+List-Ids and subjects, plus a few regex rules), matches a set of headers against them
+repeatedly and prints the mean match time per message. Exact rules are looked up
+through indexes, so the time should not depend on the number of rules
+
+用法 / Usage:
+    python -m benchmarks.bench_rules --rules 10,1000,10000
+"""
+import argparse
+import random
+import time
+from typing import Any, Dict, List, Tuple
+
+from app.rules import RuleSet
+
+
+def make_rules(count: int, regex_rules: int) -> List[Dict[str, Any]]:
+    rules: List[Dict[str, Any]] = []
+    for index in range(count - regex_rules):
+        kind = index % 4
+        if kind == 0:
+            rules.append({'from': f'user{index}@example.com', 'topic': f'email/user{index}'})
+        elif kind == 1:
+            rules.append({'from_domain': f'dept{index}.example.org', 'action': 'headers'})
+        elif kind == 2:
+            rules.append({'list_id': f'list{index}.lists.example.net', 'action': 'drop'})
+        else:
+            rules.append({'subject': f'Report {index}', 'topic': 'email/reports'})
+    # 正则规则排在最后，只在没有精确规则命中时检查 / Regex rules come last and only run without an exact hit
+    rules.extend({'subject_regex': rf'^\[ALERT-{index}\]', 'topic': 'email/alerts'} for index in range(regex_rules))
+    return rules
+
+
+def make_headers(count: int, rule_count: int, seed: int) -> List[Tuple[str, str, str]]:
+    rng = random.Random(seed)
+    headers = []
+    for _ in range(count):
+        index = rng.randrange(max(1, rule_count))
+        choice = rng.randrange(5)
+        if choice == 0:
+            headers.append((f'User <user{index}@example.com>', 'hello', ''))
+        elif choice == 1:
+            headers.append((f'ops@mail.dept{index}.example.org', 'status', ''))
+        elif choice == 2:
+            headers.append(('list@example.net', 'post', f'List <list{index}.lists.example.net>'))
+        elif choice == 3:
+            headers.append(('reports@example.com', f'Report {index}', ''))
+        else:
+            headers.append(('nobody@example.invalid', 'no rule matches this', ''))
+    return headers
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rules', default='10,1000,10000', help='逗号分隔的规则数量 / Comma-separated rule counts')
+    parser.add_argument('--regex-rules', type=int, default=5, help='每组中的正则规则数 / Regex rules in each set')
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{'rules':>8}{'build ms':>10}{'us/match':>10}")
+    for count in (int(value) for value in args.rules.split(',')):
+        regex_rules = min(args.regex_rules, count)
+        start = time.perf_counter()
+        rule_set = RuleSet(make_rules(count, regex_rules))
+        build = time.perf_counter() - start
+        headers = make_headers(args.messages, count - regex_rules, args.seed)
+        start = time.perf_counter()
+        for sender, subject, list_id in headers:
+            rule_set.match(sender, subject, list_id)
+        elapsed = time.perf_counter() - start
+        print(f"{count:>8}{build * 1000:>10.1f}{elapsed / len(headers) * 1e6:>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+"""冷启动基准：从进程启动到第一封邮件发布
+Cold start benchmark: from process start to the first mail published
+
+每一轮在新的工作目录中用uvicorn启动一个子进程（与容器的启动命令相同），连接本地IMAP替身和
+MQTT替身，邮箱中预先放入一封未读邮件。输出JSON格式的各阶段耗时（取各轮中位数）：
+HTTP服务可访问、/ready 就绪、MQTT替身收到第一封邮件，以及单独导入 app.main 和空解释器的耗时
+Each round starts a child process under uvicorn (the same command the container runs) in
+a fresh work directory, against the local IMAP and MQTT stand-ins with one unread
+message waiting. Prints the median time of each phase across rounds as JSON: HTTP
+reachable, /ready reporting ready, and the first mail reaching the MQTT stand-in, plus
+the time to import app.main on its own and to start a bare interpreter
+
+用法 / Usage:
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --runs 5 --latency 0.02 --output startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List, Optional
+
+from benchmarks.fake_imap import FakeIMAPServer, Mailbox
+from benchmarks.fake_mqtt import FakeMQTTBroker
+
+# 子进程中把IMAP4_SSL换成明文连接后按容器的方式启动 / In the child, swap IMAP4_SSL for plain IMAP and start the way the container does
+LAUNCHER = (
+    "import imaplib, sys, uvicorn\n"
+    "imaplib.IMAP4_SSL = imaplib.IMAP4\n"
+    "uvicorn.run('app.main:app', host='127.0.0.1', port=int(sys.argv[1]), log_level='warning')\n"
+)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def child_env(work_dir: str, imap_port: int, mqtt_port: int) -> Dict[str, str]:
+    accounts_file = os.path.join(work_dir, 'accounts.json')
+    with open(accounts_file, 'w', encoding='utf-8') as f:
+        json.dump({'accounts': [{
+            'name': 'bench', 'server': '127.0.0.1', 'port': imap_port,
+            'username': 'bench', 'password': 'bench', 'topic': 'email/bench'
+        }]}, f)
+    env = dict(os.environ)
+    env.update({
+        'ACCOUNTS_FILE': accounts_file,
+        'MQTT_BROKER': '127.0.0.1', 'MQTT_PORT': str(mqtt_port), 'MQTT_SSL': 'False',
+        'MQTT_USERNAME': 'bench', 'MQTT_PASSWORD': 'bench',
+        'CHECKPOINT_FILE': os.path.join(work_dir, 'checkpoint.json'),
+        'DEDUP_DB': os.path.join(work_dir, 'dedup.sqlite3'),
+        'SPOOL_FILE': os.path.join(work_dir, 'spool.bin'),
+        'PYTHONPATH': os.getcwd(),
+    })
+    return env
+
+
+def status(url: str) -> Optional[int]:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+def run_once(latency: float, timeout: float, quiet: bool) -> Dict[str, float]:
+    """启动一次并记录各阶段距进程启动的秒数 / Start once and record each phase in seconds since process start"""
+    mailbox = Mailbox()
+    mailbox.add(b'From: bench@example.com\r\nSubject: startup\r\n\r\nfirst mail\r\n', seen=False)
+    imap_server = FakeIMAPServer(mailbox, latency=latency)
+    broker = FakeMQTTBroker()
+    work_dir = tempfile.mkdtemp(prefix='email2mqtt-startup-')
+    port = free_port()
+    base = f'http://127.0.0.1:{port}'
+    phases: Dict[str, float] = {}
+
+    start = time.perf_counter()
+    child = subprocess.Popen(
+        [sys.executable, '-c', LAUNCHER, str(port)], env=child_env(work_dir, imap_server.port, broker.port),
+        stdout=subprocess.DEVNULL if quiet else sys.stderr, stderr=subprocess.DEVNULL if quiet else sys.stderr
+    )
+    try:
+        while len(phases) < 3 and time.perf_counter() - start < timeout:
+            if child.poll() is not None:
+                raise RuntimeError(f'email2mqtt exited with {child.returncode}')
+            now = time.perf_counter() - start
+            if broker.messages and 'first_publish_s' not in phases:
+                phases['first_publish_s'] = now
+            if 'http_s' not in phases:
+                if status(f'{base}/health') is not None:
+                    phases['http_s'] = time.perf_counter() - start
+            elif 'ready_s' not in phases and status(f'{base}/ready') == 200:
+                phases['ready_s'] = time.perf_counter() - start
+            time.sleep(0.005)
+    finally:
+        child.terminate()
+        child.wait()
+        imap_server.shutdown()
+        broker.stop()
+    return phases
+
+
+def timed_process(code: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], check=True, env=dict(os.environ, PYTHONPATH=os.getcwd()))
+    return time.perf_counter() - start
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.0, help='IMAP替身每条命令的延迟(秒) / Per-command IMAP stand-in latency (seconds)')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--output', help='同时把结果写入文件 / Also write the result to a file')
+    parser.add_argument('--verbose', action='store_true', help='显示子进程日志 / Show the child process log')
+    args = parser.parse_args()
+
+    runs: List[Dict[str, float]] = [run_once(args.latency, args.timeout, not args.verbose) for _ in range(args.runs)]
+    phases = ('http_s', 'ready_s', 'first_publish_s')
+    result = {
+        'benchmark': 'startup',
+        'runs': args.runs,
+        'median': {phase: round(statistics.median(run[phase] for run in runs), 3)
+                   for phase in phases if all(phase in run for run in runs)},
+        'min': {phase: round(min(run[phase] for run in runs), 3)
+                for phase in phases if all(phase in run for run in runs)},
+        'interpreter_s': round(timed_process('pass'), 3),
+        'import_s': round(timed_process('import app.main'), 3),
+        'config': {'imap_latency': args.latency},
+        'python': platform.python_version(),
+        'timestamp': int(time.time()),
+    }
+    output = json.dumps(result, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    return 0 if len(result['median']) == len(phases) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
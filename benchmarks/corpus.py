@@ -0,0 +1,126 @@
+"""生成可复现的MIME测试邮件
+Generate a reproducible MIME test corpus
+
+每封邮件的主题和正文都带有 "bench-<编号>" 标记，便于在MQTT端对应回原始邮件
+Every message carries a "bench-<index>" token in its subject and body so it can be
+matched back to its source on the MQTT side
+"""
+import base64
+import random
+from email.header import Header
+from typing import Dict, List, Tuple
+
+# 默认的邮件类型比例 / Default mix of message kinds
+DEFAULT_MIX = {'plain': 30, 'html': 25, 'multipart': 25, 'attachment': 10, 'legacy_charset': 10}
+
+# 非UTF-8编码及对应的示例文字 / Non-UTF-8 charsets and sample text for each
+LEGACY_CHARSETS = [
+    ('gb2312', '您好，这是一封测试邮件，请查收附件中的报告。'),
+    ('big5', '您好，這是一封測試郵件，請查收附件中的報告。'),
+    ('shift_jis', 'こんにちは、これはテストメールです。'),
+    ('koi8-r', 'Здравствуйте, это тестовое письмо.'),
+    ('iso-8859-1', 'Bonjour, voici un message de test très ordinaire.'),
+]
+
+WORDS = ('invoice order delivery meeting update report weekly account password reset '
+         'shipment confirm schedule review project budget release notes customer').split()
+
+
+def _paragraphs(rng: random.Random, count: int) -> List[str]:
+    return [' '.join(rng.choice(WORDS) for _ in range(rng.randint(20, 60))).capitalize() + '.'
+            for _ in range(count)]
+
+
+def _headers(index: int, subject: str, content_type: str) -> str:
+    return (f'From: Sender {index % 97} <sender{index % 97}@example.com>\r\n'
+            f'To: bench@example.com\r\n'
+            f'Subject: {subject}\r\n'
+            f'Message-ID: <bench-{index}@example.com>\r\n'
+            f'Date: Mon, 05 Oct 2026 10:00:00 +0000\r\n'
+            f'MIME-Version: 1.0\r\n'
+            f'Content-Type: {content_type}\r\n')
+
+
+def _html(rng: random.Random, token: str) -> str:
+    rows = ''.join(f'<tr><td style="padding:4px">{text}</td><td><a href="https://example.com/{rng.randint(1, 9999)}">more</a></td></tr>'
+                   for text in _paragraphs(rng, 8))
+    return (f'<html><head><style>td{{color:#333}}</style></head><body><h1>{token}</h1>'
+            f'<table>{rows}</table><p>Unsubscribe</p></body></html>')
+
+
+def plain(index: int, rng: random.Random) -> bytes:
+    token = f'bench-{index}'
+    body = f'{token}\r\n\r\n' + '\r\n\r\n'.join(_paragraphs(rng, 5))
+    return (_headers(index, f'Plain {token}', 'text/plain; charset=utf-8') +
+            'Content-Transfer-Encoding: 8bit\r\n\r\n' + body + '\r\n').encode('utf-8')
+
+
+def html(index: int, rng: random.Random) -> bytes:
+    token = f'bench-{index}'
+    return (_headers(index, f'Newsletter {token}', 'text/html; charset=utf-8') +
+            'Content-Transfer-Encoding: 8bit\r\n\r\n' + _html(rng, token) + '\r\n').encode('utf-8')
+
+
+def multipart(index: int, rng: random.Random) -> bytes:
+    token = f'bench-{index}'
+    boundary = f'=_alt_{index}'
+    text = f'{token}\r\n\r\n' + '\r\n\r\n'.join(_paragraphs(rng, 4))
+    return (_headers(index, f'Update {token}', f'multipart/alternative; boundary="{boundary}"') + '\r\n' +
+            f'--{boundary}\r\nContent-Type: text/plain; charset=utf-8\r\nContent-Transfer-Encoding: 8bit\r\n\r\n{text}\r\n'
+            f'--{boundary}\r\nContent-Type: text/html; charset=utf-8\r\nContent-Transfer-Encoding: 8bit\r\n\r\n'
+            f'{_html(rng, token)}\r\n--{boundary}--\r\n').encode('utf-8')
+
+
+def attachment(index: int, rng: random.Random, attachment_bytes: int = 512 * 1024) -> bytes:
+    token = f'bench-{index}'
+    boundary = f'=_mixed_{index}'
+    data = base64.encodebytes(rng.randbytes(attachment_bytes)).decode('ascii').replace('\n', '\r\n')
+    return (_headers(index, f'Report {token}', f'multipart/mixed; boundary="{boundary}"') + '\r\n' +
+            f'--{boundary}\r\nContent-Type: text/plain; charset=utf-8\r\n\r\n{token}\r\nThe report is attached.\r\n'
+            f'--{boundary}\r\nContent-Type: application/pdf; name="report-{index}.pdf"\r\n'
+            f'Content-Disposition: attachment; filename="report-{index}.pdf"\r\n'
+            f'Content-Transfer-Encoding: base64\r\n\r\n{data}--{boundary}--\r\n').encode('ascii')
+
+
+def legacy_charset(index: int, rng: random.Random) -> bytes:
+    token = f'bench-{index}'
+    charset, sample = LEGACY_CHARSETS[index % len(LEGACY_CHARSETS)]
+    subject = Header(f'{sample[:8]} {token}', charset).encode()
+    body = f'{token}\r\n\r\n' + '\r\n'.join([sample] * rng.randint(5, 20))
+    headers = _headers(index, subject, f'text/plain; charset={charset}') + 'Content-Transfer-Encoding: 8bit\r\n\r\n'
+    return headers.encode('ascii') + body.encode(charset) + b'\r\n'
+
+
+BUILDERS = {
+    'plain': plain, 'html': html, 'multipart': multipart,
+    'attachment': attachment, 'legacy_charset': legacy_charset,
+}
+
+
+def parse_mix(spec: str) -> Dict[str, int]:
+    """解析 "plain=30,html=20" 形式的比例 / Parse a mix such as "plain=30,html=20"
+    """
+    mix = {}
+    for item in spec.split(','):
+        kind, _, weight = item.partition('=')
+        if kind.strip() not in BUILDERS:
+            raise ValueError(f"未知邮件类型 / Unknown message kind: {kind}")
+        mix[kind.strip()] = int(weight or 1)
+    return mix
+
+
+def generate(count: int, seed: int = 1, mix: Dict[str, int] = DEFAULT_MIX) -> List[Tuple[str, bytes]]:
+    """按比例生成 count 封邮件，同一 seed 结果相同
+    Generate count messages in the given mix, identical for the same seed
+
+    Returns:
+        list: [(类型, 原始邮件)] / [(kind, raw message)]
+    """
+    rng = random.Random(seed)
+    kinds = [kind for kind, weight in mix.items() for _ in range(weight)]
+    corpus = []
+    for index in range(count):
+        kind = kinds[index % len(kinds)] if len(kinds) else 'plain'
+        corpus.append((kind, BUILDERS[kind](index, rng)))
+    rng.shuffle(corpus)
+    return corpus
@@ -0,0 +1,287 @@
+"""本地IMAP替身服务器，用于基准测试
+Local IMAP stand-in server for benchmarks
+
+只实现 Email2MQTT 用到的命令子集，可以为每个响应增加人为延迟来模拟远程服务器
+Implements only the command subset Email2MQTT uses and can add artificial latency
+to every response to simulate a remote server
+"""
+import email
+import email.message
+import re
+import socketserver
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+
+class Mailbox:
+    """内存中的邮箱 / In-memory mailbox"""
+
+    def __init__(self, uidvalidity: int = 1) -> None:
+        self.uidvalidity = uidvalidity
+        self.messages: List[Dict] = []  # 格式: {'uid': int, 'raw': bytes, 'flags': set}
+        self.next_uid = 1
+        self.lock = threading.Lock()
+        self.listeners: List[Callable[[int], None]] = []
+
+    def add(self, raw: bytes, seen: bool = False) -> int:
+        """添加一封邮件并通知IDLE中的连接 / Add a message and notify idling connections"""
+        with self.lock:
+            uid = self.next_uid
+            self.next_uid += 1
+            self.messages.append({'uid': uid, 'raw': raw, 'flags': {'\\Seen'} if seen else set()})
+            count = len(self.messages)
+            for listener in list(self.listeners):
+                listener(count)
+        return uid
+
+
+def parse_sequence_set(spec: str, maximum: int) -> Set[int]:
+    """解析IMAP序列集合 / Parse an IMAP sequence set"""
+    result: Set[int] = set()
+    for part in spec.split(','):
+        if ':' in part:
+            start, end = (maximum if value == '*' else int(value) for value in part.split(':'))
+            result.update(range(min(start, end), max(start, end) + 1))
+        else:
+            result.add(maximum if part == '*' else int(part))
+    return result
+
+
+class Handler(socketserver.StreamRequestHandler):
+    """单个IMAP连接 / A single IMAP connection"""
+
+    server: 'FakeIMAPServer'
+
+    def send(self, data) -> None:
+        if isinstance(data, str):
+            data = data.encode()
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.wfile.write(data)
+        self.wfile.flush()
+
+    def handle(self) -> None:
+        mailbox = self.server.mailbox
+        capabilities = 'IMAP4rev1' + (' IDLE' if self.server.idle else '')
+        # 上次向这个连接报告的邮件数 / Message count last reported to this connection
+        self.reported = 0
+        self.send('* OK fake IMAP ready\r\n')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            tag, _, rest = line.decode().rstrip('\r\n').partition(' ')
+            command, _, args = rest.partition(' ')
+            command = command.upper()
+            use_uid = command == 'UID'
+            if use_uid:
+                command, _, args = args.partition(' ')
+                command = command.upper()
+            self.server.commands.append(command)
+
+            if command == 'CAPABILITY':
+                self.send(f'* CAPABILITY {capabilities}\r\n{tag} OK CAPABILITY completed\r\n')
+            elif command == 'LOGIN':
+                self.send(f'{tag} OK LOGIN completed\r\n')
+            elif command in ('SELECT', 'EXAMINE'):
+                self.reported = len(mailbox.messages)
+                self.send(f'* {self.reported} EXISTS\r\n'
+                          f'* OK [UIDVALIDITY {mailbox.uidvalidity}] UIDs valid\r\n'
+                          f'* OK [UIDNEXT {mailbox.next_uid}] Predicted next UID\r\n'
+                          f'{tag} OK [READ-WRITE] SELECT completed\r\n')
+            elif command == 'STATUS':
+                self.send(f'* STATUS "INBOX" (UIDVALIDITY {mailbox.uidvalidity} UIDNEXT {mailbox.next_uid} '
+                          f'MESSAGES {len(mailbox.messages)})\r\n{tag} OK STATUS completed\r\n')
+            elif command == 'NOOP':
+                self.send(f'{tag} OK NOOP completed\r\n')
+            elif command == 'LOGOUT':
+                self.send(f'* BYE logging out\r\n{tag} OK LOGOUT completed\r\n')
+                return
+            elif command == 'IDLE':
+                self.idle(tag)
+            elif command == 'SEARCH':
+                self.search(tag, args, use_uid)
+            elif command == 'FETCH':
+                self.fetch(tag, args, use_uid)
+            elif command == 'STORE':
+                self.store(tag, args, use_uid)
+            else:
+                self.send(f'{tag} BAD unknown command {command}\r\n')
+
+    def idle(self, tag: str) -> None:
+        def listener(count: int) -> None:
+            self.reported = count
+            try:
+                self.wfile.write(f'* {count} EXISTS\r\n'.encode())
+                self.wfile.flush()
+            except OSError:
+                pass
+
+        mailbox = self.server.mailbox
+        self.send('+ idling\r\n')
+        with mailbox.lock:
+            mailbox.listeners.append(listener)
+            # 与真实服务器一样，上次报告之后到达的邮件在进入IDLE时报告
+            # Like a real server, mail that arrived since the last report is reported on entering IDLE
+            if len(mailbox.messages) > self.reported:
+                listener(len(mailbox.messages))
+        self.rfile.readline()  # DONE
+        with mailbox.lock:
+            mailbox.listeners.remove(listener)
+        self.send(f'{tag} OK IDLE terminated\r\n')
+
+    def select_messages(self, spec: str, use_uid: bool) -> List[Tuple[int, Dict]]:
+        messages = self.server.mailbox.messages
+        if use_uid:
+            highest = messages[-1]['uid'] if messages else 0
+            wanted = parse_sequence_set(spec, highest)
+            # "n:*" 总是包含最后一封邮件 / "n:*" always includes the last message
+            if spec.endswith(':*') and messages:
+                wanted.add(highest)
+            return [(seq, m) for seq, m in enumerate(messages, 1) if m['uid'] in wanted]
+        wanted = parse_sequence_set(spec, len(messages))
+        return [(seq, m) for seq, m in enumerate(messages, 1) if seq in wanted]
+
+    def search(self, tag: str, args: str, use_uid: bool) -> None:
+        criteria = args.upper().split()
+        if criteria and criteria[0] == 'CHARSET':
+            criteria = criteria[2:]
+        result = list(enumerate(self.server.mailbox.messages, 1))
+        index = 0
+        while index < len(criteria):
+            criterion = criteria[index]
+            if criterion == 'UNSEEN':
+                result = [(seq, m) for seq, m in result if '\\Seen' not in m['flags']]
+            elif criterion == 'UID':
+                index += 1
+                selected = {id(m) for _, m in self.select_messages(criteria[index], True)}
+                result = [(seq, m) for seq, m in result if id(m) in selected]
+            index += 1
+        ids = ' '.join(str(m['uid'] if use_uid else seq) for seq, m in result)
+        self.send(f'* SEARCH{" " + ids if ids else ""}\r\n{tag} OK SEARCH completed\r\n')
+
+    def store(self, tag: str, args: str, use_uid: bool) -> None:
+        spec, operation, flags = args.split(' ', 2)
+        flag_set = set(flags.strip('()').split())
+        operation = operation.upper()
+        for seq, message in self.select_messages(spec, use_uid):
+            if operation.startswith('+'):
+                message['flags'] |= flag_set
+            elif operation.startswith('-'):
+                message['flags'] -= flag_set
+            if not operation.endswith('.SILENT'):
+                self.send(f'* {seq} FETCH (FLAGS ({" ".join(sorted(message["flags"]))}))\r\n')
+        self.send(f'{tag} OK STORE completed\r\n')
+
+    def fetch(self, tag: str, args: str, use_uid: bool) -> None:
+        spec, _, items = args.partition(' ')
+        items = items.strip()
+        if items.startswith('('):
+            items = items[1:-1]
+        names = re.findall(r'BODY(?:\.PEEK)?\[[^\]]*\](?:<[\d.]+>)?|BODYSTRUCTURE|[A-Z0-9.]+', items.upper())
+        if use_uid and 'UID' not in names:
+            names.insert(0, 'UID')
+        response = []
+        for seq, message in self.select_messages(spec, use_uid):
+            parts = [self.fetch_item(name, message) for name in names]
+            response.append(f'* {seq} FETCH ('.encode() + b' '.join(parts) + b')\r\n')
+        self.send(b''.join(response) + f'{tag} OK FETCH completed\r\n'.encode())
+
+    def fetch_item(self, name: str, message: Dict) -> bytes:
+        if name == 'UID':
+            return f'UID {message["uid"]}'.encode()
+        if name == 'FLAGS':
+            return f'FLAGS ({" ".join(sorted(message["flags"]))})'.encode()
+        if name == 'RFC822.SIZE':
+            return f'RFC822.SIZE {len(message["raw"])}'.encode()
+        if name in ('RFC822', 'BODY[]', 'BODY.PEEK[]'):
+            if 'PEEK' not in name:
+                message['flags'].add('\\Seen')
+            key = 'RFC822' if name == 'RFC822' else 'BODY[]'
+            return f'{key} {{{len(message["raw"])}}}\r\n'.encode() + message['raw']
+        if name == 'BODYSTRUCTURE':
+            return b'BODYSTRUCTURE ' + bodystructure(email.message_from_bytes(message['raw']))
+        match = re.match(r'BODY(\.PEEK)?\[([^\]]*)\](?:<(\d+)\.(\d+)>)?$', name)
+        if match:
+            if not match.group(1):
+                message['flags'].add('\\Seen')
+            data = body_section(message['raw'], match.group(2))
+            key = f'BODY[{match.group(2)}]'
+            if match.group(3):
+                start = int(match.group(3))
+                data = data[start:start + int(match.group(4))]
+                key += f'<{start}>'
+            return f'{key} {{{len(data)}}}\r\n'.encode() + data
+        raise ValueError(f'unsupported FETCH item {name}')
+
+
+def _quote(value: Optional[str]) -> str:
+    if value is None:
+        return 'NIL'
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+
+def bodystructure(message: email.message.Message) -> bytes:
+    """生成邮件的BODYSTRUCTURE / Build the BODYSTRUCTURE of a message"""
+    if message.is_multipart():
+        children = b''.join(bodystructure(part) for part in message.get_payload())
+        return b'(' + children + f' {_quote(message.get_content_subtype())} NIL NIL NIL NIL)'.encode()
+    params = message.get_params()[1:] if message.get_params() else []
+    param_list = ' '.join(f'{_quote(key)} {_quote(value)}' for key, value in params)
+    body = message.get_payload(decode=False).encode('utf-8', 'surrogateescape')
+    fields = [
+        _quote(message.get_content_maintype()), _quote(message.get_content_subtype()),
+        f'({param_list})' if param_list else 'NIL', 'NIL', 'NIL',
+        _quote(message.get('Content-Transfer-Encoding', '7bit').lower()), str(len(body))
+    ]
+    if message.get_content_maintype() == 'text':
+        fields.append(str(body.count(b'\n') + 1))
+    fields.append('NIL')  # MD5
+    disposition = message.get_content_disposition()
+    if disposition:
+        filename = message.get_filename()
+        fields.append(f'({_quote(disposition)} ' + (f'("FILENAME" {_quote(filename)}))' if filename else 'NIL)'))
+    else:
+        fields.append('NIL')
+    fields.extend(['NIL', 'NIL'])
+    return f'({" ".join(fields)})'.encode()
+
+
+def body_section(raw: bytes, section: str) -> bytes:
+    """按段号返回邮件的一部分（保持传输编码） / Return one section of a message, still transfer-encoded"""
+    header, _, body = raw.partition(b'\r\n\r\n')
+    if section == 'HEADER':
+        return header + b'\r\n\r\n'
+    if section in ('', 'TEXT'):
+        return body
+    message = email.message_from_bytes(raw)
+    for index in section.split('.'):
+        if message.is_multipart():
+            message = message.get_payload()[int(index) - 1]
+    return message.get_payload(decode=False).encode('utf-8', 'surrogateescape')
+
+
+class FakeIMAPServer(socketserver.ThreadingTCPServer):
+    """在后台线程运行的IMAP替身 / IMAP stand-in running in a background thread
+
+    Args:
+        mailbox (Mailbox, optional): 共享的邮箱 / Shared mailbox
+        latency (float): 每个响应的额外延迟（秒） / Extra delay per response in seconds
+        idle (bool): 是否声明IDLE能力 / Whether to advertise the IDLE capability
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, mailbox: Optional[Mailbox] = None, latency: float = 0.0, idle: bool = True) -> None:
+        super().__init__(('127.0.0.1', 0), Handler)
+        self.mailbox = mailbox or Mailbox()
+        self.latency = latency
+        self.idle = idle
+        self.commands: List[str] = []  # 收到的命令名，UID前缀已去掉 / Command names received, without the UID prefix
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
@@ -0,0 +1,308 @@
+"""本地MQTT代理替身，用于基准测试和故障演练
+Local MQTT broker stand-in for benchmarks and failure drills
+
+支持MQTT 3.1.1的CONNECT(含遗嘱)、PUBLISH(QoS 0/1/2、保留消息)、SUBSCRIBE、PINGREQ和DISCONNECT。
+MQTT v5 客户端也可以连接：PUBLISH的属性被解析并记录，主题别名被还原。
+stop() 会立即断开所有连接，模拟代理宕机；restart() 在同一端口重新启动
+Supports MQTT 3.1.1 CONNECT (with will), PUBLISH (QoS 0/1/2, retained), SUBSCRIBE,
+PINGREQ and DISCONNECT. MQTT v5 clients can connect too: PUBLISH properties are parsed
+and recorded and topic aliases are resolved. stop() drops every connection at once to
+simulate a broker crash; restart() brings it back on the same port
+"""
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+# 代理在CONNACK中允许的主题别名数 / Topic aliases the broker allows in its CONNACK
+TOPIC_ALIAS_MAXIMUM = 16
+# MQTT v5 属性: 标识 -> (名称, 类型) / MQTT v5 properties: identifier -> (name, type)
+PROPERTIES = {
+    0x01: ('PayloadFormatIndicator', 'byte'), 0x02: ('MessageExpiryInterval', 'int4'),
+    0x03: ('ContentType', 'str'), 0x08: ('ResponseTopic', 'str'), 0x09: ('CorrelationData', 'bin'),
+    0x0B: ('SubscriptionIdentifier', 'varint'), 0x11: ('SessionExpiryInterval', 'int4'),
+    0x21: ('ReceiveMaximum', 'int2'), 0x22: ('TopicAliasMaximum', 'int2'), 0x23: ('TopicAlias', 'int2'),
+    0x26: ('UserProperty', 'pair'), 0x27: ('MaximumPacketSize', 'int4'),
+}
+
+
+def encode_length(length: int) -> bytes:
+    """编码MQTT剩余长度 / Encode the MQTT remaining length"""
+    encoded = bytearray()
+    while True:
+        byte, length = length % 128, length // 128
+        encoded.append(byte | (0x80 if length else 0))
+        if not length:
+            return bytes(encoded)
+
+
+def encode_string(value: bytes) -> bytes:
+    return struct.pack('>H', len(value)) + value
+
+
+def decode_varint(data: bytes, position: int) -> Tuple[int, int]:
+    """解码变长整数，返回值和之后的位置 / Decode a variable byte integer, returning it and the next position"""
+    multiplier, value = 1, 0
+    while True:
+        byte = data[position]
+        position += 1
+        value += (byte & 0x7F) * multiplier
+        multiplier *= 128
+        if not byte & 0x80:
+            return value, position
+
+
+def decode_properties(data: bytes, position: int) -> Tuple[Dict[str, Any], int]:
+    """解码MQTT v5属性，返回属性和之后的位置 / Decode MQTT v5 properties, returning them and the next position"""
+    length, position = decode_varint(data, position)
+    end, properties = position + length, {}
+    while position < end:
+        name, kind = PROPERTIES[data[position]]
+        position += 1
+        if kind == 'byte':
+            value, position = data[position], position + 1
+        elif kind == 'int2':
+            value, position = struct.unpack('>H', data[position:position + 2])[0], position + 2
+        elif kind == 'int4':
+            value, position = struct.unpack('>I', data[position:position + 4])[0], position + 4
+        elif kind == 'varint':
+            value, position = decode_varint(data, position)
+        else:
+            values = []
+            for _ in range(2 if kind == 'pair' else 1):
+                size = struct.unpack('>H', data[position:position + 2])[0]
+                raw = data[position + 2:position + 2 + size]
+                values.append(raw if kind == 'bin' else raw.decode('utf-8'))
+                position += 2 + size
+            if kind == 'pair':
+                properties.setdefault(name, []).append(tuple(values))
+                continue
+            value = values[0]
+        properties[name] = value
+    return properties, end
+
+
+def topic_matches(pattern: str, topic: str) -> bool:
+    """按MQTT通配符规则匹配主题 / Match a topic against an MQTT wildcard filter"""
+    pattern_parts, topic_parts = pattern.split('/'), topic.split('/')
+    for index, part in enumerate(pattern_parts):
+        if part == '#':
+            return True
+        if index >= len(topic_parts) or (part != '+' and part != topic_parts[index]):
+            return False
+    return len(pattern_parts) == len(topic_parts)
+
+
+class Handler(socketserver.BaseRequestHandler):
+    """单个MQTT客户端连接 / A single MQTT client connection"""
+
+    server: 'FakeMQTTBroker'
+
+    def setup(self) -> None:
+        self.subscriptions: List[str] = []
+        self.will: Optional[Tuple[str, bytes, bool]] = None
+        self.clean_exit = False
+        self.protocol_level = 4
+        self.topic_aliases: Dict[int, str] = {}
+        self.write_lock = threading.Lock()
+        self.server.register(self)
+
+    def finish(self) -> None:
+        self.server.unregister(self)
+        if self.will and not self.clean_exit and self.server.running:
+            topic, payload, retain = self.will
+            self.server.route(topic, payload, retain)
+
+    def send(self, packet_type: int, flags: int, body: bytes) -> None:
+        with self.write_lock:
+            self.request.sendall(bytes([(packet_type << 4) | flags]) + encode_length(len(body)) + body)
+
+    def read_exact(self, count: int) -> bytes:
+        data = b''
+        while len(data) < count:
+            chunk = self.request.recv(count - len(data))
+            if not chunk:
+                raise ConnectionError('client closed')
+            data += chunk
+        return data
+
+    def read_packet(self) -> Tuple[int, int, bytes]:
+        first = self.read_exact(1)[0]
+        multiplier, length = 1, 0
+        while True:
+            byte = self.read_exact(1)[0]
+            length += (byte & 0x7F) * multiplier
+            multiplier *= 128
+            if not byte & 0x80:
+                break
+        return first >> 4, first & 0x0F, self.read_exact(length)
+
+    def handle(self) -> None:
+        try:
+            while True:
+                packet_type, flags, body = self.read_packet()
+                if packet_type == CONNECT:
+                    self.handle_connect(body)
+                elif packet_type == PUBLISH:
+                    self.handle_publish(flags, body)
+                elif packet_type == PUBREL:
+                    self.send(PUBCOMP, 0, body[:2])
+                elif packet_type == SUBSCRIBE:
+                    self.handle_subscribe(body)
+                elif packet_type == UNSUBSCRIBE:
+                    self.send(UNSUBACK, 0, body[:2])
+                elif packet_type == PINGREQ:
+                    self.send(PINGRESP, 0, b'')
+                elif packet_type == DISCONNECT:
+                    self.clean_exit = True
+                    return
+        except (ConnectionError, OSError):
+            return
+
+    def handle_connect(self, body: bytes) -> None:
+        position = 2 + struct.unpack('>H', body[:2])[0]  # 协议名 / Protocol name
+        self.protocol_level = body[position]
+        connect_flags = body[position + 1]
+        position += 4  # 协议级别、标志、保活 / Level, flags, keepalive
+        if self.v5:
+            position = decode_properties(body, position)[1]
+        client_id_length = struct.unpack('>H', body[position:position + 2])[0]
+        position += 2 + client_id_length
+        if connect_flags & 0x04:
+            if self.v5:
+                position = decode_properties(body, position)[1]
+            topic_length = struct.unpack('>H', body[position:position + 2])[0]
+            topic = body[position + 2:position + 2 + topic_length].decode('utf-8')
+            position += 2 + topic_length
+            payload_length = struct.unpack('>H', body[position:position + 2])[0]
+            payload = body[position + 2:position + 2 + payload_length]
+            self.will = (topic, payload, bool(connect_flags & 0x20))
+        if self.v5:
+            self.send(CONNACK, 0, b'\x00\x00\x03\x22' + struct.pack('>H', TOPIC_ALIAS_MAXIMUM))
+        else:
+            self.send(CONNACK, 0, b'\x00\x00')
+
+    @property
+    def v5(self) -> bool:
+        return self.protocol_level == 5
+
+    def handle_publish(self, flags: int, body: bytes) -> None:
+        qos, retain = (flags >> 1) & 0x03, bool(flags & 0x01)
+        topic_length = struct.unpack('>H', body[:2])[0]
+        topic = body[2:2 + topic_length].decode('utf-8')
+        position = 2 + topic_length
+        packet_id = body[position:position + 2] if qos else b''
+        position += 2 if qos else 0
+        properties: Dict[str, Any] = {}
+        if self.v5:
+            properties, position = decode_properties(body, position)
+            alias = properties.get('TopicAlias')
+            if alias and topic:
+                self.topic_aliases[alias] = topic
+            elif alias:
+                topic = self.topic_aliases[alias]
+        payload = body[position:]
+        self.server.route(topic, payload, retain, properties)
+        if qos == 1:
+            self.send(PUBACK, 0, packet_id)
+        elif qos == 2:
+            self.send(PUBREC, 0, packet_id)
+
+    def handle_subscribe(self, body: bytes) -> None:
+        packet_id, position, granted = body[:2], 2, bytearray()
+        if self.v5:
+            position = decode_properties(body, position)[1]
+        while position < len(body):
+            length = struct.unpack('>H', body[position:position + 2])[0]
+            self.subscriptions.append(body[position + 2:position + 2 + length].decode('utf-8'))
+            position += 2 + length + 1
+            granted.append(0)
+        self.send(SUBACK, 0, packet_id + (b'\x00' if self.v5 else b'') + bytes(granted))
+        for topic, payload in self.server.retained_messages():
+            if any(topic_matches(pattern, topic) for pattern in self.subscriptions):
+                self.deliver(topic, payload, retain=True)
+
+    def deliver(self, topic: str, payload: bytes, retain: bool = False) -> None:
+        try:
+            properties = b'\x00' if self.v5 else b''
+            self.send(PUBLISH, 0x01 if retain else 0, encode_string(topic.encode('utf-8')) + properties + payload)
+        except OSError:
+            pass
+
+
+class FakeMQTTBroker(socketserver.ThreadingTCPServer):
+    """在后台线程运行的MQTT代理替身，记录所有收到的消息
+    MQTT broker stand-in running in a background thread, recording every message received
+
+    Args:
+        port (int): 监听端口，0表示自动分配 / Port to listen on, 0 picks a free one
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, port: int = 0) -> None:
+        super().__init__(('127.0.0.1', port), Handler)
+        self.port = self.server_address[1]
+        self.messages: List[Tuple[float, str, bytes]] = []  # (收到时间, 主题, 内容) / (time received, topic, payload)
+        self.properties: List[Dict[str, Any]] = []  # 与messages对应的MQTT v5属性 / MQTT v5 properties matching messages
+        self.retained: Dict[str, bytes] = {}
+        self.clients: List[Handler] = []
+        self.lock = threading.Lock()
+        self.running = True
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def register(self, handler: Handler) -> None:
+        with self.lock:
+            self.clients.append(handler)
+
+    def unregister(self, handler: Handler) -> None:
+        with self.lock:
+            if handler in self.clients:
+                self.clients.remove(handler)
+
+    def retained_messages(self) -> List[Tuple[str, bytes]]:
+        with self.lock:
+            return list(self.retained.items())
+
+    def route(self, topic: str, payload: bytes, retain: bool, properties: Optional[Dict[str, Any]] = None) -> None:
+        with self.lock:
+            self.messages.append((time.time(), topic, payload))
+            self.properties.append(properties or {})
+            if retain:
+                if payload:
+                    self.retained[topic] = payload
+                else:
+                    self.retained.pop(topic, None)
+            receivers = [client for client in self.clients
+                         if any(topic_matches(pattern, topic) for pattern in client.subscriptions)]
+        for client in receivers:
+            client.deliver(topic, payload, retain=False)
+
+    def stop(self) -> None:
+        """模拟代理宕机：停止监听并断开所有连接 / Simulate a crash: stop listening and drop every connection"""
+        self.running = False
+        self.shutdown()
+        self.server_close()
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            try:
+                client.request.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    @classmethod
+    def restart(cls, previous: 'FakeMQTTBroker') -> 'FakeMQTTBroker':
+        """在同一端口重新启动，保留已收到的消息和保留消息
+        Restart on the same port, keeping received and retained messages
+        """
+        broker = cls(previous.port)
+        broker.messages = previous.messages
+        broker.properties = previous.properties
+        broker.retained = previous.retained
+        return broker
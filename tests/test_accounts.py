@@ -0,0 +1,26 @@
+"""多账户配置 / Multi-account configuration"""
+import json
+import os
+
+from app.accounts import load_accounts
+
+
+def write_accounts(tmp_path, accounts):
+    path = tmp_path / 'accounts.json'
+    path.write_text(json.dumps({'accounts': accounts}), encoding='utf-8')
+    return str(path)
+
+
+def account(name, folders):
+    return {'name': name, 'server': 'imap.example.com', 'username': name, 'password': 'x', 'folders': folders}
+
+
+def test_similar_names_get_separate_checkpoints(tmp_path):
+    # a/b 和 a_b 替换特殊字符后相同 / a/b and a_b are the same once special characters are replaced
+    path = write_accounts(tmp_path, [account('a/b', ['INBOX']), account('a_b', ['INBOX']),
+                                     account('a-b', ['c']), account('a', ['b-c'])])
+    watchers = load_accounts(path, 'email', str(tmp_path / 'checkpoint.json'))
+    checkpoints = [watcher['checkpoint'] for watcher in watchers]
+    assert len(set(checkpoints)) == len(checkpoints)
+    assert all(os.path.dirname(checkpoint) == str(tmp_path) for checkpoint in checkpoints)
+
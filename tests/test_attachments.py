@@ -0,0 +1,51 @@
+"""按内容寻址的附件存储 / Content-addressed attachment store"""
+import base64
+import hashlib
+import os
+import quopri
+
+import pytest
+
+from app.attachments import AttachmentStore
+
+DATA = bytes(range(256)) * 40 + 'café = end\n'.encode()
+
+
+def write_in_chunks(store: AttachmentStore, encoding: str, encoded: bytes, size: int):
+    writer = store.open(encoding)
+    for start in range(0, len(encoded), size):
+        writer.write(encoded[start:start + size])
+    return writer.commit()
+
+
+@pytest.mark.parametrize('encoding, encoded', [
+    ('base64', base64.encodebytes(DATA)),
+    ('base64', base64.b64encode(DATA).rstrip(b'=')),  # 缺少填充 / Missing padding
+    ('quoted-printable', quopri.encodestring(DATA)),
+    ('binary', DATA),
+])
+@pytest.mark.parametrize('size', [1, 7, 4096])
+def test_chunks_need_no_alignment(tmp_path, encoding, encoded, size):
+    stored = write_in_chunks(AttachmentStore(str(tmp_path)), encoding, encoded, size)
+    digest = hashlib.sha256(DATA).hexdigest()
+    assert stored == {'sha256': digest, 'size': len(DATA), 'path': str(tmp_path / digest[:2] / digest)}
+    with open(stored['path'], 'rb') as f:
+        assert f.read() == DATA
+    assert os.listdir(tmp_path / 'tmp') == []
+
+
+def test_identical_content_is_stored_once_and_aborts_leave_nothing(tmp_path):
+    store = AttachmentStore(str(tmp_path))
+    first = write_in_chunks(store, 'binary', DATA, 100)
+    second = write_in_chunks(store, 'base64', base64.encodebytes(DATA), 100)
+    assert first == second
+    writer = store.open('binary')
+    writer.write(b'partial')
+    writer.abort()
+    assert os.listdir(tmp_path / 'tmp') == []
+    assert os.listdir(tmp_path / first['sha256'][:2]) == [first['sha256']]
+
+    # 上次中断留下的临时文件在启动时清理 / Temp files left by an interrupted run are removed on startup
+    (tmp_path / 'tmp' / 'leftover').write_bytes(b'x')
+    AttachmentStore(str(tmp_path))
+    assert os.listdir(tmp_path / 'tmp') == []
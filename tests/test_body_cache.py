@@ -0,0 +1,128 @@
+"""按需读取完整正文的LRU缓存，/mail 接口针对uvicorn子进程
+LRU cache for on-demand full bodies, with the /mail endpoint tested on a uvicorn child process
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import urllib.error
+import urllib.request
+from typing import Dict, Optional, Tuple
+
+import pytest
+
+from app.body_cache import BodyCache
+from benchmarks.bench_failover import MAIL_TOPIC, wait_for
+from benchmarks.bench_startup import LAUNCHER, child_env, free_port
+from benchmarks.fake_imap import FakeIMAPServer, Mailbox
+from benchmarks.fake_mqtt import FakeMQTTBroker
+
+
+def body(i: int) -> Tuple[str, str]:
+    return f'text {i} ' + 'x' * 100, f'<p>html {i}</p>'
+
+
+def test_ids_are_content_digests():
+    cache = BodyCache(10_000)
+    body_id = cache.put(*body(1))
+    assert cache.put(*body(1)) == body_id
+    assert cache.put(*body(2)) != body_id
+    assert cache.get(body_id) == {'text': body(1)[0], 'html': body(1)[1]}
+    # 不是put()生成的ID / IDs that put() never returns
+    assert cache.get('../' + body_id[3:]) is None
+    assert cache.get(body_id[:-1]) is None
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 0
+
+
+def test_memory_is_bounded_by_bytes_in_lru_order():
+    cache = BodyCache(400)
+    ids = [cache.put(*body(i)) for i in range(3)]
+    assert cache.stats()['bytes'] <= 400
+    assert cache.get(ids[0]) is None
+    assert cache.get(ids[2]) is not None
+    assert cache.get(ids[1]) is not None  # ids[1] 变为最近使用 / ids[1] becomes most recently used
+    new = cache.put(*body(3))
+    assert cache.get(ids[2]) is None
+    assert cache.get(ids[1]) is not None and cache.get(new) is not None
+    assert cache.stats()['misses'] == 2
+
+
+def test_evicted_bodies_spill_to_disk_and_survive_restart(tmp_path):
+    spill = str(tmp_path / 'bodies')
+    cache = BodyCache(400, spill, 10_000)
+    ids = [cache.put(*body(i)) for i in range(4)]
+    assert cache.get(ids[0]) == {'text': body(0)[0], 'html': body(0)[1]}
+    assert cache.stats()['disk_hits'] == 1 and cache.stats()['disk_entries'] == 2
+    assert sorted(os.listdir(spill)) == sorted(f'{body_id}.json' for body_id in ids[:2])
+
+    # 重启后内存为空，磁盘上的条目仍可读取 / After a restart memory is empty and the disk entries are still served
+    restarted = BodyCache(400, spill, 10_000)
+    assert restarted.get(ids[1]) == {'text': body(1)[0], 'html': body(1)[1]}
+    assert restarted.get(ids[3]) is None
+
+
+def test_spill_directory_is_bounded(tmp_path):
+    spill = str(tmp_path / 'bodies')
+    cache = BodyCache(0, spill, 500)
+    ids = [cache.put(*body(i)) for i in range(5)]
+    stats = cache.stats()
+    assert 0 < stats['disk_bytes'] <= 500 and stats['entries'] == 0
+    # 最旧的文件先被删除 / The oldest files are deleted first
+    assert cache.get(ids[0]) is None and cache.get(ids[-1]) is not None
+    assert len(os.listdir(spill)) == stats['disk_entries']
+
+
+def request(url: str, headers: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, str], bytes]:
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, headers=headers or {}), timeout=2) as response:
+            return response.status, dict(response.headers), response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, dict(e.headers), e.read()
+
+
+@pytest.fixture
+def summary_service():
+    mailbox = Mailbox()
+    imap_server = FakeIMAPServer(mailbox)
+    broker = FakeMQTTBroker()
+    work_dir = tempfile.mkdtemp(prefix='email2mqtt-body-')
+    env = child_env(work_dir, imap_server.port, broker.port)
+    env.update({'WATCH_MODE': 'poll', 'CHECK_INTERVAL': '1', 'BODY_MODE': 'summary', 'SNIPPET_LENGTH': '10'})
+    port = free_port()
+    child = subprocess.Popen([sys.executable, '-c', LAUNCHER, str(port)], env=env,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    yield mailbox, broker, port
+    child.terminate()
+    child.wait()
+    imap_server.shutdown()
+    broker.stop()
+
+
+def test_mail_endpoint_serves_bodies_with_etags(summary_service):
+    mailbox, broker, port = summary_service
+    text = 'a long body that does not fit in the snippet'
+    mailbox.add(f'From: a@example.com\r\nSubject: summary\r\n\r\n{text}\r\n'.encode())
+
+    def published():
+        with broker.lock:
+            return [payload.decode() for _, topic, payload in broker.messages if topic == MAIL_TOPIC]
+
+    assert wait_for(lambda: published(), 30) is not None
+    # summary模式的最后一行是完整正文的路径 / The last line in summary mode is the path of the full body
+    path = published()[0].split('\n')[-1]
+    assert path.startswith('/mail/')
+    base = f'http://127.0.0.1:{port}{path}'
+
+    status, headers, content = request(base)
+    assert status == 200 and text in content.decode()
+    etag = headers['etag']
+    assert etag == f'"{path[len("/mail/"):]}"'
+    status, _, content = request(base + '?part=text')
+    assert status == 200 and content.decode().strip() == text
+
+    # 匹配的 If-None-Match 返回304且没有内容 / A matching If-None-Match gets a 304 without content
+    status, headers, content = request(base, {'If-None-Match': f'"other", {etag}'})
+    assert (status, headers['etag'], content) == (304, etag, b'')
+    assert request(base, {'If-None-Match': '"other"'})[0] == 200
+    assert request(base + '?part=body')[0] == 400
+    assert request(f'http://127.0.0.1:{port}/mail/{"0" * 32}')[0] == 404
@@ -0,0 +1,82 @@
+"""有界的持久化去重索引 / Bounded, persistent deduplication index"""
+import sqlite3
+
+import pytest
+
+from app import dedup
+from app.dedup import DedupStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(dedup.time, 'time', lambda: now[0])
+    return now
+
+
+def rows(path: str) -> int:
+    with sqlite3.connect(path) as db:
+        return db.execute('SELECT COUNT(*) FROM seen').fetchone()[0]
+
+
+def test_duplicate_needs_the_same_fingerprint(tmp_path, clock):
+    store = DedupStore(str(tmp_path / 'dedup.db'))
+    assert not store.is_duplicate('<m@x>', 'f1')
+    store.add('<m@x>', 'f1')
+    assert store.is_duplicate('<m@x>', 'f1')
+    # 同一Message-ID但内容不同不算重复 / The same Message-ID with different content is not a duplicate
+    assert not store.is_duplicate('<m@x>', 'f2')
+    store.close()
+
+
+def test_lru_keeps_recent_entries_in_memory_and_falls_back_to_disk(tmp_path, clock):
+    store = DedupStore(str(tmp_path / 'dedup.db'), max_entries=2)
+    store.add('a', 'fa')
+    store.add('b', 'fb')
+    assert store.is_duplicate('a', 'fa')  # a 变为最近使用 / a becomes most recently used
+    store.add('c', 'fc')
+    assert list(store._cache) == ['a', 'c']
+    # 被淘汰的条目仍在磁盘上，读取后重新进入内存 / An evicted entry is still on disk and comes back into memory when read
+    assert store.is_duplicate('b', 'fb')
+    assert list(store._cache) == ['c', 'b'] and len(store) == 2
+    store.close()
+
+
+def test_entries_expire_after_ttl(tmp_path, clock):
+    path = str(tmp_path / 'dedup.db')
+    store = DedupStore(path, max_entries=1, ttl=100)
+    store.add('a', 'fa')
+    store.add('b', 'fb')
+    clock[0] += 100
+    assert store.is_duplicate('a', 'fa') and store.is_duplicate('b', 'fb')
+    clock[0] += 1
+    # 内存和磁盘上的过期条目都不再算重复 / Expired entries no longer count, in memory or on disk
+    assert not store.is_duplicate('a', 'fa')
+    assert not store.is_duplicate('b', 'fb')
+    assert len(store) == 0
+    assert rows(path) == 2
+    store.prune()
+    assert rows(path) == 0
+    store.close()
+
+
+def test_index_survives_restart_and_prunes_periodically(tmp_path, clock, monkeypatch):
+    path = str(tmp_path / 'dedup.db')
+    store = DedupStore(path, ttl=100)
+    store.add('old', 'f')
+    store.close()
+
+    store = DedupStore(path, ttl=100)
+    assert store.is_duplicate('old', 'f')
+    clock[0] += 101
+    monkeypatch.setattr(DedupStore, 'PRUNE_EVERY', 2)
+    store.add('new 1', 'f')
+    assert rows(path) == 2
+    store.add('new 2', 'f')
+    assert rows(path) == 2  # 第二次插入时清理了 old / old was pruned on the second insert
+    store.close()
+
+    # 启动时也清理 / Startup prunes as well
+    clock[0] += 101
+    DedupStore(path, ttl=100).close()
+    assert rows(path) == 0
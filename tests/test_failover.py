@@ -0,0 +1,245 @@
+"""主备故障切换，针对本地MQTT和IMAP替身
+Active/standby failover, against the local MQTT and IMAP stand-ins
+
+选举本身在进程内测试，邮件不丢失、不重复在两个uvicorn子进程副本上测试（与 bench_failover 相同）
+The election itself is tested in process; no lost or duplicated mail is tested on two
+uvicorn child process replicas (as in bench_failover)
+"""
+import asyncio
+import json
+import socket
+import struct
+import threading
+import time
+import urllib.request
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from app.election import LEADER, STANDBY, LeaderElection
+from benchmarks.bench_failover import LEASE_TOPIC, MAIL_TOPIC, Replica, published_subjects, wait_for
+from benchmarks.fake_imap import FakeIMAPServer, Mailbox
+from benchmarks.fake_mqtt import FakeMQTTBroker, Handler
+
+LEASE = 2.0
+CHECKPOINT_TOPIC = f'{LEASE_TOPIC}/checkpoint/bench/INBOX'
+
+
+class Node:
+    """进程内的一个选举节点，事件循环在后台线程中运行
+    One election node in process, with its event loop in a background thread
+    """
+
+    def __init__(self, broker: FakeMQTTBroker, node: str) -> None:
+        self.client = mqtt.Client(client_id=f'test-{node}-{time.monotonic_ns()}')
+        self.election = LeaderElection(self.client, LEASE_TOPIC, node, LEASE)
+        self.client.on_connect = lambda client, userdata, flags, rc: rc == 0 and self.election.subscribe()
+        self.client.on_disconnect = lambda client, userdata, rc: self.election.disconnected()
+        self.client.reconnect_delay_set(0.1, 0.2)
+        self.client.connect_async('127.0.0.1', broker.port, keepalive=5)
+        self.client.loop_start()
+        self.loop = asyncio.new_event_loop()
+        self.task = self.loop.create_task(self.election.run())
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.task)
+        except asyncio.CancelledError:
+            pass
+
+    def hang(self) -> None:
+        # 续约发不出去，其他节点的租约也收不到，如同进程卡死 / Renewals no longer go out and other leases no longer arrive, as if the process hung
+        self.election._publish_lease = lambda: None
+        self.client.message_callback_remove(LEASE_TOPIC)
+
+    def drop(self) -> None:
+        # 连接意外断开，代理发布遗嘱，paho随后自动重连 / The connection drops unexpectedly, the broker publishes the will and paho reconnects
+        self.client.socket().shutdown(socket.SHUT_RDWR)
+
+    def stop(self) -> None:
+        self.loop.call_soon_threadsafe(self.task.cancel)
+        self.thread.join(5)
+        self.client.disconnect()
+        self.client.loop_stop()
+
+
+class LeaderMonitor(threading.Thread):
+    """不断检查是否有两个节点同时是主节点 / Keep checking whether two nodes lead at the same time"""
+
+    def __init__(self, nodes: List[Node]) -> None:
+        super().__init__(daemon=True)
+        self.nodes = nodes
+        self.overlaps = 0
+        self._done = threading.Event()
+        self.start()
+
+    def run(self) -> None:
+        while not self._done.wait(0.002):
+            if sum(node.election.state == LEADER for node in self.nodes) > 1:
+                self.overlaps += 1
+
+    def stop(self) -> None:
+        self._done.set()
+        self.join()
+
+
+def leaders(nodes: List[Node]) -> List[Node]:
+    return [node for node in nodes if node.election.is_leader]
+
+
+@pytest.fixture
+def broker():
+    broker = FakeMQTTBroker()
+    yield broker
+    broker.stop()
+
+
+@pytest.fixture
+def nodes(broker):
+    nodes = [Node(broker, 'a'), Node(broker, 'b')]
+    yield nodes
+    for node in nodes:
+        node.stop()
+
+
+def test_hung_leader_steps_down_before_standby_takes_over(nodes):
+    monitor = LeaderMonitor(nodes)
+    # 两个节点可能同时认领，settle 期间也只能有一个成为主节点 / Both may claim at once, and still only one leads through settle
+    assert wait_for(lambda: len(leaders(nodes)) == 1, 10) is not None
+    time.sleep(LEASE)
+    leader = leaders(nodes)[0]
+    standby = next(node for node in nodes if node is not leader)
+
+    leader.hang()
+    hung = time.monotonic()
+    assert wait_for(lambda: standby.election.is_leader, LEASE * 3) is not None
+    # 最后一次续约之后一个租约周期加 settle 内接管 / Taken over within one lease plus settle after the last renewal
+    assert time.monotonic() - hung <= LEASE + standby.election.settle + 0.5
+    # 被隔离的旧主节点可以反复认领，但认领收不到回应就不会成为主节点
+    # The cut-off old leader may keep claiming, but a claim that never comes back never leads
+    time.sleep(LEASE)
+    assert not leader.election.is_leader
+    monitor.stop()
+    assert monitor.overlaps == 0
+
+
+def test_dropped_leader_rejoins_as_standby(nodes):
+    monitor = LeaderMonitor(nodes)
+    assert wait_for(lambda: len(leaders(nodes)) == 1, 10) is not None
+    leader = leaders(nodes)[0]
+    standby = next(node for node in nodes if node is not leader)
+
+    leader.drop()
+    # 遗嘱使待命节点不必等租约过期 / The will spares the standby waiting for the lease to expire
+    assert wait_for(lambda: standby.election.is_leader, LEASE) is not None
+    # 旧主节点重连后看到新的租约，保持待命 / Reconnected, the old leader sees the new lease and stays on standby
+    assert wait_for(lambda: leader.client.is_connected(), 10) is not None
+    time.sleep(LEASE * 2)
+    assert leader.election.state == STANDBY and standby.election.is_leader
+    assert leader.election.snapshot()['leader'] == standby.election.node
+    monitor.stop()
+    assert monitor.overlaps == 0
+
+
+class HoldingHandler(Handler):
+    # 设置 holding 时丢弃邮件消息且不回复PUBACK，如同消息在途中丢失 / While holding, drop mail messages without a PUBACK, as if lost in flight
+    def handle_publish(self, flags: int, body: bytes) -> None:
+        topic_length = struct.unpack('>H', body[:2])[0]
+        if self.server.holding.is_set() and body[2:2 + topic_length].decode('utf-8') == MAIL_TOPIC:
+            return
+        super().handle_publish(flags, body)
+
+
+@pytest.fixture
+def drill():
+    mailbox = Mailbox()
+    imap_server = FakeIMAPServer(mailbox)
+    broker = FakeMQTTBroker()
+    broker.holding = threading.Event()
+    broker.RequestHandlerClass = HoldingHandler
+    replicas = [Replica(node, imap_server.port, broker.port, LEASE, True) for node in ('a', 'b')]
+    yield mailbox, broker, replicas
+    for replica in replicas:
+        replica.stop()
+    imap_server.shutdown()
+    broker.stop()
+
+
+def deliver(mailbox: Mailbox, subjects: List[str]) -> None:
+    for subject in subjects:
+        mailbox.add(f'From: drill@example.com\r\nSubject: {subject}\r\n\r\nfailover test\r\n'.encode(), seen=False)
+
+
+def published_checkpoint(broker: FakeMQTTBroker) -> Optional[int]:
+    with broker.lock:
+        payload = broker.retained.get(CHECKPOINT_TOPIC)
+    return json.loads(payload)['last_uid'] if payload else None
+
+
+def replica_stats(replica: Replica) -> Dict[str, Any]:
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{replica.port}/stats', timeout=0.5) as response:
+            return json.load(response)
+    except (OSError, ValueError):
+        return {}
+
+
+def start_drill(replicas: List[Replica]) -> Replica:
+    for replica in replicas:
+        replica.start()
+    assert wait_for(lambda: [replica.state() for replica in replicas].count('leader') == 1, 60) is not None
+    return next(replica for replica in replicas if replica.state() == 'leader')
+
+
+def test_killed_leader_resumes_from_published_checkpoint(drill):
+    mailbox, broker, replicas = drill
+    leader = start_drill(replicas)
+    standby = next(replica for replica in replicas if replica is not leader)
+    before = [f'before {i}' for i in range(5)]
+    deliver(mailbox, before)
+    assert wait_for(lambda: published_checkpoint(broker) == 5, 30) is not None
+
+    leader.fail('kill')
+    assert wait_for(lambda: standby.state() == 'leader', LEASE) is not None
+    after = [f'after {i}' for i in range(5)]
+    deliver(mailbox, after)
+    assert wait_for(lambda: published_checkpoint(broker) == 10, 30) is not None
+
+    # 旧主节点在原来的工作目录中重启，作为待命副本加入 / The old leader restarts in its work directory and joins as a standby
+    leader.recover('kill')
+    assert wait_for(lambda: leader.state() == 'standby', 30) is not None
+    time.sleep(LEASE)
+    assert [leader.state(), standby.state()] == ['standby', 'leader']
+    counts = Counter(published_subjects(broker))
+    assert {subject: counts[subject] for subject in before + after} == dict.fromkeys(before + after, 1)
+    assert sum(counts.values()) == len(before + after)
+
+
+def test_in_flight_mail_is_fetched_again_after_failover(drill):
+    mailbox, broker, replicas = drill
+    leader = start_drill(replicas)
+    standby = next(replica for replica in replicas if replica is not leader)
+    deliver(mailbox, ['acked 0', 'acked 1'])
+    assert wait_for(lambda: published_checkpoint(broker) == 2, 30) is not None
+
+    # 代理不再确认邮件消息，检查点必须停在已确认的位置 / The broker stops acknowledging mail, so the checkpoint must stay at what was acknowledged
+    broker.holding.set()
+    in_flight = [f'in flight {i}' for i in range(3)]
+    deliver(mailbox, in_flight)
+    assert wait_for(lambda: replica_stats(leader).get('publisher', {}).get('unacked', 0) >= 3, 30) is not None
+    time.sleep(0.5)
+    assert published_checkpoint(broker) == 2
+
+    leader.fail('kill')
+    broker.holding.clear()
+    assert wait_for(lambda: standby.state() == 'leader', LEASE) is not None
+    # 接任的节点从检查点继续，重新取回未确认的邮件 / The new leader resumes from the checkpoint and fetches the unacknowledged mail again
+    assert wait_for(lambda: published_checkpoint(broker) == 5, 30) is not None
+    counts = Counter(published_subjects(broker))
+    assert {subject: counts[subject] for subject in ['acked 0', 'acked 1'] + in_flight} == \
+        dict.fromkeys(['acked 0', 'acked 1'] + in_flight, 1)
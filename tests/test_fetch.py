@@ -0,0 +1,178 @@
+"""FETCH响应解析，部分针对本地IMAP替身 / FETCH response parsing, partly against the local IMAP stand-in"""
+import imaplib
+from email.mime.application import MIMEApplication
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+import pytest
+
+from app.fetch import (
+    _parameter, chunked, compress_uids, decode_transfer_encoding, find_attachment_parts, find_text_parts,
+    iter_fetch_response
+)
+from benchmarks.fake_imap import FakeIMAPServer, Mailbox
+
+
+@pytest.fixture
+def server():
+    server = FakeIMAPServer(Mailbox())
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def connect(server: FakeIMAPServer) -> imaplib.IMAP4:
+    mail = imaplib.IMAP4('127.0.0.1', server.port)
+    mail.login('test', 'test')
+    mail.select('INBOX')
+    return mail
+
+
+def test_compress_uids_and_chunked():
+    assert compress_uids([8, 1, 2, 3, 5, 7, 3]) == '1:3,5,7:8'
+    assert compress_uids([4]) == '4'
+    assert list(chunked(list(range(5)), 2)) == [[0, 1], [2, 3], [4]]
+    assert list(chunked([1], 0)) == [[1]]
+
+
+def test_literals_are_kept_apart_per_message():
+    # 字面量内容看起来像下一封邮件的开头也不会被拆开 / A literal that looks like the start of the next message is not split
+    data = [
+        (b'1 (UID 5 BODY[] {12}', b'2 (UID 6 x)\n'),
+        b')',
+        None,
+        (b'2 (UID 6 BODY[] {3}', b'abc'),
+        b')',
+    ]
+    assert list(iter_fetch_response(data)) == [
+        {'UID': b'5', 'BODY[]': b'2 (UID 6 x)\n'},
+        {'UID': b'6', 'BODY[]': b'abc'},
+    ]
+
+
+def test_items_split_across_several_chunks():
+    # 一封邮件的多个字面量分散在多个元组中，之后的数据项在续行里
+    # Several literals of one message come in separate tuples, and later items in the continuation line
+    data = [
+        (b'3 (BODY[1]<0> {3}', b'one'),
+        (b' BODY[2] {3}', b'two'),
+        (b' BODY[HEADER.FIELDS (FROM SUBJECT)] {4}', b'h\r\n\r'),
+        b' UID 9 FLAGS (\\Seen) INTERNALDATE "01-Jan-2026 00:00:00 +0000" X-EMPTY NIL)',
+    ]
+    (item,) = iter_fetch_response(data)
+    assert item == {
+        'BODY[1]': b'one',
+        'BODY[2]': b'two',
+        'BODY[HEADER.FIELDS (FROM SUBJECT)]': b'h\r\n\r',
+        'UID': b'9',
+        'FLAGS': [b'\\Seen'],
+        'INTERNALDATE': b'01-Jan-2026 00:00:00 +0000',
+        'X-EMPTY': None,
+    }
+
+
+def test_batched_fetch_against_server(server):
+    raws = [f'From: a@example.com\r\nSubject: {i}\r\n\r\n{"x" * i * 100}\r\n'.encode() for i in range(5)]
+    uids = [server.mailbox.add(raw) for raw in raws]
+    mail = connect(server)
+    fetched = {}
+    for chunk in chunked(uids, 2):
+        status, data = mail.uid('FETCH', compress_uids(chunk), '(UID BODY.PEEK[])')
+        assert status == 'OK'
+        fetched.update((int(item['UID']), item['BODY[]']) for item in iter_fetch_response(data))
+    assert fetched == dict(zip(uids, raws))
+
+
+def mixed_message() -> bytes:
+    alternative = MIMEMultipart('alternative')
+    alternative.attach(MIMEText('caf\u00e9 text', 'plain', 'utf-8'))
+    alternative.attach(MIMEText('<p>html</p>', 'html', 'iso-8859-1'))
+    notes = MIMEText('attached notes', 'plain')
+    notes.add_header('Content-Disposition', 'attachment', filename='notes.txt')
+    message = MIMEMultipart('mixed')
+    message['From'] = 'a@example.com'
+    message['Subject'] = 'mixed'
+    message.attach(alternative)
+    message.attach(notes)
+    message.attach(MIMEApplication(b'\x00\x01' * 100, 'octet-stream', Name='data.bin'))
+    return message.as_bytes().replace(b'\n', b'\r\n')
+
+
+def test_text_parts_from_server_bodystructure(server):
+    uid = server.mailbox.add(mixed_message())
+    mail = connect(server)
+    _, data = mail.uid('FETCH', str(uid), '(UID BODYSTRUCTURE)')
+    (item,) = iter_fetch_response(data)
+    parts = find_text_parts(item['BODYSTRUCTURE'])
+    # 附件和非文本部分被跳过 / Attachments and non-text parts are skipped
+    assert parts == [
+        {'section': '1.1', 'type': 'text/plain', 'charset': 'utf-8', 'encoding': 'base64'},
+        {'section': '1.2', 'type': 'text/html', 'charset': 'iso-8859-1', 'encoding': 'quoted-printable'},
+    ]
+    query = ' '.join(f"BODY.PEEK[{part['section']}]" for part in parts)
+    _, data = mail.uid('FETCH', str(uid), f'(UID {query})')
+    (item,) = iter_fetch_response(data)
+    texts = [decode_transfer_encoding(item[f"BODY[{part['section']}]"], part['encoding']).decode(part['charset'])
+             for part in parts]
+    assert [text.strip() for text in texts] == ['caf\u00e9 text', '<p>html</p>']
+
+
+def test_single_part_text_defaults():
+    structure = [b'TEXT', b'PLAIN', None, None, None, None, b'12', b'1']
+    assert find_text_parts(structure) == [{'section': '1', 'type': 'text/plain', 'charset': 'utf-8', 'encoding': '7bit'}]
+    assert find_text_parts([b'IMAGE', b'PNG', None, None, None, b'BASE64', b'10']) == []
+
+
+def test_truncated_partial_fetch_still_decodes():
+    # BODY[1]<0.n> 可能在base64的四字符组中间截断 / BODY[1]<0.n> may cut a base64 group in half
+    assert decode_transfer_encoding(b'aGVs\r\nbG8gd29y', 'base64') == b'hello wor'
+    assert decode_transfer_encoding(b'caf=C3=A9 =\r\nx', 'quoted-printable') == 'caf\u00e9 x'.encode()
+    assert decode_transfer_encoding(b'plain', '7bit') == b'plain'
+
+
+def test_attachment_parts_from_server_bodystructure(server):
+    uid = server.mailbox.add(mixed_message())
+    mail = connect(server)
+    _, data = mail.uid('FETCH', str(uid), '(UID BODYSTRUCTURE)')
+    (item,) = iter_fetch_response(data)
+    # 文本部分不算附件，文件名来自 Content-Disposition 或 Content-Type 的 name
+    # Text parts are not attachments; the file name comes from Content-Disposition or the Content-Type name
+    parts = find_attachment_parts(item['BODYSTRUCTURE'])
+    assert [{key: part[key] for key in ('section', 'type', 'encoding', 'filename')} for part in parts] == [
+        {'section': '2', 'type': 'text/plain', 'encoding': '7bit', 'filename': 'notes.txt'},
+        {'section': '3', 'type': 'application/octet-stream', 'encoding': 'base64', 'filename': 'data.bin'},
+    ]
+    assert all(part['size'] > 0 for part in parts)
+    assert not {part['section'] for part in parts} & {part['section'] for part in find_text_parts(item['BODYSTRUCTURE'])}
+
+
+def test_embedded_message_is_one_attachment():
+    envelope = [None] * 10
+    inner = [b'TEXT', b'PLAIN', None, None, None, b'7BIT', b'5', b'1']
+    structure = [
+        [b'TEXT', b'PLAIN', [b'CHARSET', b'utf-8'], None, None, b'7BIT', b'4', b'1'],
+        [b'MESSAGE', b'RFC822', None, None, None, b'7BIT', b'120', envelope, inner, b'6', None,
+         [b'ATTACHMENT', [b'FILENAME', b'forwarded.eml']]],
+        b'MIXED',
+    ]
+    assert find_attachment_parts(structure) == [
+        {'section': '2', 'type': 'message/rfc822', 'encoding': '7bit', 'size': 120, 'filename': 'forwarded.eml'}]
+
+
+@pytest.mark.parametrize('params, expected', [
+    ([b'NAME', b'report.pdf'], 'report.pdf'),
+    # RFC 2047编码字 / RFC 2047 encoded word
+    ([b'NAME', b'=?utf-8?B?5paH5Lu2LnR4dA==?='], '\u6587\u4ef6.txt'),
+    # 支持UTF8=ACCEPT的服务器直接发送UTF-8 / A server with UTF8=ACCEPT sends raw UTF-8
+    ([b'NAME', '\u6587.txt'.encode()], '\u6587.txt'),
+    # RFC 2231 单段、编码续行、未编码续行 / RFC 2231 single piece, encoded and plain continuations
+    ([b'NAME*', b"utf-8''%E6%96%87.txt"], '\u6587.txt'),
+    ([b'NAME*1*', b'%87', b'NAME*0*', b"utf-8'zh'%E6%96", b'NAME*2', b'.txt'], '\u6587.txt'),
+    # 续行按编号而不是字符串排序 / Continuations sort by number, not as strings
+    ([item for i in range(10, -1, -1) for item in (b'name*%d' % i, b'abcdefghijk'[i:i + 1])], 'abcdefghijk'),
+    ([b'NAME*', b"x-unknown''abc"], 'abc'),
+    ([b'CHARSET', b'utf-8'], ''),
+    (None, ''),
+])
+def test_parameter(params, expected):
+    assert _parameter(params, 'name') == expected
@@ -0,0 +1,24 @@
+"""HTML转纯文本 / HTML to plain text"""
+from app.html_text import html_to_text
+
+
+def test_whitespace_is_collapsed_outside_pre():
+    assert html_to_text('<p>  Hello \n  world </p><div>\n\n\n next </div>') == 'Hello world\nnext'
+
+
+def test_pre_is_kept_verbatim():
+    html = '<p> intro </p><pre>\ndef f():\n    return  1\n\n\n\tdone</pre><p> after </p>'
+    assert html_to_text(html) == 'intro\ndef f():\n    return  1\n\n\n\tdone\nafter'
+
+
+def test_pre_at_start_keeps_indentation():
+    assert html_to_text('<pre>   indented\n      more</pre>') == '   indented\n      more'
+
+
+def test_unclosed_pre_runs_to_end():
+    assert html_to_text('<p>a</p><pre>  x\n    y') == 'a\n  x\n    y'
+
+
+def test_links_and_cells():
+    text = html_to_text('<table><tr><td>a</td><td><a href="https://e.com">link</a></td></tr></table>')
+    assert text == 'a | link (https://e.com)'
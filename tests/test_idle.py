@@ -0,0 +1,142 @@
+"""IMAP IDLE推送，针对本地IMAP替身 / IMAP IDLE push, against the local IMAP stand-in"""
+import asyncio
+import imaplib
+import threading
+import time
+
+import pytest
+
+from app.config import IDLE_TIMEOUT
+from app.control import WatcherControl
+from app.idle import MAX_IDLE_SECONDS, idle_wait, supports_idle
+from benchmarks.fake_imap import FakeIMAPServer, Handler, Mailbox
+
+RAW = b'From: test@example.com\r\nSubject: idle\r\n\r\nbody\r\n'
+
+
+def connect(server: FakeIMAPServer) -> imaplib.IMAP4:
+    mail = imaplib.IMAP4('127.0.0.1', server.port)
+    mail.login('test', 'test')
+    mail.select('INBOX')
+    return mail
+
+
+@pytest.fixture
+def server():
+    server = FakeIMAPServer(Mailbox())
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def plain_server():
+    # 不声明IDLE能力 / Does not advertise IDLE
+    server = FakeIMAPServer(Mailbox(), idle=False)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_supports_idle(server, plain_server):
+    assert supports_idle(connect(server))
+    assert not supports_idle(connect(plain_server))
+
+
+def test_idle_wakes_on_exists(server):
+    mail = connect(server)
+    threading.Timer(0.2, server.mailbox.add, (RAW,)).start()
+    start = time.monotonic()
+    assert idle_wait(mail, 10) is True
+    assert time.monotonic() - start < 5
+    # IDLE正常结束，连接仍然可用 / IDLE ended cleanly and the connection is still usable
+    assert mail.noop()[0] == 'OK'
+    assert mail.uid('SEARCH', None, 'UNSEEN')[1][0] == b'1'
+
+
+def test_mail_before_idle_is_reported(server):
+    # SELECT之后、IDLE之前到达的邮件在进入IDLE时报告 / Mail that arrives after SELECT but before IDLE is reported on entering it
+    mail = connect(server)
+    server.mailbox.add(RAW)
+    start = time.monotonic()
+    assert idle_wait(mail, 10) is True
+    assert time.monotonic() - start < 5
+    assert idle_wait(mail, 0.2) is False
+
+
+def test_idle_times_out_and_is_reissued(server):
+    mail = connect(server)
+    for _ in range(2):
+        start = time.monotonic()
+        assert idle_wait(mail, 0.2) is False
+        assert time.monotonic() - start < 5
+    assert server.commands.count('IDLE') == 2
+    assert mail.noop()[0] == 'OK'
+
+
+def test_idle_never_exceeds_limit(server):
+    # 再长的等待也在上限处结束IDLE，由调用方重新发起 / However long the wait, IDLE ends at the cap and the caller re-issues it
+    mail = connect(server)
+    start = time.monotonic()
+    assert idle_wait(mail, 3600, max_idle=0.2) is False
+    assert time.monotonic() - start < 5
+    assert server.commands.count('IDLE') == 1
+    assert MAX_IDLE_SECONDS < 29 * 60 + 1
+    assert IDLE_TIMEOUT <= MAX_IDLE_SECONDS
+
+
+def test_wake_socket_ends_idle(server):
+    mail = connect(server)
+    control = WatcherControl('test', 5)
+    threading.Timer(0.2, control.poll).start()
+    start = time.monotonic()
+    assert idle_wait(mail, 10, control.wake_socket) is False
+    assert time.monotonic() - start < 5
+    # 唤醒留给调用方读取 / The wake-up is left for the caller to consume
+    assert control.consume()
+    assert mail.noop()[0] == 'OK'
+    control.close()
+
+
+class TrailingHandler(Handler):
+    # 完成响应之后紧跟一个未标记响应，前半段与完成响应同一次写入 / A completion is followed by an untagged response whose first half comes in the same write
+    def send(self, data) -> None:
+        if isinstance(data, str) and data.endswith(('OK NOOP completed\r\n', 'OK IDLE terminated\r\n')):
+            super().send(data + '* 7 EXI')
+            time.sleep(0.1)
+            data = 'STS\r\n'
+        super().send(data)
+
+
+def test_bytes_buffered_around_idle_are_kept(server):
+    server.RequestHandlerClass = TrailingHandler
+    mail = connect(server)
+    assert mail.noop()[0] == 'OK'
+    mail.response('EXISTS')
+    # 前半段留在imaplib的缓冲区中，IDLE从那里接着读 / The first half sits in imaplib's buffer and IDLE carries on from there
+    start = time.monotonic()
+    assert idle_wait(mail, 10) is True
+    assert time.monotonic() - start < 5
+    # 完成响应之后读到的字节交还给imaplib，下一个命令的响应完好 / Bytes read past the completion go back to imaplib and the next response is intact
+    assert mail.noop()[0] == 'OK'
+    assert mail.response('EXISTS')[1] == [b'7']
+    assert idle_wait(mail, 10) is True
+    assert mail.noop()[0] == 'OK'
+    assert mail.tagged_commands == {}
+
+
+def test_polling_fallback_without_idle(plain_server):
+    from app.main import wait_for_new_mail
+
+    mail = connect(plain_server)
+    control = WatcherControl('test', 0.2)
+
+    async def imap(func, *args):
+        return await asyncio.to_thread(func, *args)
+
+    use_idle = supports_idle(mail)
+    start = time.monotonic()
+    assert asyncio.run(wait_for_new_mail(mail, use_idle, imap, control)) is False
+    assert 0.1 < time.monotonic() - start < 5
+    assert 'IDLE' not in plain_server.commands
+    control.close()
@@ -0,0 +1,25 @@
+"""异步日志管道和日志配置检查 / Asynchronous logging pipeline and log configuration checks"""
+import logging
+
+import pytest
+
+from app import config
+from app.logs import LogPipeline, StructuredFormatter
+
+
+def test_invalid_level_and_format_fall_back_without_touching_logging_globals():
+    before = (logging._srcfile, logging.logThreads, logging.logProcesses, logging.logMultiprocessing)
+    pipeline = LogPipeline('email2mqtt.test.invalid', level='LOUD', fmt='xml')
+    assert pipeline.logger.level == logging.INFO
+    assert isinstance(pipeline._listener.handlers[0].formatter, StructuredFormatter)
+    assert pipeline._listener.handlers[0].formatter.fmt == 'text'
+    assert (logging._srcfile, logging.logThreads, logging.logProcesses, logging.logMultiprocessing) == before
+    pipeline.stop()
+
+
+@pytest.mark.parametrize('name, value', [('LOG_LEVEL', 'LOUD'), ('LOG_FORMAT', 'xml')])
+def test_check_config_rejects_invalid_log_settings(monkeypatch, name, value):
+    monkeypatch.setattr(config, 'MISSING', [])
+    monkeypatch.setattr(config, name, value)
+    with pytest.raises(ValueError, match=name):
+        config.check_config()
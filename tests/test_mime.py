@@ -0,0 +1,162 @@
+"""MIME边界扫描与email包解析结果一致 / The MIME boundary scanner agrees with the email package"""
+import base64
+import email
+from typing import List
+
+import pytest
+
+from app.mime import TEXT_TYPES, PartScanner, TextPart, parse_headers, scan_message
+
+
+def reference_parts(raw: bytes) -> List[TextPart]:
+    # 与 main.extract_email_content 相同的规则 / The same rules as main.extract_email_content
+    message = email.message_from_bytes(raw)
+    parts = []
+    for part in message.walk() if message.is_multipart() else [message]:
+        disposition = str(part.get('Content-Disposition')) if message.is_multipart() else ''
+        if 'attachment' in disposition or part.get_content_type() not in TEXT_TYPES:
+            continue
+        payload = part.get_payload(decode=True)
+        if payload:
+            parts.append((part.get_content_type(), part.get_content_charset() or 'utf-8', payload))
+    return parts
+
+
+def crlf(text: str) -> bytes:
+    return text.replace('\n', '\r\n').encode('utf-8')
+
+
+NESTED = """From: outer@example.com
+Subject: outer
+MIME-Version: 1.0
+Content-Type: multipart/mixed; boundary="outer"
+
+--outer
+Content-Type: text/plain; charset=utf-8
+
+outer text
+--outer
+Content-Type: message/rfc822
+
+From: inner@example.com
+Subject: inner
+Content-Type: multipart/alternative; boundary="inner"
+
+--inner
+Content-Type: text/plain; charset=iso-8859-1
+Content-Transfer-Encoding: quoted-printable
+
+caf=E9
+--inner
+Content-Type: text/html
+
+<p>inner html</p>
+--inner--
+--outer
+Content-Type: text/plain
+Content-Disposition: attachment; filename="notes.txt"
+
+attached text
+--outer--
+"""
+
+MISSING_CLOSE = """From: a@example.com
+Subject: unterminated
+Content-Type: multipart/alternative; boundary="b1"
+
+--b1
+Content-Type: text/plain
+
+first part
+--b1
+Content-Type: text/html
+
+<b>last part without a close delimiter</b>
+"""
+
+PREAMBLE_EPILOGUE = """From: a@example.com
+Subject: preamble
+Content-Type: multipart/mixed; boundary="b1"
+
+This is a multi-part message in MIME format.
+--b1 is mentioned here but not at the start of a line: x--b1
+--b1
+Content-Type: text/plain
+
+body
+--b1x
+still the same part
+--b1--
+Epilogue text that is not a part.
+--b1
+Content-Type: text/plain
+
+after the close delimiter
+"""
+
+
+def base64_message(body: str) -> str:
+    return f"""From: a@example.com
+Subject: base64
+Content-Type: multipart/mixed; boundary="b1"
+
+--b1
+Content-Type: text/plain
+Content-Transfer-Encoding: base64
+
+{body}
+--b1--
+"""
+
+
+VALID = base64.b64encode('base64 text'.encode()).decode()
+
+
+@pytest.mark.parametrize('text', [
+    NESTED,
+    MISSING_CLOSE,
+    PREAMBLE_EPILOGUE,
+    base64_message(VALID),
+    base64_message(VALID.rstrip('=')),  # 缺少填充 / Missing padding
+    base64_message(VALID[:4] + '\n' + VALID[4:]),  # 折行 / Wrapped
+    base64_message(VALID[:4] + '!*' + VALID[4:]),  # 字母表以外的字符 / Characters outside the alphabet
+    base64_message('Zm9vYmFy' + 'Y'),  # 多出一个字符 / One character too many
+    base64_message('%%%%'),  # 没有有效字符 / No valid characters at all
+], ids=['nested-rfc822', 'missing-close', 'preamble-epilogue', 'base64', 'base64-no-padding',
+        'base64-wrapped', 'base64-invalid-chars', 'base64-extra-char', 'base64-garbage'])
+@pytest.mark.parametrize('newline', ['lf', 'crlf'])
+def test_scanner_matches_email_package(text, newline):
+    raw = crlf(text) if newline == 'crlf' else text.encode('utf-8')
+    headers, parts = scan_message(raw)
+    assert parts == reference_parts(raw)
+    assert headers['Subject'] == email.message_from_bytes(raw)['Subject']
+
+
+def test_nested_message_parts_are_found():
+    _, parts = scan_message(crlf(NESTED))
+    assert [(content_type, payload) for content_type, _, payload in parts] == [
+        ('text/plain', b'outer text'), ('text/plain', b'caf\xe9'), ('text/html', b'<p>inner html</p>')]
+    assert parts[1][1] == 'iso-8859-1'
+
+
+def test_process_pool_gives_the_same_result():
+    scanner = PartScanner(threshold=0, workers=1)
+    try:
+        headers, parts = scanner.scan(crlf(NESTED))
+    finally:
+        scanner.close()
+    assert (headers['Subject'], parts) == ('outer', scan_message(crlf(NESTED))[1])
+
+
+def test_folded_headers_are_unfolded():
+    headers = parse_headers(b'From: a@example.com\r\nSubject: one\r\n two\r\n\tthree\r\n\r\nbody')
+    assert headers['Subject'] == 'one two three'
+    assert headers['From'] == 'a@example.com'
+
+
+def test_unfollowable_structure_raises():
+    # 调用方在此时退回到email包 / The caller falls back to the email package here
+    with pytest.raises(ValueError):
+        scan_message(b'Content-Type: multipart/mixed\r\n\r\nno boundary parameter\r\n')
+    with pytest.raises(ValueError):
+        scan_message(b'Content-Type: multipart/mixed; boundary="b1"\r\n\r\nno delimiter line\r\n')
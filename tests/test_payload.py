@@ -0,0 +1,111 @@
+"""消息格式、压缩和分块 / Payload format, compression and chunking"""
+import json
+import os
+import zlib
+
+import pytest
+
+from app.payload import CHUNK_CONTENT_TYPE, CHUNK_HEADER, CHUNK_MAGIC, COMPRESSED_SUFFIX, PayloadEncoder, packb
+
+RECORD = {
+    'id': '7', 'message_id': '<m@x>', 'from': {'name': 'Alice', 'email': 'alice@example.com'},
+    'subject': 'café', 'body': 'line 1\nline 2', 'body_type': 'text',
+}
+
+
+def text_record(body: str) -> dict:
+    return dict(RECORD, **{'from': {'name': '', 'email': ''}, 'subject': '', 'body': body})
+
+
+def reassemble(messages):
+    chunks = [CHUNK_HEADER.unpack(payload[:CHUNK_HEADER.size]) + (payload[CHUNK_HEADER.size:],)
+              for payload, _ in messages]
+    assert {magic for magic, _, _, _, _ in chunks} == {CHUNK_MAGIC}
+    assert len({message_id for _, message_id, _, _, _ in chunks}) == 1
+    assert [index for _, _, index, _, _ in chunks] == list(range(len(chunks)))
+    assert {total for _, _, _, total, _ in chunks} == {len(chunks)}
+    return b''.join(body for _, _, _, _, body in chunks)
+
+
+def test_text_format():
+    ((payload, content_type),) = PayloadEncoder('text').encode(RECORD)
+    assert payload.decode() == 'Alice\ncafé\nline 1\nline 2'
+    assert content_type == 'text/plain; charset=utf-8'
+    ((payload, _),) = PayloadEncoder('text').encode(dict(RECORD, body_id='abc'))
+    assert payload.decode().endswith('\n/mail/abc')
+
+
+def test_structured_records_compress_above_threshold():
+    ((payload, content_type),) = PayloadEncoder('json', compress_threshold=10_000).encode(RECORD)
+    assert (json.loads(payload), content_type) == (RECORD, 'application/json')
+    ((payload, content_type),) = PayloadEncoder('json', compress_threshold=10).encode(RECORD)
+    assert content_type == 'application/json' + COMPRESSED_SUFFIX
+    assert json.loads(zlib.decompress(payload)) == RECORD
+
+
+def test_chunk_boundaries():
+    max_payload = CHUNK_HEADER.size + 10
+    encoder = PayloadEncoder('text', max_payload=max_payload)
+    # 正好等于上限时不分块 / Exactly at the cap is not chunked
+    ((payload, content_type),) = encoder.encode(text_record('x' * (max_payload - 2)))
+    assert len(payload) == max_payload and content_type == 'text/plain; charset=utf-8'
+
+    record = text_record('y' * (max_payload - 1))
+    messages = encoder.encode(record)
+    assert len(messages) == -(-(max_payload + 1) // 10)
+    assert all(len(payload) <= max_payload and content_type == CHUNK_CONTENT_TYPE for payload, content_type in messages)
+    assert reassemble(messages) == PayloadEncoder('text').encode(record)[0][0]
+    # 每条分块消息有自己的ID / Each chunked message has its own ID
+    assert messages[0][0][:CHUNK_HEADER.size] != encoder.encode(record)[0][0][:CHUNK_HEADER.size]
+
+
+def test_chunk_count_limit():
+    encoder = PayloadEncoder('text', max_payload=CHUNK_HEADER.size + 1)
+    assert len(encoder.encode(text_record('z' * (0xFFFF - 2)))) == 0xFFFF
+    with pytest.raises(ValueError):
+        encoder.encode(text_record('z' * (0xFFFF - 1)))
+    with pytest.raises(ValueError):
+        PayloadEncoder('text', max_payload=CHUNK_HEADER.size)
+    with pytest.raises(ValueError):
+        PayloadEncoder('xml')
+
+
+def test_compressed_msgpack_is_chunked_after_compression():
+    msgpack = pytest.importorskip('msgpack')
+    record = dict(RECORD, body=os.urandom(2000).hex())
+    messages = PayloadEncoder('msgpack', compress_threshold=100, max_payload=256).encode(record)
+    assert len(messages) > 1
+    assert msgpack.unpackb(zlib.decompress(reassemble(messages))) == record
+
+
+@pytest.mark.parametrize('value', [
+    None, True, False, 0, 127, 128, 255, 0xFFFF, 2 ** 64 - 1, -1, -32, -33, -2 ** 63, 1.5,
+    '', 'a' * 31, 'a' * 32, 'a' * 255, 'a' * 256, 'a' * 0x10000, '文' * 20,
+    b'', b'\x00' * 255, b'\x00' * 256, b'\x00' * 0x10000,
+    list(range(15)), list(range(16)), list(range(0x10000)),
+    {str(i): i for i in range(15)}, {str(i): i for i in range(16)}, {str(i): i for i in range(0x10000)},
+    {'nested': [{'a': None}, (1, 2)]},
+])
+def test_packb_matches_msgpack(value):
+    msgpack = pytest.importorskip('msgpack')
+    assert msgpack.unpackb(packb(value), raw=False, strict_map_key=False) == lists(value)
+
+
+def lists(value):
+    # MessagePack没有元组，解码后是列表 / MessagePack has no tuples, they decode as lists
+    if isinstance(value, (list, tuple)):
+        return [lists(item) for item in value]
+    if isinstance(value, dict):
+        return {key: lists(item) for key, item in value.items()}
+    return value
+
+
+def test_packb_uses_the_shortest_headers():
+    assert packb('a' * 31)[:1] == b'\xbf'
+    assert packb('a' * 32)[:2] == b'\xd9\x20'
+    assert packb('a' * 256)[:3] == b'\xda\x01\x00'
+    assert packb(list(range(16)))[:3] == b'\xdc\x00\x10'
+    assert packb({})[:1] == b'\x80'
+    assert packb(-32) == b'\xe0'
+    with pytest.raises(TypeError):
+        packb({1, 2})
@@ -0,0 +1,107 @@
+"""邮件处理管道的失败隔离，uvicorn子进程针对本地IMAP和MQTT替身
+Failure isolation in the mail pipeline, a uvicorn child process against the local IMAP and MQTT stand-ins
+"""
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import urllib.error
+import urllib.request
+from typing import List, Optional
+
+import pytest
+
+from app.payload import CHUNK_HEADER
+from benchmarks.bench_failover import published_subjects, wait_for
+from benchmarks.bench_startup import LAUNCHER, child_env, free_port
+from benchmarks.fake_imap import FakeIMAPServer, Mailbox
+from benchmarks.fake_mqtt import FakeMQTTBroker
+
+
+def message(subject: str, sender: Optional[str] = 'test@example.com', body: str = 'pipeline test') -> bytes:
+    headers = f'From: {sender}\r\n' if sender else ''
+    return f'{headers}Subject: {subject}\r\n\r\n{body}\r\n'.encode()
+
+
+def seen(mailbox: Mailbox) -> List[int]:
+    with mailbox.lock:
+        return [m['uid'] for m in mailbox.messages if '\\Seen' in m['flags']]
+
+
+def checkpoint(work_dir: str) -> Optional[int]:
+    for path in glob.glob(os.path.join(work_dir, 'checkpoint*.json')):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)['last_uid']
+    return None
+
+
+def health(port: int) -> Optional[str]:
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/health', timeout=0.5) as response:
+            return json.load(response)['status']
+    except urllib.error.HTTPError as e:
+        return json.load(e)['status']
+    except (OSError, ValueError):
+        return None
+
+
+@pytest.fixture
+def pipeline():
+    mailbox = Mailbox()
+    imap_server = FakeIMAPServer(mailbox)
+    broker = FakeMQTTBroker()
+    work_dir = tempfile.mkdtemp(prefix='email2mqtt-pipeline-')
+    children = []
+
+    def start(**settings: str) -> int:
+        env = child_env(work_dir, imap_server.port, broker.port)
+        env.update({'WATCH_MODE': 'poll', 'CHECK_INTERVAL': '1', **settings})
+        port = free_port()
+        children.append(subprocess.Popen([sys.executable, '-c', LAUNCHER, str(port)], env=env,
+                                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        return port
+
+    yield mailbox, broker, work_dir, start
+    for child in children:
+        child.terminate()
+        child.wait()
+    imap_server.shutdown()
+    broker.stop()
+
+
+def test_bad_headers_do_not_lose_the_batch_or_stop_the_watcher(pipeline):
+    mailbox, broker, _, start = pipeline
+    mailbox.add(message('first'))
+    # 无效的UTF-8字节和未知字符集 / Invalid UTF-8 bytes and an unknown charset
+    mailbox.add(message('=?utf-8?B?/w==?='))
+    mailbox.add(message('=?x-unknown?Q?hello?='))
+    mailbox.add(message('no sender', sender=None))
+    mailbox.add(message('last'))
+    port = start()
+    assert wait_for(lambda: len(published_subjects(broker)) == 5 and len(seen(mailbox)) == 5, 30) is not None
+    subjects = published_subjects(broker)
+    assert subjects[0] == 'first' and subjects[3:] == ['no sender', 'last']
+
+    # 监听仍在运行，之后的邮件照常发布 / The watcher is still running and later mail is published as usual
+    mailbox.add(message('later'))
+    assert wait_for(lambda: 'later' in published_subjects(broker) and len(seen(mailbox)) == 6, 30) is not None
+    assert health(port) == 'healthy'
+
+
+def test_failing_message_holds_the_checkpoint_until_retries_run_out(pipeline):
+    mailbox, broker, work_dir, start = pipeline
+    mailbox.add(message('before'))
+    # 每块只有一个字节时这封邮件需要超过0xFFFF块，每次发布都失败 / With one byte per chunk this message needs over 0xFFFF chunks and fails every time
+    poison = mailbox.add(message('poison', body='x' * 0x10000))
+    mailbox.add(message('after'))
+    start(MQTT_MAX_PAYLOAD=str(CHUNK_HEADER.size + 1), MAIL_RETRIES='2', PAYLOAD_FORMAT='json')
+
+    # 其余邮件照常发布并标记为已读，检查点停在失败的邮件之前
+    # The rest is published and marked as seen, and the checkpoint stops before the failing message
+    assert wait_for(lambda: seen(mailbox) == [1, 3], 30) is not None
+    assert checkpoint(work_dir) == poison - 1
+    # 重试用尽后跳过它，检查点继续前进，它保持未读 / Once the retries run out it is skipped, the checkpoint moves on and it stays unread
+    assert wait_for(lambda: checkpoint(work_dir) == 3, 30) is not None
+    assert seen(mailbox) == [1, 3]
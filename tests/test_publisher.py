@@ -0,0 +1,100 @@
+"""代理宕机和进程重启时的MQTT发布，针对本地MQTT替身
+MQTT publishing across broker outages and process restarts, against the local MQTT stand-in
+"""
+import time
+from typing import List
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from app.publisher import Publisher
+from app.spool import Spool
+from benchmarks.bench_failover import wait_for
+from benchmarks.fake_mqtt import FakeMQTTBroker
+
+TOPIC = 'test/outage'
+
+
+def received(broker: FakeMQTTBroker) -> List[str]:
+    with broker.lock:
+        return [payload.decode() for _, topic, payload in broker.messages if topic == TOPIC]
+
+
+def start_publisher(broker: FakeMQTTBroker, spool_path: str, **kwargs) -> Publisher:
+    client = mqtt.Client(client_id=f'test-{time.monotonic_ns()}')
+    publisher = Publisher(client, Spool(spool_path), qos=1, **kwargs)
+    client.on_connect = lambda client, userdata, flags, rc: publisher.set_connected(rc == 0)
+    client.on_disconnect = lambda client, userdata, rc: publisher.set_connected(False)
+    client.reconnect_delay_set(0.1, 0.2)
+    client.connect_async('127.0.0.1', broker.port, keepalive=5)
+    client.loop_start()
+    return publisher
+
+
+def stop_publisher(publisher: Publisher) -> None:
+    publisher.close()
+    publisher.client.disconnect()
+    publisher.client.loop_stop()
+    publisher.spool.close()
+
+
+@pytest.fixture
+def brokers():
+    # 重启后的代理替换列表中的旧代理 / A restarted broker replaces the old one in the list
+    brokers = [FakeMQTTBroker()]
+    yield brokers
+    brokers[-1].stop()
+
+
+def test_broker_outage_delivers_exactly_once_in_order(brokers, tmp_path):
+    publisher = start_publisher(brokers[0], str(tmp_path / 'spool'), queue_size=5, queue_timeout=0.1)
+    deliveries = [publisher.publish(TOPIC, str(i)) for i in range(20)]
+    assert wait_for(lambda: all(d.is_set() for d in deliveries), 10) is not None
+    assert received(brokers[0]) == [str(i) for i in range(20)]
+
+    # 代理在消息流中途宕机，期间的消息留在paho、内存队列和磁盘缓冲中
+    # The broker dies mid-stream; messages meanwhile stay in paho, the memory queue and the spool
+    brokers[0].stop()
+    assert wait_for(lambda: not publisher.stats()['connected'], 10) is not None
+    deliveries += [publisher.publish(TOPIC, str(i)) for i in range(20, 60)]
+    assert publisher.stats()['spooled'] > 0
+    # 只留在内存中的消息尚未送达 / Messages held only in memory are not delivered yet
+    assert not all(d.is_set() for d in deliveries)
+
+    brokers.append(FakeMQTTBroker.restart(brokers[0]))
+    deliveries += [publisher.publish(TOPIC, str(i)) for i in range(60, 70)]
+    assert wait_for(lambda: len(received(brokers[-1])) >= 70 and all(d.is_set() for d in deliveries), 20) is not None
+    assert wait_for(lambda: len(publisher.spool) == 0, 10) is not None
+    stop_publisher(publisher)
+    assert received(brokers[-1]) == [str(i) for i in range(70)]
+
+
+def test_restart_with_nonempty_spool(brokers, tmp_path):
+    spool_path = str(tmp_path / 'spool')
+    publisher = start_publisher(brokers[0], spool_path, queue_size=3, queue_timeout=0.1)
+    deliveries = [publisher.publish(TOPIC, str(i)) for i in range(5)]
+    assert wait_for(lambda: all(d.is_set() for d in deliveries), 10) is not None
+
+    brokers[0].stop()
+    assert wait_for(lambda: not publisher.stats()['connected'], 10) is not None
+    deliveries = [publisher.publish(TOPIC, str(i)) for i in range(5, 15)]
+    # 停止时未确认、正在重试和排队的消息按原来的顺序排在已缓冲的消息之前
+    # At shutdown unacknowledged, retried and queued messages go ahead of the spooled ones in their original order
+    stop_publisher(publisher)
+    assert all(d.is_set() for d in deliveries)
+    spool, spooled = Spool(spool_path), []
+    offset = spool.offset
+    while (record := spool.read(offset)) is not None:
+        _, payload, offset = record
+        spooled.append(payload.decode())
+    spool.close()
+    assert spooled == [str(i) for i in range(5, 15)]
+
+    # 进程重启后先发送缓冲中的消息，新消息排在后面 / After a restart the spool is sent first and new messages follow
+    brokers.append(FakeMQTTBroker.restart(brokers[0]))
+    publisher = start_publisher(brokers[-1], spool_path)
+    deliveries = [publisher.publish(TOPIC, str(i)) for i in range(15, 20)]
+    assert wait_for(lambda: len(received(brokers[-1])) >= 20 and len(publisher.spool) == 0, 20) is not None
+    assert all(d.is_set() for d in deliveries)
+    stop_publisher(publisher)
+    assert received(brokers[-1]) == [str(i) for i in range(20)]
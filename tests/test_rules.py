@@ -0,0 +1,104 @@
+"""按邮件头路由的规则集 / Header-based routing rule set"""
+import json
+import random
+
+import pytest
+
+from app.rules import RuleSet, load_rules
+
+
+def action(rules: RuleSet, sender: str, subject: str = '', list_id: str = ''):
+    decision = rules.match(sender, subject, list_id)
+    return decision['rule'], decision['action'], decision['topic']
+
+
+def test_first_matching_rule_wins_across_indexes():
+    rules = RuleSet([
+        {'subject_regex': r'^\[RESOLVED\]', 'action': 'drop'},
+        {'from_domain': 'example.com', 'subject_regex': 'urgent', 'topic': 'email/urgent'},
+        {'from': 'Boss@Example.com', 'topic': 'email/boss'},
+        {'from_domain': 'example.com', 'action': 'headers'},
+        {'subject_regex': 'report'},
+    ], default={'action': 'publish', 'topic': 'email/other'})
+    # 排在前面的正则规则先于哈希命中 / An earlier regex rule beats an indexed hit
+    assert action(rules, 'boss@example.com', '[RESOLVED] disk') == (0, 'drop', None)
+    # 候选规则的其余条件必须成立 / The remaining conditions of a candidate must hold
+    assert action(rules, 'ops@example.com', 'urgent: disk') == (1, 'publish', 'email/urgent')
+    assert action(rules, '"The Boss" <BOSS@example.COM>', 'hello') == (2, 'publish', 'email/boss')
+    assert action(rules, 'ops@example.com', 'hello') == (3, 'headers', None)
+    # 排在哈希命中之后的正则规则不生效 / A regex rule after an indexed hit does not apply
+    assert action(rules, 'ops@example.com', 'report') == (3, 'headers', None)
+    assert action(rules, 'someone@other.org', 'report') == (4, 'publish', None)
+    assert action(rules, 'someone@other.org', 'hello') == (None, 'publish', 'email/other')
+
+
+def test_domain_suffix_lookup():
+    rules = RuleSet([{'from_domain': '@Example.com', 'action': 'drop'}, {'from_domain': ['org', 'b.net']}])
+    assert action(rules, 'a@example.com')[0] == 0
+    assert action(rules, 'a@mail.alerts.example.com')[0] == 0
+    assert action(rules, 'a@badexample.com')[0] is None
+    assert action(rules, 'a@lists.python.org')[0] == 1
+    assert action(rules, 'a@a.b.net')[0] == 1
+    assert action(rules, 'a@ab.net')[0] is None
+    assert action(rules, '')[0] is None
+
+
+def test_list_id_and_subject_are_normalized():
+    rules = RuleSet([
+        {'list_id': 'Announce <announce.lists.example.org>', 'action': 'headers', 'name': 'announce'},
+        {'subject': '  Daily digest '},
+    ])
+    assert action(rules, 'a@x.com', list_id='"Announcements" <ANNOUNCE.lists.example.org>')[0] == 'announce'
+    assert action(rules, 'a@x.com', list_id='announce.lists.example.org')[0] == 'announce'
+    assert action(rules, 'a@x.com', 'Daily digest ')[0] == 1
+    assert action(rules, 'a@x.com', 'daily digest')[0] is None
+
+
+def test_index_agrees_with_rules_checked_one_by_one():
+    # 随机规则集的结果与逐条检查一致 / On random rule sets the result matches checking each rule in turn
+    rng = random.Random(7)
+    senders = [f'{user}@{host}' for user in ('a', 'b') for host in ('x.com', 'm.x.com', 'y.org')]
+    subjects = ['alert', 'alert resolved', 'digest']
+    for _ in range(50):
+        rule_list = []
+        for _ in range(rng.randint(1, 8)):
+            rule = {}
+            while not rule:
+                if rng.random() < 0.4:
+                    rule['from'] = rng.choice(senders)
+                if rng.random() < 0.4:
+                    rule['from_domain'] = rng.choice(['x.com', 'm.x.com', 'org'])
+                if rng.random() < 0.3:
+                    rule['subject'] = rng.choice(subjects)
+                if rng.random() < 0.3:
+                    rule['subject_regex'] = rng.choice(['^alert', 'resolved$', 'dig'])
+            rule_list.append(rule)
+        rules = RuleSet(rule_list)
+        singles = [RuleSet([rule]) for rule in rule_list]
+        for sender in senders:
+            for subject in subjects:
+                expected = next((i for i, single in enumerate(singles)
+                                 if single.match(sender, subject, '')['rule'] is not None), None)
+                assert rules.match(sender, subject, '')['rule'] == expected
+
+
+@pytest.mark.parametrize('rule', [
+    {'action': 'drop'},
+    {'from': 'a@x.com', 'action': 'archive'},
+    {'from': 'a@x.com', 'sender': 'a@x.com'},
+    {'subject_regex': '('},
+])
+def test_invalid_rules_are_rejected(rule):
+    with pytest.raises(ValueError):
+        RuleSet([rule])
+
+
+def test_load_rules(tmp_path):
+    path = tmp_path / 'rules.json'
+    path.write_text(json.dumps({'rules': [{'from': 'a@x.com', 'action': 'drop'}], 'default': {'topic': 'email/x'}}))
+    rules = load_rules(str(path))
+    assert len(rules) == 1
+    assert action(rules, 'a@x.com') == (0, 'drop', None)
+    assert action(rules, 'b@x.com') == (None, 'publish', 'email/x')
+    path.write_text(json.dumps([{'from': 'a@x.com'}]))
+    assert action(load_rules(str(path)), 'b@x.com') == (None, 'publish', None)
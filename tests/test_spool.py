@@ -0,0 +1,33 @@
+"""磁盘缓冲的读取位置持久化 / Persisting the disk spool's read position"""
+import os
+
+from app.spool import Spool
+
+
+def test_committed_offset_survives_reopen(tmp_path):
+    path = str(tmp_path / 'spool')
+    spool = Spool(path)
+    for i in range(3):
+        spool.append('test/spool', str(i).encode())
+    _, _, offset = spool.read(spool.offset)
+    spool.commit(offset)
+    spool.close()
+
+    # 偏移文件通过临时文件替换写入，不留下临时文件 / The offset file is written by replacing a temporary file, which is not left behind
+    assert not os.path.exists(f'{path}.offset.tmp')
+    spool = Spool(path)
+    assert spool.offset == offset
+    assert spool.read(spool.offset)[1] == b'1'
+    spool.close()
+
+
+def test_truncated_offset_file_replays_instead_of_failing(tmp_path):
+    path = str(tmp_path / 'spool')
+    spool = Spool(path)
+    spool.append('test/spool', b'0')
+    spool.close()
+    with open(f'{path}.offset', 'wb') as f:
+        f.write(b'\x00\x00')
+    spool = Spool(path)
+    assert spool.offset == 0 and spool.read(0)[1] == b'0'
+    spool.close()
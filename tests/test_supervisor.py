@@ -0,0 +1,52 @@
+"""重连退避和断路器 / Reconnect backoff and circuit breaker"""
+import time
+
+from app.supervisor import CLOSED, HALF_OPEN, OPEN, ConnectionSupervisor
+
+
+def test_breaker_rejects_attempts_until_cool_off():
+    supervisor = ConnectionSupervisor('test', min_delay=0.2, max_delay=0.2, failure_threshold=2)
+    assert supervisor.allow()
+    supervisor.failed('refused')
+    assert supervisor.state == CLOSED and supervisor.allow()
+    delay = supervisor.failed('refused')
+    assert supervisor.state == OPEN
+    assert not supervisor.allow()
+    time.sleep(delay + 0.01)
+    # 冷却期过后只放行一次试探 / Only one probe after the cool-off
+    assert supervisor.state == HALF_OPEN
+    assert supervisor.allow()
+    assert not supervisor.allow()
+    supervisor.failed('still refused')
+    assert supervisor.state == OPEN and not supervisor.allow()
+    assert supervisor.snapshot()['rejected'] == 3
+
+
+def test_successful_probe_closes_the_circuit():
+    supervisor = ConnectionSupervisor('test', min_delay=0.05, max_delay=0.05, failure_threshold=1)
+    time.sleep(supervisor.failed('refused') + 0.01)
+    assert supervisor.allow()
+    supervisor.succeeded()
+    assert supervisor.state == CLOSED and supervisor.connected and supervisor.allow()
+
+
+def test_connection_dropping_right_away_keeps_backing_off():
+    supervisor = ConnectionSupervisor('test', min_delay=1, max_delay=64, failure_threshold=100, stable_after=30)
+    delays = []
+    for _ in range(6):
+        supervisor.succeeded()
+        delays.append(supervisor.disconnected('dropped'))
+    # 失败次数不会被短暂的连接清零，等待随之增长 / Short-lived connections do not clear the failure count, so the wait grows
+    assert supervisor.snapshot()['consecutive_failures'] == 6
+    assert delays[-1] >= 16
+    assert not supervisor.connected
+
+
+def test_stable_connection_reconnects_quickly():
+    supervisor = ConnectionSupervisor('test', min_delay=1, max_delay=64, stable_after=0.05)
+    for _ in range(3):
+        supervisor.failed('refused')
+    supervisor.succeeded()
+    time.sleep(0.06)
+    assert supervisor.disconnected('dropped') <= 1
+    assert supervisor.snapshot()['consecutive_failures'] == 0